@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试框架热点路径的微基准测试
+覆盖 SQL 提取、安全检查、测试用例加载（JSON 与流式 JSONL）、统计聚合、问题缓存查找和结果序列化，完全离线运行。
+
+每个基准输出 ops/sec 和峰值内存，可保存为基线 JSON 文件；与基线对比时，
+吞吐下降或内存增长超过阈值即以非零退出码失败。
+
+另外在全新子进程中检查 import test_case.test_text2sql 的耗时：超过 --import-budget，
+或导入时加载了模型 SDK / 数据库驱动，同样以非零退出码失败。
+
+用法:
+    python test_case/benchmark.py                    # 运行并与基线对比（基线不存在时仅输出结果）
+    python test_case/benchmark.py --save-baseline    # 运行并保存为新基线
+    python test_case/benchmark.py --filter sql --threshold 0.15
+    python test_case/benchmark.py --import-budget 80
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from test_case import report
+from test_case.question_cache import QuestionCache
+from test_case.test_text2sql import (
+    ALLOWED_TABLES,
+    MAX_ROWS,
+    _json_default,
+    detect_dangerous_sql,
+    extract_sql_from_response,
+    is_safe_sql,
+    iter_test_cases_jsonl,
+    load_test_cases,
+)
+
+DEFAULT_BASELINE_FILE = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+
+# import test_case.test_text2sql 的耗时预算（毫秒）
+DEFAULT_IMPORT_BUDGET_MS = 150.0
+
+# 导入主模块时不应加载的重量级依赖（首次使用时才导入）
+LAZY_MODULES = ("openai", "google.generativeai", "pymysql", "http.server", "cProfile")
+
+# 基准注册表：名称 -> setup(workdir) -> (每轮执行的函数, 每轮包含的操作数)
+BENCHMARKS: Dict[str, Callable[[str], Tuple[Callable[[], None], int]]] = {}
+
+
+def benchmark(name: str):
+    """注册一个基准测试"""
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# 合成数据
+# ---------------------------------------------------------------------------
+
+_SAMPLE_SQL = [
+    "SELECT id, name FROM sportradar_tennis_competition WHERE gender = 'men' AND type = 'singles' LIMIT 20",
+    "SELECT s.name, s.start_date, c.name AS competition FROM sportradar_tennis_season s "
+    "JOIN sportradar_tennis_competition c ON s.competition_id = c.id "
+    "WHERE s.start_date >= '2023-01-01' ORDER BY s.start_date DESC LIMIT 10",
+    "SELECT sport_event_id, sport_event_start_time, sport_event_competition_name "
+    "FROM sportradar_tennis_summary_live WHERE sport_event_competitors LIKE '%Djokovic%' "
+    "ORDER BY sport_event_start_time DESC LIMIT 5",
+    "SELECT COUNT(*) AS matches, sport_event_competition_level FROM sportradar_tennis_summary_live "
+    "GROUP BY sport_event_competition_level ORDER BY matches DESC LIMIT 50",
+    "SELECT name, abbreviation, JSON_EXTRACT(players, '$[0].country') AS country "
+    "FROM sportradar_tennis_competitor WHERE season_id = 'sr:season:105353' LIMIT 20",
+    "SELECT * FROM sportradar_tennis_competitor WHERE name LIKE '%Nadal%'",
+    "DELETE FROM sportradar_tennis_competition WHERE id = 'sr:competition:1'",
+    "SELECT id FROM users LIMIT 10",
+    "UPDATE sportradar_tennis_season SET name = 'x' WHERE id = 'sr:season:1'",
+    "SELECT id, name FROM sportradar_tennis_competition LIMIT 500",
+]
+
+
+def _model_output_corpus() -> List[str]:
+    """模拟各种格式的模型输出"""
+    corpus = []
+    for sql in _SAMPLE_SQL:
+        corpus.append(f"```sql\n{sql};\n```")
+        corpus.append(f"以下是查询语句：\n\n```sql\n{sql};\n```\n\n该查询会返回满足条件的记录，并限制返回行数。")
+        corpus.append(f"```\n{sql};\n```")
+        corpus.append(f"{sql};")
+        corpus.append(sql.replace(" FROM ", "\nFROM ").replace(" WHERE ", "\nWHERE ").replace(" ORDER BY ", "\n# 排序\nORDER BY "))
+    corpus.append("抱歉，我无法根据现有表结构回答这个问题。")
+    corpus.append("该问题需要的数据不在数据库中。" * 20)
+    return corpus
+
+
+def _synthetic_results(count: int, seed: int = 42) -> List[Dict]:
+    """生成与 test_question 输出结构一致的合成结果"""
+    rng = random.Random(seed)
+    models = [("openai", "gpt-4o"), ("openai", "gpt-4o-mini"), ("google", "gemini-2.0-flash-exp")]
+    results = []
+    for i in range(count):
+        model_type, model_name = models[i % len(models)]
+        dangerous = rng.random() < 0.03
+        success = not dangerous and rng.random() < 0.75
+        results.append({
+            "question": f"问题 {i}: 最近一个赛季 Djokovic 参加了哪些比赛？",
+            "prompt": "",
+            "model_type": model_type,
+            "model_name": model_name,
+            "sql": _SAMPLE_SQL[i % len(_SAMPLE_SQL)],
+            "success": success,
+            "error": None if success else "执行异常: (1054, \"Unknown column\")",
+            "result_count": rng.randint(0, 50) if success else 0,
+            "is_dangerous": dangerous,
+            "dangerous_keyword": "DELETE" if dangerous else None,
+            "db_name": "tennis",
+            "generation_time": rng.uniform(0.3, 6.0),
+            "db_time": rng.uniform(0.002, 0.4),
+            "prompt_tokens": rng.randint(3000, 4500),
+            "completion_tokens": rng.randint(20, 200),
+            "retries": 0,
+            "reused": False,
+            "group_name": f"测试组{i % 12}",
+        })
+    return results
+
+
+# ---------------------------------------------------------------------------
+# 基准定义
+# ---------------------------------------------------------------------------
+
+@benchmark("extract_sql_from_response")
+def _bench_extract_sql(workdir: str):
+    corpus = _model_output_corpus()
+
+    def run():
+        for text in corpus:
+            extract_sql_from_response(text)
+    return run, len(corpus)
+
+
+@benchmark("is_safe_sql")
+def _bench_is_safe_sql(workdir: str):
+    allowed_upper = {table.upper() for table in ALLOWED_TABLES}
+    corpus = _SAMPLE_SQL
+
+    def run():
+        for sql in corpus:
+            is_safe_sql(sql, allowed_upper, MAX_ROWS)
+    return run, len(corpus)
+
+
+@benchmark("detect_dangerous_sql")
+def _bench_detect_dangerous_sql(workdir: str):
+    corpus = _SAMPLE_SQL
+
+    def run():
+        for sql in corpus:
+            detect_dangerous_sql(sql)
+    return run, len(corpus)
+
+
+@benchmark("load_test_cases")
+def _bench_load_test_cases(workdir: str):
+    path = os.path.join(workdir, "testcase_large.json")
+    groups = []
+    for g in range(200):
+        group = {
+            "name": f"测试组{g}",
+            "database_name": "tennis",
+            "questions": [f"第 {g}-{q} 个问题：{2015 + q % 10} 年 ATP 巡回赛冠军是谁？" for q in range(50)],
+        }
+        if g % 2:
+            group["prompt"] = f"你是网球数据助手（变体 {g}），只返回 SQL。"
+        groups.append(group)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"database": {"tennis": {"host": "localhost", "user": "u", "password": "p", "database": "tennis"}},
+                   "test_groups": groups}, f, ensure_ascii=False)
+
+    def run():
+        load_test_cases(path)
+    return run, 1
+
+
+@benchmark("iter_test_cases_jsonl")
+def _bench_iter_test_cases_jsonl(workdir: str):
+    path = os.path.join(workdir, "testcase_large.jsonl")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"type": "config", "database": {"tennis": {"host": "localhost", "user": "u",
+                                                                       "password": "p", "database": "tennis"}}}) + "\n")
+        for g in range(200):
+            group = {"type": "group", "name": f"测试组{g}", "database_name": "tennis"}
+            if g % 2:
+                group["prompt"] = f"你是网球数据助手（变体 {g % 4}），只返回 SQL。"
+            f.write(json.dumps(group, ensure_ascii=False) + "\n")
+            for q in range(50):
+                question = f"第 {g}-{q} 个问题：{2015 + q % 10} 年 ATP 巡回赛冠军是谁？"
+                f.write(json.dumps({"question": question}, ensure_ascii=False) + "\n")
+
+    def run():
+        for _ in iter_test_cases_jsonl(path):
+            pass
+    return run, 1
+
+
+@benchmark("statistics_aggregate")
+def _bench_statistics(workdir: str):
+    results = _synthetic_results(10000)
+
+    def run():
+        report.aggregate(report.ResultColumns.from_results(results))
+    return run, len(results)
+
+
+@benchmark("question_cache_lookup")
+def _bench_question_cache(workdir: str):
+    players = ["德约科维奇", "纳达尔", "费德勒", "阿尔卡拉斯", "辛纳", "梅德韦杰夫", "Zverev", "Ruud"]
+    templates = ["{p}最近的比赛", "{p} 在 {y} 年赢了几场比赛？", "{p}参加过哪些大满贯", "{y} 年 {p} 的排名是多少"]
+    cache = QuestionCache()
+    scope = QuestionCache.scope("tennis", "openai", "gpt-4o")
+    for i in range(5000):
+        question = templates[i % len(templates)].format(p=players[i % len(players)], y=2000 + i % 25)
+        cache.add(f"{question}（{i}）", scope, _SAMPLE_SQL[i % len(_SAMPLE_SQL)])
+    queries = [templates[i % len(templates)].format(p=players[(i * 3) % len(players)], y=2010 + i % 10)
+               for i in range(200)]
+
+    def run():
+        for question in queries:
+            cache.lookup(question, scope)
+    return run, len(queries)
+
+
+@benchmark("result_serialization")
+def _bench_serialization(workdir: str):
+    results = _synthetic_results(2000)
+    payload = {
+        "test_time": "2025-01-01T00:00:00",
+        "test_groups": [{"name": "tennis", "allowed_tables": set(ALLOWED_TABLES)}],
+        "results_flat": {"openai": results},
+    }
+    path = os.path.join(workdir, "results.json")
+
+    def run():
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2, default=_json_default)
+    return run, len(results)
+
+
+# ---------------------------------------------------------------------------
+# 运行与基线对比
+# ---------------------------------------------------------------------------
+
+def measure(run: Callable[[], None], ops_per_call: int, min_time: float = 0.2, repeats: int = 5) -> Dict:
+    """测量吞吐（取多轮中最快的一轮）和单次调用的峰值内存"""
+    run()  # 预热
+
+    # 校准每轮循环次数，使单轮耗时不少于 min_time
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        best = elapsed
+        for _ in range(repeats - 1):
+            start = time.perf_counter()
+            for _ in range(loops):
+                run()
+            best = min(best, time.perf_counter() - start)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ops_per_sec": loops * ops_per_call / best if best > 0 else float("inf"),
+        "peak_memory_bytes": peak,
+        "loops": loops,
+        "ops_per_call": ops_per_call,
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """与基线对比，返回回归描述列表"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if current["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            drop = (1 - current["ops_per_sec"] / base["ops_per_sec"]) * 100
+            regressions.append(f"{name}: 吞吐下降 {drop:.1f}% "
+                               f"({base['ops_per_sec']:.0f} -> {current['ops_per_sec']:.0f} ops/sec)")
+        # 小于 64KB 的内存波动不计入
+        base_memory = base.get("peak_memory_bytes", 0)
+        if (current["peak_memory_bytes"] > base_memory * (1 + threshold)
+                and current["peak_memory_bytes"] - base_memory > 64 * 1024):
+            regressions.append(f"{name}: 峰值内存增长 "
+                               f"({base_memory / 1024:.0f}KB -> {current['peak_memory_bytes'] / 1024:.0f}KB)")
+    return regressions
+
+
+def run_benchmarks(name_filter: Optional[str] = None, min_time: float = 0.2, repeats: int = 5) -> Dict[str, Dict]:
+    """运行所有（或匹配过滤条件的）基准"""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="text2sql_bench_") as workdir:
+        for name, setup in BENCHMARKS.items():
+            if name_filter and name_filter not in name:
+                continue
+            run, ops_per_call = setup(workdir)
+            results[name] = measure(run, ops_per_call, min_time=min_time, repeats=repeats)
+    return results
+
+
+def measure_import(repeats: int = 3) -> Dict:
+    """在全新子进程中测量导入主模块的耗时，并检查哪些延迟加载的模块被提前导入（取最快一次）"""
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    code = (
+        "import json, sys, time\n"
+        f"sys.path.insert(0, {root!r})\n"
+        "start = time.perf_counter()\n"
+        "import test_case.test_text2sql\n"
+        "elapsed = (time.perf_counter() - start) * 1000\n"
+        f"loaded = [m for m in {LAZY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'import_ms': elapsed, 'eager_modules': loaded}))\n"
+    )
+    best = None
+    for _ in range(repeats):
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                              timeout=60, check=True)
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if best is None or result["import_ms"] < best["import_ms"]:
+            best = result
+    return best
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Text2SQL 测试框架微基准")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_FILE, help="基线文件路径（默认: test_case/benchmark_baseline.json）")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--threshold", type=float, default=0.25, help="允许的回归比例（默认: 0.25，即 25%%）")
+    parser.add_argument("--filter", default=None, help="只运行名称包含该字符串的基准")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每轮最短耗时（秒）")
+    parser.add_argument("--repeats", type=int, default=5, help="重复轮数（取最快一轮）")
+    parser.add_argument("--import-budget", type=float, default=DEFAULT_IMPORT_BUDGET_MS,
+                        help=f"导入主模块的耗时预算（毫秒，默认: {DEFAULT_IMPORT_BUDGET_MS:.0f}，0 表示不检查）")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.filter, min_time=args.min_time, repeats=args.repeats)
+
+    import_failures = []
+    if args.import_budget > 0:
+        startup = measure_import()
+        print(f"导入 test_case.test_text2sql: {startup['import_ms']:.1f}ms（预算 {args.import_budget:.0f}ms）")
+        if startup["import_ms"] > args.import_budget:
+            import_failures.append(f"导入耗时 {startup['import_ms']:.1f}ms 超过预算 {args.import_budget:.0f}ms")
+        if startup["eager_modules"]:
+            import_failures.append(f"导入时提前加载了: {', '.join(startup['eager_modules'])}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get("benchmarks", {})
+
+    print("=" * 80)
+    print(f"{'基准':<28}{'ops/sec':>14}{'峰值内存':>14}{'相对基线':>14}")
+    print("-" * 80)
+    for name, current in results.items():
+        base = baseline.get(name)
+        delta = f"{(current['ops_per_sec'] / base['ops_per_sec'] - 1) * 100:+.1f}%" if base else "-"
+        print(f"{name:<28}{current['ops_per_sec']:>14.0f}{current['peak_memory_bytes'] / 1024:>12.0f}KB{delta:>14}")
+    print("=" * 80)
+
+    if import_failures:
+        print("启动开销检查失败:")
+        for line in import_failures:
+            print(f"  ✗ {line}")
+
+    if args.save_baseline:
+        merged = dict(baseline)
+        merged.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({"python": sys.version.split()[0], "benchmarks": merged}, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到: {args.baseline}")
+        return 1 if import_failures else 0
+
+    if not baseline:
+        print("未找到基线文件，使用 --save-baseline 创建")
+        return 1 if import_failures else 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"性能回归（阈值 {args.threshold * 100:.0f}%）:")
+        for line in regressions:
+            print(f"  ✗ {line}")
+        return 1
+    print("✓ 未发现超过阈值的性能回归")
+    return 1 if import_failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+熔断器
+API Key 错误、配额用完或 MySQL 主机宕机时，剩下的每个测试项都会重复同一个必然失败的调用。
+为每个 (模型提供方, 模型, API Key) 和每个数据库配置各维护一个熔断器：
+
+    closed     正常调用；连续 failure_threshold 次系统性失败后打开
+    open       不再调用，测试项立即以一条说明失败（failed_stage 不变，结果带 circuit_open 标记）；
+               reset_timeout 秒后进入 half_open
+    half_open  只放行一个试探调用：不是系统性失败则关闭，否则重新打开，等待时间翻倍（最长 MAX_RESET_TIMEOUT）
+
+系统性失败指与具体问题无关、重试也不会好转的错误：认证失败、配额用完、模型不存在、依赖未安装、
+数据库拒绝连接或认证失败。classify 按异常类型和提供方 / MySQL 错误码判断，不匹配错误信息的文字。
+SQL 错误（包括函数或表不存在）、超时和限流（429）不算（限流由自适应并发控制处理），
+并且会把连续失败计数清零。API Key 只以 SHA-256 前缀区分，不会出现在输出中。
+
+被熔断器跳过的测试项没有真正执行，增量运行时总是重新执行。
+
+用法:
+    breaker = circuit_breaker.REGISTRY.model("google", "gemini-2.5-flash", api_key)
+    with breaker.call() as trial:        # 熔断中时抛出 CircuitOpen
+        sql, error = generate(...)
+        trial.record(error, usage.get("exception"))
+"""
+
+import hashlib
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+from test_case import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_RESET_TIMEOUT = 30.0
+
+# 试探连续失败时等待时间的上限（秒）
+MAX_RESET_TIMEOUT = 600.0
+
+# 计入数据库熔断的 MySQL 错误码：只有连接和认证类错误（服务端 1044/1045/1049，客户端 20xx）。
+# SQL 本身的错误（1054 未知列、1305 函数不存在等）说明生成的 SQL 有问题，数据库是可以访问的
+MYSQL_SYSTEMIC_CODES = {
+    1044: "auth", 1045: "auth", 1049: "not_found",
+    2002: "connection", 2003: "connection", 2005: "connection", 2006: "connection", 2013: "connection",
+}
+_MYSQL_DRIVER_MODULES = ("pymysql", "MySQLdb", "mysql")
+
+# 模型提供方的 HTTP 状态码。429 不在其中：限流是暂时的，由自适应并发控制处理；
+# 只有 OpenAI 明确返回 insufficient_quota 时才算配额用完
+HTTP_SYSTEMIC_STATUS = {401: "auth", 403: "auth", 404: "not_found"}
+_QUOTA_CODES = ("insufficient_quota",)
+
+REASON_LABELS = {"quota": "配额用完", "auth": "认证失败", "not_found": "模型或库不存在",
+                 "connection": "无法连接", "config": "依赖或配置缺失"}
+
+CIRCUIT_STATE = metrics.REGISTRY.gauge(
+    "text2sql_circuit_breaker_open", "熔断器是否打开（1 打开或试探中，0 关闭）", ("kind", "name"))
+CIRCUIT_REJECTIONS_TOTAL = metrics.REGISTRY.counter(
+    "text2sql_circuit_breaker_rejections_total", "熔断器打开期间被跳过的调用数", ("kind", "name"))
+CIRCUIT_OPENS_TOTAL = metrics.REGISTRY.counter(
+    "text2sql_circuit_breaker_opens_total", "熔断器打开的次数（按原因）", ("kind", "name", "reason"))
+
+
+class ConfigurationError(Exception):
+    """调用前就能确定的系统性失败（依赖未安装、未设置 API Key 等），reason 为 classify 的分类"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """提供方异常的 HTTP 状态码（OpenAI 的 status_code，google.api_core 的 code）"""
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return int(value)
+    return None
+
+
+def classify(error) -> Optional[str]:
+    """系统性失败的原因（quota / auth / not_found / connection / config）；其他错误或成功时返回 None
+
+    按异常类型和错误码判断，不匹配错误信息的文字：只给出错误信息（字符串）时无法判断，返回 None。
+    """
+    if not error or not isinstance(error, BaseException):
+        return None
+    if isinstance(error, ConfigurationError):
+        return error.reason
+    if isinstance(error, ImportError):
+        return "config"
+    if type(error).__module__.split(".", 1)[0] in _MYSQL_DRIVER_MODULES:
+        code = error.args[0] if error.args else None
+        return MYSQL_SYSTEMIC_CODES.get(code) if isinstance(code, int) else None
+    if isinstance(error, (ConnectionError, socket.gaierror)):
+        return "connection"
+    if getattr(error, "code", None) in _QUOTA_CODES:
+        return "quota"
+    status = _status_code(error)
+    return HTTP_SYSTEMIC_STATUS.get(status) if status is not None else None
+
+
+def key_fingerprint(api_key: Optional[str]) -> str:
+    """API Key 的短指纹（区分不同的 Key，不泄露 Key 本身）"""
+    if not api_key:
+        return "none"
+    return hashlib.sha256(api_key.strip().encode("utf-8")).hexdigest()[:8]
+
+
+def _first_line(error) -> str:
+    return str(error).strip().split("\n", 1)[0][:200]
+
+
+class CircuitOpen(Exception):
+    """熔断器打开，调用被跳过"""
+
+    def __init__(self, breaker: "CircuitBreaker", retry_in: float):
+        reason = REASON_LABELS.get(breaker.reason, breaker.reason)
+        super().__init__(f"熔断中（{reason}）: {breaker.kind} {breaker.name} 连续 {breaker.failure_threshold} 次"
+                         f"系统性失败，跳过调用，{retry_in:.0f}s 后试探。最近错误: {breaker.last_error}")
+        self.breaker = breaker
+
+
+class _Trial:
+    """一次被放行的调用（with 语句结束时把结果反馈给熔断器）"""
+
+    __slots__ = ("breaker", "probe", "outcome", "error")
+
+    def __init__(self, breaker: "CircuitBreaker", probe: bool):
+        self.breaker = breaker
+        self.probe = probe
+        self.outcome: Optional[str] = None   # None 表示没有结论（未调用 record 且没有异常）
+        self.error = None
+
+    def record(self, error, cause: Optional[BaseException] = None) -> None:
+        """记录调用结果（错误信息为空表示成功）
+
+        Args:
+            error: 错误信息或异常
+            cause: error 为字符串时导致该错误的异常（按它的类型和错误码判断是否为系统性失败）
+        """
+        if not error:
+            self.outcome = "ok"
+        else:
+            self.outcome = classify(cause if cause is not None else error) or "ok"
+        self.error = error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and self.outcome is None:
+            # 异常只在能确定是系统性失败时计入，其他异常（超时、停止信号）不影响状态
+            reason = classify(exc) if isinstance(exc, Exception) else None
+            if reason is not None:
+                self.outcome, self.error = reason, exc
+        self.breaker.release(self)
+        return False
+
+
+class _NullTrial:
+    """熔断未开启时的空调用"""
+
+    __slots__ = ()
+
+    def record(self, error, cause: Optional[BaseException] = None) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class CircuitBreaker:
+    """连续系统性失败后打开、定时放行试探调用的熔断器（线程安全）"""
+
+    def __init__(self, kind: str, name: str, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        """
+        Args:
+            kind: 熔断器类别（model / db），用于指标标签
+            name: 熔断器名称（提供方/模型 [Key 指纹] 或数据库名）
+            failure_threshold: 打开前的连续系统性失败次数
+            reset_timeout: 打开后到第一次试探的秒数（试探失败后翻倍）
+        """
+        self.kind = kind
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive = 0
+        self.reason: Optional[str] = None
+        self.last_error: Optional[str] = None
+        # 打开、跳过和试探次数（熔断状态在进程内共享，次数按运行分开统计）
+        self._component = f"circuit_breaker:{kind}:{name}"
+        self._totals = metrics.Counts()
+        self._timeout = reset_timeout
+        self._retry_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, kind=kind, name=name)
+
+    def call(self) -> _Trial:
+        """申请一次调用
+
+        Raises:
+            CircuitOpen: 熔断器打开（或试探调用正在进行）
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return _Trial(self, probe=False)
+            now = time.monotonic()
+            if not self._probing and now >= self._retry_at:
+                self.state = HALF_OPEN
+                self._probing = True
+                self._count("probes")
+                return _Trial(self, probe=True)
+            self._count("rejected")
+            retry_in = max(0.0, self._retry_at - now)
+        CIRCUIT_REJECTIONS_TOTAL.inc(kind=self.kind, name=self.name)
+        raise CircuitOpen(self, retry_in)
+
+    def release(self, trial: _Trial) -> None:
+        message = None
+        with self._lock:
+            if trial.probe:
+                self._probing = False
+            if trial.outcome is None:
+                if trial.probe:
+                    # 试探没有结论：保持打开，下一个调用立即重新试探
+                    self.state = OPEN
+            elif trial.outcome == "ok":
+                if self.state != CLOSED:
+                    message = f"\n✓ 熔断器恢复: [{self.kind}] {self.name} 调用成功，恢复正常调用"
+                    self.state = CLOSED
+                    self._timeout = self.reset_timeout
+                    CIRCUIT_STATE.set(0, kind=self.kind, name=self.name)
+                self.consecutive = 0
+            else:
+                self.consecutive += 1
+                self.reason = trial.outcome
+                self.last_error = _first_line(trial.error)
+                if trial.probe:
+                    self._timeout = min(MAX_RESET_TIMEOUT, self._timeout * 2)
+                    self._open()
+                    message = (f"\n⚡ 熔断器试探失败: [{self.kind}] {self.name}（{REASON_LABELS[self.reason]}），"
+                               f"{self._timeout:g}s 后再次试探")
+                elif self.state == CLOSED and self.consecutive >= self.failure_threshold:
+                    self._open()
+                    message = (f"\n⚡ 熔断器打开: [{self.kind}] {self.name} 连续 {self.consecutive} 次"
+                               f"{REASON_LABELS[self.reason]}，后续调用直接跳过，{self._timeout:g}s 后试探\n"
+                               f"   最近错误: {self.last_error}")
+        if message:
+            print(message, flush=True)
+
+    def _count(self, name: str) -> None:
+        for counts in metrics.counts_to_update(self._component, self._totals):
+            counts.add(name)
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self._count("opens")
+        self._retry_at = time.monotonic() + self._timeout
+        CIRCUIT_STATE.set(1, kind=self.kind, name=self.name)
+        CIRCUIT_OPENS_TOTAL.inc(kind=self.kind, name=self.name, reason=self.reason)
+
+    def snapshot(self) -> Dict:
+        """当前状态，以及打开、跳过和试探次数（在 run_scope() 中时只含本次运行）"""
+        counts = metrics.counts_to_report(self._component, self._totals)
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "name": self.name,
+                "state": self.state,
+                "opens": counts.get("opens"),
+                "rejected": counts.get("rejected"),
+                "probes": counts.get("probes"),
+                "reason": self.reason,
+                "last_error": self.last_error,
+            }
+
+
+class BreakerRegistry:
+    """按 (提供方, 模型, API Key) 和数据库配置惰性创建熔断器"""
+
+    def __init__(self):
+        self.enabled = True
+        self.failure_threshold = DEFAULT_FAILURE_THRESHOLD
+        self.reset_timeout = DEFAULT_RESET_TIMEOUT
+        self._breakers: Dict[tuple, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                  reset_timeout: float = DEFAULT_RESET_TIMEOUT) -> None:
+        """设置熔断参数（failure_threshold 为 0 时关闭熔断；只影响之后新建的熔断器）"""
+        self.enabled = failure_threshold > 0
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def _get(self, key: tuple, kind: str, name: str) -> Optional[CircuitBreaker]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(kind, name, self.failure_threshold,
+                                                               self.reset_timeout)
+            return breaker
+
+    def model(self, model_type: str, model_name: str, api_key: Optional[str]) -> Optional[CircuitBreaker]:
+        """模型调用的熔断器；未开启时返回 None"""
+        fingerprint = key_fingerprint(api_key)
+        return self._get(("model", model_type, model_name, fingerprint), "model",
+                         f"{model_type}/{model_name} [key {fingerprint}]")
+
+    def database(self, db_name: str, db_config: Dict) -> Optional[CircuitBreaker]:
+        """数据库配置的熔断器（按主机、端口、库名和用户区分）；未开启时返回 None"""
+        key = ("db", db_name, db_config.get("host"), db_config.get("port"), db_config.get("database"),
+               db_config.get("user"))
+        return self._get(key, "db", db_name)
+
+    def snapshot(self) -> List[Dict]:
+        """打开过或跳过过调用的熔断器（写入结果文件的 statistics.circuit_breakers 字段，在 run_scope() 中时只含本次运行）"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return [snap for snap in (breaker.snapshot() for breaker in breakers) if snap["opens"] or snap["rejected"]]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._breakers.clear()
+
+
+# 全局熔断器注册表（同一进程内的所有运行共享，失效的 Key 和宕机的数据库是进程级状态）
+REGISTRY = BreakerRegistry()
+
+
+def guard(breaker: Optional[CircuitBreaker]):
+    """breaker.call() 的简写；熔断器未开启（None）时返回一个只接受 record 的空调用"""
+    return breaker.call() if breaker is not None else _NullTrial()
+
+
+def format_console(snapshots: List[Dict]) -> str:
+    lines = ["熔断器:"]
+    for snap in snapshots:
+        reason = REASON_LABELS.get(snap["reason"], snap["reason"] or "-")
+        lines.append(f"  [{snap['kind']}] {snap['name']}: {snap['state']}，打开 {snap['opens']} 次（{reason}），"
+                     f"跳过 {snap['rejected']} 次调用，试探 {snap['probes']} 次")
+        if snap["last_error"]:
+            lines.append(f"    最近错误: {snap['last_error']}")
+    return "\n".join(lines)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应并发控制（AIMD）
+为每个模型和每个数据库配置各维护一个并发上限：
+    - 请求成功且延迟正常时加性增加（每个完整窗口约 +1）
+    - 遇到限流（429 / RESOURCE_EXHAUSTED / Too many connections）、超时，
+      或控制器饱和（并发数达到上限）时数据库近期延迟的中位数超过基线中位数的 latency_tolerance 倍时
+      乘性减少（默认减半）；单条查询的延迟主要取决于 SQL 本身，用中位数比较，一条慢查询不会触发减少
+同一窗口内（上次减少之前已发出的请求）的多次失败只减少一次，避免并发突发时上限被连续砍到底。
+
+模型的设置来自测试用例文件顶层的 model_concurrency（按模型名，"default" 为默认值）；
+数据库的设置来自数据库配置中的 concurrency 字段，上限默认等于连接池大小：
+
+    "model_concurrency": {"default": {"initial": 4, "max": 32}, "gpt-4o": {"max": 64}},
+    "database": {"tennis": {..., "pool_size": 8, "concurrency": {"initial": 4, "latency_tolerance": 2.0}}}
+"""
+
+import collections
+import statistics
+import threading
+import time
+from typing import Dict, List, Optional
+
+from test_case import metrics
+
+# 请求结果分类
+OK = "ok"
+ERROR = "error"          # 与负载无关的失败（SQL 错误、认证失败等），不调整上限
+THROTTLED = "throttled"  # 限流 / 资源耗尽
+TIMEOUT = "timeout"
+
+_THROTTLE_MARKERS = ("429", "resource_exhausted", "rate limit", "ratelimit", "too many requests",
+                     "too many connections", "(1040")
+_TIMEOUT_MARKERS = ("timed out", "timeout", "超时", "时间预算", "maximum statement execution time", "(3024")
+
+DEFAULT_MODEL_SETTINGS = {"initial": 4, "min": 1, "max": 64, "increase": 1.0, "backoff": 0.5,
+                          "latency_tolerance": None}
+DEFAULT_DB_SETTINGS = {"initial": 4, "min": 1, "max": None, "increase": 1.0, "backoff": 0.5,
+                       "latency_tolerance": 2.0}
+
+# 每个控制器保留的最近调整记录条数
+MAX_ADJUSTMENTS = 200
+
+# 近期延迟取最近 RECENT_SAMPLES 个成功请求的中位数，基线取最近 BASELINE_SAMPLES 个正常样本的中位数
+RECENT_SAMPLES = 10
+BASELINE_SAMPLES = 200
+# 基线至少积累这么多个样本后才根据延迟调整
+MIN_LATENCY_SAMPLES = 10
+
+CONCURRENCY_LIMIT = metrics.REGISTRY.gauge(
+    "text2sql_concurrency_limit", "自适应并发上限", ("kind", "name"))
+CONCURRENCY_BACKOFFS_TOTAL = metrics.REGISTRY.counter(
+    "text2sql_concurrency_backoffs_total", "并发上限减少次数（按原因）", ("kind", "name", "reason"))
+
+
+def classify(error) -> str:
+    """根据错误信息（字符串或异常）判断请求结果类型"""
+    if not error:
+        return OK
+    if isinstance(error, TimeoutError):
+        return TIMEOUT
+    text = str(error).lower()
+    if any(marker in text for marker in _THROTTLE_MARKERS):
+        return THROTTLED
+    if any(marker in text for marker in _TIMEOUT_MARKERS):
+        return TIMEOUT
+    return ERROR
+
+
+class _Slot:
+    """一次已获得的并发配额（with 语句结束时归还并反馈结果）"""
+
+    __slots__ = ("limiter", "epoch", "start", "outcome")
+
+    def __init__(self, limiter: "AIMDLimiter", epoch: int):
+        self.limiter = limiter
+        self.epoch = epoch
+        self.start = time.perf_counter()
+        self.outcome = OK
+
+    def record(self, error) -> None:
+        """记录请求结果（错误信息为空表示成功）"""
+        self.outcome = classify(error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.outcome = classify(exc)
+        self.limiter.release(self, time.perf_counter() - self.start)
+        return False
+
+
+class AIMDLimiter:
+    """加性增、乘性减的并发上限控制器（线程安全）"""
+
+    def __init__(self, kind: str, name: str, initial: float = 4, min_limit: float = 1,
+                 max_limit: Optional[float] = 64, increase: float = 1.0, backoff: float = 0.5,
+                 latency_tolerance: Optional[float] = None):
+        """
+        Args:
+            kind: 控制器类别（model / db），用于指标标签
+            name: 控制器名称（模型名或数据库名）
+            initial: 初始上限
+            min_limit: 上限的下界
+            max_limit: 上限的上界（为空时不限制）
+            increase: 每个完整窗口的加性增量
+            backoff: 乘性减少系数（0-1）
+            latency_tolerance: 延迟超过基线的倍数时视为过载；为空时不根据延迟调整
+        """
+        self.kind = kind
+        self.name = name
+        self.min_limit = max(1.0, float(min_limit))
+        self.max_limit = float(max_limit) if max_limit else float("inf")
+        self.increase = increase
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.limit = min(self.max_limit, max(self.min_limit, float(initial)))
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._baseline = collections.deque(maxlen=BASELINE_SAMPLES)
+        self._recent = collections.deque(maxlen=RECENT_SAMPLES)
+        self.counts = {OK: 0, ERROR: 0, THROTTLED: 0, TIMEOUT: 0}
+        self.increases = 0
+        self.decreases: Dict[str, int] = {}
+        self.adjustments: List[Dict] = []
+        self._epoch = 0
+        self._started = time.monotonic()
+        self._cond = threading.Condition()
+        CONCURRENCY_LIMIT.set(int(self.limit), kind=kind, name=name)
+
+    def slot(self, timeout: Optional[float] = None) -> _Slot:
+        """等待并获得一个并发配额
+
+        Raises:
+            TimeoutError: timeout 秒内没有可用配额
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                raise TimeoutError(f"等待 {self.name} 的并发配额超时（当前上限 {int(self.limit)}）")
+            self.in_flight += 1
+            if self.in_flight > self.peak_in_flight:
+                self.peak_in_flight = self.in_flight
+            return _Slot(self, self._epoch)
+
+    def release(self, slot: _Slot, latency: float) -> None:
+        with self._cond:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            self.counts[slot.outcome] += 1
+            reason = slot.outcome if slot.outcome in (THROTTLED, TIMEOUT) else None
+            if slot.outcome == OK and self.latency_tolerance:
+                reason = self._observe_latency(latency, saturated)
+            if reason is not None:
+                # 上次减少之前发出的请求反映的是旧上限下的负载，不再重复减少
+                if slot.epoch == self._epoch:
+                    self._decrease(reason)
+            elif slot.outcome == OK and saturated:
+                self._increase()
+            self._cond.notify_all()
+
+    def _observe_latency(self, latency: float, saturated: bool) -> Optional[str]:
+        """记录一个成功请求的延迟；控制器饱和且近期延迟中位数超过基线中位数的 latency_tolerance 倍时
+        返回 "latency"（需要减少上限）
+
+        未饱和时延迟变高说明的是查询本身慢，而不是并发过高，不减少上限。
+        """
+        self._recent.append(latency)
+        baseline = self.baseline_latency
+        if not (saturated and baseline is not None and latency > baseline * self.latency_tolerance):
+            # 基线只跟随正常样本和未饱和时的样本，过载时的慢样本不会把基线拉高
+            self._baseline.append(latency)
+            return None
+        if (len(self._baseline) >= MIN_LATENCY_SAMPLES and len(self._recent) == RECENT_SAMPLES
+                and statistics.median(self._recent) > baseline * self.latency_tolerance):
+            # 重新开始累计近期延迟，减少后的效果由之后的样本判断
+            self._recent.clear()
+            return "latency"
+        return None
+
+    @property
+    def baseline_latency(self) -> Optional[float]:
+        """基线延迟（正常样本的中位数）"""
+        return statistics.median(self._baseline) if self._baseline else None
+
+    @property
+    def recent_latency(self) -> Optional[float]:
+        """近期延迟（最近 RECENT_SAMPLES 个成功请求的中位数）"""
+        return statistics.median(self._recent) if self._recent else None
+
+    def _increase(self) -> None:
+        previous = int(self.limit)
+        self.limit = min(self.max_limit, self.limit + self.increase / max(self.limit, 1.0))
+        if int(self.limit) != previous:
+            self.increases += 1
+            self._record("increase")
+
+    def _decrease(self, reason: str) -> None:
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self._epoch += 1
+        self.decreases[reason] = self.decreases.get(reason, 0) + 1
+        CONCURRENCY_BACKOFFS_TOTAL.inc(kind=self.kind, name=self.name, reason=reason)
+        self._record(reason)
+
+    def _record(self, reason: str) -> None:
+        CONCURRENCY_LIMIT.set(int(self.limit), kind=self.kind, name=self.name)
+        self.adjustments.append({
+            "elapsed": round(time.monotonic() - self._started, 3),
+            "limit": int(self.limit),
+            "reason": reason,
+        })
+        if len(self.adjustments) > MAX_ADJUSTMENTS:
+            del self.adjustments[0]
+
+    def snapshot(self) -> Dict:
+        """当前上限、结果计数和最近的调整记录"""
+        with self._cond:
+            return {
+                "kind": self.kind,
+                "name": self.name,
+                "limit": int(self.limit),
+                "min": self.min_limit,
+                "max": None if self.max_limit == float("inf") else self.max_limit,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "baseline_latency": self.baseline_latency,
+                "recent_latency": self.recent_latency,
+                "outcomes": dict(self.counts),
+                "increases": self.increases,
+                "decreases": dict(self.decreases),
+                "adjustments": list(self.adjustments),
+            }
+
+
+def _from_settings(kind: str, name: str, settings: Dict) -> AIMDLimiter:
+    """按配置字典（initial / min / max / increase / backoff / latency_tolerance）创建控制器"""
+    return AIMDLimiter(kind, name, initial=settings["initial"], min_limit=settings["min"],
+                       max_limit=settings["max"], increase=settings["increase"],
+                       backoff=settings["backoff"], latency_tolerance=settings["latency_tolerance"])
+
+
+class LimiterRegistry:
+    """按模型和数据库配置惰性创建控制器"""
+
+    def __init__(self):
+        self.model_settings: Dict[str, Dict] = {}
+        self._limiters: Dict[tuple, AIMDLimiter] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, model_settings: Optional[Dict[str, Dict]]) -> None:
+        """设置模型控制器参数（只影响之后新建的控制器）"""
+        self.model_settings = dict(model_settings or {})
+
+    def model(self, model_type: str, model_name: str) -> AIMDLimiter:
+        key = ("model", model_type, model_name)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                settings = dict(DEFAULT_MODEL_SETTINGS)
+                settings.update(self.model_settings.get("default", {}))
+                settings.update(self.model_settings.get(model_name, {}))
+                limiter = self._limiters[key] = _from_settings("model", f"{model_type}/{model_name}", settings)
+            return limiter
+
+    def database(self, db_name: str, db_config: Dict, pool_size: int) -> AIMDLimiter:
+        key = ("db", db_name, db_config.get("host"), db_config.get("database"))
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                settings = dict(DEFAULT_DB_SETTINGS, max=pool_size)
+                settings.update(db_config.get("concurrency", {}))
+                limiter = self._limiters[key] = _from_settings("db", db_name, settings)
+            return limiter
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return [limiter.snapshot() for limiter in limiters]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._limiters.clear()
+
+
+# 全局控制器注册表（同一进程内的所有运行共享，模型配额和数据库容量是进程级资源）
+REGISTRY = LimiterRegistry()
+
+
+def format_console(snapshots: List[Dict]) -> str:
+    """控制台输出：每个控制器一行"""
+    lines = ["自适应并发控制:"]
+    for snap in snapshots:
+        decreases = ", ".join(f"{reason} {count}" for reason, count in sorted(snap["decreases"].items())) or "无"
+        lines.append(f"  [{snap['kind']}] {snap['name']}: 当前上限 {snap['limit']}，峰值并发 {snap['peak_in_flight']}，"
+                     f"增加 {snap['increases']} 次，减少: {decreases}")
+    return "\n".join(lines)
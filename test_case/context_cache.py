@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型提供方的提示词前缀缓存
+同一测试组的所有问题共用一份提示词（表结构 + 规则），每次调用只有末尾的问题不同。
+提示词被拆成稳定前缀（组提示词，逐字节不变）和每个问题的后缀，前缀始终放在最前面：
+
+    - OpenAI: 自动前缀缓存，system 消息（组提示词）在前、用户问题在后；开启后额外传入
+              prompt_cache_key（组提示词的哈希），让同组请求路由到同一缓存
+    - Gemini: 显式上下文缓存，每个 (API Key, 模型, 组提示词) 创建一个 CachedContent
+              （提示词作为 system_instruction），后续调用只发送问题后缀；
+              剩余有效期不足 REFRESH_FRACTION 时延长 TTL，失效时重新创建，进程退出时删除
+
+缓存命中的 token 数（OpenAI prompt_tokens_details.cached_tokens、Gemini cached_content_token_count）
+记录在每个结果的 cached_tokens 字段中，无论是否开启本模块。
+
+用法:
+    from test_case import context_cache
+    context_cache.REGISTRY.configure(enabled=True, ttl=3600)
+    model_instance = context_cache.REGISTRY.gemini_model(genai, api_key, model, prompt)
+"""
+
+import atexit
+import datetime
+import hashlib
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from test_case import metrics, schema_catalog
+
+DEFAULT_TTL = 3600
+
+# 剩余有效期低于 TTL 的该比例时延长
+REFRESH_FRACTION = 0.2
+
+# 低于该 token 数的提示词不创建显式缓存（Gemini 显式缓存有最小 token 数要求，各模型不同）
+DEFAULT_MIN_TOKENS = 1024
+
+
+def question_suffix(question: str) -> str:
+    """每个问题不同的后缀（接在稳定前缀之后）"""
+    return f"用户问题：{question}\n\n请只返回 SQL 语句："
+
+
+def split_prompt(prompt: str, question: str) -> Tuple[str, str]:
+    """拆分为 (稳定前缀, 问题后缀)；prefix + "\\n\\n" + suffix 即完整的单段提示词"""
+    return prompt, question_suffix(question)
+
+
+def full_prompt(prompt: str, question: str) -> str:
+    """不支持分段时使用的完整提示词（前缀在前）"""
+    prefix, suffix = split_prompt(prompt, question)
+    return f"{prefix}\n\n{suffix}"
+
+
+def prompt_digest(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def prompt_cache_key(prompt: str) -> str:
+    """OpenAI prompt_cache_key：同一组提示词得到相同的键"""
+    return f"text2sql-{prompt_digest(prompt)[:16]}"
+
+
+def is_cache_error(error: Exception) -> bool:
+    """调用失败是否由缓存失效引起（此时应丢弃缓存并改用不带缓存的调用）"""
+    message = str(error)
+    lowered = message.lower()
+    if "cachedcontent" in lowered or "cached content" in lowered:
+        return True
+    return ("NOT_FOUND" in message or "404" in message) and "cache" in lowered
+
+
+class _GeminiEntry:
+    """一个组提示词在一个模型上的显式缓存"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cached = None            # genai.caching.CachedContent
+        self.model_instance = None    # 绑定到该缓存的 GenerativeModel
+        self.expires_at = 0.0         # time.monotonic() 时间
+        self.unavailable: Optional[str] = None  # 无法缓存的原因（不再重试）
+
+
+class ContextCacheRegistry:
+    """提示词前缀缓存的全局状态（线程安全）"""
+
+    def __init__(self):
+        self.enabled = False
+        self.ttl = DEFAULT_TTL
+        self.min_tokens = DEFAULT_MIN_TOKENS
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str, str], _GeminiEntry] = {}
+        self._atexit_registered = False
+        self._totals = metrics.Counts()
+
+    def configure(self, enabled: bool = True, ttl: int = DEFAULT_TTL,
+                  min_tokens: int = DEFAULT_MIN_TOKENS) -> None:
+        self.enabled = enabled
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+
+    def openai_kwargs(self, prompt: str) -> Dict:
+        """OpenAI 请求的额外参数（通过 extra_body 传入，兼容不认识 prompt_cache_key 的旧版 SDK）"""
+        if not self.enabled:
+            return {}
+        return {"extra_body": {"prompt_cache_key": prompt_cache_key(prompt)}}
+
+    def _count(self, name, amount: int = 1) -> None:
+        for counts in metrics.counts_to_update("context_cache", self._totals):
+            counts.add(name, amount)
+
+    def _entry(self, key: Tuple[str, str, str]) -> _GeminiEntry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _GeminiEntry()
+            return entry
+
+    def gemini_model(self, genai, api_key: str, model: str, prompt: str):
+        """获取绑定到组提示词缓存的 Gemini 模型实例
+
+        Returns:
+            未开启、提示词过短或创建失败时返回 None（调用方改用不带缓存的完整提示词）
+        """
+        if not self.enabled or getattr(genai, "caching", None) is None:
+            return None
+        key = (api_key, model, prompt_digest(prompt))
+        entry = self._entry(key)
+        self._count(("calls",) + key)
+        with entry.lock:
+            if entry.unavailable is not None:
+                return None
+            now = time.monotonic()
+            if entry.cached is not None and entry.expires_at - now < self.ttl * REFRESH_FRACTION:
+                self._refresh(entry, now)
+            if entry.cached is None:
+                if schema_catalog.estimate_tokens(prompt) < self.min_tokens:
+                    entry.unavailable = f"提示词少于 {self.min_tokens} tokens"
+                    return None
+                self._create(genai, entry, model, prompt, now)
+                if entry.cached is None:
+                    return None
+            self._count(("uses",) + key)
+            return entry.model_instance
+
+    def _create(self, genai, entry: _GeminiEntry, model: str, prompt: str, now: float) -> None:
+        try:
+            cached = genai.caching.CachedContent.create(
+                model=model,
+                display_name=prompt_cache_key(prompt),
+                system_instruction=prompt,
+                ttl=datetime.timedelta(seconds=self.ttl),
+            )
+            model_instance = genai.GenerativeModel.from_cached_content(cached_content=cached)
+        except Exception as e:
+            # 模型不支持显式缓存或提示词低于该模型的最小 token 数：本次运行不再尝试
+            entry.unavailable = str(e).split("\n", 1)[0][:200]
+            self._count("failures")
+            return
+        entry.cached = cached
+        entry.model_instance = model_instance
+        entry.expires_at = now + self.ttl
+        self._count("created")
+        with self._lock:
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def _refresh(self, entry: _GeminiEntry, now: float) -> None:
+        """延长即将过期的缓存；失败时丢弃，由调用方重新创建"""
+        try:
+            entry.cached.update(ttl=datetime.timedelta(seconds=self.ttl))
+        except Exception:
+            entry.cached = None
+            entry.model_instance = None
+            self._count("recreated")
+            return
+        entry.expires_at = now + self.ttl
+        self._count("refreshed")
+
+    def invalidate(self, api_key: str, model: str, prompt: str) -> None:
+        """缓存在服务端已失效（被删除或过期）：丢弃本地记录，下次调用重新创建"""
+        entry = self._entry((api_key, model, prompt_digest(prompt)))
+        with entry.lock:
+            entry.cached = None
+            entry.model_instance = None
+        self._count("invalidated")
+
+    def close(self) -> None:
+        """删除本进程创建的全部缓存（避免按存储时长计费到 TTL 结束）"""
+        with self._lock:
+            entries = list(self._entries.values())
+        for entry in entries:
+            with entry.lock:
+                if entry.cached is not None:
+                    try:
+                        entry.cached.delete()
+                    except Exception:
+                        pass
+                    entry.cached = None
+                    entry.model_instance = None
+
+    def snapshot(self) -> Optional[Dict]:
+        """缓存统计（写入结果文件的 statistics.context_cache 字段，在 run_scope() 中时只含本次运行用到的缓存）；
+        未开启时返回 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entries = list(self._entries.items())
+        counts = metrics.counts_to_report("context_cache", self._totals)
+        counters = {name: counts.get(name) for name in ("created", "refreshed", "recreated", "invalidated", "failures")}
+        caches: List[Dict] = []
+        for key, entry in entries:
+            if not counts.get(("calls",) + key):
+                continue
+            _, model, digest = key
+            caches.append({"model": model, "prompt_sha256": digest[:16], "uses": counts.get(("uses",) + key),
+                           "active": entry.cached is not None, "unavailable": entry.unavailable})
+        return {"ttl": self.ttl, **counters, "gemini_caches": caches}
+
+
+REGISTRY = ContextCacheRegistry()
+
+
+def format_console(snapshot: Dict) -> str:
+    lines = [f"提示词前缀缓存（TTL {snapshot['ttl']}s）: Gemini 显式缓存创建 {snapshot['created']} 个，"
+             f"延长 {snapshot['refreshed']} 次，重建 {snapshot['recreated'] + snapshot['invalidated']} 次，"
+             f"创建失败 {snapshot['failures']} 次"]
+    for cache in snapshot["gemini_caches"]:
+        if cache["unavailable"]:
+            lines.append(f"  {cache['model']} [{cache['prompt_sha256']}]: 未缓存（{cache['unavailable']}）")
+        else:
+            lines.append(f"  {cache['model']} [{cache['prompt_sha256']}]: 使用 {cache['uses']} 次")
+    return "\n".join(lines)
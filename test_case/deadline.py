@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试项截止时间与优雅停止
+
+每个测试项（问题 × 模型）有一个总的时间预算，覆盖模型生成、重试和数据库执行。
+预算按线程记录，模型 SDK 调用和数据库查询通过 remaining() 取得剩余时间作为超时参数：
+
+    with deadline.scope(120):
+        ...
+        client.chat.completions.create(..., **deadline.timeout_kwargs())
+
+GracefulShutdown 接管 SIGTERM/SIGINT：
+    - 第一次收到信号：停止调度新的测试项，进行中的测试项最多再等待 grace_period 秒
+    - 宽限期结束或再次收到信号：中止进行中的测试项（抛出 Cancelled），由调用方写出已有结果
+    - request()：其他线程（任务调度器）请求停止，效果同第一次收到信号，但不设置全局宽限期
+"""
+
+import _thread
+import contextlib
+import signal
+import threading
+import time
+from typing import Dict, Optional
+
+# 单个测试项的默认时间预算（秒）
+DEFAULT_DEADLINE = 120.0
+
+# 收到停止信号后等待进行中测试项的默认宽限期（秒）
+DEFAULT_GRACE_PERIOD = 30.0
+
+
+class DeadlineExceeded(TimeoutError):
+    """测试项超过时间预算"""
+
+    def __init__(self, stage: str, budget: float):
+        super().__init__(f"超过测试项时间预算（{budget:g}s），在 {stage} 阶段中止")
+        self.stage = stage
+        self.budget = budget
+
+
+class Cancelled(BaseException):
+    """运行被停止信号中止（与 KeyboardInterrupt 一样不被 except Exception 捕获）"""
+
+
+class Deadline:
+    """一个测试项的截止时间"""
+
+    __slots__ = ("budget", "expires_at")
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        """剩余秒数（停止信号的宽限期更早结束时以宽限期为准）"""
+        expires_at = self.expires_at
+        if _cancel_at is not None and _cancel_at < expires_at:
+            expires_at = _cancel_at
+        return max(0.0, expires_at - time.monotonic())
+
+    def check(self, stage: str) -> None:
+        """时间已用完时抛出 DeadlineExceeded"""
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(stage, self.budget)
+
+
+_local = threading.local()
+
+# 停止信号宽限期的结束时间（monotonic），None 表示未收到停止信号
+_cancel_at: Optional[float] = None
+
+
+@contextlib.contextmanager
+def scope(budget: Optional[float]):
+    """在当前线程内为一个测试项设置时间预算；budget 为空或 <= 0 时不限制"""
+    previous = getattr(_local, "deadline", None)
+    _local.deadline = Deadline(budget) if budget and budget > 0 else None
+    try:
+        yield _local.deadline
+    finally:
+        _local.deadline = previous
+
+
+@contextlib.contextmanager
+def attach(active: Optional[Deadline]):
+    """在当前线程内沿用一个已有的截止时间（流水线中同一测试项的各阶段在不同线程执行）"""
+    previous = getattr(_local, "deadline", None)
+    _local.deadline = active
+    try:
+        yield active
+    finally:
+        _local.deadline = previous
+
+
+def current() -> Optional[Deadline]:
+    return getattr(_local, "deadline", None)
+
+
+def remaining() -> Optional[float]:
+    """当前测试项的剩余秒数；未设置预算时返回 None"""
+    active = getattr(_local, "deadline", None)
+    return active.remaining() if active is not None else None
+
+
+def check(stage: str) -> None:
+    """当前测试项已超时时抛出 DeadlineExceeded（未设置预算时不做任何事）"""
+    active = getattr(_local, "deadline", None)
+    if active is not None:
+        active.check(stage)
+
+
+def timeout_kwargs(name: str = "timeout") -> Dict[str, float]:
+    """把剩余时间转换为 SDK 调用的超时参数（未设置预算时返回空字典，沿用 SDK 默认值）"""
+    left = remaining()
+    if left is None:
+        return {}
+    # 剩余时间为 0 时仍给出一个极短的超时，让 SDK 立即失败而不是无限等待
+    return {name: max(left, 0.001)}
+
+
+class GracefulShutdown:
+    """接管 SIGTERM/SIGINT，实现"停止调度 → 宽限期 → 中止进行中的测试项"
+
+    只能在主线程中安装信号处理器；在其他线程中使用时不做任何事。
+    进行中的测试项需包在 in_flight() 中，信号处理器只在测试项执行期间抛出 Cancelled，
+    其余时刻只记录停止请求，由调度循环通过 requested 自行退出。
+    """
+
+    def __init__(self, grace_period: float = DEFAULT_GRACE_PERIOD):
+        self.grace_period = grace_period
+        self.signal_name: Optional[str] = None
+        self._in_flight = 0
+        self._previous_handlers = {}
+        self._timer: Optional[threading.Timer] = None
+
+    @property
+    def requested(self) -> bool:
+        return self.signal_name is not None
+
+    @property
+    def signal_number(self) -> Optional[int]:
+        return int(getattr(signal, self.signal_name)) if self.signal_name else None
+
+    def __enter__(self):
+        global _cancel_at
+        _cancel_at = None
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                self._previous_handlers[signum] = signal.signal(signum, self._handle)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _cancel_at
+        if self._timer is not None:
+            self._timer.cancel()
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+        self._previous_handlers.clear()
+        _cancel_at = None
+        return False
+
+    @contextlib.contextmanager
+    def in_flight(self):
+        """标记一个正在执行的测试项（期间的第二次信号或宽限期结束会中止它）"""
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+
+    def request(self, signal_name: str = "SIGTERM") -> None:
+        """在其他线程中请求停止（任务调度器取消任务）：停止调度新的测试项
+
+        与信号不同，不设置全局宽限期，也不中止进行中的测试项（它们在各自的时间预算内结束），
+        以免影响同一进程中的其他运行。
+        """
+        if not self.requested:
+            self.signal_name = signal_name
+            print(f"\n收到取消请求（{signal_name}），停止调度新的测试项，等待进行中的测试项结束", flush=True)
+
+    def _handle(self, signum, frame):
+        global _cancel_at
+        if not self.requested:
+            self.signal_name = signal.Signals(signum).name
+            _cancel_at = time.monotonic() + self.grace_period
+            if self.grace_period > 0:
+                print(f"\n收到 {self.signal_name}，停止调度新的测试项；进行中的测试项最多再等待 "
+                      f"{self.grace_period:g} 秒（再次发送信号立即中止）", flush=True)
+                self._timer = threading.Timer(self.grace_period, self._expire)
+                self._timer.daemon = True
+                self._timer.start()
+                return
+            print(f"\n收到 {self.signal_name}，中止运行", flush=True)
+        else:
+            _cancel_at = time.monotonic()
+        if self._in_flight:
+            raise Cancelled(self.signal_name)
+        print("正在保存已完成的结果，请稍候...", flush=True)
+
+    def _expire(self):
+        """宽限期结束：若仍有测试项在执行，在主线程中触发一次信号处理以中止它"""
+        if self._in_flight:
+            print("\n宽限期已到，中止进行中的测试项", flush=True)
+            _thread.interrupt_main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多模型对比的顺序提前停止
+同一测试组内的多个模型按问题交替执行，每轮后用 Wilson 置信区间估计各模型的成功率
+（成功执行计为成功，危险 SQL 和其他失败计为失败），满足以下任一条件的模型不再继续：
+    - dominated: 另一个模型的置信下界高于它的置信上界（已确定更差）
+    - pinned:    置信区间半宽不超过 tolerance（成功率已足够精确）
+两条规则都只在样本数达到 min_samples 后生效。被停止的模型不再消耗调用，节省的测试项数量计入报告。
+
+每轮都检查一次会放大误停的概率，因此 1 - confidence 按 Bonferroni 分配到每次检查和每个模型：
+已知问题数时每次检查分到 α / (最多检查次数 × 模型数)；流式模式下问题数未知，第 k 次检查分到
+α · 6 / (π² k²) / 模型数（各次之和不超过 α）。所有模型的区间在所有检查中同时成立的概率不低于 confidence，
+因此任意两两比较和精度判断的总误停概率不超过 1 - confidence。报告中的置信区间是最后一次检查使用的校正区间。
+"""
+
+import math
+import random
+from statistics import NormalDist
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MIN_SAMPLES = 10
+DEFAULT_TOLERANCE = 0.05
+
+ACTIVE = "active"
+DOMINATED = "dominated"
+PINNED = "pinned"
+
+
+def wilson_interval(successes: int, n: int, confidence: float = DEFAULT_CONFIDENCE) -> Tuple[float, float]:
+    """成功率的 Wilson 置信区间（0-1）；没有样本时返回 (0, 1)"""
+    if n <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    margin = z * ((p * (1 - p) / n + z * z / (4 * n * n)) ** 0.5) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def shuffled(questions: Sequence[str], group_name: str) -> List[str]:
+    """按测试组名固定种子打乱问题顺序（避免按难度排序的问题集让前若干题的成功率偏高或偏低）"""
+    order = list(questions)
+    random.Random(group_name).shuffle(order)
+    return order
+
+
+class SequentialEvaluator:
+    """一个测试组内多个模型的顺序评估状态"""
+
+    def __init__(self, group_name: str, models: Sequence[Tuple[str, str]],
+                 confidence: float = DEFAULT_CONFIDENCE, min_samples: int = DEFAULT_MIN_SAMPLES,
+                 tolerance: float = DEFAULT_TOLERANCE, max_questions: Optional[int] = None):
+        """
+        Args:
+            group_name: 测试组名称
+            models: 参与对比的 (model_type, model_name) 列表
+            confidence: 整个评估过程的置信水平（0-1），按检查次数和模型数校正后用于每次检查
+            min_samples: 每个模型至少执行的问题数
+            tolerance: 置信区间半宽不超过该值时视为成功率已确定
+            max_questions: 测试组的问题数（决定最多检查次数）；为空时（流式模式）按检查序号递减分配
+        """
+        self.group_name = group_name
+        self.confidence = confidence
+        self.min_samples = min_samples
+        self.tolerance = tolerance
+        self.max_looks = max(1, max_questions - min_samples + 1) if max_questions else None
+        self.looks = 0
+        self.models = {model: {"n": 0, "successes": 0, "status": ACTIVE, "reason": None,
+                               "stopped_after": None, "skipped": 0} for model in models}
+
+    def active(self) -> List[Tuple[str, str]]:
+        return [model for model, state in self.models.items() if state["status"] == ACTIVE]
+
+    def look_confidence(self, look: int) -> float:
+        """第 look 次检查（从 1 开始）使用的校正后置信水平"""
+        alpha = 1 - self.confidence
+        if self.max_looks:
+            share = alpha / self.max_looks
+        else:
+            share = alpha * 6 / (math.pi ** 2 * look ** 2)
+        return 1 - share / max(1, len(self.models))
+
+    @property
+    def adjusted_confidence(self) -> float:
+        """最近一次检查使用的校正后置信水平（还没有检查时为第一次检查的水平）"""
+        return self.look_confidence(max(1, self.looks))
+
+    def interval(self, model: Tuple[str, str]) -> Tuple[float, float]:
+        state = self.models[model]
+        return wilson_interval(state["successes"], state["n"], self.adjusted_confidence)
+
+    def record(self, model: Tuple[str, str], success: bool) -> None:
+        state = self.models[model]
+        state["n"] += 1
+        state["successes"] += 1 if success else 0
+
+    def skip(self, model: Tuple[str, str]) -> None:
+        """记录一个因提前停止而跳过的测试项"""
+        self.models[model]["skipped"] += 1
+
+    def update(self) -> List[Tuple[Tuple[str, str], str]]:
+        """一轮问题结束后检查停止条件
+
+        Returns:
+            List[Tuple[Tuple[str, str], str]]: 本轮被停止的 (模型, 原因说明)
+        """
+        if not any(self.models[model]["n"] >= self.min_samples for model in self.active()):
+            return []
+        self.looks += 1
+        intervals = {model: self.interval(model) for model in self.models}
+        stopped = []
+        for model in self.active():
+            state = self.models[model]
+            if state["n"] < self.min_samples:
+                continue
+            lower, upper = intervals[model]
+            dominator = next((other for other, (other_lower, _) in intervals.items()
+                              if other != model and self.models[other]["n"] >= self.min_samples
+                              and other_lower > upper), None)
+            if dominator is not None:
+                state["status"] = DOMINATED
+                state["reason"] = f"被 {dominator[1]} 支配（其下界 {intervals[dominator][0] * 100:.1f}% > 上界 {upper * 100:.1f}%）"
+            elif (upper - lower) / 2 <= self.tolerance:
+                state["status"] = PINNED
+                state["reason"] = f"置信区间半宽 {(upper - lower) / 2 * 100:.1f}% ≤ {self.tolerance * 100:.1f}%"
+            else:
+                continue
+            state["stopped_after"] = state["n"]
+            stopped.append((model, state["reason"]))
+        return stopped
+
+    def summary(self) -> List[Dict]:
+        rows = []
+        for (model_type, model_name), state in self.models.items():
+            lower, upper = self.interval((model_type, model_name))
+            rows.append({
+                "group": self.group_name,
+                "model_type": model_type,
+                "model": model_name,
+                "evaluated": state["n"],
+                "successes": state["successes"],
+                "success_rate": state["successes"] / state["n"] * 100 if state["n"] else None,
+                "ci_lower": lower * 100,
+                "ci_upper": upper * 100,
+                "adjusted_confidence": self.adjusted_confidence,
+                "looks": self.looks,
+                "status": state["status"],
+                "reason": state["reason"],
+                "skipped": state["skipped"],
+            })
+        return rows
+
+
+def summarize(evaluators: Sequence[SequentialEvaluator], confidence: float, min_samples: int,
+              tolerance: float) -> Dict:
+    """汇总所有测试组的提前停止结果（写入结果文件的 early_stopping 字段）"""
+    rows = [row for evaluator in evaluators for row in evaluator.summary()]
+    evaluated = sum(row["evaluated"] for row in rows)
+    skipped = sum(row["skipped"] for row in rows)
+    return {
+        "confidence": confidence,
+        "min_samples": min_samples,
+        "tolerance": tolerance,
+        "evaluated_items": evaluated,
+        "skipped_items": skipped,
+        "saved_rate": skipped / (evaluated + skipped) * 100 if evaluated + skipped else 0,
+        "models": rows,
+    }
+
+
+def format_console(summary: Dict) -> str:
+    lines = [f"顺序提前停止（置信水平 {summary['confidence'] * 100:g}%，按检查次数和模型数校正，"
+             f"最少 {summary['min_samples']} 题，精度 ±{summary['tolerance'] * 100:g}%）:"]
+    for row in summary["models"]:
+        rate = "-" if row["success_rate"] is None else f"{row['success_rate']:.1f}%"
+        status = {ACTIVE: "完成全部问题", DOMINATED: "提前停止", PINNED: "提前停止"}[row["status"]]
+        alpha = 1 - row["adjusted_confidence"]
+        line = (f"  [{row['group']}] {row['model']}: 成功率 {rate}，校正后置信区间（α {alpha:.1e}）"
+                f"[{row['ci_lower']:.1f}%, {row['ci_upper']:.1f}%]，执行 {row['evaluated']} 题，{status}")
+        if row["reason"]:
+            line += f"（{row['reason']}，节省 {row['skipped']} 题）"
+        lines.append(line)
+    lines.append(f"  共节省 {summary['skipped_items']} 个测试项（{summary['saved_rate']:.1f}%），"
+                 f"实际执行 {summary['evaluated_items']} 个")
+    return "\n".join(lines)
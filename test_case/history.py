@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行历史库
+把每次运行的结果写入本地 SQLite 数据库（默认 test_case/history.db），记录运行元数据
+（git 版本、模型、各组提示词哈希），用于查看延迟、token/费用和成功率的变化趋势，
+并与选定的基线运行对比、标记退化。
+
+用法:
+    python test_case/test_text2sql.py history ingest test_case/test_results.json --label baseline
+    python test_case/test_text2sql.py history list
+    python test_case/test_text2sql.py history trend --model gpt-4o --metric generation_p90
+    python test_case/test_text2sql.py history compare --baseline baseline
+    python test_case/test_text2sql.py history regressions --baseline 12 --pricing pricing.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from test_case import report
+
+DEFAULT_HISTORY_DB = os.path.join(os.path.dirname(__file__), "history.db")
+
+# 按模型（group 为空）和模型 × 测试组保存的统计字段
+STAT_FIELDS = [
+    "total", "success", "failed", "dangerous", "reused", "cache_hits",
+    "success_rate", "dangerous_rate",
+    "generation_p50", "generation_p90", "generation_p95", "generation_p99",
+    "db_p50", "db_p90", "db_p95", "db_p99",
+    "prompt_tokens", "completion_tokens", "cost",
+]
+
+# 可用于趋势和对比的指标
+LATENCY_METRICS = ["generation_p50", "generation_p90", "generation_p99", "db_p90"]
+TREND_METRICS = ["success_rate"] + LATENCY_METRICS + ["tokens_per_question", "cost"]
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ingested_at TEXT NOT NULL,
+    test_time TEXT,
+    source_file TEXT,
+    content_sha256 TEXT UNIQUE,
+    label TEXT,
+    git_rev TEXT,
+    git_dirty INTEGER,
+    harness_version TEXT,
+    models TEXT,
+    prompt_hashes TEXT,
+    total_results INTEGER
+);
+CREATE TABLE IF NOT EXISTS stats (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    model_type TEXT NOT NULL,
+    model TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    {", ".join(f"{field} REAL" for field in STAT_FIELDS)},
+    PRIMARY KEY (run_id, model_type, model, group_name)
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    model_type TEXT,
+    model TEXT,
+    group_name TEXT,
+    question TEXT,
+    input_hash TEXT,
+    success INTEGER,
+    is_dangerous INTEGER,
+    failed_stage TEXT,
+    generation_time REAL,
+    db_time REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_results_run ON results(run_id, model_type, model);
+"""
+
+
+def connect(db_path: str = DEFAULT_HISTORY_DB) -> sqlite3.Connection:
+    """打开（必要时创建）历史库"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _git_revision() -> Tuple[Optional[str], Optional[bool]]:
+    """返回测试框架代码的 (当前提交, 工作区是否有未提交修改)；不在 git 仓库中时返回 (None, None)"""
+    import subprocess
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        rev = subprocess.run(["git", "rev-parse", "HEAD"], cwd=cwd, capture_output=True,
+                             text=True, timeout=5, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                               capture_output=True, text=True, timeout=5, check=True).stdout.strip()
+        return rev, bool(dirty)
+    except (OSError, subprocess.SubprocessError):
+        return None, None
+
+
+def prompt_hash(prompt: Optional[str]) -> Optional[str]:
+    """提示词的短哈希（sha256 前 16 位），用于识别提示词变化"""
+    if prompt is None:
+        return None
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ingest(conn: sqlite3.Connection, results_file: str, label: str = None,
+           pricing: Dict = None) -> Optional[int]:
+    """把一个结果文件写入历史库
+
+    Args:
+        conn: 历史库连接
+        results_file: test_results.json 或 JSONL 结果文件
+        label: 运行标签（如 "baseline"），可用于 compare 时指定基线
+        pricing: 模型单价表（report.load_pricing 的返回值），用于计算费用
+
+    Returns:
+        Optional[int]: 新运行的 run_id；同一文件内容已入库时返回 None
+    """
+    content_sha = _file_sha256(results_file)
+    existing = conn.execute("SELECT run_id FROM runs WHERE content_sha256 = ?", (content_sha,)).fetchone()
+    if existing:
+        return None
+
+    rows = list(report.iter_result_rows([results_file]))
+    statistics = report.aggregate(report.ResultColumns.from_results(rows), pricing or {})
+
+    test_time = None
+    harness_version = None
+    prompt_hashes = {}
+    if results_file.endswith(".json"):
+        with open(results_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        test_time = data.get("test_time")
+        harness_version = data.get("harness_version")
+        for group in data.get("test_groups", []):
+            prompt_hashes[group.get("name", "")] = prompt_hash(group.get("prompt"))
+    for row in rows:
+        group_name = row.get("group_name") or ""
+        if group_name not in prompt_hashes:
+            if row.get("prompt") is not None:
+                prompt_hashes[group_name] = prompt_hash(row["prompt"])
+            elif row.get("prompt_hash"):
+                prompt_hashes[group_name] = row["prompt_hash"]
+    models = sorted({f"{row.get('model_type', '')}/{row.get('model_name', '')}" for row in rows})
+    git_rev, git_dirty = _git_revision()
+
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO runs (ingested_at, test_time, source_file, content_sha256, label, git_rev, git_dirty, "
+            "harness_version, models, prompt_hashes, total_results) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (datetime.now().isoformat(), test_time, os.path.abspath(results_file), content_sha, label,
+             git_rev, None if git_dirty is None else int(git_dirty), harness_version,
+             json.dumps(models, ensure_ascii=False), json.dumps(prompt_hashes, ensure_ascii=False), len(rows)))
+        run_id = cursor.lastrowid
+        placeholders = ", ".join("?" * (len(STAT_FIELDS) + 4))
+        conn.executemany(
+            f"INSERT INTO stats (run_id, model_type, model, group_name, {', '.join(STAT_FIELDS)}) "
+            f"VALUES ({placeholders})",
+            [(run_id, stat["model_type"], stat["model"], stat["group"] or "",
+              *(stat.get(field) for field in STAT_FIELDS))
+             for stat in statistics["models"] + statistics["groups"]])
+        conn.executemany(
+            "INSERT INTO results (run_id, model_type, model, group_name, question, input_hash, success, "
+            "is_dangerous, failed_stage, generation_time, db_time, prompt_tokens, completion_tokens) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(run_id, row.get("model_type"), row.get("model_name"), row.get("group_name"), row.get("question"),
+              row.get("input_hash"), int(bool(row.get("success"))), int(bool(row.get("is_dangerous"))),
+              row.get("failed_stage"), row.get("generation_time"), row.get("db_time"),
+              row.get("prompt_tokens") or 0, row.get("completion_tokens") or 0)
+             for row in rows])
+    return run_id
+
+
+def resolve_run(conn: sqlite3.Connection, ref: Optional[str]) -> Optional[sqlite3.Row]:
+    """按 run_id 或标签查找运行（同一标签取最近一次）；ref 为空时返回最近一次运行"""
+    if ref:
+        if ref.isdigit():
+            run = conn.execute("SELECT * FROM runs WHERE run_id = ?", (int(ref),)).fetchone()
+            if run:
+                return run
+        return conn.execute("SELECT * FROM runs WHERE label = ? ORDER BY run_id DESC LIMIT 1", (ref,)).fetchone()
+    return conn.execute("SELECT * FROM runs ORDER BY run_id DESC LIMIT 1").fetchone()
+
+
+def _metric_value(stat: sqlite3.Row, metric: str, pricing: Dict) -> Optional[float]:
+    """从统计行读取指标；费用在入库时未计算时按单价表从 token 数推算"""
+    if metric == "tokens_per_question":
+        total = stat["total"] - stat["reused"]
+        return (stat["prompt_tokens"] + stat["completion_tokens"]) / total if total > 0 else None
+    if metric == "cost":
+        price = pricing.get(stat["model"])
+        if price:
+            return (stat["prompt_tokens"] * price.get("prompt", 0)
+                    + stat["completion_tokens"] * price.get("completion", 0)) / 1_000_000
+        return stat["cost"]
+    return stat[metric]
+
+
+def _load_stats(conn: sqlite3.Connection, run_id: int, by_group: bool) -> Dict:
+    condition = "group_name != ''" if by_group else "group_name = ''"
+    return {(row["model_type"], row["model"], row["group_name"]): row
+            for row in conn.execute(f"SELECT * FROM stats WHERE run_id = ? AND {condition}", (run_id,))}
+
+
+def compare_runs(conn: sqlite3.Connection, baseline_id: int, run_id: int, by_group: bool = False,
+                 pricing: Dict = None, latency_threshold: float = 0.2, cost_threshold: float = 0.1,
+                 success_drop: float = 5.0) -> List[Dict]:
+    """对比两次运行，返回每个模型（或模型 × 测试组）的指标变化
+
+    Args:
+        latency_threshold: 延迟分位数相对增长超过该比例视为退化
+        cost_threshold: 费用或单题 token 相对增长超过该比例视为退化
+        success_drop: 成功率下降超过该百分点视为退化
+
+    Returns:
+        List[Dict]: 每项包含 key、metric、baseline、current、change、regression
+    """
+    pricing = pricing or {}
+    baseline = _load_stats(conn, baseline_id, by_group)
+    current = _load_stats(conn, run_id, by_group)
+    rows = []
+    for key in sorted(set(baseline) & set(current)):
+        for metric in TREND_METRICS:
+            before = _metric_value(baseline[key], metric, pricing)
+            after = _metric_value(current[key], metric, pricing)
+            if before is None or after is None:
+                continue
+            if metric == "success_rate":
+                change = after - before
+                regression = -change > success_drop
+            else:
+                change = (after - before) / before if before else (0.0 if after == before else float("inf"))
+                threshold = latency_threshold if metric in LATENCY_METRICS else cost_threshold
+                regression = change > threshold
+            rows.append({"model_type": key[0], "model": key[1], "group": key[2] or None, "metric": metric,
+                         "baseline": before, "current": after, "change": change, "regression": regression})
+    return rows
+
+
+def trend(conn: sqlite3.Connection, metric: str, model: str = None, group: str = None,
+          limit: int = 20, pricing: Dict = None) -> List[Dict]:
+    """按运行顺序列出指标变化"""
+    sql = ("SELECT s.*, r.test_time, r.ingested_at, r.label, r.git_rev FROM stats s "
+           "JOIN runs r ON r.run_id = s.run_id WHERE s.group_name = ?")
+    params: list = [group or ""]
+    if model:
+        sql += " AND s.model = ?"
+        params.append(model)
+    sql += " AND s.run_id IN (SELECT run_id FROM runs ORDER BY run_id DESC LIMIT ?) ORDER BY s.model_type, s.model, s.run_id"
+    params.append(limit)
+    return [{"run_id": row["run_id"], "test_time": row["test_time"] or row["ingested_at"], "label": row["label"],
+             "git_rev": (row["git_rev"] or "")[:10], "model_type": row["model_type"], "model": row["model"],
+             "value": _metric_value(row, metric, pricing or {})}
+            for row in conn.execute(sql, params)]
+
+
+def _fmt(metric: str, value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    if metric == "success_rate":
+        return f"{value:.2f}%"
+    if metric in LATENCY_METRICS:
+        return f"{value:.3f}s"
+    if metric == "cost":
+        return f"{value:.4f}"
+    return f"{value:.1f}"
+
+
+def _fmt_change(metric: str, change: float) -> str:
+    if metric == "success_rate":
+        return f"{change:+.2f}pp"
+    return f"{change * 100:+.1f}%"
+
+
+def print_comparison(baseline: sqlite3.Row, current: sqlite3.Row, rows: List[Dict],
+                     only_regressions: bool = False) -> None:
+    print("=" * 80)
+    print(f"基线: #{baseline['run_id']} {baseline['label'] or ''} ({baseline['test_time'] or baseline['ingested_at']}, "
+          f"git {(baseline['git_rev'] or '-')[:10]})")
+    print(f"当前: #{current['run_id']} {current['label'] or ''} ({current['test_time'] or current['ingested_at']}, "
+          f"git {(current['git_rev'] or '-')[:10]})")
+    baseline_prompts = json.loads(baseline["prompt_hashes"] or "{}")
+    current_prompts = json.loads(current["prompt_hashes"] or "{}")
+    changed = sorted(g for g in current_prompts if g in baseline_prompts and current_prompts[g] != baseline_prompts[g])
+    if changed:
+        print(f"提示词有变化的测试组: {', '.join(changed)}")
+    print("=" * 80)
+    last_key = None
+    for row in rows:
+        if only_regressions and not row["regression"]:
+            continue
+        key = (row["model_type"], row["model"], row["group"])
+        if key != last_key:
+            print(f"\n  {row['model_type']}/{row['model']}" + (f" [{row['group']}]" if row["group"] else ""))
+            last_key = key
+        flag = "  ⚠️ 退化" if row["regression"] else ""
+        print(f"    {row['metric']:<22} {_fmt(row['metric'], row['baseline']):>12} → "
+              f"{_fmt(row['metric'], row['current']):>12}  ({_fmt_change(row['metric'], row['change'])}){flag}")
+    regressions = sum(1 for row in rows if row["regression"])
+    print(f"\n共 {regressions} 项退化")
+
+
+def main(argv: List[str] = None) -> int:
+    """history 子命令入口"""
+    parser = argparse.ArgumentParser(prog="test_text2sql.py history", description="运行历史：入库、趋势和退化对比")
+    parser.add_argument("--db", default=DEFAULT_HISTORY_DB, help="历史库路径（默认: test_case/history.db）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_ingest = sub.add_parser("ingest", help="把结果文件写入历史库")
+    p_ingest.add_argument("results", nargs="+", help="结果文件（test_results.json 或 JSONL）")
+    p_ingest.add_argument("--label", default=None, help="运行标签（如 baseline）")
+    p_ingest.add_argument("--pricing", default=None, help="模型单价 JSON 文件（每百万 token 费用）")
+
+    p_list = sub.add_parser("list", help="列出已入库的运行")
+    p_list.add_argument("--limit", type=int, default=20)
+
+    p_trend = sub.add_parser("trend", help="查看指标随运行的变化")
+    p_trend.add_argument("--metric", choices=TREND_METRICS, default="success_rate")
+    p_trend.add_argument("--model", default=None)
+    p_trend.add_argument("--group", default=None, help="测试组（默认按模型汇总）")
+    p_trend.add_argument("--limit", type=int, default=20, help="最近的运行数")
+    p_trend.add_argument("--pricing", default=None)
+
+    for name, help_text in (("compare", "对比两次运行的全部指标"), ("regressions", "只列出相对基线退化的指标")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--baseline", default=None, help="基线运行（run_id 或标签，默认为上一次运行）")
+        p.add_argument("--run", default=None, help="要对比的运行（run_id 或标签，默认为最近一次运行）")
+        p.add_argument("--by-group", action="store_true", help="按模型 × 测试组对比")
+        p.add_argument("--pricing", default=None)
+        p.add_argument("--latency-threshold", type=float, default=0.2, help="延迟分位数相对增长阈值（默认 0.2）")
+        p.add_argument("--cost-threshold", type=float, default=0.1, help="费用/单题 token 相对增长阈值（默认 0.1）")
+        p.add_argument("--success-drop", type=float, default=5.0, help="成功率下降阈值，百分点（默认 5）")
+
+    args = parser.parse_args(argv)
+    conn = connect(args.db)
+    pricing = report.load_pricing(getattr(args, "pricing", None))
+
+    if args.command == "ingest":
+        for path in args.results:
+            if not os.path.exists(path):
+                print(f"错误: 结果文件不存在: {path}", file=sys.stderr)
+                return 1
+            run_id = ingest(conn, path, label=args.label, pricing=pricing)
+            if run_id is None:
+                print(f"跳过（内容已入库）: {path}")
+            else:
+                print(f"已入库: {path} → 运行 #{run_id}")
+        return 0
+
+    if args.command == "list":
+        print(f"{'run':>5}  {'测试时间':<26} {'标签':<12} {'git':<11} {'结果数':>6}  模型")
+        for run in conn.execute("SELECT * FROM runs ORDER BY run_id DESC LIMIT ?", (args.limit,)):
+            rev = (run["git_rev"] or "-")[:10] + ("*" if run["git_dirty"] else "")
+            print(f"{run['run_id']:>5}  {(run['test_time'] or run['ingested_at']):<26} {run['label'] or '':<12} "
+                  f"{rev:<11} {run['total_results']:>6}  {', '.join(json.loads(run['models'] or '[]'))}")
+        return 0
+
+    if args.command == "trend":
+        rows = trend(conn, args.metric, model=args.model, group=args.group, limit=args.limit, pricing=pricing)
+        last_model = None
+        for row in rows:
+            if (row["model_type"], row["model"]) != last_model:
+                last_model = (row["model_type"], row["model"])
+                print(f"\n{row['model_type']}/{row['model']} - {args.metric}" + (f" [{args.group}]" if args.group else ""))
+            print(f"  #{row['run_id']:<5} {row['test_time']:<26} {row['git_rev']:<10} "
+                  f"{_fmt(args.metric, row['value']):>12}  {row['label'] or ''}")
+        return 0
+
+    current = resolve_run(conn, args.run)
+    baseline = None
+    if args.baseline:
+        baseline = resolve_run(conn, args.baseline)
+    elif current is not None:
+        baseline = conn.execute("SELECT * FROM runs WHERE run_id < ? ORDER BY run_id DESC LIMIT 1",
+                                (current["run_id"],)).fetchone()
+    if current is None or baseline is None:
+        print("错误: 找不到要对比的运行（至少需要两次已入库的运行）", file=sys.stderr)
+        return 1
+    rows = compare_runs(conn, baseline["run_id"], current["run_id"], by_group=args.by_group, pricing=pricing,
+                        latency_threshold=args.latency_threshold, cost_threshold=args.cost_threshold,
+                        success_drop=args.success_drop)
+    print_comparison(baseline, current, rows, only_regressions=args.command == "regressions")
+    return 1 if args.command == "regressions" and any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,657 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+索引建议
+从已保存的结果中取出全部执行成功的 SQL，统计每张表的列在谓词、连接和排序/分组中的使用情况，
+结合现有索引（提示词中的 DDL，或 --explain 时读取 INFORMATION_SCHEMA）和 EXPLAIN 输出，
+给出按收益排序的索引和生成列建议：
+
+    - 索引：同一查询形状中的等值/连接列（按全局使用频率排序）+ 一个范围列；没有范围列时接上排序列。
+            已被现有索引（含主键）覆盖的候选会被跳过，是其他候选前缀的候选合并到更长的候选中
+    - 生成列：被函数包裹的列（DATE(col)、STR_TO_DATE、JSON_EXTRACT / ->>、LOWER 等）无法使用普通索引，
+              建议添加虚拟生成列并建索引（MySQL 8.0.13+ 也可改用函数索引）
+    - 提示：用字符串保存的日期列、对 TEXT/JSON 列的 LIKE '%...%' 等无法靠索引解决的问题
+
+收益估计：影响的查询数、EXPLAIN 中的全表扫描次数和扫描行数、这些查询的数据库耗时合计。
+没有 --explain 时只按查询数和数据库耗时排序。
+
+用法:
+    python test_case/test_text2sql.py indexes test_case/test_results.json
+    python test_case/test_text2sql.py indexes results.jsonl --testcase test_case/testcase.json --explain
+    python test_case/test_text2sql.py indexes test_case/test_results.json --format json --output indexes.json
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from test_case import report, schema_catalog, sql_analysis
+import test_case.test_text2sql as t2s
+
+DEFAULT_TOP = 10
+
+# 执行 EXPLAIN 的查询形状数上限（按出现次数取前 N 个）
+DEFAULT_EXPLAIN_LIMIT = 50
+
+# TEXT/BLOB 列建索引时使用的前缀长度
+TEXT_PREFIX_LENGTH = 64
+
+# 被视为全表扫描的 EXPLAIN type
+FULL_SCAN_TYPES = {"ALL", "index"}
+
+# 像日期/时间的列名
+_DATE_LIKE_NAME = re.compile(r"(?:^|_)(?:date|time|day|at)$", re.I)
+
+# 生成列类型：外层函数 -> 列类型
+_GENERATED_TYPES = {
+    "DATE": "DATE",
+    "YEAR": "SMALLINT",
+    "MONTH": "TINYINT",
+    "DAY": "TINYINT",
+    "DAYOFMONTH": "TINYINT",
+    "HOUR": "TINYINT",
+    "TIMESTAMP": "DATETIME",
+    "LOWER": "VARCHAR(255)",
+    "UPPER": "VARCHAR(255)",
+    "TRIM": "VARCHAR(255)",
+    "LEFT": "VARCHAR(255)",
+    "SUBSTRING": "VARCHAR(255)",
+    "SUBSTR": "VARCHAR(255)",
+    "JSON_UNQUOTE": "VARCHAR(255)",
+    "JSON_EXTRACT": "VARCHAR(255)",
+    "->": "VARCHAR(255)",
+    "->>": "VARCHAR(255)",
+    "JSON_LENGTH": "INT",
+    "LENGTH": "INT",
+    "CHAR_LENGTH": "INT",
+}
+
+
+def _is_text_type(column_type: Optional[str]) -> bool:
+    return bool(column_type) and re.match(r"(?:tiny|medium|long)?(?:text|blob)\b", column_type, re.I) is not None
+
+
+def _is_string_type(column_type: Optional[str]) -> bool:
+    return bool(column_type) and re.match(r"(?:var)?char|(?:tiny|medium|long)?text", column_type, re.I) is not None
+
+
+# ---------------------------------------------------------------------------
+# 表结构与现有索引
+# ---------------------------------------------------------------------------
+
+def catalog_from_testcases(testcase_file: str) -> Tuple[Dict[str, Dict[str, Dict]], Dict[str, Dict]]:
+    """从测试用例各组的提示词中解析表结构
+
+    Returns:
+        Tuple: (数据库名 -> 表结构目录, 数据库名 -> 数据库配置)
+    """
+    test_groups, _ = t2s.load_test_cases(testcase_file)
+    catalogs: Dict[str, Dict[str, Dict]] = {}
+    db_configs: Dict[str, Dict] = {}
+    for group in test_groups:
+        catalog = catalogs.setdefault(group.get("db_name"), {})
+        for name, table in schema_catalog.parse_catalog(group.get("prompt") or "").items():
+            catalog.setdefault(name, table)
+        if group.get("db_config"):
+            db_configs.setdefault(group["db_name"], group["db_config"])
+    return catalogs, db_configs
+
+
+def catalog_from_database(db) -> Dict[str, Dict]:
+    """从 INFORMATION_SCHEMA 读取当前库的列、索引和行数估计（结构同 schema_catalog.parse_catalog）"""
+    catalog: Dict[str, Dict] = {}
+    for row in db.execute_query(
+            "SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name, COLUMN_TYPE AS column_type, "
+            "IS_NULLABLE AS is_nullable FROM INFORMATION_SCHEMA.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, ORDINAL_POSITION"):
+        table = catalog.setdefault(row["table_name"], {"name": row["table_name"], "title": None, "columns": [],
+                                                       "primary_key": [], "indexes": []})
+        table["columns"].append({"name": row["column_name"], "type": row["column_type"],
+                                 "nullable": row["is_nullable"] == "YES", "default": None, "comment": None})
+    indexes: Dict[Tuple[str, str], Dict] = {}
+    for row in db.execute_query(
+            "SELECT TABLE_NAME AS table_name, INDEX_NAME AS index_name, NON_UNIQUE AS non_unique, "
+            "COLUMN_NAME AS column_name FROM INFORMATION_SCHEMA.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX"):
+        table = catalog.get(row["table_name"])
+        if table is None or row["column_name"] is None:
+            continue
+        if row["index_name"] == "PRIMARY":
+            table["primary_key"].append(row["column_name"])
+            continue
+        index = indexes.get((row["table_name"], row["index_name"]))
+        if index is None:
+            index = indexes[(row["table_name"], row["index_name"])] = {
+                "name": row["index_name"], "columns": [], "unique": not int(row["non_unique"])}
+            table["indexes"].append(index)
+        index["columns"].append(row["column_name"])
+    for row in db.execute_query(
+            "SELECT TABLE_NAME AS table_name, TABLE_ROWS AS table_rows FROM INFORMATION_SCHEMA.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE()"):
+        if row["table_name"] in catalog:
+            catalog[row["table_name"]]["rows"] = row["table_rows"]
+    return catalog
+
+
+def existing_indexes(table: Dict) -> List[Tuple[List[str], bool]]:
+    """表上现有索引的 (列, 是否唯一)（主键在前）"""
+    indexes = [(list(table["primary_key"]), True)] if table.get("primary_key") else []
+    return indexes + [(list(index["columns"]), bool(index.get("unique"))) for index in table.get("indexes", [])]
+
+
+def is_covered(candidate: List[str], existing: List[Tuple[List[str], bool]], equality: int) -> bool:
+    """候选索引是否已被现有索引覆盖
+
+    - 现有索引的前 equality 列与候选的等值列集合相同（顺序不限），其后的列与候选剩余的列依次相同
+    - 或者等值列已包含主键/唯一索引的全部列（最多命中一行，再加列没有意义）
+    """
+    lowered = [c.lower() for c in candidate]
+    equal_set = set(lowered[:equality])
+    for index, unique in existing:
+        columns = [c.lower() for c in index]
+        if unique and columns and set(columns) <= equal_set:
+            return True
+        if len(columns) < len(lowered):
+            continue
+        if set(columns[:equality]) == equal_set and columns[equality:len(lowered)] == lowered[equality:]:
+            return True
+    return False
+
+
+# ---------------------------------------------------------------------------
+# 语料
+# ---------------------------------------------------------------------------
+
+class QueryShape:
+    """一个查询形状（字面量不同的 SQL 归为一类）"""
+
+    def __init__(self, fingerprint: str, sql: str, db_name: Optional[str]):
+        self.fingerprint = fingerprint
+        self.sql = sql                  # 示例 SQL（第一次出现的原文）
+        self.db_name = db_name
+        self.count = 0
+        self.db_time = 0.0
+        self.models: Counter = Counter()
+        self.analysis: Optional[sql_analysis.Analysis] = None
+        self.explain: Optional[List[Dict]] = None
+        self.explain_error: Optional[str] = None
+
+    def add(self, result: Dict) -> None:
+        self.count += 1
+        self.db_time += float(result.get("db_time") or 0.0)
+        self.models[f"{result.get('model_type', '')}/{result.get('model_name', '')}"] += 1
+
+    def explain_rows(self, table: str) -> List[Dict]:
+        """EXPLAIN 中属于指定表（按别名还原）的行"""
+        if not self.explain:
+            return []
+        rows = []
+        for row in self.explain:
+            name = str(row.get("table") or "")
+            target = self.analysis.aliases.get(name.lower(), name) if self.analysis else name
+            if target == table:
+                rows.append(row)
+        return rows
+
+
+def load_corpus(results: Iterable[Dict]) -> Tuple[Dict[str, QueryShape], int]:
+    """按查询形状汇总执行成功的 SQL
+
+    Returns:
+        Tuple[Dict[str, QueryShape], int]: (指纹 -> 查询形状, 成功 SQL 总数)
+    """
+    shapes: Dict[str, QueryShape] = {}
+    total = 0
+    for result in results:
+        sql = result.get("sql")
+        if not result.get("success") or not sql or result.get("is_dangerous"):
+            continue
+        total += 1
+        key = f"{result.get('db_name')}\0{sql_analysis.fingerprint(sql)}"
+        shape = shapes.get(key)
+        if shape is None:
+            shape = shapes[key] = QueryShape(key.split("\0", 1)[1], sql, result.get("db_name"))
+        shape.add(result)
+    return shapes, total
+
+
+def explain_shapes(shapes: List[QueryShape], databases: Dict[str, object], limit: int) -> int:
+    """对出现次数最多的 limit 个查询形状执行 EXPLAIN（使用各形状的示例 SQL）
+
+    Returns:
+        int: 成功执行 EXPLAIN 的形状数
+    """
+    explained = 0
+    for shape in sorted(shapes, key=lambda s: -s.count)[:limit]:
+        db = databases.get(shape.db_name)
+        if db is None:
+            continue
+        try:
+            shape.explain = db.execute_query(f"EXPLAIN {shape.sql.strip().rstrip(';')}")
+            explained += 1
+        except Exception as e:
+            shape.explain_error = str(e).split("\n", 1)[0][:200]
+    return explained
+
+
+# ---------------------------------------------------------------------------
+# 建议
+# ---------------------------------------------------------------------------
+
+class Recommendation:
+    """一条索引或生成列建议及其收益估计"""
+
+    def __init__(self, kind: str, db_name: Optional[str], table: str, columns: List[str], equality: int = 0):
+        self.kind = kind                # index / generated_column
+        self.db_name = db_name
+        self.table = table
+        self.columns = columns
+        self.equality = equality        # 前 equality 列为等值/连接列
+        self.expression: Optional[str] = None
+        self.column_type: Optional[str] = None
+        self.ddl = ""
+        self.shapes: Dict[str, QueryShape] = {}
+        self.usages: Counter = Counter()
+
+    def absorb(self, other: "Recommendation") -> None:
+        self.shapes.update(other.shapes)
+        self.usages.update(other.usages)
+
+    def benefit(self) -> Dict:
+        """收益估计（影响的查询、全表扫描、扫描行数和数据库耗时）"""
+        queries = full_scans = filesorts = explained = 0
+        rows_examined = 0
+        db_time = saving = 0.0
+        models: Counter = Counter()
+        for shape in self.shapes.values():
+            queries += shape.count
+            db_time += shape.db_time
+            models.update(shape.models)
+            rows = shape.explain_rows(self.table)
+            if not rows:
+                continue
+            explained += shape.count
+            scanned = any(row.get("type") in FULL_SCAN_TYPES for row in rows)
+            if scanned:
+                full_scans += shape.count
+                # 全表扫描的查询耗时作为节省时间的上限
+                saving += shape.db_time
+            if any("filesort" in str(row.get("Extra") or "") for row in rows):
+                filesorts += shape.count
+            rows_examined += shape.count * sum(int(row.get("rows") or 0) for row in rows)
+        return {"queries": queries, "shapes": len(self.shapes), "explained_queries": explained,
+                "full_scans": full_scans, "filesorts": filesorts, "rows_examined": rows_examined,
+                "db_time_total": db_time, "estimated_saving": saving if explained else None,
+                "models": dict(models.most_common())}
+
+    def rank_key(self) -> Tuple:
+        benefit = self.benefit()
+        return (-benefit["full_scans"], -benefit["rows_examined"], -benefit["db_time_total"], -benefit["queries"])
+
+    def as_dict(self) -> Dict:
+        data = {"kind": self.kind, "db_name": self.db_name, "table": self.table, "columns": self.columns,
+                "usages": dict(self.usages), "ddl": self.ddl, "example": next(iter(self.shapes.values())).sql}
+        if self.kind == "generated_column":
+            data["expression"] = self.expression
+            data["column_type"] = self.column_type
+        data.update(self.benefit())
+        return data
+
+
+def _index_name(columns: List[str]) -> str:
+    name = "idx_" + "_".join(re.sub(r"\W", "", c.lower()) for c in columns)
+    return name[:64]
+
+
+def _column_types(table: Optional[Dict]) -> Dict[str, str]:
+    if not table:
+        return {}
+    return {column["name"].lower(): column["type"] for column in table["columns"]}
+
+
+def _index_part(column: str, types: Dict[str, str]) -> str:
+    if _is_text_type(types.get(column.lower())):
+        return f"`{column}`({TEXT_PREFIX_LENGTH})"
+    return f"`{column}`"
+
+
+def index_ddl(table: str, columns: List[str], types: Dict[str, str]) -> str:
+    parts = ", ".join(_index_part(column, types) for column in columns)
+    return f"ALTER TABLE `{table}` ADD INDEX `{_index_name(columns)}` ({parts});"
+
+
+def generated_column(use: sql_analysis.ColumnUse) -> Tuple[str, str, str]:
+    """被函数包裹的列 -> (生成列名, 类型, 生成表达式)"""
+    expression = use.expression
+    function = (use.function or "").upper()
+    column_type = _GENERATED_TYPES.get(function, "VARCHAR(255)")
+    if function == "STR_TO_DATE":
+        column_type = "DATETIME" if re.search(r"%[HhisTr]", expression) else "DATE"
+    elif function == "CAST":
+        match = re.search(r"\bAS\s+([A-Z]+(?:\(\d+(?:,\s*\d+)?\))?)\s*\)$", expression, re.I)
+        if match:
+            column_type = match.group(1).upper().replace("SIGNED", "BIGINT").replace("CHAR", "VARCHAR")
+    if function in ("->", "JSON_EXTRACT"):
+        # JSON 值不能直接建索引，取消引号后作为字符串
+        expression = f"JSON_UNQUOTE({expression})"
+    path = re.search(r"'\$\.?([^']*)'", use.expression)
+    suffix = path.group(1) if path else function.lower().strip("->") or "expr"
+    name = re.sub(r"\W+", "_", f"{use.column}_{suffix}".lower()).strip("_")[:64]
+    return name, column_type, expression
+
+
+def generated_ddl(table: str, name: str, column_type: str, expression: str) -> str:
+    return (f"ALTER TABLE `{table}` ADD COLUMN `{name}` {column_type} GENERATED ALWAYS AS ({expression}) VIRTUAL, "
+            f"ADD INDEX `{_index_name([name])}` (`{name}`);")
+
+
+# 单个索引建议的最大列数
+MAX_INDEX_COLUMNS = 4
+
+# 可以作为索引范围列的使用方式
+_RANGE_USAGES = {sql_analysis.RANGE, sql_analysis.LIKE_PREFIX}
+
+# 可以作为索引等值列的使用方式
+_EQUALITY_USAGES = {sql_analysis.EQUALITY, sql_analysis.IS_NULL, sql_analysis.JOIN}
+
+
+def _unique(values: Iterable[str]) -> List[str]:
+    seen: Set[str] = set()
+    out = []
+    for value in values:
+        if value.lower() not in seen:
+            seen.add(value.lower())
+            out.append(value)
+    return out
+
+
+def _note(notes: Dict[Tuple, Dict], kind: str, db_name: Optional[str], table: str, column: str,
+          shape: QueryShape, message: str) -> None:
+    note = notes.get((kind, db_name, table, column))
+    if note is None:
+        note = notes[(kind, db_name, table, column)] = {"kind": kind, "db_name": db_name, "table": table,
+                                                       "column": column, "queries": 0, "shapes": set(),
+                                                       "message": message}
+    # 同一查询中该列可能出现多次（如 WHERE 和 ORDER BY），每个查询形状只计一次
+    if shape.fingerprint in note["shapes"]:
+        return
+    note["shapes"].add(shape.fingerprint)
+    note["queries"] += shape.count
+
+
+def build_recommendations(shapes: Dict[str, QueryShape], catalogs: Dict[str, Dict[str, Dict]]) -> Dict:
+    """分析全部查询形状，生成索引、生成列建议和提示
+
+    Returns:
+        Dict: {"column_usage", "indexes", "generated_columns", "notes", "covered", "unresolved"}
+    """
+    usage: Dict[Tuple, Counter] = {}
+    for shape in shapes.values():
+        catalog = catalogs.get(shape.db_name) or {}
+        columns = {name: {c["name"] for c in table["columns"]} for name, table in catalog.items()} or None
+        shape.analysis = sql_analysis.analyze(shape.sql, columns)
+        for use in shape.analysis.uses:
+            usage.setdefault((shape.db_name, use.table, use.column.lower()), Counter())[use.usage] += shape.count
+
+    def frequency(db_name, table, column) -> int:
+        counter = usage.get((db_name, table, column.lower()), Counter())
+        return sum(counter[u] for u in _EQUALITY_USAGES | _RANGE_USAGES)
+
+    indexes: Dict[Tuple, Recommendation] = {}
+    generated: Dict[Tuple, Recommendation] = {}
+    notes: Dict[Tuple, Dict] = {}
+    covered = 0
+    unresolved = 0
+    for shape in shapes.values():
+        analysis = shape.analysis
+        catalog = catalogs.get(shape.db_name) or {}
+        unresolved += len(analysis.unresolved) * shape.count
+        by_table: Dict[str, List[sql_analysis.ColumnUse]] = {}
+        for use in analysis.uses:
+            by_table.setdefault(use.table, []).append(use)
+        for table, uses in by_table.items():
+            types = _column_types(catalog.get(table))
+            for use in uses:
+                column_type = types.get(use.column.lower())
+                if use.expression is not None and use.usage in (_EQUALITY_USAGES | _RANGE_USAGES
+                                                               | {sql_analysis.ORDER, sql_analysis.GROUP}):
+                    name, generated_type, expression = generated_column(use)
+                    rec = generated.get((shape.db_name, table, expression))
+                    if rec is None:
+                        rec = generated[(shape.db_name, table, expression)] = Recommendation(
+                            "generated_column", shape.db_name, table, [name])
+                        rec.expression, rec.column_type = expression, generated_type
+                        rec.ddl = generated_ddl(table, name, generated_type, expression)
+                    rec.shapes[shape.fingerprint] = shape
+                    rec.usages[use.usage] += shape.count
+                if use.usage == sql_analysis.LIKE_CONTAINS:
+                    _note(notes, "like_contains", shape.db_name, table, use.column, shape,
+                          "LIKE '%...%' 无法使用 B-Tree 索引" + (
+                              "；TEXT 列可考虑 FULLTEXT 索引，JSON 内容可把常用字段提取为生成列"
+                              if _is_text_type(column_type) else "；可考虑改为前缀匹配或 FULLTEXT 索引"))
+                if (_is_string_type(column_type) and _DATE_LIKE_NAME.search(use.column)
+                        and (use.usage in _RANGE_USAGES | {sql_analysis.ORDER}
+                             or use.function in ("DATE", "STR_TO_DATE", "YEAR", "MONTH"))):
+                    _note(notes, "string_date", shape.db_name, table, use.column, shape,
+                          f"日期以 {column_type} 保存，范围比较和排序按字符串进行；"
+                          f"建议改为 DATE/DATETIME 或添加 STR_TO_DATE 生成列")
+
+            plain = [use for use in uses if use.expression is None]
+            order_uses = [use for use in uses if use.usage == sql_analysis.ORDER]
+            all_order = [use for use in analysis.uses if use.usage == sql_analysis.ORDER]
+            joins = {use.column.lower() for use in plain if use.usage == sql_analysis.JOIN}
+            # 连接查询中本表可能是被驱动表（按连接列查找）也可能是驱动表（只按本表的过滤条件查找）
+            variants = [plain]
+            if joins and any(use.usage != sql_analysis.JOIN for use in plain):
+                variants.append([use for use in plain if use.column.lower() not in joins])
+            for n, variant in enumerate(variants):
+                equality = _unique(sorted((use.column for use in variant if use.usage in _EQUALITY_USAGES),
+                                          key=lambda c: (-frequency(shape.db_name, table, c), c.lower())))
+                ranges = _unique(sorted((use.column for use in variant if use.usage in _RANGE_USAGES
+                                         and use.column.lower() not in {c.lower() for c in equality}),
+                                        key=lambda c: (-frequency(shape.db_name, table, c), c.lower())))
+                columns = list(equality)
+                if ranges:
+                    columns.append(ranges[0])
+                elif (order_uses and len(order_uses) == len(all_order)
+                      and all(use.expression is None for use in order_uses)):
+                    # ORDER BY 全部是本表的普通列时，索引顺序可以避免排序
+                    columns += [c for c in _unique(use.column for use in order_uses)
+                                if c.lower() not in {e.lower() for e in equality}]
+                columns = columns[:MAX_INDEX_COLUMNS]
+                if not columns:
+                    continue
+                if catalog.get(table) and is_covered(columns, existing_indexes(catalog[table]), len(equality)):
+                    if n == 0:
+                        covered += shape.count
+                    continue
+                key = (shape.db_name, table, tuple(c.lower() for c in columns))
+                rec = indexes.get(key)
+                if rec is None:
+                    rec = indexes[key] = Recommendation("index", shape.db_name, table, columns,
+                                                        min(len(equality), len(columns)))
+                    rec.ddl = index_ddl(table, columns, types)
+                rec.shapes[shape.fingerprint] = shape
+                for use in variant:
+                    if use.column.lower() in key[2]:
+                        rec.usages[use.usage] += shape.count
+
+    # 是其他候选前缀的候选合并到更长的候选中（更长的索引同样能服务这些查询）
+    merged = sorted(indexes.values(), key=lambda r: -len(r.columns))
+    kept: List[Recommendation] = []
+    for rec in merged:
+        lowered = [c.lower() for c in rec.columns]
+        target = next((other for other in kept if other.db_name == rec.db_name and other.table == rec.table
+                       and [c.lower() for c in other.columns[:len(lowered)]] == lowered), None)
+        if target is not None:
+            target.absorb(rec)
+        else:
+            kept.append(rec)
+
+    for note in notes.values():
+        note["shapes"] = len(note["shapes"])
+
+    column_usage: Dict[str, Dict[str, Dict[str, int]]] = {}
+    for (db_name, table, column), counter in sorted(usage.items(), key=lambda item: (str(item[0][0]), item[0][1:])):
+        label = f"{db_name}.{table}" if db_name else table
+        column_usage.setdefault(label, {})[column] = dict(counter.most_common())
+    return {
+        "column_usage": column_usage,
+        "indexes": sorted(kept, key=Recommendation.rank_key),
+        "generated_columns": sorted(generated.values(), key=Recommendation.rank_key),
+        "notes": sorted(notes.values(), key=lambda n: -n["queries"]),
+        "covered": covered,
+        "unresolved": unresolved,
+    }
+
+
+def advise(paths: List[str], testcase_file: Optional[str] = None, explain: bool = False,
+           explain_limit: int = DEFAULT_EXPLAIN_LIMIT, top: int = DEFAULT_TOP, min_queries: int = 1) -> Dict:
+    """从结果文件生成索引建议报告
+
+    Args:
+        paths: 结果文件（test_results.json 或 JSONL）
+        testcase_file: 测试用例文件，用于从提示词中解析表结构并取得数据库配置
+        explain: 是否连接数据库读取 INFORMATION_SCHEMA 并执行 EXPLAIN
+        explain_limit: 执行 EXPLAIN 的查询形状数上限
+        top: 每类建议输出的条数
+        min_queries: 建议至少影响的查询数
+
+    Returns:
+        Dict: 报告（可直接序列化为 JSON）
+    """
+    shapes, total = load_corpus(report.iter_result_rows(paths))
+    catalogs: Dict[str, Dict[str, Dict]] = {}
+    db_configs: Dict[str, Dict] = {}
+    if testcase_file:
+        catalogs, db_configs = catalog_from_testcases(testcase_file)
+    # 结果中的数据库没有在测试用例中出现时，使用任一已知表结构（多数测试只有一个库）
+    fallback = next((catalog for catalog in catalogs.values() if catalog), {})
+    for shape in shapes.values():
+        catalogs.setdefault(shape.db_name, fallback)
+
+    explained = 0
+    schema_source = "prompt" if testcase_file else None
+    errors: List[str] = []
+    if explain:
+        databases = {}
+        for db_name, db_config in db_configs.items():
+            try:
+                db = t2s.get_db_from_config(db_name, db_config)
+                catalogs[db_name] = catalog_from_database(db) or catalogs.get(db_name, {})
+                databases[db_name] = db
+                schema_source = "information_schema"
+            except Exception as e:
+                errors.append(f"{db_name}: {str(e).splitlines()[0] if str(e) else type(e).__name__}")
+        explained = explain_shapes(list(shapes.values()), databases, explain_limit)
+        for db in databases.values():
+            db.close()
+
+    result = build_recommendations(shapes, catalogs)
+
+    def select(recs: List[Recommendation]) -> List[Dict]:
+        return [rec.as_dict() for rec in recs if rec.benefit()["queries"] >= min_queries][:top]
+
+    return {
+        "queries": total,
+        "shapes": len(shapes),
+        "explained_shapes": explained,
+        "schema_source": schema_source,
+        "errors": errors,
+        "covered_queries": result["covered"],
+        "unresolved_columns": result["unresolved"],
+        "indexes": select(result["indexes"]),
+        "generated_columns": select(result["generated_columns"]),
+        "notes": [note for note in result["notes"] if note["queries"] >= min_queries][:top],
+        "column_usage": result["column_usage"],
+    }
+
+
+def _format_benefit(rec: Dict) -> str:
+    parts = [f"影响 {rec['queries']} 条查询（{rec['shapes']} 种形状）", f"数据库耗时 {rec['db_time_total']:.3f}s"]
+    if rec["explained_queries"]:
+        parts.append(f"全表扫描 {rec['full_scans']} 次")
+        parts.append(f"扫描行数约 {rec['rows_examined']}")
+        if rec["filesorts"]:
+            parts.append(f"filesort {rec['filesorts']} 次")
+        parts.append(f"预计最多节省 {rec['estimated_saving']:.3f}s")
+    return "，".join(parts)
+
+
+def format_console(data: Dict) -> str:
+    lines = ["=" * 80, "索引建议", "=" * 80,
+             f"成功执行的 SQL: {data['queries']} 条，{data['shapes']} 种查询形状；"
+             f"EXPLAIN {data['explained_shapes']} 种；表结构来源: {data['schema_source'] or '无（只按 SQL 推断）'}",
+             f"已被现有索引覆盖的查询: {data['covered_queries']} 条；无法确定所属表的列引用: {data['unresolved_columns']} 个"]
+    for error in data["errors"]:
+        lines.append(f"⚠️  无法读取数据库 {error}")
+    lines.append("\n索引:")
+    if not data["indexes"]:
+        lines.append("  （无）")
+    for i, rec in enumerate(data["indexes"], 1):
+        models = "，".join(f"{model} {count}" for model, count in rec["models"].items())
+        lines.append(f"  {i}. {rec['table']}({', '.join(rec['columns'])})")
+        lines.append(f"     {_format_benefit(rec)}")
+        lines.append(f"     模型: {models}")
+        lines.append(f"     {rec['ddl']}")
+    lines.append("\n生成列:")
+    if not data["generated_columns"]:
+        lines.append("  （无）")
+    for i, rec in enumerate(data["generated_columns"], 1):
+        lines.append(f"  {i}. {rec['table']}: {rec['expression']} → {rec['columns'][0]} {rec['column_type']}")
+        lines.append(f"     {_format_benefit(rec)}")
+        lines.append(f"     {rec['ddl']}")
+        lines.append("     查询中的表达式需与生成列定义一致才会使用该索引")
+    if data["notes"]:
+        lines.append("\n提示:")
+        for note in data["notes"]:
+            lines.append(f"  - {note['table']}.{note['column']}（{note['queries']} 条查询）: {note['message']}")
+    return "\n".join(lines) + "\n"
+
+
+def main(argv: List[str] = None) -> int:
+    """indexes 子命令入口"""
+    parser = argparse.ArgumentParser(
+        prog="test_text2sql.py indexes",
+        description="根据生成的 SQL 给出索引和生成列建议"
+    )
+    parser.add_argument("results", nargs="+", help="结果文件（test_results.json 或 JSONL），可指定多个")
+    parser.add_argument("--testcase", default=os.path.join(os.path.dirname(__file__), "testcase.json"),
+                        help="测试用例文件，用于解析表结构和取得数据库配置（默认: test_case/testcase.json）")
+    parser.add_argument("--explain", action="store_true",
+                        help="连接数据库：从 INFORMATION_SCHEMA 读取现有索引，并对常见查询形状执行 EXPLAIN")
+    parser.add_argument("--explain-limit", type=int, default=DEFAULT_EXPLAIN_LIMIT,
+                        help=f"执行 EXPLAIN 的查询形状数上限（默认: {DEFAULT_EXPLAIN_LIMIT}）")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help=f"每类建议输出的条数（默认: {DEFAULT_TOP}）")
+    parser.add_argument("--min-queries", type=int, default=1, help="建议至少影响的查询数（默认: 1）")
+    parser.add_argument("--format", choices=["console", "json"], default="console", help="输出格式（默认: console）")
+    parser.add_argument("--output", default=None, help="输出文件路径（默认输出到标准输出）")
+    args = parser.parse_args(argv)
+
+    for path in args.results:
+        if not os.path.exists(path):
+            print(f"错误: 结果文件不存在: {path}", file=sys.stderr)
+            return 1
+    testcase_file = args.testcase if args.testcase and os.path.exists(args.testcase) else None
+
+    data = advise(args.results, testcase_file, explain=args.explain, explain_limit=args.explain_limit,
+                  top=args.top, min_queries=args.min_queries)
+    text = json.dumps(data, ensure_ascii=False, indent=2) if args.format == "json" else format_console(data)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"索引建议已保存到: {args.output}")
+    else:
+        sys.stdout.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Text2SQL 端到端压测
+以开环到达过程（固定速率或线性爬坡）回放 testcase.json 中的问题，并发数有上限，
+记录端到端延迟分位数、各阶段（排队、LLM、校验、数据库）的延迟和错误率，并找出各阶段的饱和点。
+
+可以使用真实的模型和数据库，也可以使用本地模拟后端（--mock）在离线环境下评估框架本身的容量。
+
+用法:
+    python test_case/test_text2sql.py loadtest --rate 5 --duration 60 --concurrency 16
+    python test_case/test_text2sql.py loadtest --mock --rate 10 --ramp-to 200 --duration 120
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from test_case import concurrency, metrics, replicas
+from test_case.report import percentile
+from test_case import test_text2sql as t2s
+
+# 统计的阶段：排队等待、模型生成、校验、数据库执行
+STAGES = ("queue", "llm", "validation", "db")
+
+# 末尾不足该比例个窗口长度的部分并入前一个窗口（到达停止后排空的几毫秒不单独成窗）
+MIN_WINDOW_FRACTION = 0.5
+
+
+# ---------------------------------------------------------------------------
+# 本地模拟后端
+# ---------------------------------------------------------------------------
+
+# 模拟后端参数（由 configure_mock_backends 设置）
+_mock_settings = {
+    "llm_latency": 0.8,
+    "llm_error_rate": 0.0,
+    "db_latency": 0.02,
+    "db_capacity": 16,
+    "db_error_rate": 0.0,
+}
+
+_MOCK_SQL = [
+    "SELECT id, name FROM sportradar_tennis_competition WHERE gender = 'men' LIMIT 20",
+    "SELECT s.name, s.start_date FROM sportradar_tennis_season s "
+    "JOIN sportradar_tennis_competition c ON s.competition_id = c.id ORDER BY s.start_date DESC LIMIT 10",
+    "SELECT sport_event_id, sport_event_start_time FROM sportradar_tennis_summary_live "
+    "ORDER BY sport_event_start_time DESC LIMIT 5",
+]
+
+
+def _lognormal(mean: float, sigma: float = 0.5) -> float:
+    """按给定均值采样对数正态分布的延迟"""
+    if mean <= 0:
+        return 0.0
+    mu = math.log(mean) - sigma * sigma / 2
+    return random.lognormvariate(mu, sigma)
+
+
+def generate_sql_with_mock(question: str, prompt: str, model: str = "mock",
+                           usage: Dict = None) -> tuple:
+    """模拟模型：按配置的延迟和错误率返回固定的 SQL"""
+    time.sleep(_lognormal(_mock_settings["llm_latency"]))
+    if random.random() < _mock_settings["llm_error_rate"]:
+        return None, "Mock API 错误: 429 RESOURCE_EXHAUSTED"
+    if usage is not None:
+        usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + (len(prompt) + len(question)) // 3
+        usage["completion_tokens"] = usage.get("completion_tokens", 0) + 40
+    # 不用 hash()：字符串哈希按进程加盐，--seed 无法复现
+    sql = _MOCK_SQL[zlib.crc32(question.encode("utf-8")) % len(_MOCK_SQL)]
+    return t2s.extract_sql_from_response(f"```sql\n{sql};\n```"), None
+
+
+class MockDatabase:
+    """模拟数据库：有限的并发容量，超出容量的查询排队等待"""
+
+    def __init__(self, latency: float, capacity: int, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._slots = threading.Semaphore(max(1, capacity))
+
+    @classmethod
+    def from_config(cls, db_config: Dict) -> "MockDatabase":
+        return cls(
+            latency=float(db_config.get("latency", _mock_settings["db_latency"])),
+            capacity=int(db_config.get("capacity", _mock_settings["db_capacity"])),
+            error_rate=float(db_config.get("error_rate", _mock_settings["db_error_rate"])),
+        )
+
+    def execute_query(self, sql: str, timeout: float = None) -> List[Dict]:
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"等待数据库连接超时（{timeout:.1f}s）")
+        try:
+            time.sleep(_lognormal(self.latency))
+            if random.random() < self.error_rate:
+                raise RuntimeError("Mock DB 错误: Lost connection to MySQL server during query")
+            return [{"id": i} for i in range(5)]
+        finally:
+            self._slots.release()
+
+    def close(self):
+        pass
+
+
+def configure_mock_backends(**settings) -> None:
+    """注册模拟模型（model_type="mock"）和模拟数据库驱动（driver="mock"）"""
+    _mock_settings.update({k: v for k, v in settings.items() if v is not None})
+    t2s.SQL_GENERATORS["mock"] = generate_sql_with_mock
+    t2s.DATABASE_DRIVERS["mock"] = MockDatabase.from_config
+
+
+# ---------------------------------------------------------------------------
+# 工作项与到达过程
+# ---------------------------------------------------------------------------
+
+def build_work_items(testcase_file: str, mock: bool = False, openai_model: str = None,
+                     google_model: str = None, compact_schema: bool = False) -> List[Dict]:
+    """从测试用例构建压测回放的工作项（问题 × 模型）"""
+    test_groups, defaults = t2s.load_test_cases(testcase_file, compact_schema=compact_schema)
+    concurrency.REGISTRY.configure(defaults["model_concurrency"])
+    items = []
+    for group_idx, group in enumerate(test_groups, 1):
+        models = []
+        if mock:
+            models.append(("mock", "mock"))
+        else:
+            if t2s.sdk_available("genai"):
+                models += [("google", m) for m in ([google_model] if google_model else group["google_model"])]
+            if t2s.sdk_available("openai"):
+                models += [("openai", m) for m in ([openai_model] if openai_model else group["openai_model"])]
+        db_config = group.get("db_config")
+        if mock:
+            db_config = {"driver": "mock"}
+        for question in group.get("questions", []):
+            for model_type, model_name in models:
+                items.append({
+                    "question": question,
+                    "prompt": group.get("prompt", defaults["prompt"]),
+                    "model_type": model_type,
+                    "model_name": model_name,
+                    "group_name": group.get("name", f"测试组{group_idx}"),
+                    "db_name": group.get("db_name", t2s.DEFAULT_DB_NAME),
+                    "db_config": db_config,
+                    "allowed_tables": group.get("allowed_tables", t2s.ALLOWED_TABLES),
+                })
+    return items
+
+
+def arrival_offsets(rate: float, duration: float, ramp_to: float = None,
+                    arrival: str = "poisson", seed: int = None) -> Iterator[float]:
+    """生成到达时间偏移（秒）
+
+    Args:
+        rate: 起始到达速率（QPS）
+        duration: 持续时间（秒）
+        ramp_to: 结束时的到达速率，指定时在 duration 内线性爬坡
+        arrival: poisson（指数间隔）或 uniform（等间隔）
+        seed: 随机种子
+    """
+    rng = random.Random(seed)
+    end_rate = rate if ramp_to is None else ramp_to
+    t = 0.0
+    while True:
+        current = rate + (end_rate - rate) * min(t / duration, 1.0) if duration > 0 else rate
+        if current <= 0:
+            t += 0.1
+            if t >= duration:
+                return
+            continue
+        t += rng.expovariate(current) if arrival == "poisson" else 1.0 / current
+        if t >= duration:
+            return
+        yield t
+
+
+def rate_at(offset: float, rate: float, duration: float, ramp_to: float = None) -> float:
+    """某一时刻的目标到达速率"""
+    if ramp_to is None or duration <= 0:
+        return rate
+    return rate + (ramp_to - rate) * min(offset / duration, 1.0)
+
+
+# ---------------------------------------------------------------------------
+# 压测执行
+# ---------------------------------------------------------------------------
+
+class LoadTest:
+    """开环压测：按到达时间提交请求，并发数受限，积压超过上限的请求直接丢弃"""
+
+    def __init__(self, work_items: List[Dict], concurrency: int, max_queue: int):
+        self.work_items = work_items
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.records: List[Dict] = []
+        self._lock = threading.Lock()
+        self._outstanding = 0
+
+    def _execute(self, item: Dict, scheduled: float, run_start: float) -> None:
+        started = time.perf_counter()
+        metrics.INFLIGHT_REQUESTS.inc()
+        try:
+            result = t2s.test_question(item["question"], item["prompt"], item["model_type"], item["model_name"],
+                                       db_name=item["db_name"], db_config=item["db_config"],
+                                       allowed_tables=item["allowed_tables"])
+        except Exception as e:
+            result = {"success": False, "error": f"压测执行异常: {e}", "failed_stage": "harness",
+                      "model_type": item["model_type"], "model_name": item["model_name"]}
+        finally:
+            metrics.INFLIGHT_REQUESTS.dec()
+        finished = time.perf_counter()
+        result["group_name"] = item["group_name"]
+        metrics.record_result(result)
+        record = {
+            "offset": scheduled - run_start,
+            "completed": finished - run_start,
+            "e2e": finished - scheduled,
+            "queue": started - scheduled,
+            "llm": result.get("generation_time"),
+            "validation": result.get("validation_time"),
+            "db": result.get("db_time"),
+            "success": bool(result.get("success")),
+            "failed_stage": result.get("failed_stage"),
+            "model": f"{result.get('model_type')}:{result.get('model_name')}",
+        }
+        with self._lock:
+            self.records.append(record)
+            self._outstanding -= 1
+
+    def run(self, offsets: Iterator[float]) -> Dict:
+        """执行压测，返回计数信息"""
+        dropped = []
+        submitted = 0
+        run_start = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="loadtest")
+        try:
+            for i, offset in enumerate(offsets):
+                scheduled = run_start + offset
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                with self._lock:
+                    backlog = self._outstanding - self.concurrency
+                    if backlog >= self.max_queue:
+                        dropped.append(offset)
+                        continue
+                    self._outstanding += 1
+                item = self.work_items[i % len(self.work_items)]
+                executor.submit(self._execute, item, scheduled, run_start)
+                submitted += 1
+        finally:
+            executor.shutdown(wait=True)
+        return {"submitted": submitted, "dropped": dropped, "elapsed": time.perf_counter() - run_start}
+
+
+# ---------------------------------------------------------------------------
+# 分析
+# ---------------------------------------------------------------------------
+
+def _latency_summary(values: List[float]) -> Dict:
+    values = sorted(v for v in values if v is not None)
+    summary = {"count": len(values)}
+    for pct in (50, 90, 95, 99):
+        summary[f"p{pct}"] = percentile(values, pct)
+    summary["max"] = values[-1] if values else None
+    return summary
+
+
+def analyze(records: List[Dict], dropped: List[float], elapsed: float, rate: float, duration: float,
+            ramp_to: Optional[float], window: float, saturation_factor: float) -> Dict:
+    """汇总延迟和错误率，按时间窗口计算吞吐，并找出各阶段的饱和点"""
+    total = len(records) + len(dropped)
+    stage_errors = {}
+    for record in records:
+        if not record["success"]:
+            stage = record["failed_stage"] or "unknown"
+            stage_errors[stage] = stage_errors.get(stage, 0) + 1
+
+    summary = {
+        "offered": total,
+        "completed": len(records),
+        "dropped": len(dropped),
+        "elapsed": elapsed,
+        "throughput": len(records) / elapsed if elapsed > 0 else 0,
+        "success_rate": sum(1 for r in records if r["success"]) / len(records) * 100 if records else 0,
+        "error_rates": {stage: count / len(records) * 100 for stage, count in sorted(stage_errors.items())} if records else {},
+        "latency": {"e2e": _latency_summary([r["e2e"] for r in records])},
+    }
+    for stage in STAGES:
+        summary["latency"][stage] = _latency_summary([r[stage] for r in records])
+
+    # 按到达时间划分窗口；到达停止后仍有请求完成，窗口一直延续到压测结束。
+    # 最后一个窗口可能只覆盖一部分时间：到达速率除以窗口内的到达时长（截止到 duration），
+    # 吞吐除以窗口内的观测时长（截止到 elapsed），不足一个窗口的部分不按整个窗口摊薄；
+    # 过短的尾部并入前一个窗口，避免几毫秒内完成的几个请求折算出虚高的吞吐
+    end = max(duration, elapsed)
+    bounds = [w * window for w in range(max(1, int(math.ceil(end / window))))]
+    if len(bounds) > 1 and end - bounds[-1] < window * MIN_WINDOW_FRACTION:
+        bounds.pop()
+    bounds.append(end)
+    windows = []
+    for w in range(len(bounds) - 1):
+        low = bounds[w]
+        high = bounds[w + 1] if w + 2 < len(bounds) else math.inf
+        arrival_span = min(bounds[w + 1], duration) - low
+        completion_span = min(bounds[w + 1], elapsed) - low
+        in_window = [r for r in records if low <= r["offset"] < high]
+        dropped_in_window = sum(1 for d in dropped if low <= d < high)
+        completed_in_window = sum(1 for r in records if low <= r["completed"] < high)
+        entry = {
+            "start": low,
+            "span": max(arrival_span, completion_span, 0.0),
+            "target_rate": rate_at(low + arrival_span / 2, rate, duration, ramp_to) if arrival_span > 0 else None,
+            "offered_rate": (len(in_window) + dropped_in_window) / arrival_span if arrival_span > 0 else None,
+            "throughput": completed_in_window / completion_span if completion_span > 0 else None,
+            "dropped": dropped_in_window,
+            "error_rate": (sum(1 for r in in_window if not r["success"]) / len(in_window) * 100) if in_window else 0,
+            "e2e_p95": percentile(sorted(r["e2e"] for r in in_window), 95),
+        }
+        for stage in STAGES:
+            entry[f"{stage}_p95"] = percentile(sorted(r[stage] for r in in_window if r[stage] is not None), 95)
+        windows.append(entry)
+
+    # 饱和点：某阶段的窗口 p95 超过首个有效窗口 p95 的 saturation_factor 倍（排队阶段另设 50ms 下限）
+    saturation = {}
+    for stage in STAGES + ("e2e",):
+        key = f"{stage}_p95"
+        baseline = next((w[key] for w in windows if w[key] is not None), None)
+        if baseline is None:
+            continue
+        limit = max(baseline * saturation_factor, 0.05 if stage in ("queue", "e2e") else 0.0)
+        hit = next((w for w in windows if w[key] is not None and w[key] > limit), None)
+        saturation[stage] = {
+            "baseline_p95": baseline,
+            "saturated": hit is not None,
+            "at_offered_rate": hit["offered_rate"] if hit else None,
+            "at_offset": hit["start"] if hit else None,
+        }
+    first_drop = next((w for w in windows if w["dropped"] > 0), None)
+    saturation["admission"] = {
+        "saturated": first_drop is not None,
+        "at_offered_rate": first_drop["offered_rate"] if first_drop else None,
+        "at_offset": first_drop["start"] if first_drop else None,
+    }
+    return {"summary": summary, "windows": windows, "saturation": saturation}
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+
+def _fmt_rate(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def print_analysis(analysis: Dict) -> None:
+    summary = analysis["summary"]
+    print("\n" + "=" * 80)
+    print("压测结果")
+    print("=" * 80)
+    print(f"  到达请求: {summary['offered']}，完成: {summary['completed']}，丢弃: {summary['dropped']}")
+    print(f"  耗时: {summary['elapsed']:.1f}s，吞吐: {summary['throughput']:.2f} QPS，成功率: {summary['success_rate']:.2f}%")
+    if summary["error_rates"]:
+        rates = "，".join(f"{stage} {rate:.2f}%" for stage, rate in summary["error_rates"].items())
+        print(f"  各阶段错误率: {rates}")
+    print(f"\n  {'阶段':<12}{'p50':>10}{'p90':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name in ("e2e",) + STAGES:
+        lat = summary["latency"][name]
+        print(f"  {name:<12}{_fmt(lat['p50']):>10}{_fmt(lat['p90']):>10}{_fmt(lat['p95']):>10}"
+              f"{_fmt(lat['p99']):>10}{_fmt(lat['max']):>10}")
+
+    print(f"\n  {'窗口':>6}{'目标QPS':>10}{'到达QPS':>10}{'吞吐':>10}{'丢弃':>6}{'错误率':>9}{'e2e p95':>10}")
+    for w in analysis["windows"]:
+        print(f"  {w['start']:>5.0f}s{_fmt_rate(w['target_rate']):>10}{_fmt_rate(w['offered_rate']):>10}"
+              f"{_fmt_rate(w['throughput']):>10}{w['dropped']:>6}{w['error_rate']:>8.1f}%{_fmt(w['e2e_p95']):>10}")
+
+    print("\n  饱和点:")
+    for stage, info in analysis["saturation"].items():
+        if info["saturated"]:
+            print(f"    {stage}: 在 {info['at_offset']:.0f}s 处（到达约 {info['at_offered_rate']:.1f} QPS）饱和")
+        else:
+            print(f"    {stage}: 未饱和")
+    if analysis.get("concurrency"):
+        print("\n  " + concurrency.format_console(analysis["concurrency"]).replace("\n", "\n  "))
+    if analysis.get("replicas"):
+        print("\n  " + replicas.format_console(analysis["replicas"]).replace("\n", "\n  "))
+    print("=" * 80)
+
+
+def main(argv: List[str] = None) -> int:
+    """loadtest 子命令入口"""
+    parser = argparse.ArgumentParser(prog="test_text2sql.py loadtest", description="Text2SQL 端到端压测")
+    parser.add_argument("--testcase", default=os.path.join(os.path.dirname(__file__), "testcase.json"),
+                        help="测试用例文件路径（默认: test_case/testcase.json）")
+    parser.add_argument("--rate", type=float, default=1.0, help="到达速率 QPS（爬坡时为起始速率）")
+    parser.add_argument("--ramp-to", type=float, default=None, help="爬坡结束时的到达速率 QPS")
+    parser.add_argument("--duration", type=float, default=60.0, help="压测持续时间（秒）")
+    parser.add_argument("--arrival", choices=["poisson", "uniform"], default="poisson", help="到达过程（默认: poisson）")
+    parser.add_argument("--concurrency", type=int, default=16, help="最大并发请求数（工作线程数；每个模型和数据库的实际并发还受自适应并发控制限制）")
+    parser.add_argument("--max-queue", type=int, default=1000, help="最大积压请求数，超过时丢弃新到达的请求")
+    parser.add_argument("--window", type=float, default=10.0, help="统计窗口长度（秒）")
+    parser.add_argument("--saturation-factor", type=float, default=2.0, help="窗口 p95 超过初始 p95 的倍数即视为饱和")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--openai-model", default=None, help="OpenAI 模型名称（覆盖配置文件中的设置）")
+    parser.add_argument("--google-model", default=None, help="Google 模型名称（覆盖配置文件中的设置）")
+    parser.add_argument("--mock", action="store_true", help="使用本地模拟的模型和数据库")
+    parser.add_argument("--compact-schema", action="store_true", help="提示词使用紧凑表结构（同主测试的 --compact-schema）")
+    parser.add_argument("--mock-llm-latency", type=float, default=None, help="模拟模型平均延迟（秒，默认 0.8）")
+    parser.add_argument("--mock-llm-error-rate", type=float, default=None, help="模拟模型错误率（0-1）")
+    parser.add_argument("--mock-db-latency", type=float, default=None, help="模拟数据库平均延迟（秒，默认 0.02）")
+    parser.add_argument("--mock-db-capacity", type=int, default=None, help="模拟数据库并发容量（默认 16）")
+    parser.add_argument("--mock-db-error-rate", type=float, default=None, help="模拟数据库错误率（0-1）")
+    parser.add_argument("--metrics-port", type=int, default=None, help="在指定端口暴露 Prometheus 格式的实时指标")
+    parser.add_argument("--output", default=None, help="保存压测结果的 JSON 文件路径")
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.mock:
+        configure_mock_backends(
+            llm_latency=args.mock_llm_latency, llm_error_rate=args.mock_llm_error_rate,
+            db_latency=args.mock_db_latency, db_capacity=args.mock_db_capacity,
+            db_error_rate=args.mock_db_error_rate,
+        )
+
+    work_items = build_work_items(args.testcase, mock=args.mock,
+                                  openai_model=args.openai_model, google_model=args.google_model,
+                                  compact_schema=args.compact_schema)
+    if not work_items:
+        print("错误: 没有可回放的工作项（检查测试用例和已安装的模型 SDK，或使用 --mock）")
+        return 1
+
+    metrics_server = metrics.start_metrics_server(args.metrics_port) if args.metrics_port else None
+
+    ramp = f" → {args.ramp_to} QPS" if args.ramp_to is not None else ""
+    print("=" * 80)
+    print("Text2SQL 压测")
+    print("=" * 80)
+    print(f"  工作项: {len(work_items)}，到达速率: {args.rate} QPS{ramp}，持续: {args.duration}s，"
+          f"并发上限: {args.concurrency}，到达过程: {args.arrival}")
+    if args.mock:
+        print(f"  模拟后端: {_mock_settings}")
+
+    load_test = LoadTest(work_items, args.concurrency, args.max_queue)
+    outcome = load_test.run(arrival_offsets(args.rate, args.duration, args.ramp_to, args.arrival, args.seed))
+    analysis = analyze(load_test.records, outcome["dropped"], outcome["elapsed"], args.rate, args.duration,
+                       args.ramp_to, args.window, args.saturation_factor)
+    analysis["concurrency"] = concurrency.REGISTRY.snapshot()
+    analysis["replicas"] = t2s.replica_snapshots()
+    print_analysis(analysis)
+
+    if args.output:
+        analysis["config"] = {k: v for k, v in vars(args).items()}
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(analysis, f, ensure_ascii=False, indent=2)
+        print(f"压测结果已保存到: {args.output}")
+
+    if metrics_server:
+        metrics_server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
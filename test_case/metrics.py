@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+轻量级 Prometheus 指标
+提供计数器、仪表盘和直方图，以 Prometheus 文本格式通过 HTTP 暴露，不依赖 prometheus_client
+
+另外提供按运行划分的统计（Counts / run_scope）：表结构校验、服务端指标、提示词前缀缓存和熔断器的
+全局对象在进程内共享，调度器中同时或先后运行的多个任务各自在 run_scope() 中运行，
+写入结果文件的统计只包含本任务的计数。
+"""
+
+import contextlib
+import contextvars
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    # 仅用于类型注解；运行时 http.server 在启动指标服务时才导入
+    from http.server import ThreadingHTTPServer
+
+# 默认的延迟直方图桶（秒）
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape_label_value(value) -> str:
+    """转义标签值（反斜杠、双引号、换行）"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names: Sequence[str], label_values: Sequence, extra: str = "") -> str:
+    """格式化标签为 {a="x",b="y"} 形式"""
+    parts = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    """格式化样本值"""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类：按标签值保存样本"""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, object] = {}
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda kv: tuple(str(v) for v in kv[0]))
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key: Tuple, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """可增可减的仪表盘"""
+
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """累积桶直方图"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def _render_sample(self, key: Tuple, state) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state["counts"]):
+            cumulative += count
+            labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{labels} {state['count']}")
+        plain = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{plain} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{plain} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        """渲染为 Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class Counts:
+    """一组按名称累加的统计值（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[Hashable, Any] = {}
+
+    def add(self, name: Hashable, amount: float = 1) -> None:
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def maximum(self, name: Hashable, value: float) -> None:
+        with self._lock:
+            self._values[name] = max(self._values.get(name, value), value)
+
+    def put(self, name: Hashable, value: Any) -> None:
+        with self._lock:
+            self._values[name] = value
+
+    def get(self, name: Hashable, default: Any = 0) -> Any:
+        with self._lock:
+            return self._values.get(name, default)
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        with self._lock:
+            return list(self._values.items())
+
+
+class RunStats:
+    """一次运行中各模块的统计（按模块名区分）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._components: Dict[str, Counts] = {}
+
+    def counts(self, component: str) -> Counts:
+        with self._lock:
+            counts = self._components.get(component)
+            if counts is None:
+                counts = self._components[component] = Counts()
+            return counts
+
+
+# 当前上下文所属的运行（流水线工作线程沿用启动线程的上下文）
+_current_run: contextvars.ContextVar = contextvars.ContextVar("text2sql_run", default=None)
+
+
+@contextlib.contextmanager
+def run_scope() -> Iterator[RunStats]:
+    """在当前上下文中开始一次运行的统计；其中的计数同时累加到全局计数"""
+    stats = RunStats()
+    token = _current_run.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_run.reset(token)
+
+
+def counts_to_update(component: str, totals: Counts) -> Tuple[Counts, ...]:
+    """需要累加的统计：全局计数，以及在 run_scope() 中时本次运行的计数"""
+    run = _current_run.get()
+    return (totals,) if run is None else (totals, run.counts(component))
+
+
+def counts_to_report(component: str, totals: Counts) -> Counts:
+    """写入结果的统计：在 run_scope() 中时为本次运行的计数，否则为全局计数"""
+    run = _current_run.get()
+    return totals if run is None else run.counts(component)
+
+
+# 测试框架使用的全局注册表和指标
+REGISTRY = MetricsRegistry()
+
+QUESTIONS_TOTAL = REGISTRY.counter(
+    "text2sql_questions_total", "已完成的测试项数量（按结果分类）",
+    ("model_type", "model", "group", "outcome"))
+GENERATION_SECONDS = REGISTRY.histogram(
+    "text2sql_generation_seconds", "模型生成 SQL 的耗时（秒）", ("model_type", "model"))
+DB_SECONDS = REGISTRY.histogram(
+    "text2sql_db_seconds",
+    "数据库阶段的耗时（秒），包括并发限制器排队、等待连接池连接和查询执行，不含 SQL 安全检查", ("db",))
+INFLIGHT_REQUESTS = REGISTRY.gauge(
+    "text2sql_inflight_requests", "正在处理中的测试项数量")
+RETRIES_TOTAL = REGISTRY.counter(
+    "text2sql_retries_total", "模型调用重试次数", ("model_type", "model"))
+CACHE_HITS_TOTAL = REGISTRY.counter(
+    "text2sql_cache_hits_total", "缓存命中次数", ("cache",))
+TOKENS_TOTAL = REGISTRY.counter(
+    "text2sql_tokens_total", "消耗的 token 数量（kind=cached 为 prompt 中命中提供方缓存的部分）", ("model_type", "model", "kind"))
+LAST_COMPLETION_TIMESTAMP = REGISTRY.gauge(
+    "text2sql_last_completion_timestamp_seconds", "最近一个测试项完成的 Unix 时间戳（用于发现卡住的运行）")
+RUN_START_TIMESTAMP = REGISTRY.gauge(
+    "text2sql_run_start_timestamp_seconds", "本次运行开始的 Unix 时间戳")
+
+
+def record_result(result: Dict) -> None:
+    """将一个测试结果记录到全局指标
+
+    Args:
+        result: test_question 返回的结果字典（需包含 group_name）
+    """
+    model_type = result.get("model_type", "")
+    model = result.get("model_name", "")
+    if result.get("is_dangerous"):
+        outcome = "dangerous"
+    elif result.get("success"):
+        outcome = "success"
+    else:
+        outcome = "failed"
+    QUESTIONS_TOTAL.inc(model_type=model_type, model=model, group=result.get("group_name", ""), outcome=outcome)
+    LAST_COMPLETION_TIMESTAMP.set(time.time())
+
+    if result.get("reused"):
+        CACHE_HITS_TOTAL.inc(cache="incremental")
+        return
+
+    if result.get("cache_hit"):
+        CACHE_HITS_TOTAL.inc(cache="question")
+    elif result.get("generation_time") is not None:
+        GENERATION_SECONDS.observe(result["generation_time"], model_type=model_type, model=model)
+    if result.get("db_time") is not None:
+        DB_SECONDS.observe(result["db_time"], db=result.get("db_name") or "")
+    if result.get("retries"):
+        RETRIES_TOTAL.inc(result["retries"], model_type=model_type, model=model)
+    for kind in ("prompt", "completion", "cached"):
+        tokens = result.get(f"{kind}_tokens")
+        if tokens:
+            TOKENS_TOTAL.inc(tokens, model_type=model_type, model=model, kind=kind)
+
+
+def _make_handler(registry: MetricsRegistry):
+    """创建 /metrics 请求处理类（http.server 在启动指标服务时才导入）"""
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # 不把抓取请求写进测试日志
+            pass
+
+    return MetricsHandler
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1",
+                         registry: Optional[MetricsRegistry] = None) -> "ThreadingHTTPServer":
+    """在后台线程启动指标 HTTP 服务
+
+    Args:
+        port: 监听端口
+        host: 监听地址（默认仅本机）
+        registry: 指标注册表（默认使用全局 REGISTRY）
+
+    Returns:
+        ThreadingHTTPServer: 服务实例，调用 shutdown() 停止
+    """
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((host, port), _make_handler(registry or REGISTRY))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    RUN_START_TIMESTAMP.set(time.time())
+    return server
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分阶段流水线
+各阶段之间用有界队列连接，每个阶段有独立的工作线程数：
+
+    生成（模型调用） → 校验（危险检测、安全检查） → 执行（数据库） → 写出（单线程）
+
+下游队列满时上游的 put 阻塞（背压），生产者也因此自动限速，内存中的测试项数量有上限。
+每个阶段的处理函数返回下一个阶段的名称（可以跳过中间阶段，但只能向后流动），返回 DONE 表示结束。
+统计信息：
+    - queue_depth: 队列深度的时间加权平均值和峰值
+    - utilisation: 忙碌时间 / (工作线程数 × 运行时长)，接近 100% 的阶段即为瓶颈
+    - blocked_seconds: 上游因该阶段队列已满而等待的总时长
+
+用法:
+    p = pipeline.Pipeline([pipeline.Stage("generate", gen, workers=8),
+                           pipeline.Stage("write", write, workers=1)], queue_size=16)
+    with p:
+        for item in items:
+            p.submit(item)
+    p.snapshot()
+"""
+
+import contextvars
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from test_case import metrics
+
+# 处理函数返回 DONE 表示测试项已结束，不再向后传递
+DONE = None
+
+DEFAULT_QUEUE_SIZE = 16
+
+# 工作线程等待新测试项的轮询间隔（秒）；排空时据此发现队列已空并退出
+_POLL_INTERVAL = 0.05
+
+STAGE_QUEUE_DEPTH = metrics.REGISTRY.gauge(
+    "text2sql_pipeline_queue_depth", "流水线各阶段队列中等待的测试项数量", ("stage",))
+STAGE_BUSY_WORKERS = metrics.REGISTRY.gauge(
+    "text2sql_pipeline_busy_workers", "流水线各阶段正在处理的工作线程数", ("stage",))
+STAGE_ITEMS_TOTAL = metrics.REGISTRY.counter(
+    "text2sql_pipeline_items_total", "流水线各阶段处理完成的测试项数量", ("stage",))
+
+
+class Stage:
+    """流水线的一个阶段"""
+
+    def __init__(self, name: str, handler: Callable[[Any], Optional[str]], workers: int = 1):
+        """
+        Args:
+            name: 阶段名称
+            handler: 处理函数，参数为测试项，返回下一个阶段名称或 DONE
+            workers: 工作线程数
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue: Optional[queue.Queue] = None
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._draining = False
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.max_depth = 0
+        self._depth = 0
+        self._depth_area = 0.0
+        self._depth_changed = 0.0
+
+    def _change_depth(self, delta: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._depth_area += self._depth * (now - self._depth_changed)
+            self._depth_changed = now
+            self._depth += delta
+            self.max_depth = max(self.max_depth, self._depth)
+        STAGE_QUEUE_DEPTH.inc(delta, stage=self.name)
+
+    def put(self, item: Any) -> None:
+        """放入队列（队列已满时阻塞，阻塞时长计入 blocked_seconds）"""
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            start = time.monotonic()
+            self.queue.put(item)
+            with self._lock:
+                self.blocked_seconds += time.monotonic() - start
+        self._change_depth(1)
+
+    def snapshot(self, elapsed: float) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            area = self._depth_area + self._depth * (now - self._depth_changed)
+            return {
+                "stage": self.name,
+                "workers": self.workers,
+                "queue_size": self.queue.maxsize if self.queue is not None else None,
+                "processed": self.processed,
+                "errors": self.errors,
+                "utilisation": self.busy_seconds / (self.workers * elapsed) * 100 if elapsed > 0 else 0.0,
+                "busy_seconds": self.busy_seconds,
+                "avg_queue_depth": area / elapsed if elapsed > 0 else 0.0,
+                "max_queue_depth": self.max_depth,
+                "blocked_seconds": self.blocked_seconds,
+            }
+
+
+class Pipeline:
+    """由有界队列连接的多阶段流水线（第一个阶段接收 submit 的测试项）"""
+
+    def __init__(self, stages: List[Stage], queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+        self._index = {stage.name: i for i, stage in enumerate(stages)}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+        self.failures: List[BaseException] = []
+        self._closed = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def start(self) -> None:
+        now = time.monotonic()
+        self.started_at = now
+        for stage in self.stages:
+            stage.queue = queue.Queue(maxsize=self.queue_size)
+            stage._depth_changed = now
+            for i in range(stage.workers):
+                # 工作线程沿用启动线程的上下文变量（任务调度器据此把输出写入所属任务的日志）
+                context = contextvars.copy_context()
+                thread = threading.Thread(target=context.run, args=(self._work, stage), daemon=True,
+                                          name=f"pipeline-{stage.name}-{i}")
+                stage._threads.append(thread)
+                thread.start()
+
+    def submit(self, item: Any) -> None:
+        """提交到第一个阶段（队列已满时阻塞）"""
+        self.stages[0].put(item)
+
+    def cancel(self) -> None:
+        """停止信号：处理函数可通过 cancelled 把尚未开始的测试项直接结束"""
+        self.cancelled = True
+
+    def _forward(self, stage: Stage, item: Any, target: Optional[str]) -> None:
+        if target is DONE:
+            return
+        index = self._index.get(target)
+        if index is None or index <= self._index[stage.name]:
+            raise ValueError(f"阶段 {stage.name} 只能把测试项交给后续阶段，而不是 {target}")
+        self.stages[index].put(item)
+
+    def _work(self, stage: Stage) -> None:
+        while True:
+            try:
+                item = stage.queue.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                if stage._draining:
+                    return
+                continue
+            stage._change_depth(-1)
+            with stage._lock:
+                stage.busy += 1
+            STAGE_BUSY_WORKERS.inc(stage=stage.name)
+            start = time.monotonic()
+            try:
+                self._forward(stage, item, stage.handler(item))
+            except BaseException as e:
+                # 处理函数应自行把错误写入测试项；这里只兜底记录，避免工作线程退出后流水线卡住
+                with stage._lock:
+                    stage.errors += 1
+                self.failures.append(e)
+            finally:
+                with stage._lock:
+                    stage.busy -= 1
+                    stage.busy_seconds += time.monotonic() - start
+                    stage.processed += 1
+                STAGE_BUSY_WORKERS.dec(stage=stage.name)
+                STAGE_ITEMS_TOTAL.inc(stage=stage.name)
+
+    def close(self) -> None:
+        """按阶段顺序排空并停止全部工作线程（前一阶段全部退出后，后续阶段不会再收到测试项）
+
+        可以重复调用：被停止信号打断后再次调用会从未排空的阶段继续。
+        """
+        if self._closed:
+            return
+        for stage in self.stages:
+            stage._draining = True
+            for thread in stage._threads:
+                thread.join()
+        self._closed = True
+        self.finished_at = time.monotonic()
+
+    def snapshot(self) -> List[Dict]:
+        """各阶段的统计（写入结果文件的 statistics.pipeline 字段）"""
+        if self.started_at is None:
+            return []
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return [stage.snapshot(elapsed) for stage in self.stages]
+
+
+def bottleneck(snapshot: List[Dict]) -> Optional[str]:
+    """利用率最高的阶段"""
+    if not snapshot:
+        return None
+    return max(snapshot, key=lambda row: row["utilisation"])["stage"]
+
+
+def format_console(snapshot: List[Dict]) -> str:
+    lines = ["流水线各阶段:"]
+    for row in snapshot:
+        lines.append(f"  {row['stage']}: {row['workers']} 个线程，处理 {row['processed']} 项，"
+                     f"利用率 {row['utilisation']:.1f}%，队列平均 {row['avg_queue_depth']:.1f} / "
+                     f"峰值 {row['max_queue_depth']}（上限 {row['queue_size']}），"
+                     f"上游阻塞 {row['blocked_seconds']:.2f}s")
+    slowest = bottleneck(snapshot)
+    if slowest:
+        lines.append(f"  瓶颈阶段: {slowest}（可增加该阶段的线程数）")
+    return "\n".join(lines)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+近似重复问题缓存
+对已验证成功的 SQL 按问题建立 MinHash/LSH 索引，新问题与已缓存问题足够相似时直接复用 SQL，
+跳过模型调用（SQL 仍会重新校验并执行）。
+
+相似度在归一化后的字符 n-gram 上计算，适用于中英文混排：
+    - 中文：字符二元组（单字问题取单字）
+    - 英文和数字：按词切分
+问题中的数字、否定词和排序 / 极值词必须完全一致才视为命中：
+    - "2023 年" 与 "2024 年"
+    - "按得分升序" 与 "按得分降序"
+    - "都进入过" 与 "都没有进入过"
+这些问题字面上高度相似，但含义不同，不会互相命中。
+
+英文名与中文名之间的对应（如 djokovic → 德约科维奇）通过别名表提供：
+    {"djokovic": "德约科维奇", "nadal": "纳达尔"}
+"""
+
+import functools
+import json
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+# MinHash 签名长度与 LSH 分带（NUM_BANDS * ROWS_PER_BAND == NUM_PERMUTATIONS）
+NUM_PERMUTATIONS = 64
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+
+DEFAULT_THRESHOLD = 0.85
+
+# 对相似度无贡献的虚词和标点
+_STOP_CHARS = set("的了吗呢吧啊呀么是")
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?|[㐀-鿿]+")
+_NUMBER_RE = re.compile(r"[0-9]+(?:\.[0-9]+)?")
+
+# 改变问题含义的否定词和排序 / 极值词（命中保护）：中文按子串匹配，英文按词匹配
+_GUARD_PHRASES = ("不", "没", "未", "非", "无", "升序", "降序", "正序", "倒序",
+                  "最多", "最少", "最高", "最低", "最大", "最小", "最早", "最晚")
+_GUARD_WORDS = frozenset({"not", "no", "none", "never", "without", "asc", "desc", "ascending", "descending",
+                          "top", "bottom", "most", "least", "highest", "lowest", "max", "min"})
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(NUM_PERMUTATIONS)]
+
+
+def load_aliases(aliases_file: Optional[str]) -> Dict[str, str]:
+    """加载别名表（JSON 对象：别名 -> 规范名），键统一转为小写"""
+    if not aliases_file:
+        return {}
+    with open(aliases_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {unicodedata.normalize("NFKC", k).lower(): v for k, v in data.items()}
+
+
+def normalize_question(question: str, aliases: Dict[str, str] = None) -> str:
+    """归一化问题文本：全角转半角、转小写、替换别名、去掉标点和多余空白"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    if aliases:
+        # 先替换较长的别名，避免短别名截断长别名
+        for alias in sorted(aliases, key=len, reverse=True):
+            if alias in text:
+                text = text.replace(alias, aliases[alias])
+    return " ".join(_TOKEN_RE.findall(text))
+
+
+def shingles(normalized: str) -> FrozenSet[str]:
+    """把归一化后的问题切分为 shingle 集合"""
+    result = set()
+    for token in normalized.split():
+        if token[0] < "㐀":
+            result.add(token)
+            continue
+        chars = [c for c in token if c not in _STOP_CHARS]
+        if len(chars) == 1:
+            result.add(chars[0])
+        for i in range(len(chars) - 1):
+            result.add(chars[i] + chars[i + 1])
+    return frozenset(result)
+
+
+def numbers(normalized: str) -> Tuple[str, ...]:
+    """提取问题中的数字（用于命中保护）"""
+    return tuple(sorted(_NUMBER_RE.findall(normalized)))
+
+
+def guard_tokens(normalized: str) -> Tuple[str, ...]:
+    """提取必须完全一致才能命中的词：数字、否定词和排序 / 极值词（含出现次数）"""
+    guards = list(_NUMBER_RE.findall(normalized))
+    for token in normalized.split():
+        if token[0] < "㐀":
+            if token in _GUARD_WORDS:
+                guards.append(token)
+            continue
+        for phrase in _GUARD_PHRASES:
+            guards.extend([phrase] * token.count(phrase))
+    return tuple(sorted(guards))
+
+
+@functools.lru_cache(maxsize=65536)
+def _shingle_hashes(shingle: str) -> Tuple[int, ...]:
+    """单个 shingle 在各置换下的哈希值（shingle 词表很小，缓存后签名只需逐位取最小值）"""
+    h = zlib.crc32(shingle.encode("utf-8"))
+    return tuple((a * h + b) % _MERSENNE_PRIME for a, b in _PERMUTATIONS)
+
+
+def minhash(shingle_set: FrozenSet[str]) -> Tuple[int, ...]:
+    """计算 MinHash 签名"""
+    if not shingle_set:
+        return (0,) * NUM_PERMUTATIONS
+    return tuple(map(min, zip(*map(_shingle_hashes, shingle_set))))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class QuestionCache:
+    """近似重复问题缓存
+
+    条目按作用域（测试组 × 模型）隔离；只保存成功执行的 SQL。
+    线程安全，可在多个工作线程间共享。
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, aliases: Dict[str, str] = None,
+                 path: str = None):
+        self.threshold = threshold
+        self.aliases = aliases or {}
+        self.path = path
+        self.entries: List[Dict] = []
+        self.lookups = 0
+        self.hits = 0
+        self.audit: List[Dict] = []
+        self._shingles: List[FrozenSet[str]] = []
+        self._guards: List[Tuple[str, ...]] = []
+        self._exact: Dict[Tuple[Tuple, str], int] = {}
+        self._buckets: Dict[Tuple, List[int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def scope(group_name: str, model_type: str, model_name: str) -> Tuple[str, str, str]:
+        return group_name or "", model_type or "", model_name or ""
+
+    def _index(self, entry: Dict) -> None:
+        idx = len(self.entries)
+        self.entries.append(entry)
+        scope = tuple(entry["scope"])
+        shingle_set = shingles(entry["normalized"])
+        self._shingles.append(shingle_set)
+        self._guards.append(guard_tokens(entry["normalized"]))
+        self._exact[(scope, entry["normalized"])] = idx
+        signature = minhash(shingle_set)
+        for band in range(NUM_BANDS):
+            start = band * ROWS_PER_BAND
+            key = (scope, band, signature[start:start + ROWS_PER_BAND])
+            self._buckets.setdefault(key, []).append(idx)
+
+    def lookup(self, question: str, scope: Tuple[str, str, str]) -> Optional[Tuple[Dict, float]]:
+        """查找相似问题
+
+        Returns:
+            Optional[Tuple[Dict, float]]: (缓存条目, 相似度)，未命中时返回 None
+        """
+        normalized = normalize_question(question, self.aliases)
+        with self._lock:
+            self.lookups += 1
+            idx = self._exact.get((scope, normalized))
+            if idx is not None:
+                self.hits += 1
+                return self.entries[idx], 1.0
+
+            query = shingles(normalized)
+            query_guards = guard_tokens(normalized)
+            signature = minhash(query)
+            candidates = set()
+            for band in range(NUM_BANDS):
+                start = band * ROWS_PER_BAND
+                candidates.update(self._buckets.get((scope, band, signature[start:start + ROWS_PER_BAND]), ()))
+
+            best, best_similarity = None, 0.0
+            for idx in candidates:
+                if self._guards[idx] != query_guards:
+                    continue
+                similarity = jaccard(query, self._shingles[idx])
+                if similarity > best_similarity:
+                    best, best_similarity = idx, similarity
+            if best is None or best_similarity < self.threshold:
+                return None
+            self.hits += 1
+            return self.entries[best], best_similarity
+
+    def add(self, question: str, scope: Tuple[str, str, str], sql: str) -> None:
+        """加入一条已验证成功的 SQL（归一化后相同的问题只保留第一条）"""
+        normalized = normalize_question(question, self.aliases)
+        with self._lock:
+            if (scope, normalized) in self._exact:
+                return
+            self._index({
+                "scope": list(scope),
+                "question": question,
+                "normalized": normalized,
+                "sql": sql,
+                "success": True,
+                "created_at": time.time(),
+            })
+
+    def record_hit(self, question: str, entry: Dict, similarity: float) -> Dict:
+        """记录一次缓存作答，返回写入结果的来源信息"""
+        source = {"question": entry["question"], "similarity": round(similarity, 4)}
+        with self._lock:
+            self.audit.append({
+                "question": question,
+                "cached_question": entry["question"],
+                "similarity": source["similarity"],
+                "scope": entry["scope"],
+                "sql": entry["sql"],
+            })
+        return source
+
+    def summary(self) -> Dict:
+        """命中率和缓存作答审计记录"""
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "entries": len(self.entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": (self.hits / self.lookups * 100) if self.lookups else 0,
+                "audit": list(self.audit),
+            }
+
+    @classmethod
+    def load(cls, path: str, threshold: float = DEFAULT_THRESHOLD,
+             aliases: Dict[str, str] = None) -> "QuestionCache":
+        """从文件加载缓存（文件不存在时返回空缓存）；别名表变化时按新别名重新归一化"""
+        cache = cls(threshold=threshold, aliases=aliases, path=path)
+        if not path or not os.path.exists(path):
+            return cache
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"警告: 无法读取问题缓存文件 {path}: {e}")
+            return cache
+        for entry in data.get("entries", []):
+            entry["normalized"] = normalize_question(entry["question"], cache.aliases)
+            if (tuple(entry["scope"]), entry["normalized"]) not in cache._exact:
+                cache._index(entry)
+        return cache
+
+    def save(self, path: str = None) -> None:
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            entries = list(self.entries)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": 1, "entries": entries}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+只读副本路由与负载均衡
+数据库配置中列出 replicas 时，查询按负载分配到各副本，而不是全部压在一台 MySQL 上：
+
+    "tennis": {
+        "user": "...", "password": "...", "database": "tennis", "pool_size": 8,
+        "replicas": [
+            {"host": "10.0.0.11", "weight": 2},
+            {"host": "10.0.0.12", "port": 3307, "weight": 1, "pool_size": 4}
+        ],
+        "health_check": {"interval": 5, "max_failures": 3, "ejection_time": 30}
+    }
+
+每个副本的配置 = 顶层配置（去掉 replicas / health_check）+ 副本自身的字段，仍由 DATABASE_DRIVERS 中的驱动创建。
+
+路由：在健康副本中选择 (进行中查询数 + 1) × 近期延迟 / 权重 最小的一个；还没有延迟样本的副本按已知最快的延迟估计，
+探测成功时也会更新近期延迟，空闲副本的估计不会一直停留在旧值上。
+健康检查：
+    - 被动：连续 max_failures 次连接类错误（连不上、连接断开、等待连接超时）后摘除，SQL 本身的错误不计入
+    - 主动：后台线程每 interval 秒对所有副本执行 SELECT 1；被摘除的副本在摘除时间结束且探测成功后重新加入，
+      多次摘除时摘除时间逐次翻倍（最长 MAX_EJECTION_TIME）
+所有副本都被摘除时仍选择最早到期的副本，而不是直接失败。
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from test_case import metrics, report
+
+DEFAULT_HEALTH_CHECK = {"interval": 5.0, "max_failures": 3, "ejection_time": 30.0, "probe_timeout": 2.0}
+
+# 多次摘除时摘除时间的上限（秒）
+MAX_EJECTION_TIME = 300.0
+
+# 近期延迟 EWMA 的平滑系数
+LATENCY_ALPHA = 0.2
+
+# 所有副本都没有延迟样本时使用的初始估计（秒）
+INITIAL_LATENCY = 0.01
+
+# 每个副本保留的最近延迟样本数（用于分位数统计）
+MAX_LATENCY_SAMPLES = 2048
+
+_CONNECTION_ERROR_MARKERS = ("can't connect", "lost connection", "gone away", "connection refused",
+                             "(2003", "(2006", "(2013", "等待数据库连接超时")
+
+REPLICA_IN_FLIGHT = metrics.REGISTRY.gauge(
+    "text2sql_replica_in_flight", "副本上正在执行的查询数", ("db", "replica"))
+REPLICA_HEALTHY = metrics.REGISTRY.gauge(
+    "text2sql_replica_healthy", "副本是否在路由中（1 健康，0 已摘除）", ("db", "replica"))
+REPLICA_EJECTIONS_TOTAL = metrics.REGISTRY.counter(
+    "text2sql_replica_ejections_total", "副本被摘除的次数", ("db", "replica"))
+REPLICA_QUERY_SECONDS = metrics.REGISTRY.histogram(
+    "text2sql_replica_query_seconds", "副本上的查询耗时（秒）", ("db", "replica"))
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """是否为副本不可用类的错误（SQL 语法、未知列等错误不算）"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    text = str(error).lower()
+    return any(marker in text for marker in _CONNECTION_ERROR_MARKERS)
+
+
+class Replica:
+    """一个副本的连接实例和运行状态"""
+
+    def __init__(self, name: str, database, weight: float):
+        self.name = name
+        self.database = database
+        self.weight = max(float(weight), 0.01)
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.latencies: List[float] = []
+        self.queries = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.probe_failures = 0
+
+    def score(self, default_latency: float) -> float:
+        latency = self.latency if self.latency is not None else default_latency
+        return (self.in_flight + 1) * latency / self.weight
+
+    def observe_latency(self, latency: float, query: bool = True) -> None:
+        """更新近期延迟；query 为 False（探测）时不计入查询延迟分位数"""
+        self.latency = latency if self.latency is None else self.latency + LATENCY_ALPHA * (latency - self.latency)
+        if not query:
+            return
+        self.latencies.append(latency)
+        if len(self.latencies) > MAX_LATENCY_SAMPLES:
+            del self.latencies[:len(self.latencies) - MAX_LATENCY_SAMPLES]
+
+
+class ReplicaSet:
+    """多个副本组成的数据库（与单个数据库实例的接口相同：execute_query / close / pool_size）"""
+
+    def __init__(self, db_name: str, replicas: List[Replica], health_check: Optional[Dict] = None):
+        """
+        Args:
+            db_name: 数据库名称标识（用于日志和指标标签）
+            replicas: 副本列表
+            health_check: 健康检查参数（interval / max_failures / ejection_time / probe_timeout）
+        """
+        if not replicas:
+            raise ValueError(f"数据库 {db_name} 的 replicas 为空")
+        settings = dict(DEFAULT_HEALTH_CHECK)
+        settings.update(health_check or {})
+        self.db_name = db_name
+        self.replicas = replicas
+        self.interval = float(settings["interval"])
+        self.max_failures = int(settings["max_failures"])
+        self.ejection_time = float(settings["ejection_time"])
+        self.probe_timeout = float(settings["probe_timeout"])
+        self.pool_size = sum(getattr(replica.database, "pool_size", 1) for replica in replicas)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._prober: Optional[threading.Thread] = None
+        for replica in replicas:
+            REPLICA_HEALTHY.set(1, db=db_name, replica=replica.name)
+
+    @classmethod
+    def from_config(cls, db_name: str, db_config: Dict, factory: Callable[[Dict], object]) -> "ReplicaSet":
+        """根据带 replicas 的数据库配置创建，每个副本由 factory(副本配置) 创建"""
+        base = {key: value for key, value in db_config.items() if key not in ("replicas", "health_check")}
+        replicas = []
+        for i, overrides in enumerate(db_config["replicas"]):
+            replica_config = dict(base)
+            replica_config.update(overrides)
+            name = overrides.get("name") or f"{replica_config.get('host')}:{replica_config.get('port', 3306)}"
+            if any(replica.name == name for replica in replicas):
+                name = f"{name}#{i}"
+            replicas.append(Replica(name, factory(replica_config), replica_config.get("weight", 1)))
+        return cls(db_name, replicas, db_config.get("health_check"))
+
+    def _choose(self) -> Replica:
+        now = time.monotonic()
+        with self._lock:
+            if self.interval <= 0:
+                # 未开启主动探测：摘除时间结束后直接重新加入
+                for replica in self.replicas:
+                    if not replica.healthy and now >= replica.ejected_until:
+                        self._readmit(replica)
+            candidates = [replica for replica in self.replicas if replica.healthy]
+            if not candidates:
+                # 全部被摘除：选择最早到期的副本，让请求有机会成功
+                candidates = [min(self.replicas, key=lambda replica: replica.ejected_until)]
+            known = [replica.latency for replica in candidates if replica.latency is not None]
+            default_latency = min(known) if known else INITIAL_LATENCY
+            replica = min(candidates, key=lambda candidate: candidate.score(default_latency))
+            replica.in_flight += 1
+        REPLICA_IN_FLIGHT.set(replica.in_flight, db=self.db_name, replica=replica.name)
+        self._ensure_prober()
+        return replica
+
+    def _finish(self, replica: Replica, latency: float, error: Optional[BaseException]) -> None:
+        with self._lock:
+            replica.in_flight -= 1
+            replica.queries += 1
+            if error is not None and is_connection_error(error):
+                replica.errors += 1
+                replica.consecutive_failures += 1
+                if replica.healthy and replica.consecutive_failures >= self.max_failures:
+                    self._eject(replica, f"连续 {replica.consecutive_failures} 次连接错误: {error}")
+            else:
+                replica.consecutive_failures = 0
+                replica.observe_latency(latency)
+        REPLICA_IN_FLIGHT.set(replica.in_flight, db=self.db_name, replica=replica.name)
+        if error is None:
+            REPLICA_QUERY_SECONDS.observe(latency, db=self.db_name, replica=replica.name)
+
+    def _eject(self, replica: Replica, reason: str) -> None:
+        """摘除副本（调用方需持有锁）；多次摘除时摘除时间逐次翻倍"""
+        if sum(1 for other in self.replicas if other.healthy) <= 1 and replica.healthy:
+            # 最后一个健康副本不摘除，避免全部流量落到已知故障的副本上
+            return
+        replica.healthy = False
+        replica.ejections += 1
+        duration = min(MAX_EJECTION_TIME, self.ejection_time * (2 ** (replica.ejections - 1)))
+        replica.ejected_until = time.monotonic() + duration
+        REPLICA_HEALTHY.set(0, db=self.db_name, replica=replica.name)
+        REPLICA_EJECTIONS_TOTAL.inc(db=self.db_name, replica=replica.name)
+        print(f"  [副本] {self.db_name}/{replica.name} 已摘除 {duration:g} 秒（{reason}）", flush=True)
+
+    def _readmit(self, replica: Replica) -> None:
+        replica.healthy = True
+        replica.consecutive_failures = 0
+        replica.probe_failures = 0
+        REPLICA_HEALTHY.set(1, db=self.db_name, replica=replica.name)
+        print(f"  [副本] {self.db_name}/{replica.name} 重新加入路由", flush=True)
+
+    def execute_query(self, sql: str, timeout: Optional[float] = None) -> List[Dict]:
+        """把查询路由到当前负载最低的健康副本"""
+        replica = self._choose()
+        start = time.perf_counter()
+        error = None
+        try:
+            return replica.database.execute_query(sql, timeout=timeout)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(replica, time.perf_counter() - start, error)
+
+    # ------------------------------------------------------------------
+    # 主动健康检查
+    # ------------------------------------------------------------------
+
+    def _ensure_prober(self) -> None:
+        if self._prober is None and self.interval > 0 and len(self.replicas) > 1:
+            with self._lock:
+                if self._prober is None:
+                    self._prober = threading.Thread(target=self._probe_loop, daemon=True,
+                                                    name=f"replica-probe-{self.db_name}")
+                    self._prober.start()
+
+    def _probe_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.probe_all()
+
+    def probe_all(self) -> None:
+        """对所有副本执行一次 SELECT 1 探测"""
+        for replica in self.replicas:
+            with self._lock:
+                due = replica.healthy or time.monotonic() >= replica.ejected_until
+            if not due:
+                continue
+            start = time.perf_counter()
+            try:
+                replica.database.execute_query("SELECT 1", timeout=self.probe_timeout)
+            except Exception as e:
+                with self._lock:
+                    replica.probe_failures += 1
+                    if replica.healthy and replica.probe_failures >= self.max_failures:
+                        self._eject(replica, f"连续 {replica.probe_failures} 次探测失败: {e}")
+                    elif not replica.healthy:
+                        duration = min(MAX_EJECTION_TIME, self.ejection_time * (2 ** (replica.ejections - 1)))
+                        replica.ejected_until = time.monotonic() + duration
+                continue
+            with self._lock:
+                replica.probe_failures = 0
+                replica.observe_latency(time.perf_counter() - start, query=False)
+                if not replica.healthy:
+                    self._readmit(replica)
+
+    def close(self) -> None:
+        self._stop.set()
+        for replica in self.replicas:
+            close = getattr(replica.database, "close", None)
+            if close:
+                close()
+
+    def snapshot(self) -> Dict:
+        """各副本的健康状态、查询数和延迟分位数（毫秒）"""
+        with self._lock:
+            rows = []
+            for replica in self.replicas:
+                latencies = sorted(replica.latencies)
+                p50 = report.percentile(latencies, 50)
+                p90 = report.percentile(latencies, 90)
+                p99 = report.percentile(latencies, 99)
+                rows.append({
+                    "replica": replica.name,
+                    "weight": replica.weight,
+                    "healthy": replica.healthy,
+                    "in_flight": replica.in_flight,
+                    "queries": replica.queries,
+                    "errors": replica.errors,
+                    "ejections": replica.ejections,
+                    "latency_ewma_ms": replica.latency * 1000 if replica.latency is not None else None,
+                    "latency_p50_ms": p50 * 1000 if p50 is not None else None,
+                    "latency_p90_ms": p90 * 1000 if p90 is not None else None,
+                    "latency_p99_ms": p99 * 1000 if p99 is not None else None,
+                })
+            return {"db": self.db_name, "replicas": rows}
+
+
+def format_console(snapshots: List[Dict]) -> str:
+    """控制台输出：每个副本一行"""
+    lines = ["只读副本:"]
+    for snap in snapshots:
+        total = sum(row["queries"] for row in snap["replicas"]) or 1
+        for row in snap["replicas"]:
+            p50 = f"{row['latency_p50_ms']:.1f}ms" if row["latency_p50_ms"] is not None else "-"
+            p90 = f"{row['latency_p90_ms']:.1f}ms" if row["latency_p90_ms"] is not None else "-"
+            state = "健康" if row["healthy"] else "已摘除"
+            lines.append(f"  [{snap['db']}] {row['replica']}（权重 {row['weight']:g}，{state}）: "
+                         f"查询 {row['queries']}（{row['queries'] / total * 100:.1f}%），错误 {row['errors']}，"
+                         f"摘除 {row['ejections']} 次，p50 {p50}，p90 {p90}")
+    return "\n".join(lines)
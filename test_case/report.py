@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试结果分析报告
+从一个或多个已保存的结果文件重新计算统计信息，无需重新运行测试
+
+结果先被读入按列存储的数组（分类列使用字典编码），然后一次遍历计算全部聚合：
+成功率/危险率、延迟分位数、token 与费用合计、服务端查询指标，以及按模型、按测试组的细分。
+"""
+
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from test_case import server_metrics
+
+PERCENTILES = (50, 90, 95, 99)
+
+# 报告输出的字段顺序（用于控制台和 CSV）
+SUMMARY_FIELDS = [
+    "model_type", "model", "group", "total", "success", "failed", "dangerous", "reused",
+    "cache_hits", "success_rate", "dangerous_rate", "fresh_success_rate",
+    "generation_p50", "generation_p90", "generation_p95", "generation_p99",
+    "db_p50", "db_p90", "db_p95", "db_p99",
+    "prompt_tokens", "completion_tokens", "cached_tokens", "cached_rate", "cost",
+    "server_queries", "server_time_avg", "rows_examined_avg", "rows_sent_avg", "examined_per_sent",
+    "tmp_tables", "tmp_disk_tables", "filesorts", "full_scans",
+]
+
+
+def iter_result_rows(paths: Sequence[str]) -> Iterator[Dict]:
+    """逐条读取结果文件中的测试结果
+
+    支持 run_tests 输出的 test_results.json（读取 results_flat），以及每行一个结果的 JSONL 文件。
+    """
+    for path in paths:
+        if path.endswith(".jsonl"):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line)
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for model_results in data.get("results_flat", {}).values():
+            yield from model_results
+
+
+class _Dictionary:
+    """分类列的字典编码（字符串 -> 整数编码）"""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class ResultColumns:
+    """按列存储的测试结果"""
+
+    def __init__(self):
+        self.models = _Dictionary()   # 编码 "model_type\0model_name"
+        self.groups = _Dictionary()
+        self.model_code = array('i')
+        self.group_code = array('i')
+        self.success = bytearray()
+        self.dangerous = bytearray()
+        self.reused = bytearray()
+        self.cache_hit = bytearray()
+        self.generation_time = array('d')
+        self.db_time = array('d')
+        self.prompt_tokens = array('q')
+        self.completion_tokens = array('q')
+        self.cached_tokens = array('q')
+        # 服务端查询指标（server_measured 为 0 的行其余各列无意义）
+        self.server_measured = bytearray()
+        self.server_time = array('d')
+        self.rows_examined = array('q')
+        self.rows_sent = array('q')
+        self.tmp_tables = array('q')
+        self.tmp_disk_tables = array('q')
+        self.filesorts = array('q')
+        self.full_scans = array('q')
+
+    def __len__(self) -> int:
+        return len(self.model_code)
+
+    def append(self, result: Dict) -> None:
+        model_key = f"{result.get('model_type', '')}\0{result.get('model_name', '')}"
+        self.model_code.append(self.models.encode(model_key))
+        self.group_code.append(self.groups.encode(result.get("group_name") or "未知组"))
+        self.success.append(1 if result.get("success") else 0)
+        self.dangerous.append(1 if result.get("is_dangerous") else 0)
+        self.reused.append(1 if result.get("reused") else 0)
+        self.cache_hit.append(1 if result.get("cache_hit") else 0)
+        generation_time = result.get("generation_time")
+        db_time = result.get("db_time")
+        self.generation_time.append(math.nan if generation_time is None else float(generation_time))
+        self.db_time.append(math.nan if db_time is None else float(db_time))
+        self.prompt_tokens.append(int(result.get("prompt_tokens") or 0))
+        self.completion_tokens.append(int(result.get("completion_tokens") or 0))
+        self.cached_tokens.append(int(result.get("cached_tokens") or 0))
+        server = result.get("server_metrics") or {}
+        self.server_measured.append(1 if server else 0)
+        server_time = server.get("server_time")
+        self.server_time.append(math.nan if server_time is None else float(server_time))
+        self.rows_examined.append(int(server.get("rows_examined") or 0))
+        self.rows_sent.append(int(server.get("rows_sent") or 0))
+        self.tmp_tables.append(int(server.get("tmp_tables") or 0))
+        self.tmp_disk_tables.append(int(server.get("tmp_disk_tables") or 0))
+        self.filesorts.append(int(server.get("filesorts") or 0))
+        self.full_scans.append(int(server.get("full_scans") or 0))
+
+    @classmethod
+    def from_results(cls, results: Iterable[Dict]) -> "ResultColumns":
+        columns = cls()
+        for result in results:
+            columns.append(result)
+        return columns
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> Optional[float]:
+    """线性插值分位数（输入需已排序）"""
+    if not sorted_values:
+        return None
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def load_pricing(pricing_file: Optional[str]) -> Dict[str, Dict[str, float]]:
+    """加载模型单价表
+
+    文件格式: {"gpt-4o": {"prompt": 2.5, "completion": 10.0, "cached": 1.25}, ...}，单位为每百万 token 的费用；
+    cached 为命中提供方提示词缓存的 prompt token 单价（省略时按 prompt 单价计算）
+    """
+    if not pricing_file:
+        return {}
+    with open(pricing_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class _Accumulator:
+    """单个聚合键（模型或模型 × 测试组）的累加状态"""
+
+    __slots__ = ("total", "success", "dangerous", "reused", "cache_hits", "cache_success", "prompt_tokens",
+                 "completion_tokens", "cached_tokens", "generation_times", "db_times",
+                 "server_queries", "server_timed", "server_time", "rows_examined", "rows_sent", "tmp_tables",
+                 "tmp_disk_tables", "filesorts", "full_scans")
+
+    def __init__(self):
+        self.total = 0
+        self.success = 0
+        self.dangerous = 0
+        self.reused = 0
+        self.cache_hits = 0
+        self.cache_success = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.generation_times = array('d')
+        self.db_times = array('d')
+        self.server_queries = 0
+        self.server_timed = 0
+        self.server_time = 0.0
+        self.rows_examined = 0
+        self.rows_sent = 0
+        self.tmp_tables = 0
+        self.tmp_disk_tables = 0
+        self.filesorts = 0
+        self.full_scans = 0
+
+    def summary(self, model_type: str, model: str, group: Optional[str], pricing: Dict) -> Dict:
+        safe = self.total - self.dangerous
+        # 新生成 = 未经问题缓存作答的结果（缓存作答的 SQL 已验证过，不计入危险）
+        fresh_safe = safe - self.cache_hits
+        fresh_success = self.success - self.cache_success
+        generation_times = sorted(self.generation_times)
+        db_times = sorted(self.db_times)
+        row = {
+            "model_type": model_type,
+            "model": model,
+            "group": group,
+            "total": self.total,
+            "success": self.success,
+            "failed": safe - self.success,
+            "dangerous": self.dangerous,
+            "reused": self.reused,
+            "cache_hits": self.cache_hits,
+            "success_rate": (self.success / safe * 100) if safe > 0 else 0,
+            "dangerous_rate": (self.dangerous / self.total * 100) if self.total > 0 else 0,
+            "fresh_success_rate": (fresh_success / fresh_safe * 100) if fresh_safe > 0 else None,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cached_rate": (self.cached_tokens / self.prompt_tokens * 100) if self.prompt_tokens > 0 else None,
+            "cost": None,
+        }
+        queries = self.server_queries
+        row.update({
+            "server_queries": queries,
+            "server_time_avg": self.server_time / self.server_timed if self.server_timed else None,
+            "rows_examined_avg": self.rows_examined / queries if queries else None,
+            "rows_sent_avg": self.rows_sent / queries if queries else None,
+            "examined_per_sent": self.rows_examined / max(self.rows_sent, 1) if queries else None,
+            "tmp_tables": self.tmp_tables,
+            "tmp_tables_avg": self.tmp_tables / queries if queries else None,
+            "tmp_disk_tables": self.tmp_disk_tables,
+            "filesorts": self.filesorts,
+            "filesorts_avg": self.filesorts / queries if queries else None,
+            "full_scans": self.full_scans,
+        })
+        for pct in PERCENTILES:
+            row[f"generation_p{pct}"] = percentile(generation_times, pct)
+            row[f"db_p{pct}"] = percentile(db_times, pct)
+        price = pricing.get(model)
+        if price:
+            prompt_price = price.get("prompt", 0)
+            row["cost"] = ((self.prompt_tokens - self.cached_tokens) * prompt_price
+                           + self.cached_tokens * price.get("cached", prompt_price)
+                           + self.completion_tokens * price.get("completion", 0)) / 1_000_000
+        return row
+
+
+def aggregate(columns: ResultColumns, pricing: Dict = None) -> Dict:
+    """一次遍历计算全部聚合
+
+    Returns:
+        Dict: {"models": [按模型汇总], "groups": [按模型 × 测试组汇总], "overall": {模型类型: 汇总}}
+    """
+    pricing = pricing or {}
+    group_count = len(columns.groups.values)
+    model_types = [key.split("\0", 1)[0] for key in columns.models.values]
+    model_acc = [_Accumulator() for _ in columns.models.values]
+    type_acc = {model_type: _Accumulator() for model_type in model_types}
+    type_of_model = [type_acc[model_type] for model_type in model_types]
+    cell_acc: Dict[int, _Accumulator] = {}
+
+    model_code = columns.model_code
+    group_code = columns.group_code
+    success = columns.success
+    dangerous = columns.dangerous
+    reused = columns.reused
+    cache_hit = columns.cache_hit
+    generation_time = columns.generation_time
+    db_time = columns.db_time
+    prompt_tokens = columns.prompt_tokens
+    completion_tokens = columns.completion_tokens
+    cached_tokens = columns.cached_tokens
+    server_measured = columns.server_measured
+    server_time = columns.server_time
+
+    for i in range(len(columns)):
+        m = model_code[i]
+        cell = m * group_count + group_code[i]
+        cell_state = cell_acc.get(cell)
+        if cell_state is None:
+            cell_state = cell_acc[cell] = _Accumulator()
+        accs = (model_acc[m], cell_state, type_of_model[m])
+        g = generation_time[i]
+        d = db_time[i]
+        for acc in accs:
+            acc.total += 1
+            acc.success += success[i]
+            acc.dangerous += dangerous[i]
+            acc.reused += reused[i]
+            acc.cache_hits += cache_hit[i]
+            acc.cache_success += cache_hit[i] & success[i]
+            acc.prompt_tokens += prompt_tokens[i]
+            acc.completion_tokens += completion_tokens[i]
+            acc.cached_tokens += cached_tokens[i]
+            # 复用的结果不计入延迟，避免历史耗时混入本次的分位数；缓存作答没有生成耗时
+            if not reused[i]:
+                if g == g and not cache_hit[i]:  # 非 NaN
+                    acc.generation_times.append(g)
+                if d == d:
+                    acc.db_times.append(d)
+                if server_measured[i]:
+                    t = server_time[i]
+                    acc.server_queries += 1
+                    if t == t:
+                        acc.server_timed += 1
+                        acc.server_time += t
+                    acc.rows_examined += columns.rows_examined[i]
+                    acc.rows_sent += columns.rows_sent[i]
+                    acc.tmp_tables += columns.tmp_tables[i]
+                    acc.tmp_disk_tables += columns.tmp_disk_tables[i]
+                    acc.filesorts += columns.filesorts[i]
+                    acc.full_scans += columns.full_scans[i]
+
+    def split(code: int):
+        return columns.models.values[code].split("\0", 1)
+
+    models = []
+    for code in sorted(range(len(model_acc)), key=lambda c: columns.models.values[c]):
+        model_type, model = split(code)
+        models.append(model_acc[code].summary(model_type, model, None, pricing))
+
+    groups = []
+    for cell in sorted(cell_acc, key=lambda c: (columns.models.values[c // group_count], c % group_count)):
+        model_type, model = split(cell // group_count)
+        group = columns.groups.values[cell % group_count]
+        groups.append(cell_acc[cell].summary(model_type, model, group, pricing))
+
+    overall = {}
+    for model_type, acc in sorted(type_acc.items()):
+        row = acc.summary(model_type, "*", None, {})
+        costs = [m["cost"] for m in models if m["model_type"] == model_type and m["cost"] is not None]
+        row["cost"] = sum(costs) if costs else None
+        overall[model_type] = row
+
+    return {"total_results": len(columns), "models": models, "groups": groups, "overall": overall}
+
+
+def _fmt_seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.3f}s"
+
+
+def format_console(report: Dict) -> str:
+    """格式化为控制台文本"""
+    out = io.StringIO()
+    out.write("=" * 80 + "\n")
+    out.write(f"测试结果分析报告（共 {report['total_results']} 条结果）\n")
+    out.write("=" * 80 + "\n")
+    for model_type, overall in report["overall"].items():
+        out.write(f"\n{model_type.upper()} 模型统计:\n")
+        out.write("-" * 80 + "\n")
+        for row in report["models"]:
+            if row["model_type"] != model_type:
+                continue
+            out.write(f"\n  模型: {row['model']}\n")
+            out.write(f"    总问题数: {row['total']}，成功: {row['success']}，失败: {row['failed']}，"
+                      f"危险: {row['dangerous']}，复用: {row['reused']}，缓存作答: {row['cache_hits']}\n")
+            out.write(f"    安全 SQL 成功率: {row['success_rate']:.2f}%，危险率: {row['dangerous_rate']:.2f}%\n")
+            if row["cache_hits"] and row["fresh_success_rate"] is not None:
+                out.write(f"    新生成成功率（不含缓存作答）: {row['fresh_success_rate']:.2f}%\n")
+            out.write(f"    生成延迟 p50/p90/p99: {_fmt_seconds(row['generation_p50'])} / "
+                      f"{_fmt_seconds(row['generation_p90'])} / {_fmt_seconds(row['generation_p99'])}\n")
+            out.write(f"    数据库延迟 p50/p90/p99: {_fmt_seconds(row['db_p50'])} / "
+                      f"{_fmt_seconds(row['db_p90'])} / {_fmt_seconds(row['db_p99'])}\n")
+            cost = f"，费用: {row['cost']:.4f}" if row["cost"] is not None else ""
+            cached = (f"（缓存命中 {row['cached_tokens']}，{row['cached_rate']:.1f}%）"
+                      if row["cached_tokens"] else "")
+            out.write(f"    Token: prompt {row['prompt_tokens']}{cached}，completion {row['completion_tokens']}{cost}\n")
+            server = server_metrics.format_model(row)
+            if server:
+                out.write(f"    {server}\n")
+            group_rows = [g for g in report["groups"]
+                          if g["model_type"] == model_type and g["model"] == row["model"]]
+            if len(group_rows) > 1:
+                out.write("    按测试组统计:\n")
+                for g in group_rows:
+                    out.write(f"      {g['group']}: 成功 {g['success']}/{g['total'] - g['dangerous']}, "
+                              f"危险 {g['dangerous']} ({g['success_rate']:.2f}%)，"
+                              f"生成 p90 {_fmt_seconds(g['generation_p90'])}\n")
+        out.write(f"\n  {model_type.upper()} 总体统计（所有模型）:\n")
+        out.write(f"    总问题数: {overall['total']}，成功: {overall['success']}，危险: {overall['dangerous']}\n")
+        out.write(f"    安全 SQL 总成功率: {overall['success_rate']:.2f}%\n")
+    return out.getvalue()
+
+
+def format_csv(report: Dict) -> str:
+    """格式化为 CSV（按模型汇总行的 group 为空，其余为按测试组细分行）"""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=SUMMARY_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for row in report["models"] + report["groups"]:
+        writer.writerow(row)
+    return out.getvalue()
+
+
+def build_report(paths: Sequence[str], pricing_file: str = None) -> Dict:
+    """从结果文件构建报告"""
+    columns = ResultColumns.from_results(iter_result_rows(paths))
+    return aggregate(columns, load_pricing(pricing_file))
+
+
+def main(argv: List[str] = None) -> int:
+    """report 子命令入口"""
+    parser = argparse.ArgumentParser(
+        prog="test_text2sql.py report",
+        description="从已保存的结果文件重新计算统计信息"
+    )
+    parser.add_argument("results", nargs="+", help="结果文件（test_results.json 或 JSONL），可指定多个")
+    parser.add_argument("--format", choices=["console", "json", "csv"], default="console", help="输出格式（默认: console）")
+    parser.add_argument("--output", default=None, help="输出文件路径（默认输出到标准输出）")
+    parser.add_argument("--pricing", default=None, help="模型单价 JSON 文件（每百万 token 费用），用于计算费用")
+    args = parser.parse_args(argv)
+
+    for path in args.results:
+        if not os.path.exists(path):
+            print(f"错误: 结果文件不存在: {path}", file=sys.stderr)
+            return 1
+
+    report = build_report(args.results, args.pricing)
+    if args.format == "json":
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+    elif args.format == "csv":
+        text = format_csv(report)
+    else:
+        text = format_console(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        print(f"报告已保存到: {args.output}")
+    else:
+        sys.stdout.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询结果行的紧凑存储
+默认只保存 result_count；排查错误答案时，表中的数据可能早已变化，无法再重现当时的结果。
+开启行存储后，每个成功执行的测试结果额外记录：
+    - row_hash:    全部结果行的 SHA-256（列名 + 按返回顺序的行值），可直接比较两个模型的输出是否一致
+    - row_columns: 列名和推断的值类型
+    - row_sample:  前若干行（数量有上限），便于直接在结果文件中查看
+    - result_id:   结果编号，用于查回完整结果行
+完整结果行以 gzip 压缩的 JSON 保存在按内容寻址的目录中（objects/<哈希前两位>/<哈希>.json.gz），
+不同模型、不同运行得到相同输出时只保存一份；index.jsonl 记录 result_id → row_hash。
+
+用法:
+    python test_case/test_text2sql.py --store-rows test_case/row_store
+    python test_case/test_text2sql.py rows show <result_id>
+    python test_case/test_text2sql.py rows stats
+"""
+
+import argparse
+import datetime
+import decimal
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import uuid
+from typing import Dict, List, Optional, Sequence
+
+DEFAULT_ROW_STORE = os.path.join(os.path.dirname(__file__), "row_store")
+
+# 结果文件中保留的样本行数
+DEFAULT_SAMPLE_ROWS = 5
+
+# 样本行中单个字符串值的最大长度（完整值在 blob 中）
+MAX_SAMPLE_VALUE_CHARS = 200
+
+
+def _encode_value(value):
+    """把数据库返回的值转换为可稳定序列化的 JSON 值"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).hex()
+    return str(value)
+
+
+def _value_type(value) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, decimal.Decimal):
+        return "decimal"
+    if isinstance(value, datetime.datetime):
+        return "datetime"
+    if isinstance(value, datetime.date):
+        return "date"
+    if isinstance(value, (datetime.time, datetime.timedelta)):
+        return "time"
+    if isinstance(value, (bytes, bytearray)):
+        return "bytes"
+    return "str"
+
+
+def infer_columns(rows: Sequence[Dict]) -> List[Dict]:
+    """按第一个非空值推断各列类型（全为空的列记为 null）"""
+    if not rows:
+        return []
+    columns = []
+    for name in rows[0]:
+        value_type = next((_value_type(row[name]) for row in rows if row.get(name) is not None), "null")
+        columns.append({"name": name, "type": value_type})
+    return columns
+
+
+def encode_rows(rows: Sequence[Dict]) -> bytes:
+    """把结果行编码为紧凑的 JSON（列名只出现一次，行按返回顺序保存为数组）"""
+    names = list(rows[0]) if rows else []
+    payload = {"columns": names,
+               "rows": [[_encode_value(row.get(name)) for name in names] for row in rows]}
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def row_hash(encoded: bytes) -> str:
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _sample_value(value):
+    value = _encode_value(value)
+    if isinstance(value, str) and len(value) > MAX_SAMPLE_VALUE_CHARS:
+        return value[:MAX_SAMPLE_VALUE_CHARS] + "…"
+    return value
+
+
+class RowStore:
+    """按内容寻址的结果行存储（线程安全）"""
+
+    def __init__(self, directory: str = DEFAULT_ROW_STORE, sample_rows: int = DEFAULT_SAMPLE_ROWS):
+        """
+        Args:
+            directory: 存储目录
+            sample_rows: 结果中保留的样本行数
+        """
+        self.directory = directory
+        self.sample_rows = sample_rows
+        self.index_file = os.path.join(directory, "index.jsonl")
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, Dict]] = None
+        # 本次运行的存储统计
+        self.stored_results = 0
+        self.new_blobs = 0
+        self.deduplicated = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "objects", digest[:2], f"{digest}.json.gz")
+
+    def store(self, result: Dict, rows: Sequence[Dict]) -> None:
+        """保存一个成功结果的全部行，并把 result_id、row_hash、row_columns、row_sample 写入 result"""
+        rows = list(rows or [])
+        encoded = encode_rows(rows)
+        digest = row_hash(encoded)
+        path = self._blob_path(digest)
+        result_id = uuid.uuid4().hex
+        with self._lock:
+            self.stored_results += 1
+            self.raw_bytes += len(encoded)
+            if os.path.exists(path):
+                self.deduplicated += 1
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # mtime=0：相同内容得到完全相同的压缩文件
+                compressed = gzip.compress(encoded, mtime=0)
+                tmp_path = f"{path}.{result_id}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(compressed)
+                os.replace(tmp_path, path)
+                self.new_blobs += 1
+                self.compressed_bytes += len(compressed)
+            entry = {"result_id": result_id, "row_hash": digest, "row_count": len(rows)}
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+            if self._index is not None:
+                self._index[result_id] = entry
+        result["result_id"] = result_id
+        result["row_hash"] = digest
+        result["row_columns"] = infer_columns(rows)
+        result["row_sample"] = [{name: _sample_value(value) for name, value in row.items()}
+                                for row in rows[:self.sample_rows]]
+
+    def _load_index(self) -> Dict[str, Dict]:
+        with self._lock:
+            if self._index is None:
+                self._index = {}
+                if os.path.exists(self.index_file):
+                    with open(self.index_file, 'r', encoding='utf-8') as f:
+                        for line in f:
+                            if line.strip():
+                                entry = json.loads(line)
+                                self._index[entry["result_id"]] = entry
+            return self._index
+
+    def read_blob(self, digest: str) -> Optional[Dict]:
+        """按 row_hash 读取完整结果（{"columns": [...], "rows": [[...], ...]}）"""
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rb') as f:
+            return json.loads(f.read().decode("utf-8"))
+
+    def lookup(self, result_id: str) -> Optional[Dict]:
+        """按 result_id 查回完整结果行；不存在时返回 None"""
+        entry = self._load_index().get(result_id)
+        if entry is None:
+            return None
+        blob = self.read_blob(entry["row_hash"])
+        if blob is None:
+            return None
+        return {"result_id": result_id, "row_hash": entry["row_hash"],
+                "columns": blob["columns"], "rows": blob["rows"]}
+
+    def summary(self) -> Dict:
+        """本次运行的存储开销（写入结果文件的 row_store 字段）"""
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "stored_results": self.stored_results,
+                "new_blobs": self.new_blobs,
+                "deduplicated": self.deduplicated,
+                "raw_bytes": self.raw_bytes,
+                "compressed_bytes": self.compressed_bytes,
+                "compression_ratio": self.raw_bytes / self.compressed_bytes if self.compressed_bytes else None,
+            }
+
+
+def directory_stats(directory: str) -> Dict:
+    """整个存储目录的对象数和占用空间"""
+    blobs = 0
+    size = 0
+    for root, _, files in os.walk(os.path.join(directory, "objects")):
+        for name in files:
+            if name.endswith(".json.gz"):
+                blobs += 1
+                size += os.path.getsize(os.path.join(root, name))
+    index_file = os.path.join(directory, "index.jsonl")
+    results = 0
+    if os.path.exists(index_file):
+        with open(index_file, 'r', encoding='utf-8') as f:
+            results = sum(1 for line in f if line.strip())
+    return {"results": results, "blobs": blobs, "blob_bytes": size}
+
+
+def format_console(summary: Dict) -> str:
+    ratio = f"{summary['compression_ratio']:.1f}x" if summary["compression_ratio"] else "-"
+    return (f"结果行存储: {summary['stored_results']} 个结果，新增 {summary['new_blobs']} 个对象"
+            f"（去重 {summary['deduplicated']} 个），原始 {summary['raw_bytes'] / 1024:.1f} KB → "
+            f"压缩后新增 {summary['compressed_bytes'] / 1024:.1f} KB（压缩比 {ratio}），目录: {summary['directory']}")
+
+
+def main(argv: List[str] = None) -> int:
+    """rows 子命令入口"""
+    parser = argparse.ArgumentParser(prog="test_text2sql.py rows", description="查看已存储的查询结果行")
+    parser.add_argument("--dir", default=DEFAULT_ROW_STORE, help="行存储目录（默认: test_case/row_store）")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_show = sub.add_parser("show", help="按 result_id 输出完整结果行")
+    p_show.add_argument("result_id")
+    p_show.add_argument("--format", choices=("table", "json"), default="table")
+    p_show.add_argument("--limit", type=int, default=None, help="最多输出的行数（默认全部）")
+    sub.add_parser("stats", help="存储目录的结果数、对象数和占用空间")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.dir):
+        print(f"错误: 行存储目录不存在: {args.dir}", file=sys.stderr)
+        return 1
+    store = RowStore(args.dir)
+
+    if args.command == "stats":
+        stats = directory_stats(args.dir)
+        print(f"结果数: {stats['results']}，对象数: {stats['blobs']}，"
+              f"占用: {stats['blob_bytes'] / 1024:.1f} KB")
+        return 0
+
+    found = store.lookup(args.result_id)
+    if found is None:
+        print(f"错误: 找不到结果 {args.result_id}", file=sys.stderr)
+        return 1
+    rows = found["rows"][:args.limit] if args.limit is not None else found["rows"]
+    if args.format == "json":
+        print(json.dumps({**found, "rows": rows}, ensure_ascii=False, indent=2))
+        return 0
+    print(f"result_id: {found['result_id']}  row_hash: {found['row_hash']}  共 {len(found['rows'])} 行")
+    print("\t".join(found["columns"]))
+    for row in rows:
+        print("\t".join("NULL" if value is None else str(value) for value in row))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
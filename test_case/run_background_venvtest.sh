@@ -1,76 +1,46 @@
 #!/bin/bash
-# 后台运行 test_text2sql.py 并保存日志（使用 venvtest 虚拟环境）
+# 后台运行 test_text2sql.py（使用 venvtest 虚拟环境）：把测试任务提交给任务调度器（调度器未运行时先在后台启动）
+# 用法: run_background_venvtest.sh [test_text2sql.py 的参数...]
+# 环境变量: PRIORITY 任务优先级（数值越大越先执行，默认 0），JOB_NAME 任务名称，
+#           MAX_JOBS 启动调度器时同时运行的任务数（默认 2），
+#           SCHEDULER_OPTIONS 启动调度器时的其他选项（如 "--metrics-port 9477 --server-metrics status"）
 
 # 获取脚本所在目录
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
-PROJECT_ROOT="$( cd "$SCRIPT_DIR/.." && pwd )"
 TEST_SCRIPT="$SCRIPT_DIR/test_text2sql.py"
-LOG_DIR="$SCRIPT_DIR/logs"
-PID_FILE="$SCRIPT_DIR/test_text2sql_venvtest.pid"
-LOG_FILE="$LOG_DIR/test_text2sql_venvtest_$(date +%Y%m%d_%H%M%S).log"
+SOCKET="$SCRIPT_DIR/scheduler_venvtest.sock"
 
 # 虚拟环境配置
+PROJECT_ROOT="$( cd "$SCRIPT_DIR/.." && pwd )"
 VENV_NAME="venvtest"
 VENV_PATH="$PROJECT_ROOT/$VENV_NAME"
-
-# 创建日志目录
-mkdir -p "$LOG_DIR"
-
-# 检查虚拟环境是否存在
-if [ ! -d "$VENV_PATH" ]; then
-    echo "错误: 虚拟环境 '$VENV_NAME' 不存在于 $VENV_PATH"
-    echo "请先创建虚拟环境或检查路径是否正确"
-    exit 1
-fi
+VENV_PYTHON="$VENV_PATH/bin/python"
 
 # 检查虚拟环境的 Python 解释器
-VENV_PYTHON="$VENV_PATH/bin/python"
 if [ ! -f "$VENV_PYTHON" ]; then
-    echo "错误: 虚拟环境中找不到 Python 解释器: $VENV_PYTHON"
+    echo "错误: 虚拟环境 '$VENV_NAME' 中找不到 Python 解释器: $VENV_PYTHON"
+    echo "请先创建虚拟环境或检查路径是否正确"
     exit 1
 fi
 
-# 检查是否已经在运行
-if [ -f "$PID_FILE" ]; then
-    OLD_PID=$(cat "$PID_FILE")
-    if ps -p "$OLD_PID" > /dev/null 2>&1; then
-        echo "测试脚本已经在运行中 (PID: $OLD_PID)"
-        echo "日志文件: $LOG_DIR/test_text2sql_venvtest_*.log"
-        exit 1
-    else
-        # PID 文件存在但进程不存在，删除旧的 PID 文件
-        rm -f "$PID_FILE"
-    fi
-fi
-
-# 切换到项目根目录
-cd "$PROJECT_ROOT"
+SCHEDULER=("$VENV_PYTHON" "$TEST_SCRIPT" scheduler --socket "$SOCKET")
 
-# 启动后台进程
-echo "正在启动后台测试..."
-echo "虚拟环境: $VENV_PATH"
-echo "日志文件: $LOG_FILE"
-echo "PID 文件: $PID_FILE"
+# 启动调度器（已在运行时不做任何事）
+"${SCHEDULER[@]}" start --max-jobs "${MAX_JOBS:-2}" $SCHEDULER_OPTIONS || exit 1
 
-# 使用 nohup 在后台运行，使用虚拟环境的 Python，并将所有输出重定向到日志文件
-# 注意：nohup 不会自动激活虚拟环境，所以直接使用虚拟环境的 Python 解释器
-nohup "$VENV_PYTHON" "$TEST_SCRIPT" "$@" > "$LOG_FILE" 2>&1 &
-PID=$!
-
-# 保存 PID
-echo $PID > "$PID_FILE"
+# 提交任务（相对路径按当前目录解析）
+SUBMIT_ARGS=(--priority "${PRIORITY:-0}")
+if [ -n "$JOB_NAME" ]; then
+    SUBMIT_ARGS+=(--name "$JOB_NAME")
+fi
+"${SCHEDULER[@]}" submit "${SUBMIT_ARGS[@]}" -- "$@" || exit 1
 
-echo "测试已在后台启动"
-echo "进程 ID (PID): $PID"
-echo "日志文件: $LOG_FILE"
 echo ""
-echo "查看日志命令:"
-echo "  tail -f $LOG_FILE"
-echo "  或使用: $SCRIPT_DIR/view_log_venvtest.sh"
+echo "查看任务列表:"
+echo "  $SCRIPT_DIR/status_background_venvtest.sh"
 echo ""
-echo "停止测试命令:"
-echo "  $SCRIPT_DIR/stop_background_venvtest.sh"
+echo "查看任务日志:"
+echo "  $SCRIPT_DIR/view_log_venvtest.sh <任务ID>"
 echo ""
-echo "查看运行状态:"
-echo "  ps -p $PID"
-
+echo "取消任务 / 停止调度器:"
+echo "  $SCRIPT_DIR/stop_background_venvtest.sh [任务ID]"
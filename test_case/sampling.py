@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分层抽样（冒烟运行）
+按测试组（以及问题上的可选标签）分层，每层按固定种子抽取一部分问题，几分钟内评估一次提示词改动；
+统计信息中给出各模型外推到全部测试集的成功率和成功题数的置信区间。
+
+抽样规模:
+    N（整数）       共抽 N 个问题：每层至少 1 个，其余按各层剩余问题数成比例分配（最大余数法）；
+                    层数多于 N 时按种子挑选 N 个层各抽 1 个，未覆盖的层不参与外推
+    f（0-1 的小数） 每层抽 f 比例的问题（四舍五入，至少 1 个）
+
+层内用选择抽样（Knuth 算法 S）按文件顺序逐个决定是否选中，只需要事先知道各层的问题数：
+流式 JSONL 测试用例只多读一遍文件，不需要把问题留在内存中。
+相同的测试用例、抽样规模和种子总是选中相同的问题。
+
+外推（每个模型单独计算，只包含该模型有结果的层；W_h = 层问题数 / 这些层的问题总数）:
+    成功率  p = Σ W_h·p_h
+    方差    Var = Σ W_h²·(1 - n_h/N_h)·p_h(1 - p_h)/(n_h - 1)（n_h = 1 的层计为 0）
+    置信区间为有效样本量 n_eff = p(1 - p)/Var 下的 Wilson 区间（Var 为 0 时取实际样本量），
+    成功题数的区间为成功率区间乘以问题总数
+
+用法:
+    sampler = sampling.StratifiedSampler(50, seed=0)
+    for group, question in cases:
+        sampler.count(group["name"], sampling.question_tags(group, question))
+    sampler.allocate()
+    selected = [(g, q) for g, q in cases if sampler.select(g["name"], q, sampling.question_tags(g, q))]
+    ...
+    sampler.record(result)
+    sampler.summary()
+"""
+
+import random
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+
+from test_case import early_stop
+
+DEFAULT_SEED = 0
+
+
+def parse_size(value: str) -> Union[int, float]:
+    """解析 --sample 的值：正整数为问题数，0-1 之间的小数为比例
+
+    Raises:
+        ValueError: 不是正整数，也不是 (0, 1) 之间的小数
+    """
+    number = float(value)
+    if number.is_integer() and number >= 1:
+        return int(number)
+    if 0 < number < 1:
+        return number
+    raise ValueError(f"抽样规模必须是正整数（问题数）或 0-1 之间的小数（比例）: {value}")
+
+
+def question_tags(group: Dict, question: str) -> Sequence[str]:
+    """问题的标签（测试用例中写成 {"question": "...", "tags": [...]} 的问题）"""
+    return group.get("question_tags", {}).get(question, ())
+
+
+def stratum_key(group_name: str, tags: Sequence[str] = ()) -> str:
+    """层的名称：测试组名，有标签时附加排序后的标签"""
+    return f"{group_name}[{','.join(sorted(tags))}]" if tags else group_name
+
+
+class StratifiedSampler:
+    """分层抽样：count() 统计各层问题数 → allocate() 分配各层样本量 → select() 逐个决定是否选中"""
+
+    def __init__(self, size: Union[int, float], seed: int = DEFAULT_SEED,
+                 confidence: float = early_stop.DEFAULT_CONFIDENCE):
+        """
+        Args:
+            size: 问题数（整数）或比例（0-1 的小数）
+            seed: 随机种子
+            confidence: 外推置信区间的置信水平
+        """
+        self.size = size
+        self.seed = seed
+        self.confidence = confidence
+        self.populations: Dict[str, int] = {}
+        self.allocation: Dict[str, int] = {}
+        self._seen: Dict[str, int] = {}
+        self._chosen: Dict[str, int] = {}
+        self._rngs: Dict[str, random.Random] = {}
+        self._stratum_of: Dict[Tuple[str, str], str] = {}
+        # (model_type, model_name) -> 层 -> [结果数, 成功数]
+        self._outcomes: Dict[Tuple[str, str], Dict[str, List[int]]] = {}
+
+    def count(self, group_name: str, tags: Sequence[str] = ()) -> None:
+        key = stratum_key(group_name, tags)
+        self.populations[key] = self.populations.get(key, 0) + 1
+
+    def allocate(self) -> Dict[str, int]:
+        """按抽样规模分配各层的样本量"""
+        populations = self.populations
+        if isinstance(self.size, float):
+            allocation = {key: min(count, max(1, round(count * self.size))) for key, count in populations.items()}
+        elif self.size >= sum(populations.values()):
+            allocation = dict(populations)
+        elif self.size < len(populations):
+            covered = set(random.Random(self.seed).sample(sorted(populations), self.size))
+            allocation = {key: 1 if key in covered else 0 for key in populations}
+        else:
+            extra = self.size - len(populations)
+            spare = {key: count - 1 for key, count in populations.items()}
+            spare_total = sum(spare.values())
+            quotas = {key: extra * spare[key] / spare_total for key in populations}
+            allocation = {key: 1 + int(quota) for key, quota in quotas.items()}
+            leftover = extra - sum(int(quota) for quota in quotas.values())
+            for key in sorted(populations, key=lambda k: (int(quotas[k]) - quotas[k], k))[:leftover]:
+                allocation[key] += 1
+        self.allocation = allocation
+        self._rngs = {key: random.Random(f"{self.seed}\0{key}") for key in populations}
+        return allocation
+
+    def select(self, group_name: str, question: str, tags: Sequence[str] = ()) -> bool:
+        """按文件顺序逐个调用；层内第 i 个问题以 (待选数 / 剩余数) 的概率选中，恰好选满分配的样本量"""
+        key = stratum_key(group_name, tags)
+        remaining = self.populations.get(key, 0) - self._seen.get(key, 0)
+        wanted = self.allocation.get(key, 0) - self._chosen.get(key, 0)
+        if remaining <= 0:
+            return False
+        self._seen[key] = self._seen.get(key, 0) + 1
+        if wanted <= 0 or self._rngs[key].random() * remaining >= wanted:
+            return False
+        self._chosen[key] = self._chosen.get(key, 0) + 1
+        self._stratum_of[(group_name, question)] = key
+        return True
+
+    def filter(self, cases: Iterable[Tuple[Dict, str, Dict]]) -> Iterator[Tuple[Dict, str, Dict]]:
+        """从 (测试组, 问题, 默认配置) 序列中只保留选中的问题（流式测试用例使用）"""
+        for group, question, defaults in cases:
+            if self.select(group["name"], question, question_tags(group, question)):
+                yield group, question, defaults
+
+    def record(self, result: Dict) -> None:
+        """记录一个测试项的结果（被停止信号中止的测试项不计入）"""
+        key = self._stratum_of.get((result.get("group_name"), result.get("question")))
+        if key is None or result.get("failed_stage") == "cancelled":
+            return
+        model = (result.get("model_type", ""), result.get("model_name", ""))
+        counts = self._outcomes.setdefault(model, {}).setdefault(key, [0, 0])
+        counts[0] += 1
+        counts[1] += 1 if result.get("success") else 0
+
+    def _estimate(self, strata: Dict[str, List[int]]) -> Dict:
+        population = sum(self.populations[key] for key in strata)
+        sampled = sum(n for n, _ in strata.values())
+        successes = sum(s for _, s in strata.values())
+        rate = variance = 0.0
+        for key, (n, s) in strata.items():
+            weight = self.populations[key] / population
+            p = s / n
+            rate += weight * p
+            if n > 1:
+                variance += weight * weight * (1 - n / self.populations[key]) * p * (1 - p) / (n - 1)
+        effective = rate * (1 - rate) / variance if variance > 0 else sampled
+        if sampled >= population:
+            # 这些层的问题全部执行过，没有抽样误差
+            lower = upper = rate
+        else:
+            lower, upper = early_stop.wilson_interval(rate * effective, effective, self.confidence)
+        return {
+            "sampled": sampled,
+            "successes": successes,
+            "population": population,
+            "strata": len(strata),
+            "effective_samples": effective,
+            "success_rate": rate * 100,
+            "ci_lower": lower * 100,
+            "ci_upper": upper * 100,
+            "expected_successes": rate * population,
+            "successes_lower": lower * population,
+            "successes_upper": upper * population,
+        }
+
+    def summary(self) -> Dict:
+        """抽样方案和各模型外推到全集的估计（写入结果文件的 statistics.sampling 字段）"""
+        population = sum(self.populations.values())
+        selected = sum(self._chosen.values())
+        return {
+            "size": self.size,
+            "seed": self.seed,
+            "confidence": self.confidence,
+            "population": population,
+            "selected": selected,
+            "uncovered_strata": sum(1 for count in self.allocation.values() if count == 0),
+            "strata": [{"stratum": key, "population": count, "selected": self._chosen.get(key, 0)}
+                       for key, count in self.populations.items()],
+            "models": [dict(self._estimate(strata), model_type=model_type, model=model_name)
+                       for (model_type, model_name), strata in self._outcomes.items()],
+        }
+
+
+def sample_groups(test_groups: List[Dict], size: Union[int, float], seed: int = DEFAULT_SEED) -> StratifiedSampler:
+    """对已加载的测试组抽样（原地替换各组的 questions），返回抽样器"""
+    sampler = StratifiedSampler(size, seed)
+    for group in test_groups:
+        for question in group.get("questions", []):
+            sampler.count(group["name"], question_tags(group, question))
+    sampler.allocate()
+    for group in test_groups:
+        group["questions"] = [question for question in group.get("questions", [])
+                              if sampler.select(group["name"], question, question_tags(group, question))]
+    return sampler
+
+
+def format_plan(sampler: StratifiedSampler) -> str:
+    population = sum(sampler.populations.values())
+    selected = sum(sampler.allocation.values())
+    size = f"{sampler.size * 100:g}%" if isinstance(sampler.size, float) else f"{sampler.size} 题"
+    lines = [f"分层抽样（{size}，种子 {sampler.seed}）: {len(sampler.populations)} 层，"
+             f"从 {population} 个问题中选取 {selected} 个"]
+    uncovered = [key for key, count in sampler.allocation.items() if count == 0]
+    if uncovered:
+        lines.append(f"  ⚠️  抽样规模小于层数，{len(uncovered)} 个层未抽到问题，外推不包含这些层")
+    return "\n".join(lines)
+
+
+def format_console(summary: Dict) -> str:
+    confidence = f"{summary['confidence'] * 100:g}%"
+    lines = [f"抽样外推（从 {summary['population']} 个问题中抽取 {summary['selected']} 个，{confidence} 置信区间）:"]
+    for row in summary["models"]:
+        lines.append(f"  {row['model_type']}/{row['model']}: 成功率 {row['success_rate']:.1f}% "
+                     f"[{row['ci_lower']:.1f}%, {row['ci_upper']:.1f}%]，全集 {row['population']} 题中预计成功 "
+                     f"{row['expected_successes']:.0f} 题 [{row['successes_lower']:.0f}, {row['successes_upper']:.0f}]"
+                     f"（样本 {row['sampled']} 个，{row['strata']} 层）")
+    return "\n".join(lines)
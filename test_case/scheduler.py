@@ -0,0 +1,662 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务调度器
+本地常驻进程，接收多个测试任务（参数与直接运行 test_text2sql.py 相同），按优先级排队并在同一进程内并发执行。
+各任务共享模型客户端、数据库连接池、提示词前缀缓存、服务端指标设置和全局并发限制（concurrency.REGISTRY），
+每个任务有独立的日志文件和结果文件，可以随时查看状态、取消。每个任务在 metrics.run_scope() 中运行，
+结果文件中的表结构校验、服务端指标、前缀缓存和熔断器统计只包含本任务的计数。
+
+客户端通过本地 Unix socket（默认 test_case/scheduler.sock）发送按行分隔的 JSON 请求，
+后台运行脚本（run_background.sh 等）即为这些子命令的简单封装。
+
+    - 优先级数值越大越先执行，相同优先级按提交顺序；同时运行的任务数不超过 --max-jobs
+    - 取消排队中的任务直接移出队列；取消运行中的任务与 SIGTERM 相同：停止调度新的测试项，
+      进行中的测试项在各自的时间预算（--deadline）内结束，已完成的结果照常写出
+    - 进程级设置（--context-cache、--server-metrics、--metrics-port）在启动守护进程时指定，
+      任务参数中的这些选项被忽略
+    - 任务未指定 --output 时结果写入测试用例同目录的 test_results_job<ID>.json(l)，避免并发任务互相覆盖；
+      增量运行默认仍从 test_results.json(l) 读取历史结果
+
+子命令:
+    start [--max-jobs N] [...]                         在后台启动守护进程（已在运行时不做任何事）
+    run   [--max-jobs N] [...]                         在前台运行守护进程
+    stop  [--timeout S]                                取消全部任务，等待运行中的任务保存结果后退出
+    submit [--priority N] [--name NAME] -- <测试参数>   提交任务
+    list                                               列出全部任务
+    status [JOB_ID]                                    守护进程或单个任务的状态
+    cancel JOB_ID                                      取消任务
+    log JOB_ID [--follow]                              查看任务日志
+
+用法:
+    python test_case/test_text2sql.py scheduler start --max-jobs 2 --server-metrics status
+    python test_case/test_text2sql.py scheduler submit --priority 10 -- --testcase test_case/testcase.json --pipeline
+    python test_case/test_text2sql.py scheduler list
+    python test_case/test_text2sql.py scheduler log 3 --follow
+    python test_case/test_text2sql.py scheduler cancel 3
+"""
+
+import argparse
+import contextvars
+import glob
+import heapq
+import io
+import json
+import os
+import re
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from test_case import circuit_breaker, context_cache, deadline, metrics, server_metrics, sql_validator
+from test_case import test_text2sql as t2s
+
+DEFAULT_SOCKET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scheduler.sock")
+DEFAULT_MAX_JOBS = 2
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+
+STATES = ("queued", "running", "cancelling", "succeeded", "failed", "cancelled")
+FINISHED_STATES = ("succeeded", "failed", "cancelled")
+
+# 由守护进程统一设置的进程级选项（任务参数中指定时忽略）
+DAEMON_OPTIONS = ("context_cache", "context_cache_ttl", "server_metrics", "no_schema_check",
+                  "circuit_breaker_threshold", "circuit_breaker_timeout", "metrics_port", "metrics_host",
+                  "trace_file", "trace_format", "profile")
+
+# 任务参数中的路径按提交时的工作目录解析（守护进程的工作目录可能不同）
+_PATH_OPTIONS = ("testcase", "output", "previous_results", "question_cache", "cache_aliases", "history_db",
+                 "store_rows")
+
+# 单次 log 请求返回的最大字节数
+_LOG_CHUNK = 64 * 1024
+
+_JOB_LOG_PATTERN = re.compile(r"test_text2sql_job(\d+)_")
+
+# 当前线程所属的任务（流水线工作线程沿用启动线程的上下文）
+_current_job: contextvars.ContextVar = contextvars.ContextVar("scheduler_job", default=None)
+
+JOBS_TOTAL = metrics.REGISTRY.counter(
+    "text2sql_scheduler_jobs_total", "调度器结束的任务数量", ("state",))
+JOBS_ACTIVE = metrics.REGISTRY.gauge(
+    "text2sql_scheduler_jobs", "调度器中排队和运行中的任务数量", ("state",))
+
+
+class SchedulerError(RuntimeError):
+    """调度器拒绝了请求（参数错误、任务不存在等）"""
+
+
+class SchedulerNotRunning(SchedulerError):
+    """连接不到守护进程"""
+
+
+def pid_file(socket_path: str) -> str:
+    return os.path.splitext(socket_path)[0] + ".pid"
+
+
+def daemon_log_file(socket_path: str) -> str:
+    return os.path.join(LOG_DIR, os.path.splitext(os.path.basename(socket_path))[0] + ".log")
+
+
+class _JobOutput(io.TextIOBase):
+    """替换 sys.stdout / sys.stderr：任务线程（及其流水线工作线程）的输出写入任务日志，其余写入守护进程日志"""
+
+    def __init__(self, default):
+        self._default = default
+
+    def _target(self):
+        job = _current_job.get()
+        stream = job.stream if job is not None else None
+        return stream if stream is not None else self._default
+
+    @property
+    def encoding(self):
+        return self._default.encoding
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+
+class Job:
+    """一个测试任务"""
+
+    def __init__(self, job_id: int, argv: List[str], args: argparse.Namespace, priority: int = 0,
+                 name: Optional[str] = None):
+        self.id = job_id
+        self.argv = argv
+        self.args = args
+        self.priority = priority
+        self.name = name or os.path.basename(args.testcase)
+        self.state = "queued"
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.exit_code: Optional[int] = None
+        self.error: Optional[str] = None
+        self.log_file = os.path.join(
+            LOG_DIR, f"test_text2sql_job{job_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+        self.output_file = args.output or _job_output_file(args.testcase, job_id)
+        self.shutdown = deadline.GracefulShutdown(args.grace_period)
+        self.stream = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def to_dict(self) -> Dict:
+        return {"id": self.id, "name": self.name, "state": self.state, "priority": self.priority,
+                "argv": self.argv, "submitted_at": self.submitted_at, "started_at": self.started_at,
+                "finished_at": self.finished_at, "exit_code": self.exit_code, "error": self.error,
+                "log_file": self.log_file, "output_file": self.output_file}
+
+
+def _job_output_file(testcase_file: str, job_id: int) -> str:
+    suffix = ".jsonl" if testcase_file.endswith(".jsonl") else ".json"
+    return os.path.join(os.path.dirname(testcase_file), f"test_results_job{job_id}{suffix}")
+
+
+def parse_job_args(argv: List[str], cwd: Optional[str] = None) -> argparse.Namespace:
+    """解析任务参数（与 test_text2sql.py 相同），参数错误时抛出 SchedulerError 而不是退出进程"""
+    parser = t2s.build_arg_parser()
+    parser.prog = "test_text2sql.py"
+
+    def error(message):
+        raise SchedulerError(f"任务参数错误: {message}")
+
+    parser.error = error
+    try:
+        args = t2s.parse_args(parser, argv)
+    except SystemExit:
+        # --help 等会直接退出的参数
+        raise SchedulerError("任务参数不能包含 --help")
+    for dest in _PATH_OPTIONS:
+        value = getattr(args, dest)
+        if value and cwd:
+            setattr(args, dest, os.path.join(cwd, os.path.expanduser(value)))
+    return args
+
+
+def _ignored_options(args: argparse.Namespace) -> List[str]:
+    parser = t2s.build_arg_parser()
+    return ["--" + dest.replace("_", "-") for dest in DAEMON_OPTIONS
+            if getattr(args, dest) != parser.get_default(dest)]
+
+
+def _next_job_id() -> int:
+    """从已有任务日志中接着编号（守护进程重启后不复用结果文件名）"""
+    ids = [int(match.group(1)) for path in glob.glob(os.path.join(LOG_DIR, "test_text2sql_job*_*.log"))
+           for match in [_JOB_LOG_PATTERN.search(os.path.basename(path))] if match]
+    return max(ids, default=0) + 1
+
+
+class Scheduler:
+    """优先级队列 + 固定数量的任务槽（线程安全）"""
+
+    def __init__(self, max_jobs: int = DEFAULT_MAX_JOBS):
+        self.max_jobs = max(1, max_jobs)
+        self.jobs: Dict[int, Job] = {}
+        self.stopping = False
+        self._queue: List = []
+        self._seq = 0
+        self._running = 0
+        self._next_id = _next_job_id()
+        self._cond = threading.Condition()
+
+    def _update_gauges(self) -> None:
+        JOBS_ACTIVE.set(sum(1 for job in self.jobs.values() if job.state == "queued"), state="queued")
+        JOBS_ACTIVE.set(self._running, state="running")
+
+    def submit(self, argv: List[str], priority: int = 0, name: Optional[str] = None,
+               cwd: Optional[str] = None) -> Job:
+        args = parse_job_args(argv, cwd)
+        with self._cond:
+            if self.stopping:
+                raise SchedulerError("调度器正在停止，不再接收新任务")
+            job = Job(self._next_id, argv, args, priority=priority, name=name)
+            self._next_id += 1
+            self.jobs[job.id] = job
+            heapq.heappush(self._queue, (-priority, self._seq, job.id))
+            self._seq += 1
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 任务 #{job.id} 已提交（{job.name}，优先级 {priority}）",
+                  flush=True)
+            self._dispatch()
+        return job
+
+    def get(self, job_id: int) -> Job:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise SchedulerError(f"任务 #{job_id} 不存在")
+        return job
+
+    def cancel(self, job_id: int) -> Job:
+        with self._cond:
+            job = self.get(job_id)
+            if job.state == "queued":
+                self._finish(job, "cancelled")
+            elif job.state == "running":
+                job.state = "cancelling"
+                # 取消提示写入任务自己的日志
+                token = _current_job.set(job)
+                try:
+                    job.shutdown.request("SIGTERM")
+                finally:
+                    _current_job.reset(token)
+            return job
+
+    def stop(self, reason: str = "stop") -> int:
+        """取消排队中的任务并请求运行中的任务停止，返回仍在运行的任务数"""
+        with self._cond:
+            if not self.stopping:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] 收到 {reason}，取消全部任务", flush=True)
+            self.stopping = True
+            for job in list(self.jobs.values()):
+                if job.state in ("queued", "running"):
+                    self.cancel(job.id)
+            self._cond.notify_all()
+            return self._running
+
+    def wait_stopped(self, timeout: float) -> bool:
+        """等待停止请求且全部任务结束（超时返回 False，调用方据此保持对信号的响应）"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.stopping and self._running == 0, timeout)
+
+    def summary(self) -> Dict:
+        with self._cond:
+            return {"pid": os.getpid(), "max_jobs": self.max_jobs, "running": self._running,
+                    "queued": sum(1 for job in self.jobs.values() if job.state == "queued"),
+                    "stopping": self.stopping}
+
+    def _dispatch(self) -> None:
+        """有空闲槽位时按优先级启动排队中的任务（调用方持有锁）"""
+        while self._queue and self._running < self.max_jobs and not self.stopping:
+            _, _, job_id = heapq.heappop(self._queue)
+            job = self.jobs[job_id]
+            if job.state != "queued":
+                continue
+            job.state = "running"
+            job.started_at = time.time()
+            self._running += 1
+            threading.Thread(target=self._run, args=(job,), daemon=True, name=f"job-{job.id}").start()
+        self._update_gauges()
+
+    def _finish(self, job: Job, state: str) -> None:
+        job.state = state
+        job.finished_at = time.time()
+        JOBS_TOTAL.inc(state=state)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 任务 #{job.id} 结束: {state}"
+              + (f"（退出码 {job.exit_code}）" if job.exit_code is not None else ""), flush=True)
+        self._update_gauges()
+        self._cond.notify_all()
+
+    def _run(self, job: Job) -> None:
+        os.makedirs(os.path.dirname(job.log_file), exist_ok=True)
+        state = "failed"
+        with open(job.log_file, "a", encoding="utf-8", buffering=1) as log:
+            job.stream = log
+            token = _current_job.set(job)
+            try:
+                print(f"任务 #{job.id}（{job.name}，优先级 {job.priority}）: test_text2sql.py {' '.join(job.argv)}")
+                ignored = _ignored_options(job.args)
+                if ignored:
+                    print(f"⚠️  以下选项由调度器统一设置，本任务中忽略: {', '.join(ignored)}")
+                kwargs = t2s.run_tests_kwargs(job.args)
+                kwargs["output_file"] = job.output_file
+                kwargs["metrics_port"] = None
+                if job.args.incremental and not job.args.previous_results:
+                    kwargs["previous_results_file"] = os.path.join(
+                        os.path.dirname(job.args.testcase),
+                        "test_results.jsonl" if job.args.testcase.endswith(".jsonl") else "test_results.json")
+                # 表结构校验、服务端指标、前缀缓存和熔断器的统计按任务分开，结果文件只描述本任务
+                with metrics.run_scope():
+                    interrupted_by = t2s.run_tests(**kwargs, shutdown=job.shutdown)
+                job.exit_code = 128 + interrupted_by if interrupted_by else 0
+                state = "cancelled" if interrupted_by else "succeeded"
+            except BaseException as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.exit_code = 1
+                traceback.print_exc()
+            finally:
+                _current_job.reset(token)
+                job.stream = None
+        with self._cond:
+            self._running -= 1
+            self._finish(job, state)
+            self._dispatch()
+
+    def read_log(self, job_id: int, offset: int = 0) -> Dict:
+        job = self.get(job_id)
+        data = b""
+        if os.path.exists(job.log_file):
+            with open(job.log_file, "rb") as f:
+                f.seek(offset)
+                data = f.read(_LOG_CHUNK)
+        return {"data": data.decode("utf-8", errors="replace"), "offset": offset + len(data),
+                "finished": job.finished}
+
+    def handle(self, request: Dict) -> Dict:
+        """处理一个客户端请求"""
+        command = request.get("command")
+        if command == "ping":
+            return self.summary()
+        if command == "submit":
+            job = self.submit(list(request.get("argv") or []), priority=int(request.get("priority") or 0),
+                              name=request.get("name"), cwd=request.get("cwd"))
+            return {"job": job.to_dict()}
+        if command == "list":
+            return dict(self.summary(), jobs=[job.to_dict() for job in self.jobs.values()])
+        if command == "status":
+            return {"job": self.get(int(request["id"])).to_dict()}
+        if command == "cancel":
+            return {"job": self.cancel(int(request["id"])).to_dict()}
+        if command == "log":
+            return self.read_log(int(request["id"]), int(request.get("offset") or 0))
+        if command == "stop":
+            return {"running": self.stop()}
+        raise SchedulerError(f"未知的命令: {command}")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """一个连接处理一个请求：读取一行 JSON，返回一行 JSON（ok 为 false 时带 error）"""
+
+    def handle(self):
+        try:
+            response = self.server.scheduler.handle(json.loads(self.rfile.readline()))
+            response["ok"] = True
+        except (SchedulerError, ValueError, KeyError, TypeError) as e:
+            response = {"ok": False, "error": str(e)}
+        self.wfile.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, scheduler: Scheduler):
+        super().__init__(socket_path, _Handler)
+        self.scheduler = scheduler
+
+
+def request(socket_path: str, payload: Dict, timeout: float = 10.0) -> Dict:
+    """向守护进程发送一个请求
+
+    Raises:
+        SchedulerNotRunning: 守护进程未运行
+        SchedulerError: 守护进程拒绝了请求
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            raise SchedulerNotRunning(f"调度器未运行（{socket_path}）")
+        try:
+            sock.sendall((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+            line = sock.makefile("rb").readline()
+        except OSError as e:
+            # 守护进程正在退出
+            raise SchedulerError(f"与调度器的连接中断: {e}")
+    if not line:
+        raise SchedulerError("调度器没有返回结果")
+    response = json.loads(line)
+    if not response.pop("ok", False):
+        raise SchedulerError(response.get("error") or "请求失败")
+    return response
+
+
+def is_running(socket_path: str) -> bool:
+    try:
+        request(socket_path, {"command": "ping"}, timeout=2.0)
+        return True
+    except SchedulerError:
+        return False
+
+
+def serve(socket_path: str, max_jobs: int = DEFAULT_MAX_JOBS, metrics_port: Optional[int] = None,
+          metrics_host: str = "127.0.0.1") -> int:
+    """在前台运行守护进程，直到收到 stop 请求或 SIGTERM/SIGINT 且全部任务结束"""
+    if is_running(socket_path):
+        print(f"调度器已在运行（{socket_path}）")
+        return 1
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    t2s.ensure_env_loaded()
+    sys.stdout = _JobOutput(sys.stdout)
+    sys.stderr = _JobOutput(sys.stderr)
+    scheduler = Scheduler(max_jobs)
+    server = _Server(socket_path, scheduler)
+    threading.Thread(target=server.serve_forever, name="scheduler-server", daemon=True).start()
+    metrics_server = metrics.start_metrics_server(metrics_port, host=metrics_host) if metrics_port else None
+    with open(pid_file(socket_path), "w") as f:
+        f.write(str(os.getpid()))
+
+    def handle_signal(signum, frame):
+        if scheduler.stopping:
+            # 再次收到信号：不再等待运行中的任务（未写出的结果丢失）
+            raise SystemExit(128 + signum)
+        scheduler.stop(signal.Signals(signum).name)
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, handle_signal)
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] 调度器已启动（PID {os.getpid()}，最多同时运行 {scheduler.max_jobs} "
+          f"个任务）: {socket_path}" + (f"，实时指标: http://{metrics_host}:{metrics_port}/metrics"
+                                      if metrics_server else ""), flush=True)
+    try:
+        while not scheduler.wait_stopped(timeout=1.0):
+            pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        for path in (socket_path, pid_file(socket_path)):
+            if os.path.exists(path):
+                os.unlink(path)
+        context_cache.REGISTRY.close()
+        if metrics_server:
+            metrics_server.shutdown()
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 调度器已停止", flush=True)
+    return 0
+
+
+def _daemon_argv(args: argparse.Namespace) -> List[str]:
+    argv = ["--max-jobs", str(args.max_jobs),
+            "--context-cache-ttl", str(args.context_cache_ttl),
+            "--circuit-breaker-threshold", str(args.circuit_breaker_threshold),
+            "--circuit-breaker-timeout", str(args.circuit_breaker_timeout)]
+    if args.context_cache:
+        argv.append("--context-cache")
+    if args.server_metrics:
+        argv += ["--server-metrics", args.server_metrics]
+    if args.no_schema_check:
+        argv.append("--no-schema-check")
+    if args.metrics_port:
+        argv += ["--metrics-port", str(args.metrics_port), "--metrics-host", args.metrics_host]
+    return argv
+
+
+def start(args: argparse.Namespace, timeout: float = 10.0) -> int:
+    """在后台启动守护进程（脱离终端，输出写入守护进程日志），等待它开始接受请求"""
+    if is_running(args.socket):
+        summary = request(args.socket, {"command": "ping"})
+        print(f"调度器已在运行（PID {summary['pid']}）")
+        return 0
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_path = daemon_log_file(args.socket)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_text2sql.py")
+    with open(log_path, "a", encoding="utf-8") as log:
+        process = subprocess.Popen([sys.executable, script, "scheduler", "--socket", args.socket, "run"] + _daemon_argv(args),
+                                   stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                   start_new_session=True,
+                                   cwd=os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    give_up = time.monotonic() + timeout
+    while time.monotonic() < give_up:
+        if is_running(args.socket):
+            print(f"调度器已启动（PID {process.pid}）")
+            print(f"日志文件: {log_path}")
+            return 0
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+    print(f"调度器启动失败，详见日志: {log_path}")
+    return 1
+
+
+def _format_time(timestamp: Optional[float]) -> str:
+    return datetime.fromtimestamp(timestamp).strftime("%m-%d %H:%M:%S") if timestamp else "-"
+
+
+def _elapsed(job: Dict) -> str:
+    if not job["started_at"]:
+        return "-"
+    return f"{(job['finished_at'] or time.time()) - job['started_at']:.0f}s"
+
+
+def format_jobs(response: Dict) -> str:
+    lines = [f"调度器 PID {response['pid']}: 运行中 {response['running']}/{response['max_jobs']}，"
+             f"排队 {response['queued']}" + ("（正在停止）" if response["stopping"] else "")]
+    if not response["jobs"]:
+        lines.append("没有任务")
+        return "\n".join(lines)
+    lines.append(f"{'ID':>5}  {'状态':<10}  {'优先级':>6}  {'提交时间':<14}  {'用时':>6}  {'退出码':>6}  名称")
+    for job in response["jobs"]:
+        exit_code = job["exit_code"] if job["exit_code"] is not None else "-"
+        lines.append(f"{job['id']:>5}  {job['state']:<10}  {job['priority']:>6}  {_format_time(job['submitted_at']):<14}  "
+                     f"{_elapsed(job):>6}  {exit_code:>6}  {job['name']}")
+    return "\n".join(lines)
+
+
+def format_job(job: Dict) -> str:
+    lines = [f"任务 #{job['id']}（{job['name']}）: {job['state']}",
+             f"  参数: {' '.join(job['argv'])}",
+             f"  优先级: {job['priority']}",
+             f"  提交/开始/结束: {_format_time(job['submitted_at'])} / {_format_time(job['started_at'])} / "
+             f"{_format_time(job['finished_at'])}（用时 {_elapsed(job)}）",
+             f"  日志文件: {job['log_file']}",
+             f"  结果文件: {job['output_file']}"]
+    if job["exit_code"] is not None:
+        lines.append(f"  退出码: {job['exit_code']}")
+    if job["error"]:
+        lines.append(f"  错误: {job['error']}")
+    return "\n".join(lines)
+
+
+def follow_log(socket_path: str, job_id: int, follow: bool = False, interval: float = 0.5) -> None:
+    offset = 0
+    while True:
+        response = request(socket_path, {"command": "log", "id": job_id, "offset": offset})
+        if response["data"]:
+            sys.stdout.write(response["data"])
+            sys.stdout.flush()
+        offset = response["offset"]
+        if not follow or (response["finished"] and not response["data"]):
+            return
+        if not response["data"]:
+            time.sleep(interval)
+
+
+def stop(socket_path: str, timeout: float) -> int:
+    """请求守护进程停止并等待它退出"""
+    running = request(socket_path, {"command": "stop"})["running"]
+    print(f"正在停止调度器（{running} 个运行中的任务正在保存结果）...")
+    give_up = time.monotonic() + timeout
+    while time.monotonic() < give_up:
+        if not is_running(socket_path):
+            print("调度器已停止")
+            return 0
+        time.sleep(0.5)
+    print(f"调度器在 {timeout:g} 秒内未停止")
+    return 1
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="test_text2sql.py scheduler", description="测试任务调度器")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="守护进程的 Unix socket（默认: test_case/scheduler.sock）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    daemon_options = argparse.ArgumentParser(add_help=False)
+    daemon_options.add_argument("--max-jobs", type=int, default=DEFAULT_MAX_JOBS,
+                                help=f"同时运行的任务数（默认: {DEFAULT_MAX_JOBS}）")
+    daemon_options.add_argument("--context-cache", action="store_true", help="使用提供方的提示词前缀缓存（同主测试）")
+    daemon_options.add_argument("--context-cache-ttl", type=int, default=context_cache.DEFAULT_TTL,
+                                help="Gemini 显式缓存的有效期（秒）")
+    daemon_options.add_argument("--server-metrics", choices=server_metrics.MODES, default=None,
+                                help="记录每条查询的服务端指标（同主测试）")
+    daemon_options.add_argument("--no-schema-check", action="store_true", help="关闭执行前的表结构校验（同主测试）")
+    daemon_options.add_argument("--circuit-breaker-threshold", type=int,
+                                default=circuit_breaker.DEFAULT_FAILURE_THRESHOLD,
+                                help="连续多少次系统性失败后熔断（同主测试，0 表示关闭）")
+    daemon_options.add_argument("--circuit-breaker-timeout", type=float, default=circuit_breaker.DEFAULT_RESET_TIMEOUT,
+                                help="熔断后到第一次试探调用的秒数")
+    daemon_options.add_argument("--metrics-port", type=int, default=None, help="在指定端口暴露全部任务的实时指标")
+    daemon_options.add_argument("--metrics-host", default="127.0.0.1", help="指标服务监听地址")
+    commands.add_parser("start", parents=[daemon_options], help="在后台启动守护进程")
+    commands.add_parser("run", parents=[daemon_options], help="在前台运行守护进程")
+
+    stop_parser = commands.add_parser("stop", help="取消全部任务并停止守护进程")
+    stop_parser.add_argument("--timeout", type=float, default=60.0, help="等待守护进程退出的秒数（默认: 60）")
+
+    submit = commands.add_parser("submit", help="提交任务（-- 之后为 test_text2sql.py 的参数）")
+    submit.add_argument("--priority", type=int, default=0, help="优先级，数值越大越先执行（默认: 0）")
+    submit.add_argument("--name", default=None, help="任务名称（默认: 测试用例文件名）")
+    submit.add_argument("job_args", nargs=argparse.REMAINDER, help="test_text2sql.py 的参数")
+
+    commands.add_parser("list", help="列出全部任务")
+    status = commands.add_parser("status", help="守护进程或单个任务的状态")
+    status.add_argument("job_id", type=int, nargs="?", default=None)
+    cancel = commands.add_parser("cancel", help="取消任务")
+    cancel.add_argument("job_id", type=int)
+    log = commands.add_parser("log", help="查看任务日志")
+    log.add_argument("job_id", type=int)
+    log.add_argument("-f", "--follow", action="store_true", help="持续输出直到任务结束")
+    args = parser.parse_args(argv)
+    args.socket = os.path.abspath(args.socket)
+
+    if args.command == "run":
+        context_cache.REGISTRY.configure(enabled=args.context_cache, ttl=args.context_cache_ttl)
+        server_metrics.COLLECTOR.configure(args.server_metrics)
+        sql_validator.VALIDATOR.configure(enabled=not args.no_schema_check)
+        circuit_breaker.REGISTRY.configure(args.circuit_breaker_threshold, args.circuit_breaker_timeout)
+        return serve(args.socket, args.max_jobs, metrics_port=args.metrics_port, metrics_host=args.metrics_host)
+    if args.command == "start":
+        return start(args)
+
+    try:
+        if args.command == "stop":
+            return stop(args.socket, args.timeout)
+        if args.command == "submit":
+            job_args = args.job_args[1:] if args.job_args[:1] == ["--"] else args.job_args
+            job = request(args.socket, {"command": "submit", "argv": job_args, "priority": args.priority,
+                                        "name": args.name, "cwd": os.getcwd()})["job"]
+            print(f"任务 #{job['id']} 已提交（{job['name']}，优先级 {job['priority']}，状态 {job['state']}）")
+            print(f"日志文件: {job['log_file']}")
+            print(f"结果文件: {job['output_file']}")
+        elif args.command == "list" or (args.command == "status" and args.job_id is None):
+            print(format_jobs(request(args.socket, {"command": "list"})))
+        elif args.command == "status":
+            print(format_job(request(args.socket, {"command": "status", "id": args.job_id})["job"]))
+        elif args.command == "cancel":
+            job = request(args.socket, {"command": "cancel", "id": args.job_id})["job"]
+            print(f"任务 #{job['id']}: {job['state']}")
+        elif args.command == "log":
+            follow_log(args.socket, args.job_id, follow=args.follow)
+    except SchedulerError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+表结构目录与紧凑表结构渲染
+默认提示词中的 DDL 每列都重复 COLLATE、varchar(255)、DEFAULT NULL，而且表结构被拼接了两次。
+本模块把提示词里的 CREATE TABLE 解析为表结构目录，再渲染为紧凑格式：
+
+    -- 赛事元数据表
+    sportradar_tennis_competition(NOT NULL):
+      id varchar PK 'Sportradar 赛事唯一标识…'
+      ...
+    sportradar_tennis_summary_live:
+      sport_event_{
+        id varchar PK NN '比赛唯一 ID…'
+        type varchar '比赛类型'
+        ...}
+
+    - 去掉排序规则、字符集、ENGINE 等与查询无关的内容，varchar(255) 简写为 varchar，int(11) 简写为 int
+    - 同一表中至少 MIN_PREFIX_COLUMNS 列共享的前缀（如 sport_event_）提取一次
+    - 列注释、主键、索引和非空约束全部保留
+    - 相同的表只渲染一次，提示词中重复的段落只保留第一次出现
+
+用法:
+    from test_case import schema_catalog
+    compact = schema_catalog.compact_prompt(prompt)
+    schema_catalog.estimate_tokens(prompt), schema_catalog.estimate_tokens(compact)
+"""
+
+import re
+from typing import Dict, List, Optional
+
+# 共享前缀至少覆盖的列数
+MIN_PREFIX_COLUMNS = 3
+
+# 紧凑格式的说明（放在表结构之前，告诉模型如何读）
+COMPACT_LEGEND = ("格式：表名(NOT NULL 表示所有列非空): 每行一列「列名 类型 [PK] [NN=非空|NULL=可空] '说明'」；"
+                  "前缀_{...} 中的列名需加上前缀；varchar 即 varchar(255)")
+
+_CREATE_TABLE = re.compile(
+    r"CREATE TABLE\s+(?:IF NOT EXISTS\s+)?`?(?P<name>[\w.]+)`?\s*\((?P<body>.*?)\n\)\s*(?P<options>[^;]*);",
+    re.S | re.I)
+
+# 提示词中围绕 CREATE TABLE 的装饰行（标题、表名、DDL 标记、代码围栏）
+_SCHEMA_BLOCK = re.compile(
+    r"(?:^###[^\n]*\n)?"
+    r"(?:^\*\*表名\*\*[^\n]*\n|^表名[:：][^\n]*\n|^\*\*建表语句（DDL）\*\*\n|^```sql\n|^[ \t]*\n)*"
+    r"^CREATE TABLE\s.*?\n\)[^;\n]*;\n(?:```\n)?",
+    re.S | re.M | re.I)
+
+_TITLE = re.compile(r"^###\s*(?:\d+\.\s*)?(?:表[一二三四五六七八九十\d]+[:：])?\s*(?P<title>[^\n]+)", re.M)
+
+_COLUMN = re.compile(r"^\s*`(?P<name>[^`]+)`\s+(?P<type>\w+(?:\([^)]*\))?(?:\s+unsigned)?)(?P<rest>.*?),?\s*$",
+                     re.I)
+_KEY = re.compile(r"^\s*(?P<kind>PRIMARY KEY|UNIQUE(?:\s+(?:KEY|INDEX))?|KEY|INDEX)\s*`?(?P<index>\w*)`?\s*"
+                  r"\((?P<columns>[^)]*)\)", re.I)
+_COMMENT = re.compile(r"COMMENT\s+'(?P<comment>(?:[^'\\]|''|\\.)*)'", re.I)
+_DEFAULT = re.compile(r"DEFAULT\s+(?P<value>'(?:[^'\\]|''|\\.)*'|\S+)", re.I)
+
+
+def _unquote(text: str) -> str:
+    return text.replace("''", "'").replace("\\'", "'")
+
+
+def _short_type(column_type: str) -> str:
+    """去掉不影响查询的类型细节（varchar(255) → varchar，int(11) → int）"""
+    lowered = column_type.lower()
+    if lowered == "varchar(255)":
+        return "varchar"
+    if lowered == "tinyint(1)":
+        return lowered
+    return re.sub(r"^(tinyint|smallint|mediumint|int|integer|bigint)\(\d+\)", r"\1", lowered)
+
+
+def parse_create_table(ddl: str) -> Optional[Dict]:
+    """解析一条 CREATE TABLE 语句
+
+    Returns:
+        Optional[Dict]: {"name", "columns": [{"name", "type", "nullable", "default", "comment"}],
+            "primary_key": [...], "indexes": [{"name", "columns", "unique"}]}；不是 CREATE TABLE 时返回 None
+    """
+    match = _CREATE_TABLE.search(ddl)
+    if match is None:
+        return None
+    table = {"name": match.group("name").split(".")[-1], "title": None, "columns": [],
+             "primary_key": [], "indexes": []}
+    for line in match.group("body").split("\n"):
+        key = _KEY.match(line)
+        if key:
+            columns = [c.strip(" `") for c in key.group("columns").split(",") if c.strip(" `")]
+            kind = key.group("kind").upper()
+            if kind == "PRIMARY KEY":
+                table["primary_key"] = columns
+            else:
+                table["indexes"].append({"name": key.group("index") or None, "columns": columns,
+                                         "unique": kind.startswith("UNIQUE")})
+            continue
+        column = _COLUMN.match(line)
+        if column is None:
+            continue
+        rest = column.group("rest")
+        comment = _COMMENT.search(rest)
+        default = _DEFAULT.search(rest)
+        table["columns"].append({
+            "name": column.group("name"),
+            "type": column.group("type"),
+            "nullable": not re.search(r"\bNOT\s+NULL\b", rest, re.I),
+            "default": None if default is None or default.group("value").upper() == "NULL"
+            else _unquote(default.group("value").strip("'")),
+            "comment": _unquote(comment.group("comment")) if comment else None,
+        })
+    return table
+
+
+def parse_catalog(text: str) -> Dict[str, Dict]:
+    """从任意文本（提示词、.sql 文件）中解析全部 CREATE TABLE，按表名去重（保留第一次出现的定义）
+
+    Returns:
+        Dict[str, Dict]: 表名 -> parse_create_table 的结果（title 为提示词中 ### 标题里的表说明）
+    """
+    catalog: Dict[str, Dict] = {}
+    for block in _SCHEMA_BLOCK.finditer(text):
+        table = parse_create_table(block.group(0))
+        if table is None or table["name"] in catalog:
+            continue
+        title = _TITLE.match(block.group(0))
+        table["title"] = title.group("title").strip() if title else None
+        catalog[table["name"]] = table
+    # 没有装饰行的裸 DDL（如 .sql 文件）
+    for match in _CREATE_TABLE.finditer(text):
+        table = parse_create_table(match.group(0))
+        if table is not None and table["name"] not in catalog:
+            catalog[table["name"]] = table
+    return catalog
+
+
+def _common_prefix(columns: List[Dict]) -> Optional[str]:
+    """选出节省字符最多的共享前缀（以 _ 结尾，至少覆盖 MIN_PREFIX_COLUMNS 列）"""
+    counts: Dict[str, int] = {}
+    for column in columns:
+        parts = column["name"].split("_")
+        for i in range(1, len(parts)):
+            prefix = "_".join(parts[:i]) + "_"
+            counts[prefix] = counts.get(prefix, 0) + 1
+    best, best_saving = None, 0
+    for prefix, count in counts.items():
+        saving = (count - 1) * len(prefix)
+        if count >= MIN_PREFIX_COLUMNS and saving > best_saving:
+            best, best_saving = prefix, saving
+    return best
+
+
+def _render_column(column: Dict, name: str, primary_key: List[str], table_not_null: bool) -> str:
+    parts = [name, _short_type(column["type"])]
+    if primary_key == [column["name"]]:
+        parts.append("PK")
+    if column["nullable"] and table_not_null:
+        parts.append("NULL")
+    elif not column["nullable"] and not table_not_null:
+        parts.append("NN")
+    if column["default"] is not None:
+        parts.append(f"DEFAULT {column['default']}")
+    if column["comment"]:
+        parts.append("'" + column["comment"] + "'")
+    return " ".join(parts)
+
+
+def render_table(table: Dict) -> str:
+    """把一张表渲染为紧凑格式"""
+    columns = table["columns"]
+    not_null = sum(1 for column in columns if not column["nullable"])
+    table_not_null = bool(columns) and not_null * 2 > len(columns)
+    lines = []
+    if table.get("title"):
+        lines.append(f"-- {table['title']}")
+    lines.append(f"{table['name']}{'(NOT NULL)' if table_not_null else ''}:")
+    prefix = _common_prefix(columns)
+    grouped = [column for column in columns if prefix and column["name"].startswith(prefix)]
+    if grouped:
+        lines.append(f"  {prefix}{{")
+        lines.extend("    " + _render_column(column, column["name"][len(prefix):], table["primary_key"],
+                                             table_not_null) for column in grouped)
+        lines[-1] += "}"
+    lines.extend("  " + _render_column(column, column["name"], table["primary_key"], table_not_null)
+                 for column in columns if column not in grouped)
+    if len(table["primary_key"]) > 1:
+        lines.append(f"  PK({', '.join(table['primary_key'])})")
+    for index in table["indexes"]:
+        lines.append(f"  {'UNIQUE' if index['unique'] else 'INDEX'}({', '.join(index['columns'])})")
+    return "\n".join(lines)
+
+
+def render_compact(catalog: Dict[str, Dict], tables: Optional[List[str]] = None) -> str:
+    """渲染表结构目录（tables 指定时只渲染这些表，按目录顺序）"""
+    selected = [table for name, table in catalog.items() if tables is None or name in tables]
+    return "\n".join([COMPACT_LEGEND] + [render_table(table) for table in selected])
+
+
+def _dedupe_paragraphs(text: str) -> str:
+    """去掉重复的段落，以及只剩下一个已出现过的标题的段落（表结构被删除后残留的重复标题）"""
+    seen = set()
+    seen_headings = set()
+    kept = []
+    for paragraph in re.split(r"\n[ \t]*\n", text):
+        normalized = "\n".join(line.rstrip() for line in paragraph.strip("\n").split("\n"))
+        if not normalized.strip():
+            continue
+        if normalized in seen or ("\n" not in normalized and normalized.strip() in seen_headings):
+            continue
+        seen.add(normalized)
+        seen_headings.add(normalized.split("\n", 1)[0].strip())
+        kept.append(normalized)
+    return "\n\n".join(kept) + "\n"
+
+
+def compact_prompt(prompt: str) -> str:
+    """把提示词中的 DDL 替换为紧凑格式（相同的表只保留一次），并去掉重复的段落
+
+    提示词中没有 CREATE TABLE 时原样返回。
+    """
+    catalog = parse_catalog(prompt)
+    if not catalog:
+        return prompt
+    rendered = render_compact(catalog)
+    placed = []
+
+    def replace(match):
+        if placed:
+            return ""
+        placed.append(True)
+        return rendered + "\n"
+
+    return _dedupe_paragraphs(_SCHEMA_BLOCK.sub(replace, prompt))
+
+
+_tiktoken_encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 数：安装了 tiktoken 时用 cl100k_base 精确计数，否则按字符估算
+    （中日韩字符每字约 1 个 token，其余约每 4 个字符 1 个 token）"""
+    global _tiktoken_encoding
+    if _tiktoken_encoding is None:
+        try:
+            import tiktoken
+            _tiktoken_encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _tiktoken_encoding = False
+    if _tiktoken_encoding:
+        return len(_tiktoken_encoding.encode(text))
+    cjk = sum(1 for ch in text if "　" <= ch <= "鿿" or "＀" <= ch <= "￯")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def compaction_stats(before: str, after: str) -> Dict:
+    """压缩前后的 token 数"""
+    tokens_before = estimate_tokens(before)
+    tokens_after = estimate_tokens(after)
+    return {"tokens_before": tokens_before, "tokens_after": tokens_after,
+            "saved_rate": (1 - tokens_after / tokens_before) * 100 if tokens_before else 0.0}
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Text2SQL 常驻服务
+与 test_question 相同的流水线（生成 → 提取 → 校验 → 执行），以异步 HTTP 接口提供服务。
+
+模型客户端、数据库连接池、各测试组的提示词和 SQL 缓存在进程内常驻；
+请求并发受限，积压超过上限时立即返回 503，避免排队拖垮尾延迟。
+
+接口:
+    POST /v1/text2sql   {"question": "...", "group": "tennis"}（或 "database_name"），
+                        可选 "model_type"、"model"
+                        → {"sql", "success", "error", "rows", "row_count", "timings", "cached",
+                           "cache_source"（近似问题缓存命中时）}
+    GET  /healthz       服务状态
+    GET  /metrics       Prometheus 格式指标
+
+用法:
+    python test_case/test_text2sql.py serve --port 8080 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# 构造函数的 concurrency 参数与模块同名，模块以别名导入
+from test_case import concurrency as adaptive_concurrency
+from test_case import context_cache, deadline, metrics, server_metrics
+from test_case import test_text2sql as t2s
+from test_case.question_cache import QuestionCache, load_aliases, DEFAULT_THRESHOLD
+
+# 请求体大小上限（字节）
+MAX_BODY_BYTES = 64 * 1024
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+            504: "Gateway Timeout"}
+
+
+class SQLCache:
+    """生成 SQL 的 LRU 缓存（带过期时间），同一测试组、同一模型的相同问题直接复用"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[Tuple, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(group_name: str, model_type: str, model_name: str, question: str) -> Tuple:
+        return group_name, model_type, model_name, " ".join(question.split())
+
+    def get(self, key: Tuple) -> Optional[str]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            stored_at, sql = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return sql
+
+    def put(self, key: Tuple, sql: str) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = (time.monotonic(), sql)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class Text2SQLService:
+    """常驻的 Text2SQL 服务状态"""
+
+    def __init__(self, testcase_file: str, concurrency: int = 16, max_pending: int = 64,
+                 timeout: float = 60.0, model_type: str = None, model: str = None,
+                 cache_size: int = 10000, cache_ttl: float = 3600.0,
+                 question_cache: Optional[QuestionCache] = None, compact_schema: bool = False):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.default_model_type = model_type
+        self.default_model = model
+        self.cache = SQLCache(cache_size, cache_ttl)
+        self.question_cache = question_cache
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="serve")
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+        self.started_at = time.time()
+
+        # 测试组配置（提示词在加载时已补充表结构），按组名和数据库名索引
+        test_groups, self.defaults = t2s.load_test_cases(testcase_file, compact_schema=compact_schema)
+        adaptive_concurrency.REGISTRY.configure(self.defaults["model_concurrency"])
+        self.groups: Dict[str, Dict] = {}
+        self.groups_by_db: Dict[str, Dict] = {}
+        for group_idx, group in enumerate(test_groups, 1):
+            group.setdefault("name", f"测试组{group_idx}")
+            self.groups[group["name"]] = group
+            self.groups_by_db.setdefault(group["db_name"], group)
+
+    def warm_up(self) -> None:
+        """预先创建数据库连接池和模型客户端"""
+        for group in self.groups.values():
+            if group.get("db_config"):
+                try:
+                    db = t2s.get_db_from_config(group["db_name"], group["db_config"])
+                    db.execute_query("SELECT 1")
+                except Exception as e:
+                    print(f"警告: 预热数据库 {group['db_name']} 失败: {e}")
+        t2s.ensure_env_loaded()
+        if t2s.get_openai() is not None and os.getenv("OPENAI_API_KEY"):
+            t2s._get_openai_client(os.getenv("OPENAI_API_KEY"))
+
+    def resolve(self, payload: Dict) -> Tuple[Dict, str, str]:
+        """根据请求确定测试组和模型
+
+        Raises:
+            ValueError: 请求参数不合法
+        """
+        group = None
+        if payload.get("group"):
+            group = self.groups.get(payload["group"])
+            if group is None:
+                raise ValueError(f"未知的测试组: {payload['group']}")
+        elif payload.get("database_name"):
+            group = self.groups_by_db.get(payload["database_name"])
+            if group is None:
+                raise ValueError(f"未知的数据库: {payload['database_name']}")
+        elif len(self.groups) == 1:
+            group = next(iter(self.groups.values()))
+        else:
+            raise ValueError("请求必须指定 group 或 database_name")
+
+        model_type = payload.get("model_type") or self.default_model_type
+        model = payload.get("model") or self.default_model
+        if not model_type:
+            model_type = "openai" if t2s.sdk_available("openai") else "google"
+        if model_type not in t2s.SQL_GENERATORS:
+            raise ValueError(f"未知的模型类型: {model_type}")
+        if not model:
+            models = group.get(f"{model_type}_model") or [model_type]
+            model = models[0]
+        return group, model_type, model
+
+    def execute(self, question: str, group: Dict, model_type: str, model: str, received: float,
+                budget: Optional[deadline.Deadline] = None) -> Dict:
+        """在工作线程中执行流水线
+
+        Args:
+            budget: 请求的截止时间（从收到请求时开始计时）；模型和数据库调用以剩余时间作为超时，
+                请求超时后工作线程也会尽快结束。为空时以服务的 timeout 为预算
+        """
+        with (deadline.attach(budget) if budget is not None else deadline.scope(self.timeout)):
+            return self._execute(question, group, model_type, model, received)
+
+    def _execute(self, question: str, group: Dict, model_type: str, model: str, received: float) -> Dict:
+        started = time.perf_counter()
+        cache_key = SQLCache.key(group["name"], model_type, model, question)
+        cached_sql = self.cache.get(cache_key)
+        cache_scope = QuestionCache.scope(group["name"], model_type, model)
+        similar = None
+        if cached_sql is None and self.question_cache is not None:
+            similar = self.question_cache.lookup(question, cache_scope)
+            if similar is not None:
+                cached_sql = similar[0]["sql"]
+        metrics.INFLIGHT_REQUESTS.inc()
+        try:
+            if similar is not None:
+                result = t2s.run_known_sql(question, cached_sql, model_type, model,
+                                           db_name=group["db_name"], db_config=group.get("db_config"),
+                                           allowed_tables=group["allowed_tables"], include_rows=True,
+                                           prompt=group["prompt"])
+                result["cache_hit"] = True
+                result["cache_source"] = self.question_cache.record_hit(question, *similar)
+            elif cached_sql is not None:
+                metrics.CACHE_HITS_TOTAL.inc(cache="serve_sql")
+                result = t2s.run_known_sql(question, cached_sql, model_type, model,
+                                           db_name=group["db_name"], db_config=group.get("db_config"),
+                                           allowed_tables=group["allowed_tables"], include_rows=True,
+                                           prompt=group["prompt"])
+            else:
+                result = t2s.test_question(question, group["prompt"], model_type, model,
+                                           db_name=group["db_name"], db_config=group.get("db_config"),
+                                           allowed_tables=group["allowed_tables"], include_rows=True)
+                if result.get("success") and result.get("sql"):
+                    self.cache.put(cache_key, result["sql"])
+                    if self.question_cache is not None:
+                        self.question_cache.add(question, cache_scope, result["sql"])
+        finally:
+            metrics.INFLIGHT_REQUESTS.dec()
+        result["group_name"] = group["name"]
+        result["cached"] = cached_sql is not None
+        metrics.record_result(result)
+        finished = time.perf_counter()
+        result["timings"] = {
+            "queue": started - received,
+            "llm": result.get("generation_time"),
+            "validation": result.get("validation_time"),
+            "db": result.get("db_time"),
+            "total": finished - received,
+        }
+        return result
+
+    async def handle_query(self, body: bytes) -> Tuple[int, Dict, Dict]:
+        """处理 POST /v1/text2sql"""
+        try:
+            payload = json.loads(body.decode("utf-8") or "{}")
+        except (UnicodeDecodeError, ValueError):
+            return 400, {"error": "请求体必须是 JSON"}, {}
+        question = (payload.get("question") or "").strip() if isinstance(payload, dict) else ""
+        if not question:
+            return 400, {"error": "缺少 question"}, {}
+        try:
+            group, model_type, model = self.resolve(payload)
+        except ValueError as e:
+            return 400, {"error": str(e)}, {}
+
+        # 背压：积压达到上限时立即拒绝，而不是无限排队
+        with self._pending_lock:
+            if self.pending >= self.concurrency + self.max_pending:
+                return 503, {"error": "服务繁忙，请稍后重试"}, {"Retry-After": "1"}
+            self.pending += 1
+
+        received = time.perf_counter()
+        budget = deadline.Deadline(self.timeout)
+        work = self.executor.submit(self.execute, question, group, model_type, model, received, budget)
+        # 返回 504 时工作线程可能仍在执行，积压计数等工作线程结束（或排队中被取消）时才释放
+        work.add_done_callback(self._release)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(work), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return 504, {"error": f"请求超时（{self.timeout}s）"}, {}
+
+        response = {
+            "question": question,
+            "group": group["name"],
+            "model_type": model_type,
+            "model": model,
+            "sql": result.get("sql"),
+            "success": result.get("success", False),
+            "error": result.get("error"),
+            "failed_stage": result.get("failed_stage"),
+            "rows": result.get("rows", []),
+            "row_count": result.get("result_count", 0),
+            "cached": result.get("cached", False),
+            "timings": result["timings"],
+        }
+        if result.get("cache_source"):
+            response["cache_source"] = result["cache_source"]
+        return 200, response, {}
+
+    def _release(self, _work) -> None:
+        with self._pending_lock:
+            self.pending -= 1
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, object, Dict]:
+        path = path.split("?", 1)[0]
+        if path in ("/v1/text2sql", "/text2sql"):
+            if method != "POST":
+                return 405, {"error": "仅支持 POST"}, {}
+            return await self.handle_query(body)
+        if path == "/healthz":
+            return 200, {
+                "status": "ok",
+                "pending": self.pending,
+                "concurrency": self.concurrency,
+                "max_pending": self.max_pending,
+                "groups": sorted(self.groups),
+                "sql_cache_size": len(self.cache),
+                "question_cache": ({k: v for k, v in self.question_cache.summary().items() if k != "audit"}
+                                   if self.question_cache is not None else None),
+                "adaptive_concurrency": [{k: v for k, v in snap.items() if k != "adjustments"}
+                                         for snap in adaptive_concurrency.REGISTRY.snapshot()],
+                "replicas": t2s.replica_snapshots(),
+                "context_cache": context_cache.REGISTRY.snapshot(),
+                "server_metrics": server_metrics.COLLECTOR.snapshot(),
+                "uptime": time.time() - self.started_at,
+            }, {}
+        if path == "/metrics":
+            return 200, metrics.REGISTRY.render(), {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        return 404, {"error": "未找到"}, {}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """处理一个 HTTP/1.1 连接（支持 keep-alive）"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    break
+                method, path, version = parts
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    status, payload, extra = 413, {"error": "请求体过大"}, {}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    try:
+                        status, payload, extra = await self.dispatch(method, path, body)
+                    except Exception as e:
+                        status, payload, extra = 500, {"error": f"服务内部错误: {e}"}, {}
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                if isinstance(payload, str):
+                    data = payload.encode("utf-8")
+                else:
+                    data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+                    extra.setdefault("Content-Type", "application/json; charset=utf-8")
+                head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+                        f"Content-Length: {len(data)}",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head += [f"{k}: {v}" for k, v in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+        if self.question_cache is not None:
+            self.question_cache.save()
+
+
+async def serve_forever(service: Text2SQLService, host: str, port: int) -> None:
+    """启动 HTTP 服务，收到 SIGINT/SIGTERM 时停止"""
+    server = await asyncio.start_server(service.handle_connection, host, port, backlog=1024)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows 不支持
+    print(f"Text2SQL 服务已启动: http://{host}:{port}/v1/text2sql")
+    async with server:
+        await stop.wait()
+    print("Text2SQL 服务已停止")
+
+
+def main(argv: List[str] = None) -> int:
+    """serve 子命令入口"""
+    parser = argparse.ArgumentParser(prog="test_text2sql.py serve", description="Text2SQL 常驻 HTTP 服务")
+    parser.add_argument("--testcase", default=os.path.join(os.path.dirname(__file__), "testcase.json"),
+                        help="提供测试组、提示词和数据库配置的测试用例文件（默认: test_case/testcase.json）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认: 127.0.0.1）")
+    parser.add_argument("--port", type=int, default=8080, help="监听端口（默认: 8080）")
+    parser.add_argument("--concurrency", type=int, default=16, help="同时处理的请求数上限")
+    parser.add_argument("--max-pending", type=int, default=64, help="排队请求数上限，超过时返回 503")
+    parser.add_argument("--timeout", type=float, default=60.0, help="单个请求的超时时间（秒）")
+    parser.add_argument("--model-type", default=None, help="默认模型类型（openai/google）")
+    parser.add_argument("--model", default=None, help="默认模型名称（默认使用测试组配置的第一个模型）")
+    parser.add_argument("--cache-size", type=int, default=10000, help="SQL 缓存条数（0 表示关闭）")
+    parser.add_argument("--cache-ttl", type=float, default=3600.0, help="SQL 缓存有效期（秒）")
+    parser.add_argument("--question-cache", default=None,
+                        help="近似重复问题缓存文件（停止时保存）；相似问题直接复用已验证的 SQL")
+    parser.add_argument("--cache-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"问题缓存的相似度阈值，0-1（默认: {DEFAULT_THRESHOLD}）")
+    parser.add_argument("--cache-aliases", default=None, help="问题归一化使用的别名表 JSON")
+    parser.add_argument("--no-warm-up", action="store_true", help="启动时不预热数据库连接和模型客户端")
+    parser.add_argument("--compact-schema", action="store_true", help="提示词使用紧凑表结构（同主测试的 --compact-schema）")
+    parser.add_argument("--context-cache", action="store_true",
+                        help="使用提供方的提示词前缀缓存（同主测试的 --context-cache）")
+    parser.add_argument("--context-cache-ttl", type=int, default=context_cache.DEFAULT_TTL,
+                        help=f"Gemini 显式缓存的有效期（秒，默认: {context_cache.DEFAULT_TTL}）")
+    parser.add_argument("--server-metrics", choices=server_metrics.MODES, default=None,
+                        help="在返回结果中附带每条查询的服务端指标（同主测试的 --server-metrics）")
+    args = parser.parse_args(argv)
+
+    context_cache.REGISTRY.configure(enabled=args.context_cache, ttl=args.context_cache_ttl)
+    server_metrics.COLLECTOR.configure(args.server_metrics)
+
+    question_cache = None
+    if args.question_cache:
+        question_cache = QuestionCache.load(args.question_cache, threshold=args.cache_threshold,
+                                            aliases=load_aliases(args.cache_aliases))
+    service = Text2SQLService(args.testcase, concurrency=args.concurrency, max_pending=args.max_pending,
+                              timeout=args.timeout, model_type=args.model_type, model=args.model,
+                              cache_size=args.cache_size, cache_ttl=args.cache_ttl,
+                              question_cache=question_cache, compact_schema=args.compact_schema)
+    if not args.no_warm_up:
+        service.warm_up()
+    try:
+        asyncio.run(serve_forever(service, args.host, args.port))
+    finally:
+        service.close()
+        context_cache.REGISTRY.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
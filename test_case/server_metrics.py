@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务端查询指标
+在执行每条生成的 SQL 时，从数据库服务端取得这条查询的实际开销，用于比较各模型生成 SQL 的效率：
+
+    - status:             在同一连接上执行查询前后各读一次 SHOW SESSION STATUS，取差值。
+                          SHOW STATUS 自身对计数器的影响在每个数据库上首次使用时测出并扣除；
+                          扫描行数为各 Handler_read_* 之和（近似值），没有服务端执行时间
+    - performance_schema: 查询结束后读取本连接 performance_schema.events_statements_history 中的
+                          最后一条语句事件（需要开启 events_statements_history consumer）
+
+记录的字段（不可用时为 None）：
+    server_time / lock_time       服务端执行时间和锁等待时间（秒，仅 performance_schema）
+    rows_examined / rows_sent     扫描行数和返回行数
+    tmp_tables / tmp_disk_tables  内部临时表（及落盘的临时表）数量
+    filesorts / sort_rows         排序次数和排序行数；sort_merge_passes 排序归并次数
+    full_scans / full_joins       全表扫描次数和没有使用索引的连接次数
+    no_index_used                 是否有未使用索引的访问（仅 performance_schema）
+
+指标写入每个结果的 server_metrics 字段，按模型汇总后写入统计信息；读取指标失败不影响查询本身。
+
+用法:
+    from test_case import server_metrics
+    server_metrics.COLLECTOR.configure("status")
+    with server_metrics.capture() as measured:
+        rows = db.execute_query(sql)
+    measured  # {"rows_examined": ..., "rows_sent": ..., ...}
+"""
+
+import contextlib
+import threading
+from typing import Dict, List, Optional
+
+from test_case import metrics
+
+MODES = ("status", "performance_schema")
+
+FIELDS = ("server_time", "lock_time", "rows_examined", "rows_sent", "tmp_tables", "tmp_disk_tables",
+          "filesorts", "sort_rows", "sort_merge_passes", "full_scans", "full_joins", "no_index_used")
+
+# 扫描行数：各种 Handler 读操作之和
+_HANDLER_READS = ("Handler_read_first", "Handler_read_key", "Handler_read_last", "Handler_read_next",
+                  "Handler_read_prev", "Handler_read_rnd", "Handler_read_rnd_next")
+
+_STATUS_VARIABLES = _HANDLER_READS + ("Created_tmp_tables", "Created_tmp_disk_tables", "Sort_rows", "Sort_scan",
+                                      "Sort_range", "Sort_merge_passes", "Select_scan", "Select_full_join")
+
+_SHOW_STATUS = ("SHOW SESSION STATUS WHERE Variable_name IN ("
+                + ", ".join(f"'{name}'" for name in _STATUS_VARIABLES) + ")")
+
+# 本连接最近一条执行完成的语句（读取本身尚未完成，不在 history 中）
+_LAST_STATEMENT = (
+    "SELECT TIMER_WAIT AS timer_wait, LOCK_TIME AS lock_time, ROWS_EXAMINED AS rows_examined, "
+    "ROWS_SENT AS rows_sent, CREATED_TMP_TABLES AS tmp_tables, CREATED_TMP_DISK_TABLES AS tmp_disk_tables, "
+    "SORT_SCAN + SORT_RANGE AS filesorts, SORT_ROWS AS sort_rows, SORT_MERGE_PASSES AS sort_merge_passes, "
+    "SELECT_SCAN AS full_scans, SELECT_FULL_JOIN AS full_joins, NO_INDEX_USED AS no_index_used "
+    "FROM performance_schema.events_statements_history "
+    "WHERE THREAD_ID = (SELECT THREAD_ID FROM performance_schema.threads WHERE PROCESSLIST_ID = CONNECTION_ID()) "
+    "ORDER BY EVENT_ID DESC LIMIT 1")
+
+# performance_schema 的计时单位为皮秒
+_PICOSECONDS = 1e12
+
+_local = threading.local()
+
+
+def current() -> Optional[Dict]:
+    """当前线程正在收集指标的字典（没有在 capture() 中时为 None）"""
+    return getattr(_local, "target", None)
+
+
+@contextlib.contextmanager
+def capture():
+    """收集本线程下一次数据库查询的服务端指标（未开启时产出的字典保持为空）"""
+    previous = current()
+    target: Dict = {}
+    _local.target = target if COLLECTOR.enabled else None
+    try:
+        yield target
+    finally:
+        _local.target = previous
+
+
+def _status(cursor) -> Dict[str, int]:
+    cursor.execute(_SHOW_STATUS)
+    return {row["Variable_name"]: int(row["Value"]) for row in cursor.fetchall()}
+
+
+def _status_delta(before: Dict[str, int], after: Dict[str, int], overhead: Dict[str, int]) -> Dict[str, int]:
+    return {name: max(0, after.get(name, 0) - before.get(name, 0) - overhead.get(name, 0))
+            for name in _STATUS_VARIABLES}
+
+
+class ServerMetricsCollector:
+    """服务端指标的全局设置与计数（线程安全）"""
+
+    def __init__(self):
+        self.mode: Optional[str] = None
+        self._lock = threading.Lock()
+        self._overhead: Dict[str, Dict[str, int]] = {}
+        self._totals = metrics.Counts()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode is not None
+
+    def configure(self, mode: Optional[str]) -> None:
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"未知的服务端指标模式: {mode}（可选: {', '.join(MODES)}）")
+        self.mode = mode
+
+    def _failed(self, error: Exception) -> None:
+        for counts in metrics.counts_to_update("server_metrics", self._totals):
+            counts.add("errors")
+            counts.put("last_error", str(error).split("\n", 1)[0][:200])
+
+    def begin(self, cursor, key: str) -> Optional[Dict[str, int]]:
+        """查询前调用（status 模式读取计数器基线）；失败时返回 None，本次不再收集"""
+        if self.mode != "status":
+            return {}
+        try:
+            if key not in self._overhead:
+                first = _status(cursor)
+                second = _status(cursor)
+                with self._lock:
+                    self._overhead.setdefault(key, _status_delta(first, second, {}))
+                return second
+            return _status(cursor)
+        except Exception as e:
+            self._failed(e)
+            return None
+
+    def finish(self, cursor, key: str, baseline: Optional[Dict[str, int]], rows_sent: int) -> Dict:
+        """查询后调用，返回该查询的服务端指标（失败时返回空字典）"""
+        if baseline is None:
+            return {}
+        try:
+            if self.mode == "status":
+                measured = self._from_status(_status_delta(baseline, _status(cursor), self._overhead[key]), rows_sent)
+            else:
+                cursor.execute(_LAST_STATEMENT)
+                row = cursor.fetchone()
+                if row is None:
+                    raise RuntimeError("events_statements_history 中没有本连接的语句（consumer 未开启？）")
+                measured = self._from_statement(row)
+        except Exception as e:
+            self._failed(e)
+            return {}
+        for counts in metrics.counts_to_update("server_metrics", self._totals):
+            counts.add("collected")
+        return measured
+
+    @staticmethod
+    def _from_status(delta: Dict[str, int], rows_sent: int) -> Dict:
+        return {
+            "server_time": None,
+            "lock_time": None,
+            "rows_examined": sum(delta[name] for name in _HANDLER_READS),
+            "rows_sent": rows_sent,
+            "tmp_tables": delta["Created_tmp_tables"],
+            "tmp_disk_tables": delta["Created_tmp_disk_tables"],
+            "filesorts": delta["Sort_scan"] + delta["Sort_range"],
+            "sort_rows": delta["Sort_rows"],
+            "sort_merge_passes": delta["Sort_merge_passes"],
+            "full_scans": delta["Select_scan"],
+            "full_joins": delta["Select_full_join"],
+            "no_index_used": None,
+        }
+
+    @staticmethod
+    def _from_statement(row: Dict) -> Dict:
+        measured = {name: int(row[name]) if row.get(name) is not None else None for name in FIELDS
+                    if name not in ("server_time", "lock_time")}
+        measured["server_time"] = int(row["timer_wait"]) / _PICOSECONDS if row.get("timer_wait") is not None else None
+        measured["lock_time"] = int(row["lock_time"]) / _PICOSECONDS if row.get("lock_time") is not None else None
+        return {name: measured[name] for name in FIELDS}
+
+    def snapshot(self) -> Optional[Dict]:
+        """收集情况（在 run_scope() 中时只含本次运行）；未开启时返回 None"""
+        if not self.enabled:
+            return None
+        counts = metrics.counts_to_report("server_metrics", self._totals)
+        return {"mode": self.mode, "collected": counts.get("collected"), "errors": counts.get("errors"),
+                "last_error": counts.get("last_error", None)}
+
+
+COLLECTOR = ServerMetricsCollector()
+
+
+def efficiency_ranking(models: List[Dict]) -> List[Dict]:
+    """按 SQL 效率对模型排序：每返回一行扫描的行数越少越好，其次是平均服务端时间和临时表/排序次数
+
+    Args:
+        models: report.aggregate 的按模型汇总行
+
+    Returns:
+        List[Dict]: 有服务端指标的模型，按效率从高到低
+    """
+    measured = [row for row in models if row.get("server_queries")]
+
+    def key(row):
+        per_sent = row["examined_per_sent"]
+        return (per_sent if per_sent is not None else float("inf"),
+                row["server_time_avg"] if row["server_time_avg"] is not None else float("inf"),
+                row["tmp_tables_avg"] + row["filesorts_avg"])
+
+    return [{"model_type": row["model_type"], "model": row["model"], "queries": row["server_queries"],
+             "examined_per_sent": row["examined_per_sent"], "rows_examined_avg": row["rows_examined_avg"],
+             "server_time_avg": row["server_time_avg"], "tmp_tables_avg": row["tmp_tables_avg"],
+             "tmp_disk_tables": row["tmp_disk_tables"], "filesorts_avg": row["filesorts_avg"],
+             "full_scans": row["full_scans"]}
+            for row in sorted(measured, key=key)]
+
+
+def format_model(row: Dict) -> Optional[str]:
+    """按模型汇总行中的服务端指标（一行）；没有指标时返回 None"""
+    if not row.get("server_queries"):
+        return None
+    per_sent = f"{row['examined_per_sent']:.1f}" if row["examined_per_sent"] is not None else "-"
+    server_time = f"，服务端耗时均值 {row['server_time_avg'] * 1000:.2f}ms" if row["server_time_avg"] is not None else ""
+    return (f"服务端指标（{row['server_queries']} 条）: 扫描/返回行 {row['rows_examined_avg']:.0f}/"
+            f"{row['rows_sent_avg']:.1f}（每行 {per_sent}）{server_time}，临时表 {row['tmp_tables']}"
+            f"（落盘 {row['tmp_disk_tables']}），排序 {row['filesorts']}，全表扫描 {row['full_scans']}")
+
+
+def summarize(models: List[Dict]) -> Optional[Dict]:
+    """收集情况和按效率排序的模型（写入结果文件的 statistics.server_metrics 字段）；未开启时返回 None"""
+    snapshot = COLLECTOR.snapshot()
+    if snapshot is None:
+        return None
+    snapshot["ranking"] = efficiency_ranking(models)
+    return snapshot
+
+
+def format_console(summary: Dict) -> str:
+    lines = [f"服务端查询指标（{summary['mode']}）: 收集 {summary['collected']} 条，失败 {summary['errors']} 次"
+             + (f"（{summary['last_error']}）" if summary["last_error"] else "")]
+    if summary["ranking"]:
+        lines.append("  按 SQL 效率排序（每返回一行扫描的行数）:")
+        for i, row in enumerate(summary["ranking"], 1):
+            per_sent = f"{row['examined_per_sent']:.1f}" if row["examined_per_sent"] is not None else "-"
+            server_time = (f"，服务端耗时均值 {row['server_time_avg'] * 1000:.2f}ms"
+                           if row["server_time_avg"] is not None else "")
+            lines.append(f"    {i}. {row['model_type']}/{row['model']}: 每行扫描 {per_sent}，"
+                         f"平均扫描 {row['rows_examined_avg']:.0f} 行{server_time}，"
+                         f"平均临时表 {row['tmp_tables_avg']:.2f}，平均排序 {row['filesorts_avg']:.2f}")
+    return "\n".join(lines)
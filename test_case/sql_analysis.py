@@ -0,0 +1,684 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL 词法分析与列使用分析
+不依赖第三方解析库，把 MySQL 的 SELECT 语句切分为词法单元，再按子句识别：
+    - 表引用和别名（FROM / JOIN，含逗号连接、派生表、LATERAL 派生表、表函数和 WITH 定义的公共表表达式）
+    - 谓词中的列：等值（=、IN、IS NULL）、范围（<、>、BETWEEN、LIKE 'abc%'）、
+      不可走索引的匹配（LIKE '%abc'）、连接条件（a.x = b.y）
+    - 被函数包裹的列（DATE(col)、col->>'$.a'、JSON_EXTRACT(col, '$.a') 等），记录完整表达式
+    - ORDER BY / GROUP BY 中的列和表达式
+check_references 按表结构目录校验表、别名和列引用是否存在（执行前在本地拒绝 Unknown column 类错误）。
+不保证覆盖全部语法，无法识别的部分直接跳过，不会抛出异常。
+
+用法:
+    from test_case import sql_analysis
+    analysis = sql_analysis.analyze(sql, columns={"t": {"a", "b"}})
+    for use in analysis.uses:
+        print(use.table, use.column, use.usage, use.expression)
+    sql_analysis.check_references(sql, {"t": {"a", "b"}})  # None 或 "未知列 c：表 t 中没有该列"
+"""
+
+import difflib
+import re
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+_TOKEN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+  | (?P<quoted>`(?:[^`]|``)+`)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_@][\w$]*)
+  | (?P<op>->>|->|<=>|<>|!=|>=|<=|\|\||&&|[=<>+\-*/%])
+  | (?P<punct>[(),.;])
+  | (?P<other>.)
+""", re.S | re.X)
+
+# 谓词所在的子句
+PREDICATE_CLAUSES = {"WHERE", "ON", "HAVING"}
+
+# 列使用方式
+EQUALITY = "equality"
+RANGE = "range"
+LIKE_PREFIX = "like_prefix"
+LIKE_CONTAINS = "like_contains"
+NOT_EQUAL = "not_equal"
+IS_NULL = "is_null"
+JOIN = "join"
+ORDER = "order"
+GROUP = "group"
+
+# 可以使用 B-Tree 索引的谓词
+SARGABLE = {EQUALITY, RANGE, LIKE_PREFIX, IS_NULL, JOIN}
+
+_COMPARISONS = {"=": EQUALITY, "<=>": EQUALITY, "<": RANGE, ">": RANGE, "<=": RANGE, ">=": RANGE,
+                "<>": NOT_EQUAL, "!=": NOT_EQUAL}
+
+_CLAUSE_KEYWORDS = {"SELECT", "FROM", "WHERE", "ON", "USING", "HAVING", "LIMIT", "UNION", "SET", "VALUES",
+                    "WINDOW", "OFFSET"}
+
+_JOIN_KEYWORDS = {"JOIN", "STRAIGHT_JOIN"}
+
+# 不能作为表别名的关键字
+_RESERVED = {
+    "SELECT", "FROM", "WHERE", "GROUP", "ORDER", "BY", "HAVING", "LIMIT", "OFFSET", "JOIN", "INNER", "LEFT",
+    "RIGHT", "OUTER", "CROSS", "NATURAL", "STRAIGHT_JOIN", "ON", "USING", "UNION", "ALL", "AS", "AND", "OR",
+    "NOT", "IN", "IS", "NULL", "LIKE", "BETWEEN", "EXISTS", "CASE", "WHEN", "THEN", "ELSE", "END", "DISTINCT",
+    "WITH", "RECURSIVE", "WINDOW", "OVER", "PARTITION", "ASC", "DESC", "FOR", "LOCK", "INTO", "REGEXP", "RLIKE",
+    "FORCE", "USE", "IGNORE", "INDEX", "KEY", "LATERAL", "SET", "VALUES", "ESCAPE", "DIV", "MOD", "XOR",
+    "TRUE", "FALSE", "INTERVAL", "SOUNDS",
+}
+
+
+class Token:
+    """词法单元；kind 为 string、number、name（可带限定符的标识符）、op、punct 或 other"""
+
+    __slots__ = ("kind", "value", "upper", "parts")
+
+    def __init__(self, kind: str, value: str, parts: Optional[List[str]] = None):
+        self.kind = kind
+        self.value = value
+        self.upper = value.upper()
+        self.parts = parts
+
+    def __repr__(self):
+        return f"Token({self.kind}, {self.value!r})"
+
+
+def _unquote_identifier(text: str) -> str:
+    if text.startswith("`"):
+        return text[1:-1].replace("``", "`")
+    return text
+
+
+def tokenize(sql: str) -> List[Token]:
+    """切分为词法单元（去掉空白和注释，a.b.c 合并为一个 name）"""
+    raw: List[Tuple[str, str]] = []
+    for match in _TOKEN.finditer(sql or ""):
+        kind = match.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        raw.append((kind, match.group()))
+    tokens: List[Token] = []
+    i = 0
+    while i < len(raw):
+        kind, value = raw[i]
+        if kind in ("ident", "quoted"):
+            parts = [_unquote_identifier(value)]
+            j = i + 1
+            while (j + 1 < len(raw) and raw[j] == ("punct", ".")
+                   and (raw[j + 1][0] in ("ident", "quoted") or raw[j + 1][1] == "*")):
+                parts.append(_unquote_identifier(raw[j + 1][1]))
+                j += 2
+            tokens.append(Token("name", ".".join(parts), parts))
+            i = j
+            continue
+        tokens.append(Token(kind, value))
+        i += 1
+    return tokens
+
+
+def string_value(token: Token) -> str:
+    """字符串字面量的内容（去掉引号）"""
+    quote = token.value[0]
+    return token.value[1:-1].replace(quote * 2, quote).replace("\\" + quote, quote)
+
+
+def expression_text(tokens: List[Token]) -> str:
+    """把一段词法单元重新拼接为规范化的表达式文本（关键字和函数名大写，逗号后一个空格）"""
+    out = []
+    for i, token in enumerate(tokens):
+        text = token.value
+        if token.kind == "name" and i + 1 < len(tokens) and tokens[i + 1].value == "(":
+            text = token.upper
+        elif token.kind == "name" and token.upper in _RESERVED:
+            text = token.upper
+        if out and not (token.value in (")", ",") or out[-1].endswith("(")
+                        or (token.value == "(" and i > 0 and tokens[i - 1].kind == "name")):
+            out.append(" ")
+        out.append(text)
+    return "".join(out)
+
+
+def fingerprint(sql: str) -> str:
+    """查询形状：字面量替换为 ?，IN 列表折叠，用于把只有参数不同的查询归为一类"""
+    parts = []
+    for token in tokenize(sql):
+        if token.kind in ("string", "number"):
+            parts.append("?")
+        elif token.kind == "name":
+            parts.append(token.value.lower())
+        else:
+            parts.append(token.value)
+    text = " ".join(parts)
+    return re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(?)", text)
+
+
+class ColumnUse:
+    """一次列使用"""
+
+    __slots__ = ("table", "column", "usage", "expression", "function", "clause", "value")
+
+    def __init__(self, table: Optional[str], column: str, usage: str, clause: str,
+                 expression: Optional[str] = None, function: Optional[str] = None, value: Optional[str] = None):
+        self.table = table
+        self.column = column
+        self.usage = usage
+        self.clause = clause
+        self.expression = expression    # 列被函数包裹时的规范化表达式（已去掉表别名）
+        self.function = function        # 最外层函数名（大写），col->>'$.a' 记为 "->>"
+        self.value = value              # LIKE 的模式等字面量
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"ColumnUse({self.table}.{self.column}, {self.usage}, {self.expression})"
+
+
+class Analysis:
+    """analyze 的结果"""
+
+    def __init__(self):
+        self.tables: Set[str] = set()               # 引用的真实表（不含 CTE 和派生表）
+        self.aliases: Dict[str, Optional[str]] = {}  # 别名（小写）-> 表名；派生表和 CTE 为 None
+        self.scopes: Dict[int, List[Optional[str]]] = {}  # 查询块编号 -> 其中引用的表（派生表和 CTE 为 None）
+        self.uses: List[ColumnUse] = []
+        self.unresolved: List[str] = []             # 无法确定所属表的列
+        self.table_functions: List[Tuple[int, int]] = []  # 表函数（JSON_TABLE 等）参数所在的词法单元范围
+
+
+class _Operand:
+    """比较运算符一侧的操作数"""
+
+    __slots__ = ("kind", "start", "end", "columns", "function")
+
+    def __init__(self, kind: str, start: int, end: int, columns: List[int] = None, function: str = None):
+        self.kind = kind          # column / expression / literal / subquery / other
+        self.start = start        # 在词法单元列表中的范围 [start, end)
+        self.end = end
+        self.columns = columns or []
+        self.function = function
+
+
+def _is_column_name(tokens: List[Token], i: int) -> bool:
+    token = tokens[i]
+    if token.kind != "name" or token.upper in _RESERVED or token.value.startswith("@"):
+        return False
+    if i + 1 < len(tokens) and tokens[i + 1].value == "(":
+        return False
+    # CAST(x AS DATE)、选择列别名、INTERVAL 1 DAY 中的名称不是列
+    if i > 0 and tokens[i - 1].upper == "AS" or i > 1 and tokens[i - 2].upper == "INTERVAL":
+        return False
+    return token.parts[-1] != "*"
+
+
+def _matching(tokens: List[Token], i: int, step: int) -> int:
+    """从括号 i 出发找到与之匹配的括号位置（step=1 向后，-1 向前）；找不到时返回 -1"""
+    opening, closing = ("(", ")") if step == 1 else (")", "(")
+    depth = 0
+    while 0 <= i < len(tokens):
+        if tokens[i].value == opening:
+            depth += 1
+        elif tokens[i].value == closing:
+            depth -= 1
+            if depth == 0:
+                return i
+        i += step
+    return -1
+
+
+def _columns_in(tokens: List[Token], start: int, end: int) -> List[int]:
+    return [i for i in range(start, end) if _is_column_name(tokens, i)]
+
+
+def _operand_before(tokens: List[Token], i: int) -> Optional[_Operand]:
+    """运算符 i 左侧的操作数"""
+    end = i
+    j = i - 1
+    if j < 0:
+        return None
+    token = tokens[j]
+    # col->>'$.path'
+    if token.kind == "string" and j >= 2 and tokens[j - 1].value in ("->", "->>") and _is_column_name(tokens, j - 2):
+        return _Operand("expression", j - 2, end, [j - 2], tokens[j - 1].value)
+    if token.value == ")":
+        start = _matching(tokens, j, -1)
+        if start < 0:
+            return None
+        if start > 0 and tokens[start - 1].kind == "name" and tokens[start - 1].upper not in _RESERVED:
+            return _Operand("expression", start - 1, end, _columns_in(tokens, start, end),
+                            tokens[start - 1].upper)
+        if start + 1 < len(tokens) and tokens[start + 1].upper == "SELECT":
+            return _Operand("subquery", start, end)
+        return _Operand("other", start, end, _columns_in(tokens, start, end))
+    if _is_column_name(tokens, j):
+        return _Operand("column", j, end, [j])
+    if token.kind in ("string", "number") or token.upper in ("NULL", "TRUE", "FALSE"):
+        return _Operand("literal", j, end)
+    return None
+
+
+def _operand_after(tokens: List[Token], i: int) -> Optional[_Operand]:
+    """运算符 i 右侧的操作数"""
+    j = i + 1
+    if j >= len(tokens):
+        return None
+    token = tokens[j]
+    if token.value in ("+", "-") and j + 1 < len(tokens) and tokens[j + 1].kind == "number":
+        return _Operand("literal", j, j + 2)
+    if token.upper in ("ANY", "ALL", "SOME") and j + 1 < len(tokens) and tokens[j + 1].value == "(":
+        j += 1
+        token = tokens[j]
+    if token.kind in ("string", "number") or token.upper in ("NULL", "TRUE", "FALSE"):
+        return _Operand("literal", j, j + 1)
+    if token.upper == "INTERVAL":
+        return _Operand("literal", j, min(j + 3, len(tokens)))
+    if token.value == "(":
+        end = _matching(tokens, j, 1)
+        if end < 0:
+            return None
+        if j + 1 < len(tokens) and tokens[j + 1].upper == "SELECT":
+            return _Operand("subquery", j, end + 1)
+        columns = _columns_in(tokens, j, end)
+        return _Operand("other" if columns else "literal", j, end + 1, columns)
+    if token.kind == "name" and j + 1 < len(tokens) and tokens[j + 1].value == "(":
+        end = _matching(tokens, j + 1, 1)
+        if end < 0:
+            return None
+        columns = _columns_in(tokens, j + 1, end)
+        # 不含列的函数（NOW()、DATE_SUB(NOW(), ...)）视为常量
+        return _Operand("expression" if columns else "literal", j, end + 1, columns, token.upper)
+    if _is_column_name(tokens, j):
+        if j + 2 < len(tokens) and tokens[j + 1].value in ("->", "->>") and tokens[j + 2].kind == "string":
+            return _Operand("expression", j, j + 3, [j], tokens[j + 1].value)
+        return _Operand("column", j, j + 1, [j])
+    return None
+
+
+def _clause_map(tokens: List[Token]) -> List[str]:
+    """每个词法单元所在的子句（括号内的子查询有自己的子句，括号结束后恢复外层子句）"""
+    clauses = []
+    stack = []
+    clause = "SELECT"
+    for i, token in enumerate(tokens):
+        upper = token.upper if token.kind == "name" else None
+        if token.value == "(":
+            clauses.append(clause)
+            stack.append(clause)
+            continue
+        if token.value == ")":
+            clause = stack.pop() if stack else clause
+            clauses.append(clause)
+            continue
+        if upper in ("BY",) and i > 0 and tokens[i - 1].upper in ("ORDER", "GROUP", "PARTITION"):
+            clause = f"{tokens[i - 1].upper} BY"
+        elif upper in _JOIN_KEYWORDS:
+            clause = "JOIN"
+        elif upper in _CLAUSE_KEYWORDS:
+            clause = upper
+        clauses.append(clause)
+    return clauses
+
+
+def _scopes(tokens: List[Token]) -> Tuple[List[int], List[Optional[int]]]:
+    """每个词法单元所属的查询块编号（0 为最外层，每个 (SELECT ...) 子查询一个新编号）
+
+    Returns:
+        Tuple[List[int], List[Optional[int]]]: (每个词法单元的查询块编号, 每个查询块的上一层编号)
+    """
+    scope_of = []
+    parents = [None]
+    stack = []          # 每个左括号是否开启了新的查询块
+    current = 0
+    for i, token in enumerate(tokens):
+        if token.value == "(":
+            opens = i + 1 < len(tokens) and tokens[i + 1].upper in ("SELECT", "WITH")
+            stack.append((opens, current))
+            if opens:
+                parents.append(current)
+                current = len(parents) - 1
+        elif token.value == ")" and stack:
+            scope_of.append(current)
+            _, current = stack.pop()
+            continue
+        scope_of.append(current)
+    return scope_of, parents
+
+
+def _in_function(tokens: List[Token]) -> List[bool]:
+    """每个词法单元是否直接位于函数调用的括号内（EXTRACT(YEAR FROM d)、TRIM(x FROM y) 中的 FROM 不是表引用）"""
+    inside = []
+    stack = []
+    for i, token in enumerate(tokens):
+        if token.value == "(":
+            inside.append(stack[-1] if stack else False)
+            stack.append(i > 0 and tokens[i - 1].kind == "name" and tokens[i - 1].upper not in _RESERVED
+                         and not (i + 1 < len(tokens) and tokens[i + 1].upper in ("SELECT", "WITH")))
+            continue
+        if token.value == ")" and stack:
+            stack.pop()
+        inside.append(stack[-1] if stack else False)
+    return inside
+
+
+def _table_refs(tokens: List[Token], scope_of: List[int], analysis: Analysis) -> None:
+    """收集 FROM / JOIN 中的表和别名（按查询块分别记录）"""
+    ctes = set()
+    for i, token in enumerate(tokens):
+        # WITH name AS ( ... ), name (col, ...) AS ( ... )
+        if token.kind != "name" or i == 0 or tokens[i - 1].upper not in ("WITH", "RECURSIVE", ","):
+            continue
+        j = i + 1
+        if j < len(tokens) and tokens[j].value == "(":
+            j = _matching(tokens, j, 1) + 1
+        if 0 < j and j + 1 < len(tokens) and tokens[j].upper == "AS" and tokens[j + 1].value == "(":
+            ctes.add(token.value.lower())
+            analysis.aliases[token.value.lower()] = None
+    _scan_tables(tokens, 0, len(tokens), scope_of, _in_function(tokens), analysis, ctes)
+
+
+def _scan_tables(tokens: List[Token], start: int, end: int, scope_of: List[int], in_function: List[bool],
+                 analysis: Analysis, ctes: Set[str]) -> None:
+    i = start
+    while i < end:
+        upper = tokens[i].upper if tokens[i].kind == "name" else None
+        if (upper == "FROM" and not in_function[i]) or upper in _JOIN_KEYWORDS:
+            refs = analysis.scopes.setdefault(scope_of[i], [])
+            i = _read_table_list(tokens, i + 1, analysis, refs, ctes, allow_comma=upper == "FROM",
+                                 scan=lambda a, b: _scan_tables(tokens, a, b, scope_of, in_function, analysis, ctes))
+            continue
+        i += 1
+
+
+def _read_table_list(tokens: List[Token], i: int, analysis: Analysis, refs: List[Optional[str]],
+                     ctes: Set[str], allow_comma: bool, scan: Callable[[int, int], None]) -> int:
+    while i < len(tokens):
+        token = tokens[i]
+        alias_target: Optional[str]
+        if token.upper == "LATERAL" and i + 1 < len(tokens) and tokens[i + 1].value == "(":
+            i += 1
+            token = tokens[i]
+        if token.value == "(":
+            # 派生表：(SELECT ...) AS alias，其中的表记录在子查询自己的查询块中
+            end = _matching(tokens, i, 1)
+            if end < 0:
+                return len(tokens)
+            scan(i + 1, end)
+            i = end + 1
+            alias_target = None
+        elif token.kind == "name" and i + 1 < len(tokens) and tokens[i + 1].value == "(":
+            # 表函数：JSON_TABLE(expr, path COLUMNS (...)) AS alias，和派生表一样不知道列，参数中的列定义不是列引用
+            end = _matching(tokens, i + 1, 1)
+            if end < 0:
+                return len(tokens)
+            analysis.table_functions.append((i, end))
+            i = end + 1
+            alias_target = None
+        elif token.kind == "name" and token.upper not in _RESERVED:
+            name = token.parts[-1]
+            if name.lower() in ctes:
+                alias_target = None
+            else:
+                alias_target = name
+                analysis.tables.add(name)
+                analysis.aliases[name.lower()] = name
+            i += 1
+        else:
+            return i
+        refs.append(alias_target)
+        if i < len(tokens) and tokens[i].upper == "AS":
+            i += 1
+        if (i < len(tokens) and tokens[i].kind == "name" and tokens[i].upper not in _RESERVED
+                and (i + 1 >= len(tokens) or tokens[i + 1].value != "(")):
+            analysis.aliases[tokens[i].value.lower()] = alias_target
+            i += 1
+        # 索引提示：USE/FORCE/IGNORE INDEX (...)
+        while (i + 1 < len(tokens) and tokens[i].upper in ("USE", "FORCE", "IGNORE")
+               and tokens[i + 1].upper in ("INDEX", "KEY")):
+            j = i + 2
+            while j < len(tokens) and tokens[j].value != "(":
+                j += 1
+            end = _matching(tokens, j, 1)
+            i = end + 1 if end >= 0 else len(tokens)
+        if allow_comma and i < len(tokens) and tokens[i].value == ",":
+            i += 1
+            continue
+        return i
+    return i
+
+
+def _resolve(token: Token, scope: int, parents: List[Optional[int]], analysis: Analysis,
+             columns: Optional[Dict[str, Set[str]]]) -> Tuple[Optional[str], str]:
+    """列引用 -> (表名, 列名)；无法确定时表名为 None
+
+    未加限定的列从所在查询块开始向外查找（相关子查询可以引用外层的表）：
+    有表结构目录时取唯一包含该列的表；目录中没有的表只有在查询块中恰好一张表时才能确定。
+    """
+    parts = token.parts
+    column = parts[-1]
+    if len(parts) >= 2:
+        qualifier = parts[-2].lower()
+        if qualifier in analysis.aliases:
+            return analysis.aliases[qualifier], column
+        return parts[-2], column
+    while scope is not None:
+        refs = analysis.scopes.get(scope, [])
+        if columns is not None:
+            owners = {table for table in refs
+                      if table in columns and column.lower() in {c.lower() for c in columns[table]}}
+            if len(owners) == 1:
+                return owners.pop(), column
+            if owners:
+                return None, column
+            # 查询块中有目录里没有的表（或派生表、CTE）时，该列可能属于它
+            if any(table not in columns for table in refs):
+                return (refs[0] if len(refs) == 1 else None), column
+        elif refs:
+            return (refs[0] if len(refs) == 1 else None), column
+        scope = parents[scope]
+    return None, column
+
+
+def _expression_of(tokens: List[Token], operand: _Operand, analysis: Analysis) -> str:
+    """操作数的规范化表达式文本（去掉表别名限定）"""
+    stripped = []
+    for token in tokens[operand.start:operand.end]:
+        if token.kind == "name" and token.parts and len(token.parts) >= 2 and token.parts[-2].lower() in analysis.aliases:
+            stripped.append(Token("name", token.parts[-1], [token.parts[-1]]))
+        else:
+            stripped.append(token)
+    return expression_text(stripped)
+
+
+def analyze(sql: str, columns: Optional[Dict[str, Set[str]]] = None) -> Analysis:
+    """分析一条 SQL 中的表引用和列使用
+
+    Args:
+        sql: SQL 语句
+        columns: 可选的表 -> 列名集合，用于确定未加限定的列属于哪张表，并过滤 ORDER BY 中的选择列别名
+
+    Returns:
+        Analysis: 表、别名和列使用
+    """
+    analysis = Analysis()
+    tokens = tokenize(sql)
+    if not tokens:
+        return analysis
+    scope_of, parents = _scopes(tokens)
+    _table_refs(tokens, scope_of, analysis)
+    clauses = _clause_map(tokens)
+
+    def add(index: int, usage: str, clause: str, operand: Optional[_Operand] = None, value: str = None) -> None:
+        table, column = _resolve(tokens[index], scope_of[index], parents, analysis, columns)
+        if table is None:
+            analysis.unresolved.append(tokens[index].value)
+            return
+        if columns is not None and table in columns and column.lower() not in {c.lower() for c in columns[table]}:
+            return
+        expression = function = None
+        if operand is not None and operand.kind == "expression":
+            expression = _expression_of(tokens, operand, analysis)
+            function = operand.function
+        analysis.uses.append(ColumnUse(table, column, usage, clause, expression, function, value))
+
+    def add_operand(operand: _Operand, usage: str, clause: str, value: str = None) -> None:
+        if operand.kind == "column":
+            add(operand.columns[0], usage, clause, value=value)
+        elif operand.kind == "expression" and operand.columns:
+            add(operand.columns[0], usage, clause, operand, value)
+
+    for i, token in enumerate(tokens):
+        clause = clauses[i]
+        if clause in PREDICATE_CLAUSES:
+            if token.kind == "op" and token.value in _COMPARISONS:
+                left = _operand_before(tokens, i)
+                right = _operand_after(tokens, i)
+                if left is None or right is None:
+                    continue
+                usage = _COMPARISONS[token.value]
+                if left.kind == "column" and right.kind == "column":
+                    both = JOIN if usage == EQUALITY else usage
+                    add(left.columns[0], both, clause)
+                    add(right.columns[0], both, clause)
+                elif right.kind in ("literal", "subquery"):
+                    add_operand(left, usage, clause)
+                elif left.kind in ("literal", "subquery"):
+                    add_operand(right, usage, clause)
+            elif token.kind == "name" and token.upper in ("IN", "BETWEEN", "LIKE", "IS", "REGEXP", "RLIKE"):
+                anchor = i - 1 if i > 0 and tokens[i - 1].upper == "NOT" else i
+                negated = anchor != i
+                left = _operand_before(tokens, anchor)
+                if left is None or left.kind not in ("column", "expression"):
+                    continue
+                if token.upper == "IN":
+                    add_operand(left, NOT_EQUAL if negated else EQUALITY, clause)
+                elif token.upper == "BETWEEN":
+                    add_operand(left, NOT_EQUAL if negated else RANGE, clause)
+                elif token.upper == "IS":
+                    add_operand(left, IS_NULL, clause)
+                elif token.upper == "LIKE":
+                    pattern = tokens[i + 1] if i + 1 < len(tokens) else None
+                    if pattern is None or pattern.kind != "string":
+                        add_operand(left, LIKE_CONTAINS, clause)
+                        continue
+                    text = string_value(pattern)
+                    prefix = not negated and bool(text) and text[0] not in "%_"
+                    add_operand(left, LIKE_PREFIX if prefix else LIKE_CONTAINS, clause, text)
+                else:
+                    add_operand(left, LIKE_CONTAINS, clause)
+        elif clause in ("ORDER BY", "GROUP BY") and token.upper != "BY":
+            # 逐项处理：只看紧跟在 BY 或顶层逗号之后的项
+            if not (tokens[i - 1].upper == "BY" or (tokens[i - 1].value == "," and clauses[i - 1] == clause)):
+                continue
+            usage = ORDER if clause == "ORDER BY" else GROUP
+            operand = _operand_after(tokens, i - 1)
+            if operand is not None:
+                add_operand(operand, usage, clause)
+    return analysis
+
+
+# 校验列引用时跳过的名称：时间单位、函数参数中的关键字、窗口框架、全文检索修饰符、类型名和无括号的函数
+_NON_COLUMN_WORDS = {
+    "YEAR", "QUARTER", "MONTH", "WEEK", "DAY", "HOUR", "MINUTE", "SECOND", "MICROSECOND", "YEAR_MONTH",
+    "DAY_HOUR", "DAY_MINUTE", "DAY_SECOND", "HOUR_MINUTE", "HOUR_SECOND", "MINUTE_SECOND",
+    "LEADING", "TRAILING", "BOTH", "SEPARATOR", "ROWS", "RANGE", "UNBOUNDED", "PRECEDING", "FOLLOWING",
+    "CURRENT", "ROW", "ROLLUP", "BOOLEAN", "MODE", "LANGUAGE", "QUERY", "EXPANSION", "AGAINST", "BINARY",
+    "COLLATE", "SIGNED", "UNSIGNED", "CHAR", "DATE", "DATETIME", "TIME", "TIMESTAMP", "DECIMAL", "JSON",
+    "CURRENT_DATE", "CURRENT_TIME", "CURRENT_TIMESTAMP", "LOCALTIME", "LOCALTIMESTAMP", "UTC_DATE", "UTC_TIME",
+    "UTC_TIMESTAMP", "CURRENT_USER", "DUAL", "DISTINCTROW", "SQL_NO_CACHE", "SQL_CALC_FOUND_ROWS", "UNKNOWN",
+}
+
+
+def _output_aliases(tokens: List[Token], clauses: List[str]) -> Set[str]:
+    """选择列别名（小写）：AS 之后的名称，以及选择列表中紧跟在表达式之后的名称（SELECT COUNT(*) cnt）"""
+    names = set()
+    for i in range(1, len(tokens)):
+        token = tokens[i]
+        if token.kind != "name" or token.upper in _RESERVED or len(token.parts) > 1:
+            continue
+        if i + 1 < len(tokens) and tokens[i + 1].value in ("(", "."):
+            continue
+        previous = tokens[i - 1]
+        if previous.upper == "AS" or clauses[i] == "SELECT" and (
+                previous.value == ")" or previous.kind in ("number", "string")
+                or previous.kind == "name" and (previous.upper not in _RESERVED or previous.upper == "END")):
+            names.add(token.value.lower())
+    return names
+
+
+def _suggestion(column: str, candidates: Set[str]) -> str:
+    close = difflib.get_close_matches(column.lower(), sorted(candidates), n=1)
+    return f"，是否为 {close[0]}？" if close else ""
+
+
+def check_references(sql: str, columns: Dict[str, Optional[Set[str]]]) -> Optional[str]:
+    """按表结构目录校验 SQL 中的表、别名和列引用
+
+    只报告能够确定不存在的引用：派生表、公共表表达式、表函数（JSON_TABLE）和目录中没有列信息的表中的列一律视为存在，
+    无法识别的语法直接跳过，因此不会拒绝数据库能够执行的查询。
+
+    Args:
+        sql: SQL 语句
+        columns: 表名（小写）-> 列名集合（小写）；只知道表存在、不知道列的表对应 None
+
+    Returns:
+        Optional[str]: 第一个不存在的引用的说明（如 "未知列 t.x：表 t 中没有该列"）；全部可以解析时返回 None
+    """
+    tokens = tokenize(sql)
+    if not tokens:
+        return None
+    scope_of, parents = _scopes(tokens)
+    analysis = Analysis()
+    _table_refs(tokens, scope_of, analysis)
+    for refs in analysis.scopes.values():
+        for table in refs:
+            if table is not None and table.lower() not in columns and table.lower() != "dual":
+                return f"未知表 {table}" + _suggestion(table, set(columns))
+    clauses = _clause_map(tokens)
+    aliases = _output_aliases(tokens, clauses)
+    skipped = {i for start, end in analysis.table_functions for i in range(start, end + 1)}
+    for i, token in enumerate(tokens):
+        if token.kind != "name" or clauses[i] in ("FROM", "JOIN") or i in skipped:
+            continue
+        if i + 1 < len(tokens) and tokens[i + 1].value == "(":
+            continue
+        if len(token.parts) >= 2:
+            qualifier = token.parts[-2]
+            if qualifier.lower() not in analysis.aliases:
+                return f"未知的表或别名 {qualifier}（{token.value}）"
+            target = analysis.aliases[qualifier.lower()]
+            known = columns.get(target.lower()) if target is not None else None
+            column = token.parts[-1]
+            if known is not None and column != "*" and column.lower() not in known:
+                return f"未知列 {token.value}：表 {target} 中没有该列" + _suggestion(column, known)
+            continue
+        if not _is_column_name(tokens, i) or token.upper in _NON_COLUMN_WORDS:
+            continue
+        if i + 1 < len(tokens) and tokens[i + 1].kind == "string":
+            continue      # 类型化字面量和字符集前缀：DATE '2024-01-01'、_utf8mb4'abc'
+        if i > 0 and tokens[i - 1].upper in ("COLLATE", "OVER", "USING", "SET"):
+            continue      # 排序规则、命名窗口、CONVERT(x USING utf8mb4)、CHARACTER SET utf8mb4
+        if clauses[i] == "WINDOW" and i + 1 < len(tokens) and tokens[i + 1].upper == "AS":
+            continue
+        name = token.value.lower()
+        if name in aliases or analysis.aliases.get(name, "") is None:
+            continue
+        scope = scope_of[i]
+        visible: List[str] = []
+        while scope is not None:
+            refs = analysis.scopes.get(scope, [])
+            if any(table is None or columns.get(table.lower()) is None or name in columns[table.lower()]
+                   for table in refs):
+                break
+            visible.extend(refs)
+            scope = parents[scope]
+        else:
+            if not visible:
+                return f"未知列 {token.value}：查询中没有引用任何表"
+            tables = list(dict.fromkeys(visible))
+            candidates = set().union(*(columns[table.lower()] for table in tables))
+            where = f"表 {tables[0]} 中没有该列" if len(tables) == 1 else f"{'、'.join(tables)} 中都没有该列"
+            return f"未知列 {token.value}：{where}" + _suggestion(token.value, candidates)
+    return None
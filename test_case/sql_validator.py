@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+执行前的表结构校验
+很多失败结果是 "Unknown column" / "Unknown table"，它们仍要占用一个连接槽位并往返一次数据库。
+is_safe_sql 通过之后，用测试组提示词中的 CREATE TABLE（schema_catalog.parse_catalog）构建表结构目录，
+再由 sql_analysis.check_references 解析生成 SQL 中的每个表、别名和列引用，
+能确定不存在的引用直接在本地拒绝（failed_stage 为 validation），不访问数据库。
+
+    - 目录按提示词缓存：同一提示词只解析一次；开启 --compact-schema 时按压缩前的提示词注册
+    - 允许的表中提示词里没有 DDL 的表只确认表存在，不校验其列
+    - 提示词中没有任何 CREATE TABLE 时不做校验
+    - 只拒绝能确定的错误，派生表、LATERAL 派生表、表函数（JSON_TABLE）、公共表表达式和无法识别的语法一律放行
+
+统计信息（statistics.schema_validation）给出校验次数、本地拒绝次数（即避免的数据库调用次数）和耗时。
+
+用法:
+    from test_case import sql_validator
+    sql_validator.VALIDATOR.register(prompt, original_prompt)
+    error = sql_validator.VALIDATOR.check(sql, prompt, allowed_tables)
+"""
+
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from test_case import metrics, schema_catalog, sql_analysis
+
+SCHEMA_CHECKS_TOTAL = metrics.REGISTRY.counter(
+    "text2sql_schema_checks_total", "执行前表结构校验的次数（outcome=rejected 即避免的数据库调用）", ("outcome",))
+
+# 拒绝原因的分类（按说明文字的开头）
+_REASONS = (("未知表", "unknown_table"), ("未知的表或别名", "unknown_alias"), ("未知列", "unknown_column"))
+
+
+def catalog_columns(catalog: Dict[str, Dict]) -> Dict[str, Set[str]]:
+    """表结构目录 -> 表名（小写）-> 列名集合（小写）"""
+    return {name.lower(): {column["name"].lower() for column in table["columns"]}
+            for name, table in catalog.items()}
+
+
+def _reason(message: str) -> str:
+    for prefix, reason in _REASONS:
+        if message.startswith(prefix):
+            return reason
+    return "other"
+
+
+class SchemaValidator:
+    """按提示词缓存表结构目录，并统计校验结果（线程安全）"""
+
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._catalogs: Dict[str, Dict[str, Set[str]]] = {}
+        self._resolved: Dict[Tuple[str, FrozenSet[str]], Optional[Dict[str, Optional[Set[str]]]]] = {}
+        self._totals = metrics.Counts()
+
+    def configure(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+
+    def register(self, prompt: str, source: Optional[str] = None) -> None:
+        """为提示词登记表结构目录（source 为解析 DDL 用的文本，默认为提示词本身；压缩提示词时传入原始提示词）"""
+        with self._lock:
+            if prompt in self._catalogs:
+                return
+        columns = catalog_columns(schema_catalog.parse_catalog(source if source is not None else prompt))
+        with self._lock:
+            self._catalogs.setdefault(prompt, columns)
+
+    def _columns(self, prompt: str, allowed_tables: Iterable[str]) -> Optional[Dict[str, Optional[Set[str]]]]:
+        """提示词和允许的表对应的校验目录；提示词中没有 DDL 时返回 None"""
+        allowed = frozenset(table.lower() for table in allowed_tables)
+        key = (prompt, allowed)
+        with self._lock:
+            if key in self._resolved:
+                return self._resolved[key]
+            catalog = self._catalogs.get(prompt)
+        if catalog is None:
+            self.register(prompt)
+            with self._lock:
+                catalog = self._catalogs[prompt]
+        columns: Optional[Dict[str, Optional[Set[str]]]] = None
+        if catalog:
+            columns = dict.fromkeys(allowed)
+            columns.update(catalog)
+        with self._lock:
+            self._resolved[key] = columns
+        return columns
+
+    def check(self, sql: str, prompt: Optional[str], allowed_tables: Iterable[str]) -> Optional[str]:
+        """校验 SQL 中的引用
+
+        Args:
+            sql: 已通过 is_safe_sql 的 SQL
+            prompt: 测试组提示词（表结构目录的来源）
+            allowed_tables: 允许访问的表
+
+        Returns:
+            Optional[str]: 拒绝原因；通过、未开启或没有表结构目录时返回 None
+        """
+        if not self.enabled or not prompt:
+            return None
+        columns = self._columns(prompt, allowed_tables)
+        if columns is None:
+            return None
+        start = time.perf_counter()
+        error = sql_analysis.check_references(sql, columns)
+        elapsed = time.perf_counter() - start
+        for counts in metrics.counts_to_update("schema_validation", self._totals):
+            counts.add("checked")
+            counts.add("seconds", elapsed)
+            counts.maximum("max_seconds", elapsed)
+            if error is not None:
+                counts.add("rejected")
+                counts.add(("reason", _reason(error)))
+        SCHEMA_CHECKS_TOTAL.inc(outcome="passed" if error is None else "rejected")
+        return error
+
+    def snapshot(self) -> Optional[Dict]:
+        """校验统计（写入结果文件的 statistics.schema_validation 字段，在 run_scope() 中时只含本次运行）；
+        未开启或没有校验过时返回 None"""
+        counts = metrics.counts_to_report("schema_validation", self._totals)
+        checked = counts.get("checked")
+        if not self.enabled or not checked:
+            return None
+        return {
+            "checked": checked,
+            "rejected": counts.get("rejected"),
+            "db_calls_avoided": counts.get("rejected"),
+            "reasons": {name[1]: count for name, count in counts.items() if isinstance(name, tuple)},
+            "avg_microseconds": counts.get("seconds") / checked * 1e6,
+            "max_microseconds": counts.get("max_seconds") * 1e6,
+        }
+
+
+VALIDATOR = SchemaValidator()
+
+
+def format_console(snapshot: Dict) -> str:
+    labels = {"unknown_column": "未知列", "unknown_table": "未知表", "unknown_alias": "未知的表或别名", "other": "其他"}
+    reasons = "，".join(f"{labels.get(reason, reason)} {count}" for reason, count in sorted(snapshot["reasons"].items()))
+    line = (f"表结构校验: 校验 {snapshot['checked']} 条 SQL，本地拒绝 {snapshot['rejected']} 条"
+            f"（避免 {snapshot['db_calls_avoided']} 次数据库调用），"
+            f"平均 {snapshot['avg_microseconds']:.0f}µs / 最长 {snapshot['max_microseconds']:.0f}µs")
+    return line + (f"\n  拒绝原因: {reasons}" if reasons else "")
@@ -1,26 +1,39 @@
 #!/bin/bash
-# 查看后台运行的 test_text2sql.py 状态
+# 查看任务调度器和测试任务的状态
+# 用法: status_background.sh [任务ID]
 
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
-PID_FILE="$SCRIPT_DIR/test_text2sql.pid"
-LOG_DIR="$SCRIPT_DIR/logs"
+SOCKET="$SCRIPT_DIR/scheduler.sock"
+PID_FILE="$SCRIPT_DIR/scheduler.pid"
+SCHEDULER=(python3 "$SCRIPT_DIR/test_text2sql.py" scheduler --socket "$SOCKET")
 
 if [ ! -f "$PID_FILE" ]; then
-    echo "测试脚本未在运行"
+    echo "调度器未在运行"
     exit 0
 fi
 
 PID=$(cat "$PID_FILE")
 
 if ! ps -p "$PID" > /dev/null 2>&1; then
-    echo "进程 $PID 不存在，测试脚本可能已停止"
+    echo "进程 $PID 不存在，调度器可能已停止"
     rm -f "$PID_FILE"
     exit 1
 fi
 
+# 单个任务的详细状态和最后 10 行日志
+if [ -n "$1" ]; then
+    "${SCHEDULER[@]}" status "$1" || exit 1
+    echo ""
+    echo "最后 10 行日志:"
+    printf -- "-%.0s" {1..60}
+    echo ""
+    "${SCHEDULER[@]}" log "$1" | tail -n 10
+    exit 0
+fi
+
 printf "=%.0s" {1..60}
 echo ""
-echo "测试脚本运行状态"
+echo "任务调度器运行状态"
 printf "=%.0s" {1..60}
 echo ""
 echo "进程 ID (PID): $PID"
@@ -28,18 +41,23 @@ echo "运行时间: $(ps -p $PID -o etime= | xargs)"
 echo "CPU 使用率: $(ps -p $PID -o %cpu= | xargs)%"
 echo "内存使用: $(ps -p $PID -o rss= | xargs | awk '{printf "%.2f MB\n", $1/1024}')"
 echo ""
+"${SCHEDULER[@]}" list
 
-# 查找最新的日志文件
-LATEST_LOG=$(ls -t "$LOG_DIR"/test_text2sql_*.log 2>/dev/null | head -1)
-if [ -n "$LATEST_LOG" ]; then
-    echo "最新日志文件: $LATEST_LOG"
-    echo "日志文件大小: $(ls -lh "$LATEST_LOG" | awk '{print $5}')"
+# 如果调度器以 --metrics-port 启动，查询实时指标（全部任务合计）
+METRICS_PORT=${METRICS_PORT:-$(ps -p "$PID" -o args= | sed -n 's/.*--metrics-port[= ]\([0-9][0-9]*\).*/\1/p')}
+if [ -n "$METRICS_PORT" ]; then
     echo ""
-    echo "最后 10 行日志:"
-    printf "-%.0s" {1..60}
+    echo "实时指标 (http://127.0.0.1:$METRICS_PORT/metrics):"
+    printf -- "-%.0s" {1..60}
     echo ""
-    tail -n 10 "$LATEST_LOG"
-else
-    echo "未找到日志文件"
+    METRICS=$(curl -s --max-time 3 "http://127.0.0.1:$METRICS_PORT/metrics")
+    if [ -z "$METRICS" ]; then
+        echo "无法连接指标服务"
+    else
+        echo "$METRICS" | grep -v '^#' | grep -E '^text2sql_(questions_total|inflight_requests|retries_total|cache_hits_total|tokens_total|scheduler_jobs)'
+        LAST=$(echo "$METRICS" | awk '/^text2sql_last_completion_timestamp_seconds /{print int($2)}')
+        if [ -n "$LAST" ] && [ "$LAST" -gt 0 ]; then
+            echo "距上一个测试项完成: $(( $(date +%s) - LAST )) 秒"
+        fi
+    fi
 fi
-
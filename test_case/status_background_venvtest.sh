@@ -1,40 +1,77 @@
 #!/bin/bash
-# 查看后台测试运行状态（venvtest 版本）
+# 查看任务调度器和测试任务的状态（venvtest 版本）
+# 用法: status_background_venvtest.sh [任务ID]
 
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
-PID_FILE="$SCRIPT_DIR/test_text2sql_venvtest.pid"
-LOG_DIR="$SCRIPT_DIR/logs"
+SOCKET="$SCRIPT_DIR/scheduler_venvtest.sock"
+
+# 虚拟环境配置
+PROJECT_ROOT="$( cd "$SCRIPT_DIR/.." && pwd )"
+VENV_NAME="venvtest"
+VENV_PATH="$PROJECT_ROOT/$VENV_NAME"
+VENV_PYTHON="$VENV_PATH/bin/python"
+
+# 检查虚拟环境的 Python 解释器
+if [ ! -f "$VENV_PYTHON" ]; then
+    echo "错误: 虚拟环境 '$VENV_NAME' 中找不到 Python 解释器: $VENV_PYTHON"
+    echo "请先创建虚拟环境或检查路径是否正确"
+    exit 1
+fi
+
+PID_FILE="$SCRIPT_DIR/scheduler_venvtest.pid"
+SCHEDULER=("$VENV_PYTHON" "$SCRIPT_DIR/test_text2sql.py" scheduler --socket "$SOCKET")
 
 if [ ! -f "$PID_FILE" ]; then
-    echo "测试脚本未在运行（未找到 PID 文件）"
+    echo "调度器未在运行"
     exit 0
 fi
 
 PID=$(cat "$PID_FILE")
 
-if ps -p "$PID" > /dev/null 2>&1; then
-    echo "测试脚本正在运行中"
-    echo "进程 ID (PID): $PID"
-    echo ""
-    
-    # 显示进程信息
-    echo "进程信息:"
-    ps -p "$PID" -o pid,ppid,cmd,etime,pcpu,pmem
-    
-    # 显示最新的日志文件
-    LATEST_LOG=$(ls -t "$LOG_DIR"/test_text2sql_venvtest_*.log 2>/dev/null | head -1)
-    if [ -n "$LATEST_LOG" ]; then
-        echo ""
-        echo "最新日志文件: $LATEST_LOG"
-        echo "日志文件大小: $(ls -lh "$LATEST_LOG" | awk '{print $5}')"
-        echo ""
-        echo "最近 10 行日志:"
-        echo "----------------------------------------"
-        tail -n 10 "$LATEST_LOG"
-    fi
-else
-    echo "测试脚本未在运行（进程 $PID 不存在）"
+if ! ps -p "$PID" > /dev/null 2>&1; then
+    echo "进程 $PID 不存在，调度器可能已停止"
     rm -f "$PID_FILE"
     exit 1
 fi
 
+# 单个任务的详细状态和最后 10 行日志
+if [ -n "$1" ]; then
+    "${SCHEDULER[@]}" status "$1" || exit 1
+    echo ""
+    echo "最后 10 行日志:"
+    printf -- "-%.0s" {1..60}
+    echo ""
+    "${SCHEDULER[@]}" log "$1" | tail -n 10
+    exit 0
+fi
+
+printf "=%.0s" {1..60}
+echo ""
+echo "任务调度器运行状态"
+printf "=%.0s" {1..60}
+echo ""
+echo "进程 ID (PID): $PID"
+echo "运行时间: $(ps -p $PID -o etime= | xargs)"
+echo "CPU 使用率: $(ps -p $PID -o %cpu= | xargs)%"
+echo "内存使用: $(ps -p $PID -o rss= | xargs | awk '{printf "%.2f MB\n", $1/1024}')"
+echo ""
+"${SCHEDULER[@]}" list
+
+# 如果调度器以 --metrics-port 启动，查询实时指标（全部任务合计）
+METRICS_PORT=${METRICS_PORT:-$(ps -p "$PID" -o args= | sed -n 's/.*--metrics-port[= ]\([0-9][0-9]*\).*/\1/p')}
+if [ -n "$METRICS_PORT" ]; then
+    echo ""
+    echo "实时指标 (http://127.0.0.1:$METRICS_PORT/metrics):"
+    printf -- "-%.0s" {1..60}
+    echo ""
+    METRICS=$(curl -s --max-time 3 "http://127.0.0.1:$METRICS_PORT/metrics")
+    if [ -z "$METRICS" ]; then
+        echo "无法连接指标服务"
+    else
+        echo "$METRICS" | grep -v '^#' | grep -E '^text2sql_(questions_total|inflight_requests|retries_total|cache_hits_total|tokens_total|scheduler_jobs)'
+        LAST=$(echo "$METRICS" | awk '/^text2sql_last_completion_timestamp_seconds /{print int($2)}')
+        if [ -n "$LAST" ] && [ "$LAST" -gt 0 ]; then
+            echo "距上一个测试项完成: $(( $(date +%s) - LAST )) 秒"
+        fi
+    fi
+fi
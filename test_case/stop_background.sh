@@ -1,46 +1,36 @@
 #!/bin/bash
-# 停止后台运行的 test_text2sql.py
+# 取消一个测试任务，或停止任务调度器（取消全部任务）
+# 用法: stop_background.sh [任务ID]
 
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
-PID_FILE="$SCRIPT_DIR/test_text2sql.pid"
+SOCKET="$SCRIPT_DIR/scheduler.sock"
+PID_FILE="$SCRIPT_DIR/scheduler.pid"
+SCHEDULER=(python3 "$SCRIPT_DIR/test_text2sql.py" scheduler --socket "$SOCKET")
+
+# 取消单个任务（停止调度新的测试项，进行中的测试项结束后保存已有结果）
+if [ -n "$1" ]; then
+    "${SCHEDULER[@]}" cancel "$1"
+    exit $?
+fi
 
 if [ ! -f "$PID_FILE" ]; then
-    echo "未找到 PID 文件，测试脚本可能未在运行"
+    echo "未找到 PID 文件，调度器可能未在运行"
     exit 1
 fi
 
 PID=$(cat "$PID_FILE")
 
-if ! ps -p "$PID" > /dev/null 2>&1; then
-    echo "进程 $PID 不存在，可能已经停止"
-    rm -f "$PID_FILE"
-    exit 1
+# 等待运行中的任务保存结果（需大于测试项的 --deadline，默认 120 秒）
+STOP_TIMEOUT="${STOP_TIMEOUT:-180}"
+if "${SCHEDULER[@]}" stop --timeout "$STOP_TIMEOUT"; then
+    exit 0
 fi
 
-echo "正在停止测试进程 (PID: $PID)..."
-
-# 发送 SIGTERM 信号
-kill "$PID"
-
-# 等待进程结束
-for i in {1..10}; do
-    if ! ps -p "$PID" > /dev/null 2>&1; then
-        echo "测试进程已停止"
-        rm -f "$PID_FILE"
-        exit 0
-    fi
-    sleep 1
-done
-
 # 如果还没停止，强制杀死
 if ps -p "$PID" > /dev/null 2>&1; then
-    echo "进程未响应，强制停止..."
+    echo "调度器未响应，强制停止..."
     kill -9 "$PID"
     sleep 1
-    rm -f "$PID_FILE"
-    echo "测试进程已强制停止"
-else
-    rm -f "$PID_FILE"
-    echo "测试进程已停止"
+    rm -f "$PID_FILE" "$SOCKET"
+    echo "调度器已强制停止"
 fi
-
@@ -1,46 +1,50 @@
 #!/bin/bash
-# 停止后台运行的 test_text2sql.py（venvtest 版本）
+# 取消一个测试任务，或停止任务调度器并取消全部任务（venvtest 版本）
+# 用法: stop_background_venvtest.sh [任务ID]
 
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
-PID_FILE="$SCRIPT_DIR/test_text2sql_venvtest.pid"
-
-if [ ! -f "$PID_FILE" ]; then
-    echo "未找到 PID 文件，测试脚本可能未在运行"
+SOCKET="$SCRIPT_DIR/scheduler_venvtest.sock"
+
+# 虚拟环境配置
+PROJECT_ROOT="$( cd "$SCRIPT_DIR/.." && pwd )"
+VENV_NAME="venvtest"
+VENV_PATH="$PROJECT_ROOT/$VENV_NAME"
+VENV_PYTHON="$VENV_PATH/bin/python"
+
+# 检查虚拟环境的 Python 解释器
+if [ ! -f "$VENV_PYTHON" ]; then
+    echo "错误: 虚拟环境 '$VENV_NAME' 中找不到 Python 解释器: $VENV_PYTHON"
+    echo "请先创建虚拟环境或检查路径是否正确"
     exit 1
 fi
 
-PID=$(cat "$PID_FILE")
+PID_FILE="$SCRIPT_DIR/scheduler_venvtest.pid"
+SCHEDULER=("$VENV_PYTHON" "$SCRIPT_DIR/test_text2sql.py" scheduler --socket "$SOCKET")
 
-if ! ps -p "$PID" > /dev/null 2>&1; then
-    echo "进程 $PID 不存在，可能已经停止"
-    rm -f "$PID_FILE"
-    exit 1
+# 取消单个任务（停止调度新的测试项，进行中的测试项结束后保存已有结果）
+if [ -n "$1" ]; then
+    "${SCHEDULER[@]}" cancel "$1"
+    exit $?
 fi
 
-echo "正在停止测试进程 (PID: $PID)..."
+if [ ! -f "$PID_FILE" ]; then
+    echo "未找到 PID 文件，调度器可能未在运行"
+    exit 1
+fi
 
-# 发送 SIGTERM 信号
-kill "$PID"
+PID=$(cat "$PID_FILE")
 
-# 等待进程结束
-for i in {1..10}; do
-    if ! ps -p "$PID" > /dev/null 2>&1; then
-        echo "测试进程已停止"
-        rm -f "$PID_FILE"
-        exit 0
-    fi
-    sleep 1
-done
+# 等待运行中的任务保存结果（需大于测试项的 --deadline，默认 120 秒）
+STOP_TIMEOUT="${STOP_TIMEOUT:-180}"
+if "${SCHEDULER[@]}" stop --timeout "$STOP_TIMEOUT"; then
+    exit 0
+fi
 
 # 如果还没停止，强制杀死
 if ps -p "$PID" > /dev/null 2>&1; then
-    echo "进程未响应，强制停止..."
+    echo "调度器未响应，强制停止..."
     kill -9 "$PID"
     sleep 1
-    rm -f "$PID_FILE"
-    echo "测试进程已强制停止"
-else
-    rm -f "$PID_FILE"
-    echo "测试进程已停止"
+    rm -f "$PID_FILE" "$SOCKET"
+    echo "调度器已强制停止"
 fi
-
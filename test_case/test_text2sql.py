@@ -9,13 +9,25 @@ import json
 import os
 import sys
 import re
-from typing import Dict, List, Tuple, Optional
+import argparse
+import contextlib
+import hashlib
+import importlib
+import importlib.util
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Optional, Union
 from datetime import datetime
 import traceback
 
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from test_case import (circuit_breaker, concurrency, context_cache, deadline, early_stop, history, metrics, pipeline,
+                       replicas, report, row_store, sampling, schema_catalog, server_metrics, sql_validator, tracing)
+from test_case.question_cache import QuestionCache, load_aliases, DEFAULT_THRESHOLD as DEFAULT_CACHE_THRESHOLD
+
 # 加载 .env 文件
 def load_env_file(env_path: str = None) -> bool:
     """从 .env 文件加载环境变量
@@ -105,26 +117,79 @@ def update_env_from_file(env_path: str = None) -> None:
     load_env_file(env_path)
 
 
-# 初始化时加载 .env 文件
-load_env_file()
+_env_loaded = False
+_env_lock = threading.Lock()
+
+
+def ensure_env_loaded() -> None:
+    """首次使用时加载 .env 文件（导入模块时不再加载，避免副作用）"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if not _env_loaded:
+            load_env_file()
+            _env_loaded = True
+
+
+# 模型和数据库 SDK 在首次使用时才导入（google-generativeai 会连带导入 grpc/protobuf，耗时较长）
+# 名称 -> (模块路径, pip 包名)
+_SDK_MODULES = {
+    "openai": ("openai", "openai"),
+    "genai": ("google.generativeai", "google-generativeai"),
+    "pymysql": ("pymysql", "pymysql"),
+}
+_sdk_cache: Dict[str, object] = {}
+_sdk_available: Dict[str, bool] = {}
+_sdk_lock = threading.Lock()
+
+
+def _load_sdk(name: str):
+    """导入（并缓存）SDK 模块；未安装时打印一次警告并返回 None"""
+    if name in _sdk_cache:
+        return _sdk_cache[name]
+    with _sdk_lock:
+        if name not in _sdk_cache:
+            module_path, package = _SDK_MODULES[name]
+            try:
+                _sdk_cache[name] = importlib.import_module(module_path)
+            except ImportError:
+                print(f"警告: 未安装 {package} 库，请运行: pip install {package}")
+                _sdk_cache[name] = None
+        return _sdk_cache[name]
+
+
+def sdk_available(name: str) -> bool:
+    """检查 SDK 是否已安装（只查找模块，不导入）
+
+    Args:
+        name: "openai"、"genai" 或 "pymysql"
+    """
+    if name in _sdk_cache:
+        return _sdk_cache[name] is not None
+    available = _sdk_available.get(name)
+    if available is None:
+        try:
+            available = importlib.util.find_spec(_SDK_MODULES[name][0]) is not None
+        except (ImportError, ValueError):
+            available = False
+        _sdk_available[name] = available
+    return available
+
 
-try:
-    import openai
-except ImportError:
-    print("警告: 未安装 openai 库，请运行: pip install openai")
-    openai = None
+def get_openai():
+    """获取 openai 模块（首次调用时导入），未安装时返回 None"""
+    return _load_sdk("openai")
 
-try:
-    import google.generativeai as genai
-except ImportError:
-    print("警告: 未安装 google-generativeai 库，请运行: pip install google-generativeai")
-    genai = None
 
-try:
-    import pymysql
-except ImportError:
-    print("警告: 未安装 pymysql 库，请运行: pip install pymysql")
-    pymysql = None
+def get_genai():
+    """获取 google.generativeai 模块（首次调用时导入），未安装时返回 None"""
+    return _load_sdk("genai")
+
+
+def get_pymysql():
+    """获取 pymysql 模块（首次调用时导入），未安装时返回 None"""
+    return _load_sdk("pymysql")
 
 # 默认数据库配置（向后兼容）
 DEFAULT_DB_NAME = "tennis"
@@ -136,14 +201,22 @@ ALLOWED_TABLES = {
 }
 MAX_ROWS = 50
 
+# 测试框架版本：修改 SQL 提取、校验或执行逻辑时递增，使增量运行的历史结果全部失效
+HARNESS_VERSION = "2"
+
+# 每个数据库配置的默认连接池大小
+DEFAULT_POOL_SIZE = 8
+
 # 数据库连接缓存
 _db_cache = {}
+_db_cache_lock = threading.Lock()
 
 
 class MySQLDatabase:
-    """简单的 MySQL 数据库连接类"""
+    """简单的 MySQL 数据库连接类（带连接池，可在多线程间共享）"""
     
-    def __init__(self, host: str, user: str, password: str, database: str):
+    def __init__(self, host: str, user: str, password: str, database: str,
+                 port: int = 3306, pool_size: int = DEFAULT_POOL_SIZE):
         """初始化数据库连接
         
         Args:
@@ -151,47 +224,126 @@ class MySQLDatabase:
             user: 数据库用户名
             password: 数据库密码
             database: 数据库名称
+            port: 数据库端口
+            pool_size: 连接池最大连接数（同时执行的查询数上限）
         """
         self.host = host
         self.user = user
         self.password = password
         self.database = database
-        self._connection = None
-    
-    def _get_connection(self):
-        """获取数据库连接（懒加载）"""
-        if self._connection is None:
-            if pymysql is None:
-                raise ImportError("pymysql 未安装，请运行: pip install pymysql")
-            self._connection = pymysql.connect(
+        self.port = port
+        self.pool_size = pool_size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+    
+    @classmethod
+    def from_config(cls, db_config: Dict) -> "MySQLDatabase":
+        """根据 testcase.json 中的数据库配置创建实例"""
+        return cls(
+            host=db_config['host'],
+            user=db_config['user'],
+            password=db_config['password'],
+            database=db_config['database'],
+            port=int(db_config.get('port', 3306)),
+            pool_size=int(db_config.get('pool_size', DEFAULT_POOL_SIZE))
+        )
+    
+    def _connect(self):
+        """建立新的数据库连接"""
+        pymysql = get_pymysql()
+        if pymysql is None:
+            raise ImportError("pymysql 未安装，请运行: pip install pymysql")
+        with tracing.span("db.connect", host=self.host, database=self.database):
+            return pymysql.connect(
                 host=self.host,
                 user=self.user,
                 password=self.password,
                 database=self.database,
+                port=self.port,
                 charset='utf8mb4',
                 cursorclass=pymysql.cursors.DictCursor
             )
-        return self._connection
     
-    def execute_query(self, sql: str) -> List[Dict]:
+    def _get_connection(self, timeout: Optional[float] = None):
+        """从连接池获取连接（懒加载，池满时阻塞等待，最多等待 timeout 秒）"""
+        with tracing.span("db.pool_wait"):
+            if not self._slots.acquire(timeout=timeout):
+                raise TimeoutError(f"等待数据库连接超时（{timeout:.1f}s）")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+    
+    def _release_connection(self, conn) -> None:
+        """归还连接；已断开的连接直接丢弃"""
+        try:
+            if getattr(conn, "open", True):
+                self._idle.put(conn)
+            else:
+                conn.close()
+        finally:
+            self._slots.release()
+    
+    def execute_query(self, sql: str, timeout: Optional[float] = None) -> List[Dict]:
         """执行查询并返回结果
         
         Args:
             sql: SQL 查询语句
+            timeout: 可选的超时秒数，同时限制等待连接和服务端执行时间（MAX_EXECUTION_TIME 提示）
             
         Returns:
             List[Dict]: 查询结果列表
         """
-        conn = self._get_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(sql)
-            return cursor.fetchall()
+        conn = self._get_connection(timeout)
+        if timeout is not None:
+            sql = _with_max_execution_time(sql, timeout)
+        measured = server_metrics.current()
+        metrics_key = f"{self.host}:{self.port}/{self.database}"
+        try:
+            with conn.cursor() as cursor:
+                baseline = server_metrics.COLLECTOR.begin(cursor, metrics_key) if measured is not None else None
+                with tracing.span("db.execute"):
+                    cursor.execute(sql)
+                with tracing.span("db.fetchall") as sp:
+                    rows = cursor.fetchall()
+                    sp.set(rows=len(rows))
+                if measured is not None:
+                    with tracing.span("db.server_metrics"):
+                        measured.update(server_metrics.COLLECTOR.finish(cursor, metrics_key, baseline, len(rows)))
+                return rows
+        finally:
+            self._release_connection(conn)
     
     def close(self):
-        """关闭数据库连接"""
-        if self._connection:
-            self._connection.close()
-            self._connection = None
+        """关闭连接池中的所有空闲连接"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def _with_max_execution_time(sql: str, timeout: float) -> str:
+    """为 SELECT 语句加上 MySQL 的 MAX_EXECUTION_TIME 优化器提示（其他数据库会当作注释忽略）"""
+    stripped = sql.lstrip()
+    if stripped[:6].upper() != "SELECT":
+        return sql
+    return f"SELECT /*+ MAX_EXECUTION_TIME({max(1, int(timeout * 1000))}) */{stripped[6:]}"
+
+
+# 数据库驱动：db_config 中的 "driver" 字段 -> 工厂函数(db_config)
+DATABASE_DRIVERS = {
+    "mysql": MySQLDatabase.from_config,
+}
 
 
 def is_safe_sql(sql: str, allowed_tables: set, max_rows: int = 50) -> Tuple[bool, str]:
@@ -245,22 +397,32 @@ def get_db_from_config(db_name: str, db_config: Dict) -> MySQLDatabase:
     
     Args:
         db_name: 数据库名称标识
-        db_config: 数据库配置字典，包含 host, user, password, database
+        db_config: 数据库配置字典，包含 host, user, password, database；
+            带 replicas 列表时返回 replicas.ReplicaSet，查询按负载分配到各副本
         
     Returns:
-        MySQLDatabase: 数据库连接实例
+        MySQLDatabase: 数据库连接实例（由 DATABASE_DRIVERS 中对应驱动创建）
     """
-    cache_key = f"{db_name}_{db_config.get('host')}_{db_config.get('database')}"
-    
-    if cache_key not in _db_cache:
-        _db_cache[cache_key] = MySQLDatabase(
-            host=db_config['host'],
-            user=db_config['user'],
-            password=db_config['password'],
-            database=db_config['database']
-        )
-    
-    return _db_cache[cache_key]
+    driver = db_config.get("driver", "mysql")
+    cache_key = f"{driver}_{db_name}_{db_config.get('host')}_{db_config.get('database')}"
+    
+    with _db_cache_lock:
+        if cache_key not in _db_cache:
+            factory = DATABASE_DRIVERS.get(driver)
+            if factory is None:
+                raise ValueError(f"未知的数据库驱动: {driver}")
+            if db_config.get("replicas"):
+                _db_cache[cache_key] = replicas.ReplicaSet.from_config(db_name, db_config, factory)
+            else:
+                _db_cache[cache_key] = factory(db_config)
+        return _db_cache[cache_key]
+
+
+def replica_snapshots() -> List[Dict]:
+    """所有带副本的数据库的各副本状态（没有配置副本时为空列表）"""
+    with _db_cache_lock:
+        databases = list(_db_cache.values())
+    return [db.snapshot() for db in databases if isinstance(db, replicas.ReplicaSet)]
 
 # 默认 SQL 生成提示词（基于 tennis sql_query_agent.py）
 DEFAULT_SQL_GENERATION_PROMPT = """你是一个专业的网球数据查询助手。你的任务是：
@@ -482,6 +644,7 @@ CREATE TABLE `sportradar_tennis_summary_live` (
 """
 
 
+@tracing.traced("llm.extract_sql")
 def extract_sql_from_response(response: str) -> Optional[str]:
     """从模型响应中提取 SQL 语句"""
     # 尝试提取 ```sql ... ``` 代码块中的内容
@@ -512,18 +675,90 @@ def extract_sql_from_response(response: str) -> Optional[str]:
     return None
 
 
-def generate_sql_with_openai(question: str, prompt: str, model: str = "gpt-4o") -> Tuple[Optional[str], Optional[str]]:
-    """使用 OpenAI 模型生成 SQL"""
-    if openai is None:
+# 模型客户端缓存（同一进程内复用 HTTP 连接，避免每次调用重新创建客户端）
+_client_cache = {}
+_client_cache_lock = threading.Lock()
+
+
+def _get_openai_client(api_key: Optional[str]):
+    """获取（或创建）指定 API Key 的 OpenAI 客户端"""
+    with _client_cache_lock:
+        client = _client_cache.get(("openai", api_key))
+        if client is None:
+            client = get_openai().OpenAI(api_key=api_key)
+            _client_cache[("openai", api_key)] = client
+        return client
+
+
+def _get_google_model(api_key: str, model: str):
+    """获取（或创建）指定模型的 Gemini 模型实例；API Key 变化时重新配置"""
+    with _client_cache_lock:
+        genai = get_genai()
+        if _client_cache.get("google_api_key") != api_key:
+            genai.configure(api_key=api_key)
+            # Key 变化后旧的模型实例不再可用
+            for key in [k for k in _client_cache if isinstance(k, tuple) and k[0] == "google"]:
+                del _client_cache[key]
+            _client_cache["google_api_key"] = api_key
+        model_instance = _client_cache.get(("google", model))
+        if model_instance is None:
+            model_instance = genai.GenerativeModel(model)
+            _client_cache[("google", model)] = model_instance
+        return model_instance
+
+
+def _record_usage(usage: Optional[Dict], prompt_tokens, completion_tokens, cached_tokens=None) -> None:
+    """将 token 用量累加到调用方传入的 usage 字典（cached_tokens 为 prompt 中命中提供方缓存的部分）"""
+    if usage is None:
+        return
+    usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + (prompt_tokens or 0)
+    usage["completion_tokens"] = usage.get("completion_tokens", 0) + (completion_tokens or 0)
+    usage["cached_tokens"] = usage.get("cached_tokens", 0) + (cached_tokens or 0)
+
+
+def _record_exception(usage: Optional[Dict], error: BaseException) -> None:
+    """记录导致生成失败的异常（usage["exception"]），熔断器按它的类型和错误码判断是否为系统性失败"""
+    if usage is not None:
+        usage["exception"] = error
+
+
+def _record_openai_usage(response, usage: Optional[Dict]) -> None:
+    """从 OpenAI 响应中读取 token 用量（兼容 chat/completions 和 responses API）"""
+    response_usage = getattr(response, "usage", None)
+    if response_usage is None:
+        return
+    prompt_tokens = getattr(response_usage, "prompt_tokens", None) or getattr(response_usage, "input_tokens", None)
+    completion_tokens = getattr(response_usage, "completion_tokens", None) or getattr(response_usage, "output_tokens", None)
+    details = getattr(response_usage, "prompt_tokens_details", None) or getattr(response_usage, "input_tokens_details", None)
+    _record_usage(usage, prompt_tokens, completion_tokens, getattr(details, "cached_tokens", None))
+
+
+@tracing.traced("llm.openai")
+def generate_sql_with_openai(question: str, prompt: str, model: str = "gpt-4o",
+                             usage: Dict = None) -> Tuple[Optional[str], Optional[str]]:
+    """使用 OpenAI 模型生成 SQL
+
+    组提示词作为 system 消息放在最前面（逐字节不变，可命中 OpenAI 的自动前缀缓存），问题在后。
+
+    Args:
+        usage: 可选的统计字典，调用后会累加 prompt_tokens、completion_tokens、cached_tokens 和 retries；
+            失败时 exception 为导致失败的异常
+    """
+    if get_openai() is None:
+        _record_exception(usage, circuit_breaker.ConfigurationError("config", "OpenAI 库未安装"))
         return None, "OpenAI 库未安装"
+    ensure_env_loaded()
     
     try:
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        with tracing.span("llm.client"):
+            client = _get_openai_client(os.getenv("OPENAI_API_KEY"))
         
-        messages = [
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": question}
-        ]
+        with tracing.span("llm.build_prompt"):
+            messages = [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": question}
+            ]
+            cache_kwargs = context_cache.REGISTRY.openai_kwargs(prompt)
         
         # 检测是否需要使用 responses API（某些新模型如 gpt-5-pro）
         use_responses_api = model in ["gpt-5-pro", "gpt-5-thinking", "gpt-5-main"]
@@ -532,11 +767,15 @@ def generate_sql_with_openai(question: str, prompt: str, model: str = "gpt-4o")
             # 使用 responses API
             try:
                 # responses API 使用不同的格式
-                full_prompt = f"{prompt}\n\n用户问题：{question}\n\n请只返回 SQL 语句："
-                response = client.responses.create(
-                    model=model,
-                    input=full_prompt
-                )
+                full_prompt = context_cache.full_prompt(prompt, question)
+                with tracing.span("llm.request", api="responses", model=model):
+                    response = client.responses.create(
+                        model=model,
+                        input=full_prompt,
+                        **cache_kwargs,
+                        **deadline.timeout_kwargs()
+                    )
+                _record_openai_usage(response, usage)
                 # responses API 的响应格式可能不同
                 if hasattr(response, 'output') and response.output:
                     content = response.output
@@ -551,27 +790,43 @@ def generate_sql_with_openai(question: str, prompt: str, model: str = "gpt-4o")
             # 使用 chat/completions API
             # 某些模型不支持自定义 temperature，先尝试使用 temperature，如果失败则使用默认值
             try:
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    temperature=0.1
-                )
+                with tracing.span("llm.request", api="chat.completions", model=model):
+                    response = client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=0.1,
+                        **cache_kwargs,
+                        **deadline.timeout_kwargs()
+                    )
             except Exception as temp_error:
                 # 如果 temperature 不支持，尝试不使用 temperature（使用默认值）
                 error_str = str(temp_error)
                 if 'temperature' in error_str.lower() or 'unsupported_value' in error_str.lower():
-                    response = client.chat.completions.create(
-                        model=model,
-                        messages=messages
-                    )
+                    deadline.check("generation")
+                    if usage is not None:
+                        usage["retries"] = usage.get("retries", 0) + 1
+                    with tracing.span("llm.request", api="chat.completions", model=model, retry=True):
+                        response = client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            **cache_kwargs,
+                            **deadline.timeout_kwargs()
+                        )
                 elif 'v1/responses' in error_str.lower() or 'not in v1/chat/completions' in error_str.lower():
                     # 如果模型需要使用 responses API，尝试使用
+                    deadline.check("generation")
+                    if usage is not None:
+                        usage["retries"] = usage.get("retries", 0) + 1
                     try:
-                        full_prompt = f"{prompt}\n\n用户问题：{question}\n\n请只返回 SQL 语句："
-                        response = client.responses.create(
-                            model=model,
-                            input=full_prompt
-                        )
+                        full_prompt = context_cache.full_prompt(prompt, question)
+                        with tracing.span("llm.request", api="responses", model=model, retry=True):
+                            response = client.responses.create(
+                                model=model,
+                                input=full_prompt,
+                                **cache_kwargs,
+                                **deadline.timeout_kwargs()
+                            )
+                        _record_openai_usage(response, usage)
                         if hasattr(response, 'output') and response.output:
                             content = response.output
                         elif hasattr(response, 'choices') and response.choices:
@@ -587,12 +842,16 @@ def generate_sql_with_openai(question: str, prompt: str, model: str = "gpt-4o")
                     raise
             
             # 从 chat/completions 响应中提取内容
+            _record_openai_usage(response, usage)
             content = response.choices[0].message.content
         
         sql = extract_sql_from_response(content)
         
         return sql, None
+    except deadline.DeadlineExceeded as e:
+        return None, str(e)
     except Exception as e:
+        _record_exception(usage, e)
         error_msg = str(e)
         # 如果错误提示需要使用 responses API
         if 'v1/responses' in error_msg.lower() or 'not in v1/chat/completions' in error_msg.lower():
@@ -600,19 +859,32 @@ def generate_sql_with_openai(question: str, prompt: str, model: str = "gpt-4o")
         return None, f"OpenAI API 错误: {error_msg}"
 
 
-def generate_sql_with_google(question: str, prompt: str, model: str = "gemini-2.0-flash-exp") -> Tuple[Optional[str], Optional[str]]:
+@tracing.traced("llm.google")
+def generate_sql_with_google(question: str, prompt: str, model: str = "gemini-2.0-flash-exp",
+                             usage: Dict = None) -> Tuple[Optional[str], Optional[str]]:
     """使用 Google 模型生成 SQL
     
     注意：此函数使用 Google AI Studio (Gemini API)，需要使用从 Google AI Studio 获取的 API Key。
     不要使用 Google Cloud Console 创建的 API Key，那是用于 Google Cloud API 的。
+
+    开启提示词前缀缓存时，组提示词保存为 Gemini 显式缓存（context_cache），每次只发送问题后缀；
+    缓存不可用时发送完整提示词。
+
+    Args:
+        usage: 可选的统计字典，调用后会累加 prompt_tokens、completion_tokens 和 cached_tokens；
+            失败时 exception 为导致失败的异常
     """
+    genai = get_genai()
     if genai is None:
+        _record_exception(usage, circuit_breaker.ConfigurationError("config", "Google Generative AI 库未安装"))
         return None, "Google Generative AI 库未安装"
+    ensure_env_loaded()
     
     try:
         # 尝试多种方式获取 API Key
         api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
         if not api_key:
+            _record_exception(usage, circuit_breaker.ConfigurationError("auth", "未设置 Google API Key"))
             return None, (
                 "未设置 GOOGLE_API_KEY 或 GEMINI_API_KEY 环境变量。\n"
                 "请从 Google AI Studio 获取 API Key: https://makersuite.google.com/app/apikey\n"
@@ -622,6 +894,7 @@ def generate_sql_with_google(question: str, prompt: str, model: str = "gemini-2.
         # 检查 API Key 格式
         api_key = api_key.strip()
         if len(api_key) < 20:
+            _record_exception(usage, circuit_breaker.ConfigurationError("auth", "Google API Key 格式不正确"))
             return None, (
                 f"API Key 格式可能不正确（长度过短: {len(api_key)} 字符）。\n"
                 f"Google AI Studio API Key 通常为 39 个字符，以 'AIza' 开头。\n"
@@ -630,6 +903,7 @@ def generate_sql_with_google(question: str, prompt: str, model: str = "gemini-2.
         
         # 验证 API Key 格式（Google AI Studio API Key 通常以 AIza 开头）
         if not api_key.startswith("AIza"):
+            _record_exception(usage, circuit_breaker.ConfigurationError("auth", "Google API Key 格式不正确"))
             return None, (
                 f"API Key 格式可能不正确（不以 'AIza' 开头）。\n"
                 f"请确认使用的是 Google AI Studio 的 API Key，而不是 Google Cloud Console 的 API Key。\n"
@@ -637,25 +911,53 @@ def generate_sql_with_google(question: str, prompt: str, model: str = "gemini-2.
                 f"当前 API Key 前缀: {api_key[:10]}..."
             )
         
-        # 配置 API Key（每次调用前重新配置，确保使用最新的 key）
-        genai.configure(api_key=api_key)
+        # 获取模型实例（API Key 变化时会重新配置，确保使用最新的 key）
+        with tracing.span("llm.client"):
+            model_instance = _get_google_model(api_key, model)
         
-        # 创建模型实例
-        model_instance = genai.GenerativeModel(model)
+        with tracing.span("llm.build_prompt"):
+            full_prompt = context_cache.full_prompt(prompt, question)
+            with tracing.span("llm.context_cache"):
+                cached_model = context_cache.REGISTRY.gemini_model(genai, api_key, model, prompt)
         
-        full_prompt = f"{prompt}\n\n用户问题：{question}\n\n请只返回 SQL 语句："
+        # 生成内容（缓存的模型实例已带有组提示词，只发送问题后缀）
+        response = None
+        if cached_model is not None:
+            try:
+                with tracing.span("llm.request", api="generate_content", model=model, cached=True):
+                    response = cached_model.generate_content(
+                        context_cache.question_suffix(question),
+                        generation_config=genai.types.GenerationConfig(temperature=0.1),
+                        request_options=deadline.timeout_kwargs()
+                    )
+            except Exception as e:
+                if not context_cache.is_cache_error(e):
+                    raise
+                # 缓存已在服务端失效：丢弃后改用完整提示词，下次调用重新创建
+                context_cache.REGISTRY.invalidate(api_key, model, prompt)
+                deadline.check("generation")
+                if usage is not None:
+                    usage["retries"] = usage.get("retries", 0) + 1
+        if response is None:
+            with tracing.span("llm.request", api="generate_content", model=model):
+                response = model_instance.generate_content(
+                    full_prompt,
+                    generation_config=genai.types.GenerationConfig(temperature=0.1),
+                    request_options=deadline.timeout_kwargs()
+                )
         
-        # 生成内容
-        response = model_instance.generate_content(
-            full_prompt,
-            generation_config=genai.types.GenerationConfig(temperature=0.1)
-        )
+        usage_metadata = getattr(response, "usage_metadata", None)
+        if usage_metadata is not None:
+            _record_usage(usage, getattr(usage_metadata, "prompt_token_count", None),
+                          getattr(usage_metadata, "candidates_token_count", None),
+                          getattr(usage_metadata, "cached_content_token_count", None))
         
         content = response.text
         sql = extract_sql_from_response(content)
         
         return sql, None
     except Exception as e:
+        _record_exception(usage, e)
         error_msg = str(e)
         
         # 提供更详细的错误诊断
@@ -689,6 +991,28 @@ def generate_sql_with_google(question: str, prompt: str, model: str = "gemini-2.
             return None, f"Google API 错误: {error_msg}"
 
 
+# 模型提供方：test_question 的 model_type -> 生成函数(question, prompt, model, usage=None)
+SQL_GENERATORS = {
+    "openai": generate_sql_with_openai,
+    "google": generate_sql_with_google,
+}
+
+# 模型提供方使用的 API Key 环境变量（按顺序取第一个非空的），用于区分熔断器
+PROVIDER_API_KEY_VARS = {
+    "openai": ("OPENAI_API_KEY",),
+    "google": ("GOOGLE_API_KEY", "GEMINI_API_KEY"),
+}
+
+
+def _provider_api_key(model_type: str) -> Optional[str]:
+    ensure_env_loaded()
+    for name in PROVIDER_API_KEY_VARS.get(model_type, ()):
+        value = os.getenv(name)
+        if value:
+            return value
+    return None
+
+
 # 危险 SQL 关键字（会对数据库造成修改的操作）
 DANGEROUS_KEYWORDS = {
     "DROP", "DELETE", "UPDATE", "INSERT", "CREATE", "ALTER",
@@ -717,7 +1041,9 @@ def detect_dangerous_sql(sql: str) -> Tuple[bool, Optional[str]]:
     return False, None
 
 
-def execute_sql_safely(sql: str, db_name: str = None, db_config: Dict = None, allowed_tables: set = None) -> Tuple[bool, str, Optional[List[Dict]]]:
+@tracing.traced("execute_sql_safely")
+def execute_sql_safely(sql: str, db_name: str = None, db_config: Dict = None, allowed_tables: set = None,
+                       stats: Dict = None) -> Tuple[bool, str, Optional[List[Dict]]]:
     """安全执行 SQL 并返回结果
     
     Args:
@@ -725,6 +1051,8 @@ def execute_sql_safely(sql: str, db_name: str = None, db_config: Dict = None, al
         db_name: 数据库名称标识（用于从配置中获取）
         db_config: 数据库配置字典（如果提供则直接使用）
         allowed_tables: 允许访问的表名集合（如果为 None，则使用默认的 ALLOWED_TABLES）
+        stats: 可选的统计字典，调用后包含 validation_time（安全检查耗时）、db_time（数据库阶段耗时，
+            包括并发限制器排队、等待连接和查询执行，仅在实际执行时）和 failed_stage（失败阶段: validation/db）
         
     Returns:
         Tuple[bool, str, Optional[List[Dict]]]: (是否成功, 消息, 结果)
@@ -732,44 +1060,83 @@ def execute_sql_safely(sql: str, db_name: str = None, db_config: Dict = None, al
     if not sql:
         return False, "SQL 为空", None
     
+    if stats is None:
+        stats = {}
+    ok, msg = check_sql_safety(sql, allowed_tables, stats)
+    if not ok:
+        return False, msg, None
+    return execute_checked_sql(sql, db_name, db_config, stats)
+
+
+def check_sql_safety(sql: str, allowed_tables: Optional[set], stats: Dict) -> Tuple[bool, str]:
+    """execute_sql_safely 的安全检查部分（只读、表白名单、LIMIT），耗时写入 stats["validation_time"]"""
+    validation_start = time.perf_counter()
     try:
-        # 检查 SQL 安全性
         # 使用传入的 allowed_tables，如果没有则使用默认的
         if allowed_tables is None:
             allowed_tables = ALLOWED_TABLES
         # 将允许的表名转换为大写集合
         allowed_tables_upper = {table.upper() for table in allowed_tables}
-        ok, msg = is_safe_sql(sql, allowed_tables_upper, MAX_ROWS)
-        if not ok:
-            return False, msg, None
+        with tracing.span("validate.is_safe_sql"):
+            ok, msg = is_safe_sql(sql, allowed_tables_upper, MAX_ROWS)
+    except Exception as e:
+        stats["validation_time"] = time.perf_counter() - validation_start
+        stats["failed_stage"] = "db"
+        return False, f"执行异常: {str(e)}"
+    stats["validation_time"] = time.perf_counter() - validation_start
+    if not ok:
+        stats["failed_stage"] = "validation"
+    return ok, msg
+
+
+def execute_checked_sql(sql: str, db_name: Optional[str], db_config: Optional[Dict],
+                        stats: Dict) -> Tuple[bool, str, Optional[List[Dict]]]:
+    """execute_sql_safely 的执行部分（SQL 已通过 check_sql_safety），耗时写入 stats["db_time"]，
+    开启服务端指标时该查询的指标写入 stats["server_metrics"]"""
+    try:
+        # 生成阶段已用完时间预算时不再访问数据库
+        deadline.check("db")
         
         # 获取数据库连接
         if db_config:
-            db = get_db_from_config(db_name or "custom", db_config)
+            with tracing.span("db.get_pool", db=db_name or "custom"):
+                db = get_db_from_config(db_name or "custom", db_config)
         else:
             # 如果没有提供 db_config，无法连接数据库
+            stats["failed_stage"] = "db"
             return False, "未提供数据库配置，无法执行 SQL", None
         
-        results = db.execute_query(sql)
+        breaker = circuit_breaker.REGISTRY.database(db_name or "custom", db_config)
+        limiter = concurrency.REGISTRY.database(db_name or "custom", db_config, getattr(db, "pool_size", None))
+        db_start = time.perf_counter()
+        try:
+            with circuit_breaker.guard(breaker) as trial, limiter.slot(timeout=deadline.remaining()), \
+                    tracing.span("db.query", db=db_name or "custom"), server_metrics.capture() as measured:
+                try:
+                    results = db.execute_query(sql, timeout=deadline.remaining())
+                except Exception as e:
+                    # SQL 错误说明数据库可以访问，只有连接、认证类错误计入熔断
+                    trial.record(e)
+                    raise
+                trial.record(None)
+        finally:
+            stats["db_time"] = time.perf_counter() - db_start
+        if measured:
+            stats["server_metrics"] = measured
         
         return True, "执行成功", results
+    except circuit_breaker.CircuitOpen as e:
+        stats["failed_stage"] = "db"
+        stats["circuit_open"] = True
+        return False, str(e), None
     except Exception as e:
+        stats["failed_stage"] = "db"
         return False, f"执行异常: {str(e)}", None
 
 
-def test_question(question: str, prompt: str, model_type: str, model_name: str, db_name: str = None, db_config: Dict = None, allowed_tables: set = None) -> Dict:
-    """测试单个问题的 SQL 生成和执行
-    
-    Args:
-        question: 问题文本
-        prompt: 提示词
-        model_type: 模型类型 ("openai" 或 "google")
-        model_name: 模型名称
-        db_name: 数据库名称标识
-        db_config: 数据库配置字典
-        allowed_tables: 允许访问的表名集合
-    """
-    result = {
+def _new_result(question: str, prompt: str, model_type: str, model_name: str, db_name: str = None) -> Dict:
+    """创建一个空的测试结果"""
+    return {
         "question": question,
         "prompt": prompt,
         "model_type": model_type,
@@ -779,49 +1146,199 @@ def test_question(question: str, prompt: str, model_type: str, model_name: str,
         "error": None,
         "result_count": 0,
         "is_dangerous": False,
-        "dangerous_keyword": None
+        "dangerous_keyword": None,
+        "db_name": db_name,
+        "failed_stage": None,
+        "generation_time": None,
+        "validation_time": None,
+        "db_time": None,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "retries": 0
     }
-    
-    # 生成 SQL
-    if model_type == "openai":
-        sql, error = generate_sql_with_openai(question, prompt, model_name)
-    elif model_type == "google":
-        sql, error = generate_sql_with_google(question, prompt, model_name)
-    else:
-        result["error"] = f"未知的模型类型: {model_type}"
-        return result
-    
-    if error:
-        result["error"] = error
-        return result
-    
-    if not sql:
-        result["error"] = "未能从模型响应中提取 SQL"
+
+
+def validate_and_execute(result: Dict, sql: str, db_name: str = None, db_config: Dict = None,
+                         allowed_tables: set = None, include_rows: bool = False) -> Dict:
+    """对已得到的 SQL 做危险检测、安全检查并执行，结果写入 result
+
+    Args:
+        result: 测试结果字典（由 test_question 创建）
+        sql: 要执行的 SQL
+        db_name: 数据库名称标识
+        db_config: 数据库配置字典
+        allowed_tables: 允许访问的表名集合
+        include_rows: 是否在结果中附带查询返回的行（rows 字段）
+
+    Returns:
+        Dict: 更新后的 result
+    """
+    if not validate_sql(result, sql, allowed_tables):
         return result
-    
+    return execute_validated_sql(result, db_name=db_name, db_config=db_config, include_rows=include_rows)
+
+
+def validate_sql(result: Dict, sql: str, allowed_tables: set = None) -> bool:
+    """validate_and_execute 的校验部分：危险检测、安全检查和表结构校验，失败原因写入 result
+
+    Returns:
+        bool: SQL 是否可以执行
+    """
     result["sql"] = sql
     
     # 检测危险 SQL
-    is_dangerous, dangerous_keyword = detect_dangerous_sql(sql)
+    validation_start = time.perf_counter()
+    with tracing.span("validate.dangerous_sql"):
+        is_dangerous, dangerous_keyword = detect_dangerous_sql(sql)
+    result["validation_time"] = time.perf_counter() - validation_start
     result["is_dangerous"] = is_dangerous
     result["dangerous_keyword"] = dangerous_keyword
     
     # 如果是危险 SQL，不执行，直接返回
     if is_dangerous:
         result["error"] = f"检测到危险操作: {dangerous_keyword}"
-        return result
+        result["failed_stage"] = "validation"
+        return False
     
-    # 执行 SQL（使用传入的数据库配置和允许的表列表）
-    success, msg, results = execute_sql_safely(sql, db_name=db_name, db_config=db_config, allowed_tables=allowed_tables)
+    if not sql:
+        result["error"] = "SQL 为空"
+        result["failed_stage"] = "db"
+        return False
+    
+    safety_stats = {}
+    ok, msg = check_sql_safety(sql, allowed_tables, safety_stats)
+    result["validation_time"] += safety_stats.get("validation_time", 0)
+    if not ok:
+        result["error"] = msg
+        result["failed_stage"] = safety_stats.get("failed_stage", "validation")
+        return False
+    
+    # 按提示词中的表结构校验表、别名和列引用，能确定不存在的引用不再访问数据库
+    schema_start = time.perf_counter()
+    with tracing.span("validate.schema"):
+        schema_error = sql_validator.VALIDATOR.check(sql, result.get("prompt"), allowed_tables or ALLOWED_TABLES)
+    result["validation_time"] += time.perf_counter() - schema_start
+    if schema_error:
+        result["error"] = f"表结构校验失败: {schema_error}"
+        result["failed_stage"] = "validation"
+        return False
+    return True
+
+
+def execute_validated_sql(result: Dict, db_name: str = None, db_config: Dict = None,
+                          include_rows: bool = False) -> Dict:
+    """validate_and_execute 的执行部分：执行已通过 validate_sql 的 result["sql"]"""
+    execution_stats = {}
+    success, msg, results = execute_checked_sql(result["sql"], db_name, db_config, execution_stats)
+    result["db_time"] = execution_stats.get("db_time")
     result["success"] = success
     if not success:
         result["error"] = msg
+        result["failed_stage"] = execution_stats.get("failed_stage", "db")
+        if execution_stats.get("circuit_open"):
+            result["circuit_open"] = True
     else:
         result["result_count"] = len(results) if results else 0
+        if "server_metrics" in execution_stats:
+            result["server_metrics"] = execution_stats["server_metrics"]
+        if include_rows:
+            result["rows"] = list(results) if results else []
     
     return result
 
 
+def test_question(question: str, prompt: str, model_type: str, model_name: str, db_name: str = None, db_config: Dict = None, allowed_tables: set = None,
+                  include_rows: bool = False) -> Dict:
+    """测试单个问题的 SQL 生成和执行
+    
+    Args:
+        question: 问题文本
+        prompt: 提示词
+        model_type: 模型类型 ("openai" 或 "google")
+        model_name: 模型名称
+        db_name: 数据库名称标识
+        db_config: 数据库配置字典
+        allowed_tables: 允许访问的表名集合
+        include_rows: 是否在结果中附带查询返回的行（rows 字段）
+    """
+    with tracing.span("test_question", model_type=model_type, model=model_name, db=db_name,
+                      question=question) as sp:
+        result = _generate_and_execute(question, prompt, model_type, model_name, db_name, db_config,
+                                       allowed_tables, include_rows)
+        sp.set(success=result["success"], failed_stage=result["failed_stage"] or "")
+        return result
+
+
+def _generate_and_execute(question: str, prompt: str, model_type: str, model_name: str, db_name: str,
+                          db_config: Optional[Dict], allowed_tables: Optional[set], include_rows: bool) -> Dict:
+    """test_question 的流水线主体（生成 → 提取 → 校验 → 执行）"""
+    result = _new_result(question, prompt, model_type, model_name, db_name)
+    sql = generate_sql(result, question, prompt, model_type, model_name)
+    if sql is None:
+        return result
+    return validate_and_execute(result, sql, db_name=db_name, db_config=db_config,
+                                allowed_tables=allowed_tables, include_rows=include_rows)
+
+
+def generate_sql(result: Dict, question: str, prompt: str, model_type: str, model_name: str) -> Optional[str]:
+    """test_question 的生成部分：调用模型并提取 SQL，耗时、token 用量和失败原因写入 result
+
+    Returns:
+        Optional[str]: 提取出的 SQL；生成或提取失败时返回 None
+    """
+    generator = SQL_GENERATORS.get(model_type)
+    if generator is None:
+        result["error"] = f"未知的模型类型: {model_type}"
+        result["failed_stage"] = "generation"
+        return None
+    usage = {}
+    generation_start = time.perf_counter()
+    breaker = circuit_breaker.REGISTRY.model(model_type, model_name, _provider_api_key(model_type))
+    try:
+        with circuit_breaker.guard(breaker) as trial, \
+                concurrency.REGISTRY.model(model_type, model_name).slot(timeout=deadline.remaining()) as slot:
+            sql, error = generator(question, prompt, model_name, usage=usage)
+            slot.record(error)
+            trial.record(error, usage.get("exception"))
+    except circuit_breaker.CircuitOpen as e:
+        sql, error = None, str(e)
+        result["circuit_open"] = True
+    except TimeoutError as e:
+        sql, error = None, str(e)
+    result["generation_time"] = time.perf_counter() - generation_start
+    result["prompt_tokens"] = usage.get("prompt_tokens", 0)
+    result["completion_tokens"] = usage.get("completion_tokens", 0)
+    result["cached_tokens"] = usage.get("cached_tokens", 0)
+    result["retries"] = usage.get("retries", 0)
+    
+    if error:
+        result["error"] = error
+        result["failed_stage"] = "generation"
+        return None
+    
+    if not sql:
+        result["error"] = "未能从模型响应中提取 SQL"
+        result["failed_stage"] = "extraction"
+        return None
+    
+    return sql
+
+
+@tracing.traced("run_known_sql")
+def run_known_sql(question: str, sql: str, model_type: str, model_name: str, db_name: str = None,
+                  db_config: Dict = None, allowed_tables: set = None, include_rows: bool = False,
+                  prompt: str = None) -> Dict:
+    """跳过模型生成，直接校验并执行已知的 SQL（用于缓存命中），返回与 test_question 相同结构的结果
+
+    prompt 为测试组提示词：表结构校验按它的 CREATE TABLE 进行，与重新生成时的校验一致。
+    """
+    result = _new_result(question, prompt, model_type, model_name, db_name)
+    result["generation_time"] = 0.0
+    return validate_and_execute(result, sql, db_name=db_name, db_config=db_config,
+                                allowed_tables=allowed_tables, include_rows=include_rows)
+
+
 def normalize_model_config(model_config, default_value):
     """标准化模型配置：将字符串转换为数组，确保返回数组格式"""
     if model_config is None:
@@ -834,12 +1351,142 @@ def normalize_model_config(model_config, default_value):
     return default_value if isinstance(default_value, list) else [default_value]
 
 
-def load_test_cases(testcase_file: str) -> Tuple[List[Dict], Dict]:
-    """加载测试用例
+# 不同测试组对应的允许表列表（按测试组名称或数据库名称推断）
+TABLE_MAPPING = {
+    "tennis": {
+        "sportradar_tennis_competition",
+        "sportradar_tennis_season",
+        "sportradar_tennis_competitor",
+        "sportradar_tennis_summary_live"
+    },
+    "football": {
+        "sport_football_schedule"
+    },
+    "basketball": {
+        "sport_basketball_schedule"
+    }
+}
+
+
+def _build_defaults(data: Dict) -> Dict:
+    """从测试用例配置中读取默认提示词、模型和模型并发控制参数"""
+    return {
+        "prompt": data.get("default_prompt", DEFAULT_SQL_GENERATION_PROMPT + DATABASE_SCHEMA_PROMPT),
+        "openai_model": normalize_model_config(
+            data.get("default_openai_model"), ["gpt-4o"]
+        ),
+        "google_model": normalize_model_config(
+            data.get("default_google_model"), ["gemini-2.0-flash-exp"]
+        ),
+        "model_concurrency": data.get("model_concurrency", {})
+    }
+
+
+def _prepare_group(group: Dict, defaults: Dict, database_configs: Dict, prompt_cache: Dict = None,
+                   compact_schema: bool = False) -> Dict:
+    """为测试组补充默认值、数据库配置和允许的表（原地修改并返回）
+
+    Args:
+        prompt_cache: 提示词驻留表（原始提示词 -> 最终提示词）；多个组使用相同提示词时共享同一个字符串对象
+        compact_schema: 是否把提示词中的 DDL 替换为紧凑表结构（压缩前后的 token 数记录在 schema_compaction 字段）
+    """
+    if "prompt" not in group:
+        group["prompt"] = defaults["prompt"]
+    else:
+        raw_prompt = group["prompt"]
+        prompt = prompt_cache.get(raw_prompt) if prompt_cache is not None else None
+        if prompt is None:
+            # 如果提示词中没有包含数据库结构，自动添加
+            prompt = raw_prompt if "数据库表结构" in raw_prompt else raw_prompt + DATABASE_SCHEMA_PROMPT
+            if prompt_cache is not None:
+                prompt_cache[raw_prompt] = prompt
+        group["prompt"] = prompt
+    
+    if compact_schema:
+        compacted = prompt_cache.get(("compact", group["prompt"])) if prompt_cache is not None else None
+        if compacted is None:
+            compact = schema_catalog.compact_prompt(group["prompt"])
+            compacted = (compact, schema_catalog.compaction_stats(group["prompt"], compact))
+            # 紧凑表结构中没有 CREATE TABLE，表结构校验沿用压缩前的目录
+            sql_validator.VALIDATOR.register(compact, group["prompt"])
+            if prompt_cache is not None:
+                prompt_cache[("compact", group["prompt"])] = compacted
+        group["prompt"], group["schema_compaction"] = compacted
+    
+    group["openai_model"] = normalize_model_config(
+        group.get("openai_model"), defaults["openai_model"]
+    )
+    group["google_model"] = normalize_model_config(
+        group.get("google_model"), defaults["google_model"]
+    )
+    
+    # 处理数据库配置
+    group_db_name = group.get("database_name")
+    if group_db_name and group_db_name in database_configs:
+        group["db_config"] = database_configs[group_db_name]
+        group["db_name"] = group_db_name
+    elif group_db_name:
+        # 如果指定了 database_name 但配置中不存在，使用默认配置管理器
+        group["db_name"] = group_db_name
+        group["db_config"] = None
+    else:
+        # 如果没有指定，使用默认数据库
+        group["db_name"] = DEFAULT_DB_NAME
+        group["db_config"] = None
+    
+    # 处理允许的表列表
+    # 优先使用配置中的 allowed_tables，否则根据测试组名称推断
+    if "allowed_tables" in group:
+        # 如果配置中指定了 allowed_tables，使用配置的值
+        group["allowed_tables"] = set(group["allowed_tables"])
+    else:
+        # 根据测试组名称推断允许的表
+        group_name = group.get("name", "").lower()
+        if group_name in TABLE_MAPPING:
+            group["allowed_tables"] = TABLE_MAPPING[group_name]
+        elif group_db_name and group_db_name in TABLE_MAPPING:
+            group["allowed_tables"] = TABLE_MAPPING[group_db_name]
+        else:
+            # 默认使用网球表（向后兼容）
+            group["allowed_tables"] = ALLOWED_TABLES
+    return group
+
+
+def _question_text(group: Dict, entry) -> str:
+    """问题条目可以是字符串，或带标签的对象 {"question": "...", "tags": ["join"]}
+
+    标签记录在测试组的 question_tags 中（供分层抽样使用），其余代码只处理问题文本。
+    """
+    if not isinstance(entry, dict):
+        return entry
+    tags = entry.get("tags")
+    if tags:
+        group.setdefault("question_tags", {})[entry["question"]] = [tags] if isinstance(tags, str) else list(tags)
+    return entry["question"]
+
+
+def load_test_cases(testcase_file: str, compact_schema: bool = False) -> Tuple[List[Dict], Dict]:
+    """加载测试用例（.jsonl 文件按流式格式读取后展开）
+    
+    Args:
+        testcase_file: 测试用例文件路径
+        compact_schema: 是否把各组提示词中的 DDL 替换为紧凑表结构（见 schema_catalog）
     
     Returns:
         Tuple[List[Dict], Dict]: (测试组列表, 默认配置)
     """
+    if testcase_file.endswith(".jsonl"):
+        test_groups = []
+        seen = set()
+        defaults = None
+        for group, question, defaults in iter_test_cases_jsonl(testcase_file, compact_schema=compact_schema):
+            if id(group) not in seen:
+                seen.add(id(group))
+                group["questions"] = []
+                test_groups.append(group)
+            group["questions"].append(question)
+        return test_groups, defaults or _build_defaults({})
+
     with open(testcase_file, 'r', encoding='utf-8') as f:
         data = json.load(f)
     
@@ -865,106 +1512,626 @@ def load_test_cases(testcase_file: str) -> Tuple[List[Dict], Dict]:
         test_groups = data.get("test_groups", [])
     
     # 获取默认配置
-    defaults = {
-        "prompt": data.get("default_prompt", DEFAULT_SQL_GENERATION_PROMPT + DATABASE_SCHEMA_PROMPT),
-        "openai_model": normalize_model_config(
-            data.get("default_openai_model"), ["gpt-4o"]
-        ),
-        "google_model": normalize_model_config(
-            data.get("default_google_model"), ["gemini-2.0-flash-exp"]
-        )
-    }
+    defaults = _build_defaults(data)
     
     # 获取数据库配置
     database_configs = data.get("database", {})
     
-    # 定义不同测试组对应的允许表列表
-    TABLE_MAPPING = {
-        "tennis": {
-            "sportradar_tennis_competition",
-            "sportradar_tennis_season",
-            "sportradar_tennis_competitor",
-            "sportradar_tennis_summary_live"
-        },
-        "football": {
-            "sport_football_schedule"
-        },
-        "basketball": {
-            "sport_basketball_schedule"
-        }
-    }
-    
     # 为每个测试组补充默认值和数据库配置
+    prompt_cache = {}
     for group in test_groups:
-        if "prompt" not in group:
-            group["prompt"] = defaults["prompt"]
-        else:
-            # 如果提示词中没有包含数据库结构，自动添加
-            if "数据库表结构" not in group["prompt"]:
-                group["prompt"] = group["prompt"] + DATABASE_SCHEMA_PROMPT
-        
-        group["openai_model"] = normalize_model_config(
-            group.get("openai_model"), defaults["openai_model"]
-        )
-        group["google_model"] = normalize_model_config(
-            group.get("google_model"), defaults["google_model"]
-        )
-        
-        # 处理数据库配置
-        group_db_name = group.get("database_name")
-        if group_db_name and group_db_name in database_configs:
-            group["db_config"] = database_configs[group_db_name]
-            group["db_name"] = group_db_name
-        elif group_db_name:
-            # 如果指定了 database_name 但配置中不存在，使用默认配置管理器
-            group["db_name"] = group_db_name
-            group["db_config"] = None
-        else:
-            # 如果没有指定，使用默认数据库
-            group["db_name"] = DEFAULT_DB_NAME
-            group["db_config"] = None
-        
-        # 处理允许的表列表
-        # 优先使用配置中的 allowed_tables，否则根据测试组名称推断
-        if "allowed_tables" in group:
-            # 如果配置中指定了 allowed_tables，使用配置的值
-            group["allowed_tables"] = set(group["allowed_tables"])
-        else:
-            # 根据测试组名称推断允许的表
-            group_name = group.get("name", "").lower()
-            if group_name in TABLE_MAPPING:
-                group["allowed_tables"] = TABLE_MAPPING[group_name]
-            elif group_db_name and group_db_name in TABLE_MAPPING:
-                group["allowed_tables"] = TABLE_MAPPING[group_db_name]
-            else:
-                # 默认使用网球表（向后兼容）
-                group["allowed_tables"] = ALLOWED_TABLES
+        _prepare_group(group, defaults, database_configs, prompt_cache, compact_schema=compact_schema)
+        group["questions"] = [_question_text(group, question) for question in group.get("questions", [])]
     
     return test_groups, defaults
 
 
-def run_tests(testcase_file: str, openai_model: str = None, google_model: str = None):
-    """运行所有测试"""
-    print("=" * 80)
-    print("Text2SQL 能力测试")
-    print("=" * 80)
-    print(f"测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("=" * 80)
-    
-    # 加载测试用例
-    test_groups, defaults = load_test_cases(testcase_file)
-    
-    total_questions = sum(len(group.get("questions", [])) for group in test_groups)
-    print(f"\n加载了 {len(test_groups)} 个测试组，共 {total_questions} 个测试问题\n")
+def iter_test_cases_jsonl(testcase_file: str, compact_schema: bool = False) -> Iterator[Tuple[Dict, str, Dict]]:
+    """逐行读取 JSONL 格式的测试用例，惰性产出 (测试组, 问题, 默认配置)
+
+    每行一个 JSON 对象：
+        {"type": "config", "database": {...}, "default_prompt": "...", "default_openai_model": [...]}
+        {"type": "group", "name": "tennis", "database_name": "tennis", "prompt": "...", "questions": [...]}
+        {"question": "...", "group": "tennis"}    # 省略 group 时属于最近一个测试组；可选 "tags": [...]
+
+    config 行只影响其后的测试组；questions 字段可选。测试组对象只保留配置（不保存问题列表），
+    相同的提示词只补充一次表结构并共享，内存占用与问题数量无关。compact_schema 同 load_test_cases。
+
+    Raises:
+        ValueError: 某一行不是合法的 JSON 对象
+    """
+    defaults = _build_defaults({})
+    database_configs: Dict = {}
+    prompt_cache: Dict = {}
+    groups: Dict[str, Dict] = {}
+    current = None
     
+    with open(testcase_file, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{testcase_file} 第 {line_no} 行不是合法的 JSON: {e}") from e
+            if not isinstance(record, dict):
+                raise ValueError(f"{testcase_file} 第 {line_no} 行必须是 JSON 对象")
+            
+            record_type = record.get("type") or ("question" if "question" in record else "group")
+            if record_type == "config":
+                if any(key in record for key in ("default_prompt", "default_openai_model", "default_google_model",
+                                                 "model_concurrency")):
+                    defaults = _build_defaults(record)
+                database_configs.update(record.get("database", {}))
+            elif record_type == "group":
+                questions = record.pop("questions", None) or []
+                record.pop("type", None)
+                record.setdefault("name", f"测试组{len(groups) + 1}")
+                current = _prepare_group(record, defaults, database_configs, prompt_cache,
+                                         compact_schema=compact_schema)
+                groups[current["name"]] = current
+                for question in questions:
+                    yield current, _question_text(current, question), defaults
+            elif record_type == "question":
+                group = groups.get(record["group"]) if record.get("group") else current
+                if group is None:
+                    group_name = record.get("group") or "默认测试组"
+                    group = _prepare_group({"name": group_name}, defaults, database_configs, prompt_cache,
+                                           compact_schema=compact_schema)
+                    groups[group_name] = group
+                    current = group
+                yield group, _question_text(group, record), defaults
+            else:
+                raise ValueError(f"{testcase_file} 第 {line_no} 行的类型未知: {record_type}")
+
+
+def compute_work_item_hash(question: str, prompt: str, model_type: str, model_name: str,
+                           allowed_tables: set = None, db_name: str = None, db_config: Dict = None) -> str:
+    """计算单个测试项（问题 × 提示词 × 模型 × 数据库）的输入内容哈希
+
+    数据库配置只取标识字段（不含密码），测试框架版本变化时所有哈希都会改变。
+
+    Returns:
+        str: sha256 十六进制摘要
+    """
+    db_config = db_config or {}
+    payload = {
+        "harness_version": HARNESS_VERSION,
+        "question": question,
+        "prompt": prompt,
+        "model_type": model_type,
+        "model_name": model_name,
+        "allowed_tables": sorted(allowed_tables or ALLOWED_TABLES),
+        "db": {
+            "name": db_name,
+            "host": db_config.get("host"),
+            "port": db_config.get("port"),
+            "user": db_config.get("user"),
+            "database": db_config.get("database"),
+        },
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def load_previous_results(results_file: str) -> Dict[str, Dict]:
+    """加载上一次运行的结果，按输入哈希建立索引
+
+    Args:
+        results_file: 之前保存的 test_results.json（或流式运行输出的 test_results.jsonl）路径
+
+    Returns:
+        Dict[str, Dict]: {输入哈希: 测试结果}，文件不存在或格式不符时返回空字典
+    """
+    if not results_file or not os.path.exists(results_file):
+        return {}
+
+    previous = {}
+    try:
+        for result in report.iter_result_rows([results_file]):
+            input_hash = result.get("input_hash")
+            # 被停止信号中止或被熔断器跳过的测试项没有真正执行完，下次总是重新执行
+            if input_hash and result.get("failed_stage") != "cancelled" and not result.get("circuit_open"):
+                previous[input_hash] = result
+    except (OSError, ValueError) as e:
+        print(f"警告: 无法读取历史结果文件 {results_file}: {e}")
+        return {}
+    return previous
+
+
+def _json_default(obj):
+    """json.dump 的兜底序列化（集合转换为有序列表）"""
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _format_compaction(stats: Dict) -> str:
+    """紧凑表结构前后的提示词 token 数"""
+    return (f"提示词 {stats['tokens_before']} → {stats['tokens_after']} tokens"
+            f"（-{stats['saved_rate']:.1f}%）")
+
+
+def _print_result(result: Dict) -> None:
+    """打印单个测试结果"""
+    if result.get("reused"):
+        print(f"    ↺ 输入未变化，复用上次结果")
+    elif result.get("cache_hit"):
+        source = result["cache_source"]
+        print(f"    ≈ 命中问题缓存（相似度 {source['similarity']:.2f}）: {source['question']}")
+    if result.get("is_dangerous"):
+        print(f"    ⚠️  危险 SQL 检测: {result['dangerous_keyword']}")
+        print(f"    SQL: {result['sql']}")
+    elif result["success"]:
+        print(f"    ✓ SQL 执行成功，返回 {result['result_count']} 条记录")
+        print(f"    SQL: {result['sql']}")
+    else:
+        print(f"    ✗ 失败: {result['error']}")
+        if result["sql"]:
+            print(f"    SQL: {result['sql']}")
+
+
+def _run_work_item(question: str, model_type: str, model_name: str, group_name: str, group_prompt: str,
+                   db_name: str, db_config: Optional[Dict], allowed_tables: set,
+                   previous_results: Optional[Dict[str, Dict]] = None, retry_failed: bool = False,
+                   question_cache=None, item_deadline: Optional[float] = None, shutdown=None,
+                   row_storage=None) -> Dict:
+    """执行单个测试项（问题 × 模型）：优先复用历史结果，其次查问题缓存，最后调用模型
+
+    Args:
+        item_deadline: 测试项的时间预算（秒），覆盖生成、重试和数据库执行；为空时不限制
+        shutdown: GracefulShutdown 实例；测试项执行期间被停止信号中止时记为 cancelled
+        row_storage: 结果行存储（row_store.RowStore）；指定后成功结果的完整行写入存储，结果中只保留哈希和样本
+
+    Returns:
+        Dict: 测试结果（已记录到实时指标）
+    """
+    input_hash = compute_work_item_hash(question, group_prompt, model_type, model_name,
+                                        allowed_tables=allowed_tables, db_name=db_name,
+                                        db_config=db_config)
+    previous = previous_results.get(input_hash) if previous_results else None
+    if previous is not None and (previous.get("success") or not retry_failed):
+        result = dict(previous)
+        result["reused"] = True
+    else:
+        cache_scope = question_cache.scope(group_name, model_type, model_name) if question_cache else None
+        cached = question_cache.lookup(question, cache_scope) if question_cache else None
+        metrics.INFLIGHT_REQUESTS.inc()
+        try:
+            with deadline.scope(item_deadline), (shutdown.in_flight() if shutdown else contextlib.nullcontext()):
+                if cached is not None:
+                    entry, similarity = cached
+                    result = run_known_sql(question, entry["sql"], model_type, model_name,
+                                           db_name=db_name, db_config=db_config,
+                                           allowed_tables=allowed_tables, include_rows=row_storage is not None,
+                                           prompt=group_prompt)
+                    result["cache_hit"] = True
+                    result["cache_source"] = question_cache.record_hit(question, entry, similarity)
+                else:
+                    result = test_question(question, group_prompt, model_type, model_name,
+                                           db_name=db_name, db_config=db_config,
+                                           allowed_tables=allowed_tables, include_rows=row_storage is not None)
+                    if question_cache and result["success"]:
+                        question_cache.add(question, cache_scope, result["sql"])
+        except deadline.Cancelled as e:
+            result = _new_result(question, group_prompt, model_type, model_name, db_name)
+            result["error"] = f"运行被 {e} 中止"
+            result["failed_stage"] = "cancelled"
+        finally:
+            metrics.INFLIGHT_REQUESTS.dec()
+        if row_storage is not None and "rows" in result:
+            row_storage.store(result, result.pop("rows"))
+        result["reused"] = False
+    result["input_hash"] = input_hash
+    result["group_name"] = group_name
+    metrics.record_result(result)
+    return result
+
+
+def _run_model_questions(model_type: str, model_name: str, group_name: str, group_prompt: str,
+                         questions: List[str], db_name: str, db_config: Optional[Dict],
+                         allowed_tables: set, previous_results: Optional[Dict[str, Dict]] = None,
+                         retry_failed: bool = False, question_cache=None, row_storage=None,
+                         item_deadline: Optional[float] = None, shutdown=None) -> List[Dict]:
+    """使用一个模型测试一个测试组的全部问题
+
+    Args:
+        previous_results: 历史结果索引（增量运行时提供），输入哈希命中的问题直接复用
+        retry_failed: 增量运行时是否重新执行上次失败的问题
+        question_cache: 近似重复问题缓存（QuestionCache），命中时复用已验证的 SQL，跳过模型调用
+        row_storage: 结果行存储（row_store.RowStore），为空时只记录 result_count
+        item_deadline: 每个测试项的时间预算（秒）
+        shutdown: GracefulShutdown 实例；收到停止信号后不再开始新的问题
+
+    Returns:
+        List[Dict]: 测试结果列表
+    """
+    label = "OpenAI" if model_type == "openai" else "Google"
+    results = []
+    for i, question in enumerate(questions, 1):
+        if shutdown and shutdown.requested:
+            break
+        print(f"\n  [{i}/{len(questions)}] {label} ({model_name}) - {question}")
+        result = _run_work_item(question, model_type, model_name, group_name, group_prompt,
+                                db_name, db_config, allowed_tables, previous_results=previous_results,
+                                retry_failed=retry_failed, question_cache=question_cache,
+                                row_storage=row_storage, item_deadline=item_deadline, shutdown=shutdown)
+        results.append(result)
+        _print_result(result)
+    return results
+
+
+def _run_group_interleaved(evaluator: "early_stop.SequentialEvaluator", group_name: str, group_prompt: str,
+                           questions: List[str], db_name: str, db_config: Optional[Dict], allowed_tables: set,
+                           all_results: Dict, previous_results: Optional[Dict[str, Dict]] = None,
+                           retry_failed: bool = False, question_cache=None, row_storage=None,
+                           item_deadline: Optional[float] = None, shutdown=None) -> None:
+    """顺序提前停止模式：按问题交替执行各模型，每轮后停止已被支配或成功率已确定的模型
+
+    结果追加到 all_results（{model_type: {model_name: [结果]}}），跳过的测试项记录在 evaluator 中。
+    """
+    ordered = early_stop.shuffled(questions, group_name)
+    for i, question in enumerate(ordered, 1):
+        if shutdown and shutdown.requested:
+            break
+        active = evaluator.active()
+        for model in evaluator.models:
+            if model not in active:
+                evaluator.skip(model)
+                continue
+            model_type, model_name = model
+            label = "OpenAI" if model_type == "openai" else "Google"
+            print(f"\n  [{i}/{len(ordered)}] {label} ({model_name}) - {question}")
+            result = _run_work_item(question, model_type, model_name, group_name, group_prompt,
+                                    db_name, db_config, allowed_tables, previous_results=previous_results,
+                                    retry_failed=retry_failed, question_cache=question_cache,
+                                    row_storage=row_storage, item_deadline=item_deadline, shutdown=shutdown)
+            _print_result(result)
+            all_results[model_type].setdefault(model_name, []).append(result)
+            if result["failed_stage"] != "cancelled":
+                evaluator.record(model, result["success"])
+        for (_, model_name), reason in evaluator.update():
+            print(f"\n  ⏹ [{group_name}] {model_name} 停止评估: {reason}")
+
+
+# 流水线模式的默认线程数和队列长度
+DEFAULT_PIPELINE_SETTINGS = {
+    "generate_workers": 8,
+    "validate_workers": 1,
+    "execute_workers": 4,
+    "queue_size": pipeline.DEFAULT_QUEUE_SIZE,
+}
+
+
+def _pipeline_task(index: int, question: str, model_type: str, model_name: str, group_name: str,
+                   group_prompt: str, db_name: str, db_config: Optional[Dict], allowed_tables: set) -> Dict:
+    """流水线中的一个测试项（各阶段依次补充 input_hash、result、sql 等字段）"""
+    return {"index": index, "question": question, "model_type": model_type, "model_name": model_name,
+            "group_name": group_name, "prompt": group_prompt, "db_name": db_name, "db_config": db_config,
+            "allowed_tables": allowed_tables, "result": None, "sql": None, "deadline": None,
+            "in_flight": False, "cache_scope": None}
+
+
+def _run_pipelined(tasks: Iterable[Dict], on_result: Callable[[Dict, Dict], None], settings: Dict,
+                   previous_results: Optional[Dict[str, Dict]] = None, retry_failed: bool = False,
+                   question_cache=None, row_storage=None, item_deadline: Optional[float] = None,
+                   shutdown=None) -> List[Dict]:
+    """分阶段流水线执行测试项：生成 → 校验 → 执行 → 写出，各阶段由有界队列连接
+
+    与 _run_work_item 的结果相同，只是生成和数据库执行由不同的线程池并行处理，互不等待。
+    写出阶段只有一个线程，on_result(task, result) 按完成顺序调用（不保证与提交顺序一致）。
+
+    Args:
+        tasks: _pipeline_task 创建的测试项（生产者按需读取，队列满时阻塞）
+        on_result: 每个测试项完成时的回调
+        settings: generate_workers、validate_workers、execute_workers、queue_size
+
+    Returns:
+        List[Dict]: 各阶段的统计（pipeline.Pipeline.snapshot）
+    """
+    include_rows = row_storage is not None
+    completed = [0]
+
+    def cancelled(task: Dict) -> str:
+        result = task["result"] or _new_result(task["question"], task["prompt"], task["model_type"],
+                                               task["model_name"], task["db_name"])
+        result["success"] = False
+        result["error"] = f"运行被 {shutdown.signal_name if shutdown else '停止信号'} 中止"
+        result["failed_stage"] = "cancelled"
+        task["result"] = result
+        return "write"
+
+    def failed(task: Dict, error: Exception) -> str:
+        result = task["result"] or _new_result(task["question"], task["prompt"], task["model_type"],
+                                               task["model_name"], task["db_name"])
+        result["success"] = False
+        result["error"] = f"流水线执行异常: {error}"
+        result["failed_stage"] = "harness"
+        task["result"] = result
+        return "write"
+
+    def generate(task: Dict) -> Optional[str]:
+        if runner.cancelled:
+            return cancelled(task)
+        try:
+            task["input_hash"] = compute_work_item_hash(task["question"], task["prompt"], task["model_type"],
+                                                        task["model_name"], allowed_tables=task["allowed_tables"],
+                                                        db_name=task["db_name"], db_config=task["db_config"])
+            previous = previous_results.get(task["input_hash"]) if previous_results else None
+            if previous is not None and (previous.get("success") or not retry_failed):
+                task["result"] = dict(previous)
+                task["result"]["reused"] = True
+                return "write"
+            metrics.INFLIGHT_REQUESTS.inc()
+            task["in_flight"] = True
+            task["deadline"] = deadline.Deadline(item_deadline) if item_deadline and item_deadline > 0 else None
+            result = task["result"] = _new_result(task["question"], task["prompt"], task["model_type"],
+                                                  task["model_name"], task["db_name"])
+            if question_cache:
+                task["cache_scope"] = question_cache.scope(task["group_name"], task["model_type"],
+                                                           task["model_name"])
+                cached = question_cache.lookup(task["question"], task["cache_scope"])
+                if cached is not None:
+                    entry, similarity = cached
+                    result["generation_time"] = 0.0
+                    result["cache_hit"] = True
+                    result["cache_source"] = question_cache.record_hit(task["question"], entry, similarity)
+                    task["sql"] = entry["sql"]
+                    return "validate"
+            with deadline.attach(task["deadline"]), tracing.span("pipeline.generate", model=task["model_name"]):
+                task["sql"] = generate_sql(result, task["question"], task["prompt"], task["model_type"],
+                                           task["model_name"])
+            return "write" if task["sql"] is None else "validate"
+        except Exception as e:
+            return failed(task, e)
+
+    def validate(task: Dict) -> Optional[str]:
+        if runner.cancelled:
+            return cancelled(task)
+        try:
+            with tracing.span("pipeline.validate"):
+                ok = validate_sql(task["result"], task["sql"], task["allowed_tables"])
+            return "execute" if ok else "write"
+        except Exception as e:
+            return failed(task, e)
+
+    def execute(task: Dict) -> Optional[str]:
+        if runner.cancelled:
+            return cancelled(task)
+        try:
+            with deadline.attach(task["deadline"]), tracing.span("pipeline.execute", db=task["db_name"]):
+                execute_validated_sql(task["result"], db_name=task["db_name"], db_config=task["db_config"],
+                                      include_rows=include_rows)
+            return "write"
+        except Exception as e:
+            return failed(task, e)
+
+    def write(task: Dict) -> Optional[str]:
+        result = task["result"]
+        if task["in_flight"]:
+            metrics.INFLIGHT_REQUESTS.dec()
+        if not result.get("reused"):
+            if (question_cache and not result.get("cache_hit") and result["success"]
+                    and task["cache_scope"] is not None):
+                question_cache.add(task["question"], task["cache_scope"], result["sql"])
+            if row_storage is not None and "rows" in result:
+                row_storage.store(result, result.pop("rows"))
+            result["reused"] = False
+        result["input_hash"] = task.get("input_hash") or compute_work_item_hash(
+            task["question"], task["prompt"], task["model_type"], task["model_name"],
+            allowed_tables=task["allowed_tables"], db_name=task["db_name"], db_config=task["db_config"])
+        result["group_name"] = task["group_name"]
+        metrics.record_result(result)
+        completed[0] += 1
+        label = "OpenAI" if task["model_type"] == "openai" else "Google"
+        print(f"\n  [{completed[0]}] [{task['group_name']}] {label} ({task['model_name']}) - {task['question']}")
+        _print_result(result)
+        on_result(task, result)
+        return pipeline.DONE
+
+    runner = pipeline.Pipeline([
+        pipeline.Stage("generate", generate, settings["generate_workers"]),
+        pipeline.Stage("validate", validate, settings["validate_workers"]),
+        pipeline.Stage("execute", execute, settings["execute_workers"]),
+        pipeline.Stage("write", write, 1),
+    ], queue_size=settings["queue_size"])
+    runner.start()
+    try:
+        # 主线程是生产者：队列满时在 submit 处阻塞；第二次停止信号或宽限期结束时在此抛出 Cancelled
+        with (shutdown.in_flight() if shutdown else contextlib.nullcontext()):
+            for task in tasks:
+                if shutdown and shutdown.requested:
+                    break
+                runner.submit(task)
+            runner.close()
+    except deadline.Cancelled:
+        # 尚未开始的阶段直接记为 cancelled，进行中的模型调用和查询返回后即结束
+        runner.cancel()
+        runner.close()
+    for error in runner.failures:
+        print(f"⚠️  流水线阶段异常: {error}", file=sys.stderr)
+    return runner.snapshot()
+
+
+def _prompt_digest(prompt: str, digests: Dict[str, str]) -> str:
+    """提示词的短哈希（按对象缓存，驻留的提示词只计算一次）"""
+    digest = digests.get(prompt)
+    if digest is None:
+        digest = digests[prompt] = history.prompt_hash(prompt)
+    return digest
+
+
+def _run_tests_streaming(testcase_file: str, output_file: str, openai_model: str = None,
+                         google_model: str = None, previous_results: Optional[Dict[str, Dict]] = None,
+                         retry_failed: bool = False, question_cache=None, row_storage=None,
+                         item_deadline: Optional[float] = None, shutdown=None,
+                         early_stop_settings: Optional[Dict] = None, compact_schema: bool = False,
+                         pipeline_settings: Optional[Dict] = None,
+                         sampler: Optional[sampling.StratifiedSampler] = None) -> Dict:
+    """流式运行 JSONL 测试用例
+
+    边读边执行：每读到一个问题就依次交给各模型，结果逐行追加到 output_file（JSONL），
+    只在内存中保留列式统计数据，内存占用不随测试规模增长。结果中的提示词以 prompt_hash 代替。
+    收到停止信号后不再读取新的问题，已写出的结果保持完整。
+    指定 early_stop_settings 时按测试组做顺序提前停止（问题按文件顺序，不打乱）。
+    指定 pipeline_settings 时测试项交给分阶段流水线并行执行，结果按完成顺序写出。
+    指定 sampler（已分配样本量）时只运行选中的问题，统计信息中加入外推结果。
+
+    Returns:
+        Dict: report.aggregate 的统计结果
+    """
+    columns = report.ResultColumns()
+    prompt_digests: Dict[str, str] = {}
+    current_group = None
+    current_defaults = None
+    evaluators: Dict[str, early_stop.SequentialEvaluator] = {}
+    pipeline_stats = None
+    count = 0
+    with open(output_file, 'w', encoding='utf-8') as out:
+        def write_result(result: Dict) -> None:
+            if result.get("prompt") is not None:
+                result["prompt_hash"] = _prompt_digest(result.pop("prompt"), prompt_digests)
+            columns.append(result)
+            if sampler:
+                sampler.record(result)
+            out.write(json.dumps(result, ensure_ascii=False, default=_json_default) + "\n")
+            out.flush()
+
+        if pipeline_settings is not None:
+            def produce() -> Iterator[Dict]:
+                produced_group = produced_defaults = None
+                index = 0
+                for group, question, defaults in _sampled(iter_test_cases_jsonl(testcase_file,
+                                                                                compact_schema=compact_schema),
+                                                          sampler):
+                    if defaults is not produced_defaults:
+                        produced_defaults = defaults
+                        concurrency.REGISTRY.configure(defaults["model_concurrency"])
+                    model_plan = _streaming_model_plan(group, openai_model, google_model)
+                    if group is not produced_group:
+                        produced_group = group
+                        _print_streaming_group_header(group, model_plan)
+                    for model_type, model_name in model_plan:
+                        yield _pipeline_task(index, question, model_type, model_name, group["name"],
+                                             group["prompt"], group["db_name"], group["db_config"],
+                                             group["allowed_tables"])
+                        index += 1
+
+            pipeline_stats = _run_pipelined(produce(), lambda task, result: write_result(result), pipeline_settings,
+                                            previous_results=previous_results, retry_failed=retry_failed,
+                                            question_cache=question_cache, row_storage=row_storage,
+                                            item_deadline=item_deadline, shutdown=shutdown)
+        
+        # 非流水线模式：逐个问题依次交给各模型
+        cases = () if pipeline_settings is not None else _sampled(
+            iter_test_cases_jsonl(testcase_file, compact_schema=compact_schema), sampler)
+        for group, question, defaults in cases:
+            if shutdown and shutdown.requested:
+                break
+            if defaults is not current_defaults:
+                current_defaults = defaults
+                concurrency.REGISTRY.configure(defaults["model_concurrency"])
+            model_plan = _streaming_model_plan(group, openai_model, google_model)
+            evaluator = None
+            if early_stop_settings is not None:
+                evaluator = evaluators.get(group["name"])
+                if evaluator is None:
+                    evaluator = evaluators[group["name"]] = early_stop.SequentialEvaluator(
+                        group["name"], model_plan, **early_stop_settings)
+            if group is not current_group:
+                current_group = group
+                _print_streaming_group_header(group, model_plan)
+            active = evaluator.active() if evaluator else model_plan
+            for model_type, model_name in model_plan:
+                if shutdown and shutdown.requested:
+                    break
+                if (model_type, model_name) not in active:
+                    evaluator.skip((model_type, model_name))
+                    continue
+                count += 1
+                label = "OpenAI" if model_type == "openai" else "Google"
+                print(f"\n  [{count}] {label} ({model_name}) - {question}")
+                result = _run_work_item(question, model_type, model_name, group["name"], group["prompt"],
+                                        group["db_name"], group["db_config"], group["allowed_tables"],
+                                        previous_results=previous_results, retry_failed=retry_failed,
+                                        question_cache=question_cache, row_storage=row_storage,
+                                        item_deadline=item_deadline, shutdown=shutdown)
+                _print_result(result)
+                write_result(result)
+                if evaluator and result["failed_stage"] != "cancelled":
+                    evaluator.record((model_type, model_name), result["success"])
+            if evaluator:
+                for (_, model_name), reason in evaluator.update():
+                    print(f"\n  ⏹ [{group['name']}] {model_name} 停止评估: {reason}")
+    statistics = report.aggregate(columns)
+    statistics["concurrency"] = concurrency.REGISTRY.snapshot()
+    statistics["replicas"] = replica_snapshots()
+    statistics["context_cache"] = context_cache.REGISTRY.snapshot()
+    statistics["server_metrics"] = server_metrics.summarize(statistics["models"])
+    statistics["schema_validation"] = sql_validator.VALIDATOR.snapshot()
+    statistics["circuit_breakers"] = circuit_breaker.REGISTRY.snapshot()
+    if early_stop_settings is not None:
+        statistics["early_stopping"] = early_stop.summarize(list(evaluators.values()), **early_stop_settings)
+    if pipeline_stats is not None:
+        statistics["pipeline"] = pipeline_stats
+    statistics["sampling"] = sampler.summary() if sampler else None
+    return statistics
+
+
+def _sampled(cases: Iterator[Tuple[Dict, str, Dict]],
+             sampler: Optional[sampling.StratifiedSampler]) -> Iterator[Tuple[Dict, str, Dict]]:
+    return sampler.filter(cases) if sampler else cases
+
+
+def _streaming_model_plan(group: Dict, openai_model: Optional[str], google_model: Optional[str]) -> List[Tuple[str, str]]:
+    """流式模式下一个测试组要测试的 (model_type, model_name)（命令行参数优先，跳过未安装的 SDK）"""
+    model_plan = []
+    if sdk_available("genai"):
+        model_plan += [("google", m) for m in ([google_model] if google_model else group["google_model"])]
+    if sdk_available("openai"):
+        model_plan += [("openai", m) for m in ([openai_model] if openai_model else group["openai_model"])]
+    return model_plan
+
+
+def _print_streaming_group_header(group: Dict, model_plan: List[Tuple[str, str]]) -> None:
+    print("\n" + "=" * 80)
+    print(f"测试组: {group['name']}（数据库: {group['db_name']}，"
+          f"模型: {', '.join(m for _, m in model_plan) or '无可用模型'}）")
+    if "schema_compaction" in group:
+        print(f"紧凑表结构: {_format_compaction(group['schema_compaction'])}")
+    print("=" * 80)
+
+
+def _run_groups(test_groups: List[Dict], defaults: Dict, openai_model: str = None, google_model: str = None,
+                previous_results: Optional[Dict[str, Dict]] = None, retry_failed: bool = False,
+                question_cache=None, row_storage=None, item_deadline: Optional[float] = None,
+                shutdown=None, early_stop_settings: Optional[Dict] = None,
+                evaluators: Optional[List["early_stop.SequentialEvaluator"]] = None,
+                pipeline_settings: Optional[Dict] = None, pipeline_stats: Optional[List[Dict]] = None) -> Dict:
+    """依次用各模型测试所有测试组（收到停止信号后不再开始新的测试组、模型或问题）
+
+    Args:
+        early_stop_settings: 顺序提前停止参数（confidence、min_samples、tolerance）；指定后同组模型按问题交替执行
+        evaluators: 可选的列表，提前停止模式下每个测试组的 SequentialEvaluator 会追加到其中
+        pipeline_settings: 流水线参数（见 DEFAULT_PIPELINE_SETTINGS）；指定后全部测试项交给分阶段流水线并行执行
+        pipeline_stats: 可选的列表，流水线模式下各阶段的统计会追加到其中
+
+    Returns:
+        Dict: {"openai": {模型: [结果]}, "google": {模型: [结果]}}
+    """
     # 测试结果：按模型类型和模型名称组织
     all_results = {
         "openai": {},
         "google": {}
     }
+    # 流水线模式：先列出全部测试项，结果按提交顺序放回 all_results
+    tasks = []
     
     # 遍历每个测试组
     for group_idx, group in enumerate(test_groups, 1):
+        if shutdown and shutdown.requested:
+            break
         group_name = group.get("name", f"测试组{group_idx}")
         group_prompt = group.get("prompt", defaults["prompt"])
         
@@ -995,65 +2162,251 @@ def run_tests(testcase_file: str, openai_model: str = None, google_model: str =
         print(f"  问题数量: {len(questions)}")
         print("=" * 80)
         
+        if pipeline_settings is not None:
+            models = [("google", m) for m in group_google_models] if sdk_available("genai") else []
+            models += [("openai", m) for m in group_openai_models] if sdk_available("openai") else []
+            for model_type, model_name in models:
+                for question in questions:
+                    tasks.append(_pipeline_task(len(tasks), question, model_type, model_name, group_name,
+                                                group_prompt, group_db_name, group_db_config, group_allowed_tables))
+            continue
+        
+        if early_stop_settings is not None:
+            models = [("google", m) for m in group_google_models] if sdk_available("genai") else []
+            models += [("openai", m) for m in group_openai_models] if sdk_available("openai") else []
+            evaluator = early_stop.SequentialEvaluator(group_name, models, max_questions=len(questions),
+                                                       **early_stop_settings)
+            if evaluators is not None:
+                evaluators.append(evaluator)
+            _run_group_interleaved(evaluator, group_name, group_prompt, questions, group_db_name,
+                                   group_db_config, group_allowed_tables, all_results,
+                                   previous_results=previous_results, retry_failed=retry_failed,
+                                   question_cache=question_cache, row_storage=row_storage,
+                                   item_deadline=item_deadline, shutdown=shutdown)
+            continue
+        
         # 测试 Google 模型（遍历所有配置的模型）- 先测试 Google
-        if genai:
+        if sdk_available("genai"):
             for model_name in group_google_models:
+                if shutdown and shutdown.requested:
+                    break
                 print(f"\n[{group_name}] 开始测试 Google 模型: {model_name}")
-                if model_name not in all_results["google"]:
-                    all_results["google"][model_name] = []
-                
-                for i, question in enumerate(questions, 1):
-                    print(f"\n  [{i}/{len(questions)}] Google ({model_name}) - {question}")
-                    result = test_question(question, group_prompt, "google", model_name,
-                                         db_name=group_db_name, db_config=group_db_config,
-                                         allowed_tables=group_allowed_tables)
-                    result["group_name"] = group_name
-                    all_results["google"][model_name].append(result)
-                    if result.get("is_dangerous"):
-                        print(f"    ⚠️  危险 SQL 检测: {result['dangerous_keyword']}")
-                        print(f"    SQL: {result['sql']}")
-                    elif result["success"]:
-                        print(f"    ✓ SQL 执行成功，返回 {result['result_count']} 条记录")
-                        print(f"    SQL: {result['sql']}")
-                    else:
-                        print(f"    ✗ 失败: {result['error']}")
-                        if result["sql"]:
-                            print(f"    SQL: {result['sql']}")
+                model_results = _run_model_questions("google", model_name, group_name, group_prompt, questions,
+                                                     group_db_name, group_db_config, group_allowed_tables,
+                                                     previous_results=previous_results, retry_failed=retry_failed,
+                                                     question_cache=question_cache, row_storage=row_storage,
+                                                     item_deadline=item_deadline, shutdown=shutdown)
+                if model_results:
+                    all_results["google"].setdefault(model_name, []).extend(model_results)
         else:
             print(f"\n[{group_name}] 跳过 Google 测试（库未安装）")
         
         # 测试 OpenAI 模型（遍历所有配置的模型）- 后测试 OpenAI
-        if openai:
+        if sdk_available("openai"):
             for model_name in group_openai_models:
+                if shutdown and shutdown.requested:
+                    break
                 print(f"\n[{group_name}] 开始测试 OpenAI 模型: {model_name}")
-                if model_name not in all_results["openai"]:
-                    all_results["openai"][model_name] = []
-                
-                for i, question in enumerate(questions, 1):
-                    print(f"\n  [{i}/{len(questions)}] OpenAI ({model_name}) - {question}")
-                    result = test_question(question, group_prompt, "openai", model_name, 
-                                         db_name=group_db_name, db_config=group_db_config,
-                                         allowed_tables=group_allowed_tables)
-                    result["group_name"] = group_name
-                    all_results["openai"][model_name].append(result)
-                    if result.get("is_dangerous"):
-                        print(f"    ⚠️  危险 SQL 检测: {result['dangerous_keyword']}")
-                        print(f"    SQL: {result['sql']}")
-                    elif result["success"]:
-                        print(f"    ✓ SQL 执行成功，返回 {result['result_count']} 条记录")
-                        print(f"    SQL: {result['sql']}")
-                    else:
-                        print(f"    ✗ 失败: {result['error']}")
-                        if result["sql"]:
-                            print(f"    SQL: {result['sql']}")
+                model_results = _run_model_questions("openai", model_name, group_name, group_prompt, questions,
+                                                     group_db_name, group_db_config, group_allowed_tables,
+                                                     previous_results=previous_results, retry_failed=retry_failed,
+                                                     question_cache=question_cache, row_storage=row_storage,
+                                                     item_deadline=item_deadline, shutdown=shutdown)
+                if model_results:
+                    all_results["openai"].setdefault(model_name, []).extend(model_results)
         else:
             print(f"\n[{group_name}] 跳过 OpenAI 测试（库未安装）")
     
+    if pipeline_settings is not None:
+        finished = {}
+        stats = _run_pipelined(tasks, lambda task, result: finished.__setitem__(task["index"], result),
+                               pipeline_settings, previous_results=previous_results, retry_failed=retry_failed,
+                               question_cache=question_cache, row_storage=row_storage,
+                               item_deadline=item_deadline, shutdown=shutdown)
+        for index in sorted(finished):
+            result = finished[index]
+            all_results[result["model_type"]].setdefault(result["model_name"], []).append(result)
+        if pipeline_stats is not None:
+            pipeline_stats.extend(stats)
+    
+    return all_results
+
+
+def run_tests(testcase_file: str, openai_model: str = None, google_model: str = None,
+              incremental: bool = False, previous_results_file: str = None,
+              retry_failed: bool = False, metrics_port: int = None, metrics_host: str = "127.0.0.1",
+              question_cache_file: str = None, cache_threshold: float = DEFAULT_CACHE_THRESHOLD,
+              cache_aliases_file: str = None, history_db: Optional[str] = history.DEFAULT_HISTORY_DB,
+              item_deadline: Optional[float] = deadline.DEFAULT_DEADLINE,
+              grace_period: float = deadline.DEFAULT_GRACE_PERIOD,
+              early_stop_settings: Optional[Dict] = None, store_rows_dir: Optional[str] = None,
+              row_sample: int = row_store.DEFAULT_SAMPLE_ROWS, compact_schema: bool = False,
+              pipeline_settings: Optional[Dict] = None, output_file: Optional[str] = None,
+              shutdown: Optional[deadline.GracefulShutdown] = None, sample_size: Optional[Union[int, float]] = None,
+              sample_seed: int = sampling.DEFAULT_SEED) -> Optional[int]:
+    """运行所有测试
+
+    Args:
+        testcase_file: 测试用例文件路径
+        openai_model: OpenAI 模型名称（覆盖配置文件中的设置）
+        google_model: Google 模型名称（覆盖配置文件中的设置）
+        incremental: 是否增量运行（仅执行输入发生变化的测试项）
+        previous_results_file: 增量运行使用的历史结果文件（默认为本次的输出文件）
+        retry_failed: 增量运行时是否重新执行上次失败的测试项
+        metrics_port: 若指定，在该端口以 Prometheus 文本格式暴露实时指标（/metrics）
+        metrics_host: 指标服务监听地址
+        question_cache_file: 近似重复问题缓存文件；指定后相似问题直接复用已验证的 SQL
+        cache_threshold: 问题缓存的相似度阈值（0-1）
+        cache_aliases_file: 问题归一化使用的别名表（JSON，如 {"djokovic": "德约科维奇"}）
+        history_db: 运行历史库路径，结果保存后写入该库（为 None 时不记录）
+        item_deadline: 每个测试项（问题 × 模型）的时间预算（秒），覆盖生成、重试和数据库执行；为空时不限制
+        grace_period: 收到 SIGTERM/SIGINT 后等待进行中测试项的宽限期（秒），之后中止并写出已有结果
+        early_stop_settings: 顺序提前停止参数（confidence、min_samples、tolerance）；为空时每个模型跑完全部问题
+        store_rows_dir: 结果行存储目录；指定后保存成功结果的完整行（压缩、按内容去重），结果中记录哈希和样本
+        row_sample: 结果中保留的样本行数
+        compact_schema: 把提示词中的 DDL 替换为紧凑表结构（去掉排序规则、提取公共列名前缀、去重）
+        pipeline_settings: 分阶段流水线参数（generate_workers、validate_workers、execute_workers、queue_size）；
+            指定后模型生成和数据库执行由各自的线程池并行处理（不能与 early_stop_settings 同时使用）
+        output_file: 结果文件路径（默认为测试用例同目录的 test_results.json / test_results.jsonl）
+        shutdown: 外部创建的 GracefulShutdown（任务调度器通过它的 request() 取消运行）；默认新建一个
+        sample_size: 分层抽样规模（问题数或 0-1 的比例）；指定后只运行按测试组和标签分层抽取的问题，
+            统计信息中给出外推到全部问题的置信区间（抽样运行不写入运行历史）
+        sample_seed: 分层抽样的随机种子
+
+    Returns:
+        Optional[int]: 运行被停止信号中止时返回信号编号，否则返回 None
+    """
+    metrics_server = None
+    if metrics_port:
+        metrics_server = metrics.start_metrics_server(metrics_port, host=metrics_host)
+
+    print("=" * 80)
+    print("Text2SQL 能力测试")
+    print("=" * 80)
+    print(f"测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    if metrics_server:
+        print(f"实时指标: http://{metrics_host}:{metrics_port}/metrics")
+    print("=" * 80)
+    
+    # 加载测试用例（JSONL 测试用例边读边执行，不预先加载）
+    streaming = testcase_file.endswith(".jsonl")
+    sampler = None
+    if streaming:
+        print(f"\n流式读取测试用例: {testcase_file}\n")
+        output_file = output_file or os.path.join(os.path.dirname(testcase_file), "test_results.jsonl")
+        if sample_size:
+            # 先读一遍统计各层的问题数，运行时再逐个决定是否选中
+            sampler = sampling.StratifiedSampler(sample_size, sample_seed)
+            for group, question, _ in iter_test_cases_jsonl(testcase_file):
+                sampler.count(group["name"], sampling.question_tags(group, question))
+            sampler.allocate()
+            print(sampling.format_plan(sampler) + "\n")
+    else:
+        test_groups, defaults = load_test_cases(testcase_file, compact_schema=compact_schema)
+        concurrency.REGISTRY.configure(defaults["model_concurrency"])
+        
+        total_questions = sum(len(group.get("questions", [])) for group in test_groups)
+        print(f"\n加载了 {len(test_groups)} 个测试组，共 {total_questions} 个测试问题\n")
+        if sample_size:
+            sampler = sampling.sample_groups(test_groups, sample_size, sample_seed)
+            print(sampling.format_plan(sampler) + "\n")
+        if compact_schema:
+            print("紧凑表结构:")
+            for group in test_groups:
+                print(f"  [{group['name']}] {_format_compaction(group['schema_compaction'])}")
+            print()
+
+        output_file = output_file or os.path.join(os.path.dirname(testcase_file), "test_results.json")
+
+    # 增量运行：加载历史结果（必须在本次结果覆盖输出文件之前读取）
+    previous_results = None
+    if incremental:
+        previous_results_file = previous_results_file or output_file
+        previous_results = load_previous_results(previous_results_file)
+        print(f"增量运行：从 {previous_results_file} 加载了 {len(previous_results)} 条可复用的历史结果\n")
+
+    question_cache = None
+    if question_cache_file:
+        question_cache = QuestionCache.load(question_cache_file, threshold=cache_threshold,
+                                            aliases=load_aliases(cache_aliases_file))
+        print(f"问题缓存：从 {question_cache_file} 加载了 {len(question_cache.entries)} 条 SQL，"
+              f"相似度阈值 {question_cache.threshold}\n")
+
+    row_storage = None
+    if store_rows_dir:
+        row_storage = row_store.RowStore(store_rows_dir, sample_rows=row_sample)
+        print(f"结果行存储：{store_rows_dir}（每个结果保留 {row_sample} 行样本）\n")
+
+    if streaming:
+        with shutdown or deadline.GracefulShutdown(grace_period) as shutdown:
+            statistics = _run_tests_streaming(testcase_file, output_file, openai_model, google_model,
+                                              previous_results=previous_results, retry_failed=retry_failed,
+                                              question_cache=question_cache, row_storage=row_storage,
+                                              item_deadline=item_deadline, shutdown=shutdown,
+                                              early_stop_settings=early_stop_settings,
+                                              compact_schema=compact_schema, pipeline_settings=pipeline_settings,
+                                              sampler=sampler)
+        print("\n" + report.format_console(statistics))
+        if early_stop_settings is not None:
+            print(early_stop.format_console(statistics["early_stopping"]))
+        if statistics["concurrency"]:
+            print(concurrency.format_console(statistics["concurrency"]))
+        if statistics["replicas"]:
+            print(replicas.format_console(statistics["replicas"]))
+        if statistics["context_cache"]:
+            print(context_cache.format_console(statistics["context_cache"]))
+        if statistics["server_metrics"]:
+            print(server_metrics.format_console(statistics["server_metrics"]))
+        if statistics["schema_validation"]:
+            print(sql_validator.format_console(statistics["schema_validation"]))
+        if statistics["circuit_breakers"]:
+            print(circuit_breaker.format_console(statistics["circuit_breakers"]))
+        if statistics.get("pipeline"):
+            print(pipeline.format_console(statistics["pipeline"]))
+        if statistics["sampling"]:
+            print(sampling.format_console(statistics["sampling"]))
+        if question_cache:
+            question_cache.save()
+            summary = question_cache.summary()
+            print(f"问题缓存: 命中 {summary['hits']}/{summary['lookups']} ({summary['hit_rate']:.2f}%)")
+        if row_storage:
+            print(row_store.format_console(row_storage.summary()))
+        print(f"详细结果已保存到: {output_file}（失败详情可用 report 子命令查看）")
+        _finish_run(output_file, history_db, metrics_server, interrupted=shutdown.signal_name,
+                    sampled=sampler is not None)
+        return shutdown.signal_number
+
+    with shutdown or deadline.GracefulShutdown(grace_period) as shutdown:
+        evaluators = []
+        pipeline_stats = []
+        all_results = _run_groups(test_groups, defaults, openai_model, google_model,
+                                  previous_results=previous_results, retry_failed=retry_failed,
+                                  question_cache=question_cache, row_storage=row_storage,
+                                  item_deadline=item_deadline, shutdown=shutdown,
+                                  early_stop_settings=early_stop_settings, evaluators=evaluators,
+                                  pipeline_settings=pipeline_settings, pipeline_stats=pipeline_stats)
+    
     # 统计结果
     print("\n" + "=" * 80)
     print("测试结果统计")
     print("=" * 80)
     
+    # 一次遍历计算全部聚合，再按模型输出
+    statistics = report.aggregate(report.ResultColumns.from_results(
+        r for model_type in ["google", "openai"] for model_results in all_results[model_type].values()
+        for r in model_results
+    ))
+    statistics["concurrency"] = concurrency.REGISTRY.snapshot()
+    statistics["replicas"] = replica_snapshots()
+    statistics["context_cache"] = context_cache.REGISTRY.snapshot()
+    statistics["server_metrics"] = server_metrics.summarize(statistics["models"])
+    statistics["schema_validation"] = sql_validator.VALIDATOR.snapshot()
+    statistics["circuit_breakers"] = circuit_breaker.REGISTRY.snapshot()
+    model_rows = {(row["model_type"], row["model"]): row for row in statistics["models"]}
+    group_rows = {}
+    for row in statistics["groups"]:
+        group_rows.setdefault((row["model_type"], row["model"]), []).append(row)
+    
     # 先统计 Google，再统计 OpenAI
     for model_type in ["google", "openai"]:
         if not all_results[model_type]:
@@ -1064,38 +2417,39 @@ def run_tests(testcase_file: str, openai_model: str = None, google_model: str =
         
         # 遍历每个模型
         for model_name, model_results in all_results[model_type].items():
-            total = len(model_results)
-            success_count = sum(1 for r in model_results if r["success"])
-            dangerous_count = sum(1 for r in model_results if r.get("is_dangerous", False))
-            safe_count = total - dangerous_count
-            success_rate = (success_count / safe_count * 100) if safe_count > 0 else 0
+            stats = model_rows[(model_type, model_name)]
             
             print(f"\n  模型: {model_name}")
-            print(f"    总问题数: {total}")
-            print(f"    成功执行: {success_count}")
-            print(f"    失败: {safe_count - success_count}")
-            print(f"    ⚠️  危险 SQL: {dangerous_count}")
-            print(f"    安全 SQL 成功率: {success_rate:.2f}%")
-            
-            # 按测试组统计
-            group_stats = {}
-            for result in model_results:
-                group_name = result.get("group_name", "未知组")
-                if group_name not in group_stats:
-                    group_stats[group_name] = {"total": 0, "success": 0, "dangerous": 0}
-                group_stats[group_name]["total"] += 1
-                if result.get("is_dangerous", False):
-                    group_stats[group_name]["dangerous"] += 1
-                elif result["success"]:
-                    group_stats[group_name]["success"] += 1
+            print(f"    总问题数: {stats['total']}")
+            print(f"    成功执行: {stats['success']}")
+            print(f"    失败: {stats['failed']}")
+            print(f"    ⚠️  危险 SQL: {stats['dangerous']}")
+            print(f"    安全 SQL 成功率: {stats['success_rate']:.2f}%")
+            if stats["generation_p50"] is not None:
+                print(f"    生成延迟 p50/p90/p99: {stats['generation_p50']:.2f}s / "
+                      f"{stats['generation_p90']:.2f}s / {stats['generation_p99']:.2f}s")
+            if stats["prompt_tokens"] or stats["completion_tokens"]:
+                cached = (f"（缓存命中 {stats['cached_tokens']}，{stats['cached_rate']:.1f}%）"
+                          if stats["cached_tokens"] else "")
+                print(f"    Token: prompt {stats['prompt_tokens']}{cached}，completion {stats['completion_tokens']}")
+            server = server_metrics.format_model(stats)
+            if server:
+                print(f"    {server}")
+            if incremental:
+                print(f"    复用历史结果: {stats['reused']}，重新执行: {stats['total'] - stats['reused']}")
+            if question_cache:
+                fresh_rate = stats["fresh_success_rate"]
+                print(f"    问题缓存作答: {stats['cache_hits']}，新生成成功率: "
+                      f"{'-' if fresh_rate is None else f'{fresh_rate:.2f}%'}")
             
             # 按组显示统计
-            if len(group_stats) > 1:
+            model_group_rows = group_rows.get((model_type, model_name), [])
+            if len(model_group_rows) > 1:
                 print(f"\n    按测试组统计:")
-                for group_name, stats in group_stats.items():
-                    safe_total = stats["total"] - stats["dangerous"]
-                    group_rate = (stats["success"] / safe_total * 100) if safe_total > 0 else 0
-                    print(f"      {group_name}: 成功 {stats['success']}/{safe_total}, 危险 {stats['dangerous']} ({group_rate:.2f}%)")
+                for group_stats in model_group_rows:
+                    safe_total = group_stats["total"] - group_stats["dangerous"]
+                    print(f"      {group_stats['group']}: 成功 {group_stats['success']}/{safe_total}, "
+                          f"危险 {group_stats['dangerous']} ({group_stats['success_rate']:.2f}%)")
             
             # 显示危险 SQL 详情
             dangerous_cases = [r for r in model_results if r.get("is_dangerous", False)]
@@ -1117,26 +2471,43 @@ def run_tests(testcase_file: str, openai_model: str = None, google_model: str =
                         print(f"         SQL: {failure['sql']}")
         
         # 总体统计（所有模型）
-        all_model_results = []
-        for model_results in all_results[model_type].values():
-            all_model_results.extend(model_results)
-        
-        if all_model_results:
-            total_all = len(all_model_results)
-            success_all = sum(1 for r in all_model_results if r["success"])
-            dangerous_all = sum(1 for r in all_model_results if r.get("is_dangerous", False))
-            safe_all = total_all - dangerous_all
-            rate_all = (success_all / safe_all * 100) if safe_all > 0 else 0
+        overall = statistics["overall"].get(model_type)
+        if overall:
             print(f"\n  {model_type.upper()} 总体统计（所有模型）:")
-            print(f"    总问题数: {total_all}")
-            print(f"    成功执行: {success_all}")
-            print(f"    失败: {safe_all - success_all}")
-            print(f"    ⚠️  危险 SQL: {dangerous_all}")
-            print(f"    安全 SQL 总成功率: {rate_all:.2f}%")
+            print(f"    总问题数: {overall['total']}")
+            print(f"    成功执行: {overall['success']}")
+            print(f"    失败: {overall['failed']}")
+            print(f"    ⚠️  危险 SQL: {overall['dangerous']}")
+            print(f"    安全 SQL 总成功率: {overall['success_rate']:.2f}%")
+    
+    if statistics["concurrency"]:
+        print("\n" + concurrency.format_console(statistics["concurrency"]))
+    if statistics["replicas"]:
+        print("\n" + replicas.format_console(statistics["replicas"]))
+    if statistics["context_cache"]:
+        print("\n" + context_cache.format_console(statistics["context_cache"]))
+    if statistics["server_metrics"]:
+        print("\n" + server_metrics.format_console(statistics["server_metrics"]))
+    if statistics["schema_validation"]:
+        print("\n" + sql_validator.format_console(statistics["schema_validation"]))
+    if statistics["circuit_breakers"]:
+        print("\n" + circuit_breaker.format_console(statistics["circuit_breakers"]))
+    if pipeline_settings is not None:
+        statistics["pipeline"] = pipeline_stats
+        print("\n" + pipeline.format_console(pipeline_stats))
+    if early_stop_settings is not None:
+        statistics["early_stopping"] = early_stop.summarize(evaluators, **early_stop_settings)
+        print("\n" + early_stop.format_console(statistics["early_stopping"]))
+    statistics["sampling"] = None
+    if sampler:
+        for model_type in ["google", "openai"]:
+            for model_results in all_results[model_type].values():
+                for result in model_results:
+                    sampler.record(result)
+        statistics["sampling"] = sampler.summary()
+        print("\n" + sampling.format_console(statistics["sampling"]))
     
     # 保存详细结果到 JSON 文件
-    output_file = os.path.join(os.path.dirname(testcase_file), "test_results.json")
-    
     # 将结果转换为扁平化格式以便保存
     flattened_results = {
         "openai": [],
@@ -1146,29 +2517,72 @@ def run_tests(testcase_file: str, openai_model: str = None, google_model: str =
         for model_name, model_results in all_results[model_type].items():
             flattened_results[model_type].extend(model_results)
     
+    output = {
+        "test_time": datetime.now().isoformat(),
+        "harness_version": HARNESS_VERSION,
+        "interrupted": shutdown.signal_name,
+        "test_groups": test_groups,
+        "defaults": defaults,
+        "results": all_results,
+        "statistics": statistics,
+        "results_flat": flattened_results  # 扁平化结果，便于查看
+    }
+    if question_cache:
+        question_cache.save()
+        output["question_cache"] = question_cache.summary()
+        print(f"\n问题缓存: 命中 {question_cache.hits}/{question_cache.lookups} "
+              f"({output['question_cache']['hit_rate']:.2f}%)，缓存条目 {len(question_cache.entries)}")
+    if row_storage:
+        output["row_store"] = row_storage.summary()
+        print("\n" + row_store.format_console(output["row_store"]))
+
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump({
-            "test_time": datetime.now().isoformat(),
-            "test_groups": test_groups,
-            "defaults": defaults,
-            "results": all_results,
-            "results_flat": flattened_results  # 扁平化结果，便于查看
-        }, f, ensure_ascii=False, indent=2)
+        json.dump(output, f, ensure_ascii=False, indent=2, default=_json_default)
     
     print(f"\n详细结果已保存到: {output_file}")
+    _finish_run(output_file, history_db, metrics_server, interrupted=shutdown.signal_name,
+                sampled=sampler is not None)
+    return shutdown.signal_number
+
+
+def _finish_run(output_file: str, history_db: Optional[str], metrics_server=None,
+                interrupted: Optional[str] = None, sampled: bool = False) -> None:
+    """运行结束：结果写入历史库并关闭指标服务
+
+    Args:
+        interrupted: 运行被中止时的信号名；不完整的运行不写入历史库，避免干扰趋势和回归对比
+        sampled: 是否为抽样运行（同样不写入历史库）
+    """
+    if interrupted:
+        print(f"⚠️  运行被 {interrupted} 中止，以上为已完成部分的结果（未写入运行历史）")
+    elif sampled and history_db:
+        print("抽样运行，未写入运行历史")
+    elif history_db:
+        try:
+            with contextlib.closing(history.connect(history_db)) as conn:
+                run_id = history.ingest(conn, output_file)
+            print(f"已写入运行历史: {history_db}（运行 #{run_id}）")
+        except Exception as e:
+            print(f"警告: 写入运行历史失败: {e}")
     print("=" * 80)
 
+    if metrics_server:
+        metrics_server.shutdown()
 
-if __name__ == "__main__":
-    import argparse
 
-    
+def build_arg_parser() -> argparse.ArgumentParser:
+    """运行测试的命令行参数（任务调度器解析提交的任务时也使用）"""
     parser = argparse.ArgumentParser(description="Text2SQL 能力测试脚本")
     parser.add_argument(
         "--testcase",
         default=os.path.join(os.path.dirname(__file__), "testcase.json"),
         help="测试用例文件路径（默认: test_case/testcase.json）"
     )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="结果文件路径（默认: 与测试用例同目录的 test_results.json，JSONL 测试用例为 test_results.jsonl）"
+    )
     parser.add_argument(
         "--openai-model",
         default=None,
@@ -1179,16 +2593,284 @@ if __name__ == "__main__":
         default=None,
         help="Google 模型名称（覆盖配置文件中的设置）"
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="增量运行：只执行输入（问题、提示词、模型、表、数据库）发生变化的测试项，其余复用历史结果"
+    )
+    parser.add_argument(
+        "--previous-results",
+        default=None,
+        help="增量运行使用的历史结果文件（默认: 与测试用例同目录的 test_results.json）"
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="增量运行时重新执行上次失败的测试项"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="在指定端口暴露 Prometheus 格式的实时指标（/metrics），默认不开启"
+    )
+    parser.add_argument(
+        "--metrics-host",
+        default="127.0.0.1",
+        help="指标服务监听地址（默认: 127.0.0.1，需要远程抓取时设为 0.0.0.0）"
+    )
+    parser.add_argument(
+        "--question-cache",
+        default=None,
+        help="近似重复问题缓存文件（JSON，不存在时自动创建）；相似问题直接复用已验证的 SQL，跳过模型调用"
+    )
+    parser.add_argument(
+        "--cache-threshold",
+        type=float,
+        default=DEFAULT_CACHE_THRESHOLD,
+        help=f"问题缓存的相似度阈值，0-1（默认: {DEFAULT_CACHE_THRESHOLD}）"
+    )
+    parser.add_argument(
+        "--cache-aliases",
+        default=None,
+        help="问题归一化使用的别名表 JSON，如 {\"djokovic\": \"德约科维奇\"}"
+    )
+    parser.add_argument(
+        "--history-db",
+        default=history.DEFAULT_HISTORY_DB,
+        help="运行历史库路径（默认: test_case/history.db），每次运行结束后自动入库"
+    )
+    parser.add_argument(
+        "--no-history",
+        action="store_true",
+        help="不把本次运行写入历史库"
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=deadline.DEFAULT_DEADLINE,
+        help=f"每个测试项（问题 × 模型）的时间预算，单位秒，覆盖生成、重试和数据库执行"
+             f"（默认: {deadline.DEFAULT_DEADLINE:g}，0 表示不限制）"
+    )
+    parser.add_argument(
+        "--grace-period",
+        type=float,
+        default=deadline.DEFAULT_GRACE_PERIOD,
+        help=f"收到 SIGTERM/SIGINT 后等待进行中测试项的秒数，之后中止并保存已有结果"
+             f"（默认: {deadline.DEFAULT_GRACE_PERIOD:g}）"
+    )
+    parser.add_argument(
+        "--early-stop",
+        action="store_true",
+        help="顺序提前停止：同组多个模型按问题交替执行，已被其他模型统计上支配或成功率已确定的模型不再继续"
+    )
+    parser.add_argument(
+        "--early-stop-confidence",
+        type=float,
+        default=early_stop.DEFAULT_CONFIDENCE,
+        help=f"提前停止使用的置信水平（默认: {early_stop.DEFAULT_CONFIDENCE}）"
+    )
+    parser.add_argument(
+        "--early-stop-min-samples",
+        type=int,
+        default=early_stop.DEFAULT_MIN_SAMPLES,
+        help=f"每个模型至少执行的问题数（默认: {early_stop.DEFAULT_MIN_SAMPLES}）"
+    )
+    parser.add_argument(
+        "--early-stop-tolerance",
+        type=float,
+        default=early_stop.DEFAULT_TOLERANCE,
+        help=f"成功率置信区间半宽不超过该值（0-1）时停止该模型（默认: {early_stop.DEFAULT_TOLERANCE}）"
+    )
+    parser.add_argument(
+        "--store-rows",
+        nargs="?",
+        const=row_store.DEFAULT_ROW_STORE,
+        default=None,
+        metavar="DIR",
+        help="保存成功结果的完整行（gzip 压缩、按内容去重），结果中记录 row_hash、列类型和样本行"
+             "（默认目录 test_case/row_store）"
+    )
+    parser.add_argument(
+        "--row-sample",
+        type=int,
+        default=row_store.DEFAULT_SAMPLE_ROWS,
+        help=f"结果中保留的样本行数（默认: {row_store.DEFAULT_SAMPLE_ROWS}）"
+    )
+    parser.add_argument(
+        "--compact-schema",
+        action="store_true",
+        help="把提示词中的建表语句替换为紧凑表结构（去掉排序规则等噪声、提取公共列名前缀、去掉重复段落），"
+             "并输出每个测试组提示词压缩前后的 token 数"
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="分阶段流水线：模型生成、SQL 校验、数据库执行和结果写出由各自的线程池处理，"
+             "阶段之间用有界队列连接，输出各阶段的队列深度和利用率"
+    )
+    parser.add_argument(
+        "--generate-workers",
+        type=int,
+        default=DEFAULT_PIPELINE_SETTINGS["generate_workers"],
+        help=f"流水线生成阶段的线程数（默认: {DEFAULT_PIPELINE_SETTINGS['generate_workers']}）"
+    )
+    parser.add_argument(
+        "--validate-workers",
+        type=int,
+        default=DEFAULT_PIPELINE_SETTINGS["validate_workers"],
+        help=f"流水线校验阶段的线程数（默认: {DEFAULT_PIPELINE_SETTINGS['validate_workers']}）"
+    )
+    parser.add_argument(
+        "--execute-workers",
+        type=int,
+        default=DEFAULT_PIPELINE_SETTINGS["execute_workers"],
+        help=f"流水线数据库执行阶段的线程数（默认: {DEFAULT_PIPELINE_SETTINGS['execute_workers']}）"
+    )
+    parser.add_argument(
+        "--stage-queue-size",
+        type=int,
+        default=DEFAULT_PIPELINE_SETTINGS["queue_size"],
+        help=f"流水线各阶段队列的长度上限，队列满时上游阻塞（默认: {DEFAULT_PIPELINE_SETTINGS['queue_size']}）"
+    )
+    parser.add_argument(
+        "--sample",
+        type=sampling.parse_size,
+        default=None,
+        metavar="N|FRACTION",
+        help="分层抽样冒烟运行：按测试组（和问题标签）分层，共抽取 N 个问题或每层抽取 FRACTION 比例的问题，"
+             "统计信息给出外推到全部问题的成功率置信区间（抽样运行不写入运行历史）"
+    )
+    parser.add_argument(
+        "--sample-seed",
+        type=int,
+        default=sampling.DEFAULT_SEED,
+        help=f"分层抽样的随机种子，相同种子总是选中相同的问题（默认: {sampling.DEFAULT_SEED}）"
+    )
+    parser.add_argument(
+        "--context-cache",
+        action="store_true",
+        help="使用提供方的提示词前缀缓存：Gemini 为每个测试组提示词创建显式上下文缓存（运行结束时删除），"
+             "OpenAI 请求附带按组提示词生成的 prompt_cache_key；命中缓存的 token 数记录在 cached_tokens"
+    )
+    parser.add_argument(
+        "--context-cache-ttl",
+        type=int,
+        default=context_cache.DEFAULT_TTL,
+        help=f"Gemini 显式缓存的有效期（秒，默认: {context_cache.DEFAULT_TTL}），剩余不足 20%% 时自动延长"
+    )
+    parser.add_argument(
+        "--server-metrics",
+        choices=server_metrics.MODES,
+        default=None,
+        help="记录每条查询的服务端指标（扫描/返回行数、临时表、排序、全表扫描）：status 读取会话状态差值，"
+             "performance_schema 读取语句事件（含服务端执行时间）；按模型汇总并按 SQL 效率排序"
+    )
+    parser.add_argument(
+        "--no-schema-check",
+        action="store_true",
+        help="关闭执行前的表结构校验（默认按提示词中的建表语句校验生成 SQL 的表、别名和列，"
+             "能确定不存在的引用在本地拒绝，不访问数据库）"
+    )
+    parser.add_argument(
+        "--circuit-breaker-threshold",
+        type=int,
+        default=circuit_breaker.DEFAULT_FAILURE_THRESHOLD,
+        help=f"同一模型（及 API Key）或数据库连续出现多少次系统性失败（认证、配额、无法连接等）后熔断，"
+             f"后续调用直接跳过（默认: {circuit_breaker.DEFAULT_FAILURE_THRESHOLD}，0 表示关闭）"
+    )
+    parser.add_argument(
+        "--circuit-breaker-timeout",
+        type=float,
+        default=circuit_breaker.DEFAULT_RESET_TIMEOUT,
+        help=f"熔断后到第一次试探调用的秒数，试探失败后翻倍（默认: {circuit_breaker.DEFAULT_RESET_TIMEOUT:g}）"
+    )
+    parser.add_argument(
+        "--trace-file",
+        default=None,
+        help="记录各阶段 span 并写入追踪文件（chrome 格式可在 chrome://tracing 或 Perfetto 打开）"
+    )
+    parser.add_argument(
+        "--trace-format",
+        choices=tracing.TRACE_FORMATS,
+        default="chrome",
+        help="追踪文件格式：chrome（Trace Event）或 otlp（OpenTelemetry OTLP/JSON），默认 chrome"
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=os.path.join(os.path.dirname(__file__), "logs", "profile"),
+        default=None,
+        metavar="PREFIX",
+        help="使用 cProfile 和 tracemalloc 剖析整个运行，输出 PREFIX.prof、PREFIX_cpu.txt、PREFIX_mem.txt"
+             "（默认前缀: test_case/logs/profile）"
+    )
+    return parser
+
+
+def parse_args(parser: argparse.ArgumentParser, argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析并检查运行测试的命令行参数（参数错误时 parser.error 退出）"""
+    args = parser.parse_args(argv)
+    if args.pipeline and args.early_stop:
+        parser.error("--pipeline 不能与 --early-stop 同时使用（提前停止需要按轮次等待各模型的结果）")
+    return args
+
+
+def run_tests_kwargs(args: argparse.Namespace) -> Dict:
+    """把命令行参数转换为 run_tests 的参数"""
+    return dict(
+        testcase_file=args.testcase, openai_model=args.openai_model, google_model=args.google_model,
+        output_file=args.output,
+        incremental=args.incremental, previous_results_file=args.previous_results,
+        retry_failed=args.retry_failed, metrics_port=args.metrics_port,
+        metrics_host=args.metrics_host, question_cache_file=args.question_cache,
+        cache_threshold=args.cache_threshold, cache_aliases_file=args.cache_aliases,
+        history_db=None if args.no_history else args.history_db,
+        item_deadline=args.deadline, grace_period=args.grace_period,
+        early_stop_settings={
+            "confidence": args.early_stop_confidence,
+            "min_samples": args.early_stop_min_samples,
+            "tolerance": args.early_stop_tolerance,
+        } if args.early_stop else None,
+        store_rows_dir=args.store_rows, row_sample=args.row_sample,
+        compact_schema=args.compact_schema,
+        pipeline_settings={
+            "generate_workers": args.generate_workers,
+            "validate_workers": args.validate_workers,
+            "execute_workers": args.execute_workers,
+            "queue_size": args.stage_queue_size,
+        } if args.pipeline else None,
+        sample_size=args.sample, sample_seed=args.sample_seed)
+
+
+# 子命令：名称 -> 模块（模块需提供 main(argv) 入口）
+SUBCOMMANDS = {
+    "report": "test_case.report",
+    "loadtest": "test_case.loadtest",
+    "serve": "test_case.serve",
+    "history": "test_case.history",
+    "rows": "test_case.row_store",
+    "indexes": "test_case.index_advisor",
+    "scheduler": "test_case.scheduler",
+}
+
+
+if __name__ == "__main__":
+    # 子命令分发（不带子命令时保持原有的运行测试行为）
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        subcommand = importlib.import_module(SUBCOMMANDS[sys.argv[1]])
+        sys.exit(subcommand.main(sys.argv[2:]))
     
-    args = parser.parse_args()
+    args = parse_args(build_arg_parser())
     
     # 检查环境变量并显示诊断信息
     print("\n" + "=" * 80)
     print("环境变量检查")
     print("=" * 80)
     
+    ensure_env_loaded()
     openai_key = os.getenv("OPENAI_API_KEY")
-    if openai:
+    if sdk_available("openai"):
         if openai_key:
             print(f"✓ OPENAI_API_KEY 已设置 (前缀: {openai_key[:10]}...)")
         else:
@@ -1198,7 +2880,7 @@ if __name__ == "__main__":
         print("⚠ OpenAI 库未安装，跳过检查")
     
     google_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-    if genai:
+    if sdk_available("genai"):
         if google_key:
             google_key = google_key.strip()
             print(f"✓ GOOGLE_API_KEY 已设置 (前缀: {google_key[:10]}..., 长度: {len(google_key)} 字符)")
@@ -1226,5 +2908,26 @@ if __name__ == "__main__":
     
     print("=" * 80 + "\n")
     
-    run_tests(args.testcase, args.openai_model, args.google_model)
-
+    if args.trace_file:
+        tracing.start()
+    context_cache.REGISTRY.configure(enabled=args.context_cache, ttl=args.context_cache_ttl)
+    server_metrics.COLLECTOR.configure(args.server_metrics)
+    sql_validator.VALIDATOR.configure(enabled=not args.no_schema_check)
+    circuit_breaker.REGISTRY.configure(args.circuit_breaker_threshold, args.circuit_breaker_timeout)
+    profiler = tracing.Profiler(args.profile) if args.profile else contextlib.nullcontext()
+    interrupted_by = None
+    try:
+        with profiler:
+            interrupted_by = run_tests(**run_tests_kwargs(args))
+    finally:
+        context_cache.REGISTRY.close()
+        if args.trace_file:
+            tracer = tracing.stop()
+            tracer.write(args.trace_file, args.trace_format)
+            print(f"追踪文件已保存到: {args.trace_file}（{len(tracer.spans)} 个 span）")
+        if args.profile:
+            print(f"剖析报告已保存到: {args.profile}.prof / {args.profile}_cpu.txt / {args.profile}_mem.txt")
+    
+    if interrupted_by:
+        # 与被信号终止的进程保持一致的退出码（128 + 信号编号）
+        sys.exit(128 + interrupted_by)
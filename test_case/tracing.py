@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+轻量级分阶段追踪与性能剖析
+在 test_question、模型调用、SQL 校验和数据库访问等阶段记录 span，导出为：
+    - chrome: Chrome Trace Event 格式，可在 chrome://tracing 或 https://ui.perfetto.dev 打开
+    - otlp:   OpenTelemetry OTLP/JSON 格式（ExportTraceServiceRequest），可导入支持 OTLP 的后端
+
+未调用 start() 时 span() 返回共享的空对象，开销只有一次函数调用和一次全局变量判断。
+
+用法:
+    from test_case import tracing
+
+    with tracing.span("db.execute", db="tennis") as sp:
+        ...
+        sp.set(rows=len(rows))
+
+    @tracing.traced("extract_sql")
+    def extract(...): ...
+"""
+
+import functools
+import io
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+TRACE_FORMATS = ("chrome", "otlp")
+
+SERVICE_NAME = "text2sql-harness"
+
+
+class _NoopSpan:
+    """追踪关闭时使用的空 span"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    """一个已开始的 span（结束时写入 Tracer）"""
+
+    __slots__ = ("tracer", "name", "attributes", "span_id", "trace_id", "parent_id", "start_ns", "thread_id")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        parent = stack[-1] if stack else None
+        self.span_id = random.getrandbits(64) or 1
+        self.trace_id = parent.trace_id if parent else random.getrandbits(128) or 1
+        self.parent_id = parent.span_id if parent else None
+        self.thread_id = threading.get_ident()
+        stack.append(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end_ns = time.perf_counter_ns()
+        stack = self.tracer._stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if exc_type is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._finish(self, end_ns)
+        return False
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+
+class Tracer:
+    """收集已结束的 span"""
+
+    def __init__(self, max_spans: int = 1_000_000):
+        self.max_spans = max_spans
+        self.spans: List[Dict] = []
+        self.dropped = 0
+        self.thread_names: Dict[int, str] = {}
+        self.pid = os.getpid()
+        # perf_counter 与墙上时钟的偏移（OTLP 需要 Unix 纳秒时间戳）
+        self.origin_ns = time.perf_counter_ns()
+        self.epoch_offset_ns = time.time_ns() - self.origin_ns
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self) -> List[_Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _finish(self, span: _Span, end_ns: int) -> None:
+        record = {
+            "name": span.name,
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "start_ns": span.start_ns,
+            "end_ns": end_ns,
+            "thread_id": span.thread_id,
+            "attributes": span.attributes,
+        }
+        with self._lock:
+            if len(self.spans) >= self.max_spans:
+                self.dropped += 1
+                return
+            self.spans.append(record)
+            if span.thread_id not in self.thread_names:
+                self.thread_names[span.thread_id] = threading.current_thread().name
+
+    def to_chrome(self) -> Dict:
+        """导出为 Chrome Trace Event 格式（完整事件 ph=X，时间单位为微秒）"""
+        events = [{"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0,
+                   "args": {"name": SERVICE_NAME}}]
+        for thread_id, thread_name in self.thread_names.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": thread_id,
+                           "args": {"name": thread_name}})
+        for record in self.spans:
+            events.append({
+                "name": record["name"],
+                "cat": record["name"].split(".", 1)[0],
+                "ph": "X",
+                "ts": (record["start_ns"] - self.origin_ns) / 1000,
+                "dur": (record["end_ns"] - record["start_ns"]) / 1000,
+                "pid": self.pid,
+                "tid": record["thread_id"],
+                "args": record["attributes"],
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"service": SERVICE_NAME, "dropped_spans": self.dropped}}
+
+    def to_otlp(self) -> Dict:
+        """导出为 OTLP/JSON（ExportTraceServiceRequest）"""
+        spans = []
+        for record in self.spans:
+            span = {
+                "traceId": f"{record['trace_id']:032x}",
+                "spanId": f"{record['span_id']:016x}",
+                "name": record["name"],
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(record["start_ns"] + self.epoch_offset_ns),
+                "endTimeUnixNano": str(record["end_ns"] + self.epoch_offset_ns),
+                "attributes": [_otlp_attribute(k, v) for k, v in record["attributes"].items()]
+                              + [_otlp_attribute("thread.id", record["thread_id"])],
+                "status": {"code": 2, "message": record["attributes"]["error"]}
+                          if "error" in record["attributes"] else {"code": 0},
+            }
+            if record["parent_id"] is not None:
+                span["parentSpanId"] = f"{record['parent_id']:016x}"
+            spans.append(span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME),
+                                        _otlp_attribute("process.pid", self.pid)]},
+            "scopeSpans": [{"scope": {"name": "test_case.tracing"}, "spans": spans}],
+        }]}
+
+    def write(self, path: str, fmt: str = "chrome") -> None:
+        """写入追踪文件"""
+        if fmt not in TRACE_FORMATS:
+            raise ValueError(f"未知的追踪格式: {fmt}")
+        with self._lock:
+            data = self.to_chrome() if fmt == "chrome" else self.to_otlp()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+
+
+def _otlp_attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+# 当前生效的 Tracer（None 表示追踪关闭）
+_tracer: Optional[Tracer] = None
+
+
+def start(max_spans: int = 1_000_000) -> Tracer:
+    """开启追踪"""
+    global _tracer
+    _tracer = Tracer(max_spans=max_spans)
+    return _tracer
+
+
+def stop() -> Optional[Tracer]:
+    """关闭追踪，返回已收集的 Tracer"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, **attributes):
+    """创建一个 span（用于 with 语句）；追踪关闭时返回空 span"""
+    tracer = _tracer
+    if tracer is None:
+        return _NOOP_SPAN
+    return _Span(tracer, name, attributes)
+
+
+def traced(name: str = None):
+    """装饰器：把整个函数调用记录为一个 span"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return func(*args, **kwargs)
+            with _Span(tracer, span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Profiler:
+    """cProfile + tracemalloc 剖析，结束时输出热点报告
+
+    生成的文件（prefix 为输出路径前缀）:
+        {prefix}.prof       cProfile 原始数据（可用 snakeviz / pstats 查看）
+        {prefix}_cpu.txt    按累计耗时和自身耗时排序的函数列表
+        {prefix}_mem.txt    按分配大小排序的代码行
+    """
+
+    def __init__(self, prefix: str, top: int = 40, memory_frames: int = 1):
+        # 剖析模块只在需要时导入，不增加正常启动的耗时
+        import cProfile
+
+        self.prefix = prefix
+        self.top = top
+        self.memory_frames = memory_frames
+        self._profile = cProfile.Profile()
+        self._snapshot = None
+
+    def __enter__(self):
+        import tracemalloc
+
+        tracemalloc.start(self.memory_frames)
+        self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        import tracemalloc
+
+        self._profile.disable()
+        self._snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.dump(peak)
+        return False
+
+    def dump(self, peak_bytes: int = 0) -> List[str]:
+        import pstats
+        import tracemalloc
+
+        directory = os.path.dirname(self.prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        prof_file = f"{self.prefix}.prof"
+        cpu_file = f"{self.prefix}_cpu.txt"
+        mem_file = f"{self.prefix}_mem.txt"
+        self._profile.dump_stats(prof_file)
+
+        out = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=out).strip_dirs()
+        out.write("=== 按累计耗时排序 ===\n")
+        stats.sort_stats("cumulative").print_stats(self.top)
+        out.write("\n=== 按自身耗时排序 ===\n")
+        stats.sort_stats("tottime").print_stats(self.top)
+        with open(cpu_file, 'w', encoding='utf-8') as f:
+            f.write(out.getvalue())
+
+        snapshot = self._snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        with open(mem_file, 'w', encoding='utf-8') as f:
+            f.write(f"峰值内存: {peak_bytes / 1024:.1f} KB\n\n")
+            f.write(f"=== 分配最多的 {self.top} 行（运行结束时仍存活） ===\n")
+            for stat in snapshot.statistics("lineno")[:self.top]:
+                f.write(f"{stat}\n")
+        return [prof_file, cpu_file, mem_file]
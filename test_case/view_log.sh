@@ -1,8 +1,15 @@
 #!/bin/bash
 # 查看测试日志
+# 用法: view_log.sh [任务ID | 日志文件]（不指定时跟踪最新的日志文件）
 
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 LOG_DIR="$SCRIPT_DIR/logs"
+SOCKET="$SCRIPT_DIR/scheduler.sock"
+
+# 任务 ID：通过调度器持续输出该任务的日志，直到任务结束
+if [[ "$1" =~ ^[0-9]+$ ]]; then
+    exec python3 "$SCRIPT_DIR/test_text2sql.py" scheduler --socket "$SOCKET" log "$1" --follow
+fi
 
 # 如果没有指定日志文件，显示最新的
 if [ -z "$1" ]; then
@@ -31,4 +38,3 @@ echo ""
 
 # 实时跟踪日志
 tail -f "$LOG_FILE"
-
@@ -1,12 +1,33 @@
 #!/bin/bash
 # 查看测试日志（venvtest 版本）
+# 用法: view_log_venvtest.sh [任务ID | 日志文件]（不指定时跟踪最新的日志文件）
 
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 LOG_DIR="$SCRIPT_DIR/logs"
+SOCKET="$SCRIPT_DIR/scheduler_venvtest.sock"
+
+# 虚拟环境配置
+PROJECT_ROOT="$( cd "$SCRIPT_DIR/.." && pwd )"
+VENV_NAME="venvtest"
+VENV_PATH="$PROJECT_ROOT/$VENV_NAME"
+VENV_PYTHON="$VENV_PATH/bin/python"
+
+# 检查虚拟环境的 Python 解释器
+if [ ! -f "$VENV_PYTHON" ]; then
+    echo "错误: 虚拟环境 '$VENV_NAME' 中找不到 Python 解释器: $VENV_PYTHON"
+    echo "请先创建虚拟环境或检查路径是否正确"
+    exit 1
+fi
+
+
+# 任务 ID：通过调度器持续输出该任务的日志，直到任务结束
+if [[ "$1" =~ ^[0-9]+$ ]]; then
+    exec "$VENV_PYTHON" "$SCRIPT_DIR/test_text2sql.py" scheduler --socket "$SOCKET" log "$1" --follow
+fi
 
 # 如果没有指定日志文件，显示最新的
 if [ -z "$1" ]; then
-    LATEST_LOG=$(ls -t "$LOG_DIR"/test_text2sql_venvtest_*.log 2>/dev/null | head -1)
+    LATEST_LOG=$(ls -t "$LOG_DIR"/test_text2sql_*.log 2>/dev/null | head -1)
     if [ -z "$LATEST_LOG" ]; then
         echo "未找到日志文件"
         exit 1
@@ -31,4 +52,3 @@ echo ""
 
 # 实时跟踪日志
 tail -f "$LOG_FILE"
-
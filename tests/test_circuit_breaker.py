@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""circuit_breaker.classify 的分类：按异常类型和错误码，而不是错误信息的文字"""
+
+from test_case import circuit_breaker
+
+
+def _exception_type(module: str, name: str, **attrs):
+    """模拟驱动 / SDK 中的异常类型（只需要模块名和错误码属性）"""
+    return type(name, (Exception,), dict(attrs, __module__=module))
+
+
+MySQLOperationalError = _exception_type("pymysql.err", "OperationalError")
+GoogleResourceExhausted = _exception_type("google.api_core.exceptions", "ResourceExhausted", code=429)
+GoogleUnauthenticated = _exception_type("google.api_core.exceptions", "Unauthenticated", code=401)
+
+
+class OpenAIRateLimitError(Exception):
+    __module__ = "openai"
+
+    def __init__(self, message: str, code: str):
+        super().__init__(message)
+        self.status_code = 429
+        self.code = code
+
+
+def _breaker(threshold: int = 3) -> circuit_breaker.CircuitBreaker:
+    return circuit_breaker.CircuitBreaker("test", "test", failure_threshold=threshold, reset_timeout=60)
+
+
+def _fail(breaker: circuit_breaker.CircuitBreaker, error, cause=None) -> None:
+    with breaker.call() as trial:
+        trial.record(error, cause)
+
+
+def test_google_rate_limit_is_not_systemic():
+    cause = GoogleResourceExhausted("429 RESOURCE_EXHAUSTED: Resource has been exhausted")
+    assert circuit_breaker.classify(cause) is None
+    # 生成函数把 429 改写成「配额已用完」，熔断器只看导致失败的异常
+    breaker = _breaker()
+    for _ in range(10):
+        _fail(breaker, f"Google API 配额已用完: {cause}\n请检查 API 使用配额或稍后重试", cause)
+    assert breaker.state == circuit_breaker.CLOSED
+    assert breaker.snapshot()["opens"] == 0
+
+
+def test_openai_insufficient_quota_is_systemic():
+    assert circuit_breaker.classify(OpenAIRateLimitError("Rate limit reached", "rate_limit_exceeded")) is None
+    assert circuit_breaker.classify(OpenAIRateLimitError("You exceeded your current quota",
+                                                         "insufficient_quota")) == "quota"
+
+
+def test_mysql_sql_errors_are_not_systemic():
+    missing_function = MySQLOperationalError(1305, "FUNCTION tennis.DATE_DIFF does not exist")
+    assert circuit_breaker.classify(missing_function) is None
+    assert circuit_breaker.classify(MySQLOperationalError(1054, "Unknown column 'nope' in 'field list'")) is None
+    breaker = _breaker()
+    for _ in range(10):
+        _fail(breaker, missing_function)
+    assert breaker.state == circuit_breaker.CLOSED
+
+
+def test_mysql_connection_and_auth_errors_open_the_breaker():
+    assert circuit_breaker.classify(MySQLOperationalError(1045, "Access denied for user 'x'")) == "auth"
+    assert circuit_breaker.classify(MySQLOperationalError(2013, "Lost connection to MySQL server")) == "connection"
+    breaker = _breaker()
+    for _ in range(3):
+        _fail(breaker, MySQLOperationalError(2003, "Can't connect to MySQL server on 'db'"))
+    assert breaker.state == circuit_breaker.OPEN
+    assert breaker.reason == "connection"
+
+
+def test_provider_and_configuration_errors():
+    assert circuit_breaker.classify(GoogleUnauthenticated("401 API key not valid")) == "auth"
+    assert circuit_breaker.classify(circuit_breaker.ConfigurationError("config", "OpenAI 库未安装")) == "config"
+    assert circuit_breaker.classify(ConnectionRefusedError(111, "Connection refused")) == "connection"
+    # 只有错误信息时无法判断，不计入熔断
+    assert circuit_breaker.classify("Error code: 401 - invalid_api_key") is None
+    assert circuit_breaker.classify(None) is None
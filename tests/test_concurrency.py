@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""concurrency.AIMDLimiter 的延迟退避：只在控制器饱和、近期延迟中位数持续偏高时减少上限"""
+
+from test_case import concurrency
+
+
+def _limiter(initial: int = 4) -> concurrency.AIMDLimiter:
+    return concurrency.AIMDLimiter("db", "test", initial=initial, max_limit=8, latency_tolerance=2.0)
+
+
+def _run(limiter: concurrency.AIMDLimiter, latency: float, parallel: int = 1) -> None:
+    """同时占用 parallel 个配额，逐个以给定延迟归还"""
+    slots = [limiter.slot() for _ in range(parallel)]
+    for slot in slots:
+        limiter.release(slot, latency)
+
+
+def test_slow_queries_below_the_limit_do_not_back_off():
+    limiter = _limiter()
+    for _ in range(20):
+        _run(limiter, 0.01)
+    for _ in range(20):
+        _run(limiter, 1.0)      # 顺序执行的慢查询（in_flight=1）
+    assert limiter.limit == 4
+    assert not limiter.decreases
+
+
+def test_single_slow_query_at_saturation_does_not_back_off():
+    limiter = _limiter()
+    for _ in range(20):
+        _run(limiter, 0.01, parallel=4)
+    limit = int(limiter.limit)
+    _run(limiter, 1.0, parallel=1)
+    for _ in range(5):
+        _run(limiter, 0.01, parallel=int(limiter.limit))
+    assert "latency" not in limiter.decreases
+    assert int(limiter.limit) >= limit
+
+
+def test_sustained_slowness_at_saturation_backs_off():
+    limiter = _limiter()
+    for _ in range(20):
+        _run(limiter, 0.01, parallel=4)
+    for _ in range(10):
+        _run(limiter, 1.0, parallel=int(limiter.limit))
+    assert limiter.decreases.get("latency")
+    assert limiter.baseline_latency < 0.1
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""early_stop.SequentialEvaluator：每轮检查的置信水平按检查次数和模型数校正"""
+
+import random
+
+from test_case import early_stop
+
+MODELS = [("openai", "a"), ("openai", "b")]
+
+
+def _simulate(rates, seed: int, questions: int = 100, max_questions=100, tolerance: float = 0.0):
+    rng = random.Random(seed)
+    evaluator = early_stop.SequentialEvaluator("g", MODELS, tolerance=tolerance, max_questions=max_questions)
+    for _ in range(questions):
+        for model in evaluator.active():
+            evaluator.record(model, rng.random() < rates[model])
+        evaluator.update()
+    return evaluator
+
+
+def test_bonferroni_over_looks_and_models():
+    evaluator = early_stop.SequentialEvaluator("g", MODELS, confidence=0.95, min_samples=10, max_questions=100)
+    assert evaluator.max_looks == 91
+    assert abs((1 - evaluator.look_confidence(1)) - 0.05 / 91 / 2) < 1e-12
+    # 流式模式：各次检查的份额之和不超过 α
+    streaming = early_stop.SequentialEvaluator("g", MODELS, confidence=0.95)
+    spent = sum(1 - streaming.look_confidence(k) for k in range(1, 100000)) * len(MODELS)
+    assert spent <= 0.05
+
+
+def test_equal_models_are_rarely_stopped():
+    rates = {MODELS[0]: 0.7, MODELS[1]: 0.7}
+    stopped = sum(any(state["status"] != early_stop.ACTIVE for state in _simulate(rates, seed).models.values())
+                  for seed in range(200))
+    assert stopped / 200 <= 0.05
+
+
+def test_clearly_worse_model_is_still_dominated():
+    evaluator = _simulate({MODELS[0]: 0.95, MODELS[1]: 0.3}, seed=1)
+    assert evaluator.models[MODELS[1]]["status"] == early_stop.DOMINATED
+    assert evaluator.models[MODELS[1]]["stopped_after"] < 100
+    assert evaluator.looks >= 1
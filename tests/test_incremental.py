@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""增量运行：输入哈希、历史结果加载和复用（--previous-results / --retry-failed）"""
+
+import json
+
+import pytest
+
+from test_case import test_text2sql as t2s
+
+DB_CONFIG = {"host": "db", "port": 3306, "user": "u", "password": "p", "database": "tennis"}
+BASE = dict(question="有多少场比赛", prompt="CREATE TABLE `t` (\n  `id` int NOT NULL\n);", model_type="openai",
+            model_name="gpt-4o", allowed_tables={"t", "u"}, db_name="tennis", db_config=DB_CONFIG)
+
+
+def _hash(**changes) -> str:
+    return t2s.compute_work_item_hash(**dict(BASE, **changes))
+
+
+def test_hash_changes_with_every_input():
+    base = _hash()
+    assert _hash() == base
+    for changes in ({"question": "有多少名球员"}, {"prompt": BASE["prompt"] + "\n-- 注释"},
+                    {"model_type": "google"}, {"model_name": "gpt-4o-mini"}, {"allowed_tables": {"t"}},
+                    {"db_name": "tennis2"}, {"db_config": dict(DB_CONFIG, host="db2")},
+                    {"db_config": dict(DB_CONFIG, database="tennis_copy")}):
+        assert _hash(**changes) != base, changes
+
+
+def test_hash_ignores_password_and_table_order(monkeypatch):
+    base = _hash()
+    assert _hash(db_config=dict(DB_CONFIG, password="rotated")) == base
+    assert _hash(allowed_tables={"u", "t"}) == base
+    monkeypatch.setattr(t2s, "HARNESS_VERSION", t2s.HARNESS_VERSION + "-next")
+    assert _hash() != base
+
+
+@pytest.mark.parametrize("suffix", [".json", ".jsonl"])
+def test_load_previous_results_skips_unfinished_items(tmp_path, suffix):
+    rows = [
+        {"input_hash": "ok", "success": True},
+        {"input_hash": "failed", "success": False, "failed_stage": "db"},
+        {"input_hash": "cancelled", "success": False, "failed_stage": "cancelled"},
+        {"input_hash": "breaker", "success": False, "failed_stage": "db", "circuit_open": True},
+        {"success": True},
+    ]
+    path = tmp_path / f"test_results{suffix}"
+    if suffix == ".jsonl":
+        path.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+    else:
+        path.write_text(json.dumps({"results_flat": {"openai:gpt-4o": rows}}), encoding="utf-8")
+    assert sorted(t2s.load_previous_results(str(path))) == ["failed", "ok"]
+    assert t2s.load_previous_results(str(tmp_path / "missing.json")) == {}
+
+
+@pytest.fixture
+def executed(monkeypatch):
+    """替换 test_question，记录真正执行的问题"""
+    calls = []
+
+    def fake_test_question(question, prompt, model_type, model_name, **kwargs):
+        calls.append(question)
+        return {"question": question, "success": True, "sql": "SELECT 1 LIMIT 1", "error": None,
+                "failed_stage": None, "model_type": model_type, "model_name": model_name}
+
+    monkeypatch.setattr(t2s, "test_question", fake_test_question)
+    return calls
+
+
+def _run(previous, retry_failed=False):
+    return t2s._run_work_item(BASE["question"], BASE["model_type"], BASE["model_name"], "tennis", BASE["prompt"],
+                              BASE["db_name"], BASE["db_config"], BASE["allowed_tables"],
+                              previous_results=previous, retry_failed=retry_failed)
+
+
+def test_unchanged_items_are_reused(executed):
+    previous = {_hash(): {"success": True, "sql": "SELECT 2 LIMIT 1", "model_type": "openai", "model_name": "gpt-4o"}}
+    result = _run(previous)
+    assert result["reused"] and result["sql"] == "SELECT 2 LIMIT 1"
+    assert result["input_hash"] == _hash()
+    assert executed == []
+
+
+def test_failed_items_are_rerun_only_with_retry_failed(executed):
+    previous = {_hash(): {"success": False, "error": "x", "model_type": "openai", "model_name": "gpt-4o"}}
+    assert _run(previous)["reused"]
+    assert executed == []
+    result = _run(previous, retry_failed=True)
+    assert not result["reused"] and result["success"]
+    assert executed == [BASE["question"]]
+
+
+def test_changed_items_are_rerun(executed):
+    previous = {_hash(question="别的问题"): {"success": True, "model_type": "openai", "model_name": "gpt-4o"}}
+    assert not _run(previous)["reused"]
+    assert executed == [BASE["question"]]
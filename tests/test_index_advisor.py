@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""index_advisor.build_recommendations 的提示：每条查询只计一次"""
+
+from test_case import index_advisor
+
+CATALOGS = {"tennis": {"summary": {"columns": [
+    {"name": "sport_event_id", "type": "varchar(50)"},
+    {"name": "sport_event_start_time", "type": "varchar(50)"},
+]}}}
+
+
+def test_column_used_twice_in_one_query_is_counted_once():
+    sql = ("SELECT sport_event_id FROM summary WHERE sport_event_start_time >= '2024-01-01' "
+           "ORDER BY sport_event_start_time DESC LIMIT 5")
+    results = [{"success": True, "sql": sql, "db_name": "tennis"},
+               {"success": True, "sql": sql.replace("2024-01-01", "2023-06-01"), "db_name": "tennis"}]
+    shapes, total = index_advisor.load_corpus(results)
+    assert total == 2 and len(shapes) == 1
+    notes = index_advisor.build_recommendations(shapes, CATALOGS)["notes"]
+    string_date = [note for note in notes if note["kind"] == "string_date"]
+    assert len(string_date) == 1
+    assert string_date[0]["column"] == "sport_event_start_time"
+    assert string_date[0]["queries"] == 2 and string_date[0]["shapes"] == 1
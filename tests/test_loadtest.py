@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""loadtest.analyze 的窗口速率：不完整的首尾窗口按实际覆盖的时长计算"""
+
+import os
+import subprocess
+import sys
+
+from test_case import loadtest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _record(offset: float, latency: float) -> dict:
+    return {"offset": offset, "completed": offset + latency, "e2e": latency, "queue": 0.0, "llm": latency,
+            "validation": 0.0, "db": 0.0, "success": True, "failed_stage": None, "model": "mock:mock"}
+
+
+def test_partial_windows_use_the_covered_duration():
+    # 25 秒内每秒到达 2 个请求，每个耗时 1 秒；窗口 10 秒，最后一个到达窗口只有 5 秒
+    records = [_record(i / 2, 1.0) for i in range(50)]
+    analysis = loadtest.analyze(records, [], elapsed=25.5, rate=2.0, duration=25.0, ramp_to=None,
+                                window=10.0, saturation_factor=2.0)
+    windows = analysis["windows"]
+    assert [w["start"] for w in windows] == [0.0, 10.0, 20.0]
+    assert [w["offered_rate"] for w in windows] == [2.0, 2.0, 2.0]
+    assert windows[-1]["span"] == 5.5
+    # 首个窗口的第 1 秒还没有请求完成，这是真实的启动过程，不是除错了时长
+    assert windows[0]["throughput"] == 1.8
+    assert windows[-1]["throughput"] == 12 / 5.5
+    # 所有完成的请求都落在某个窗口里
+    assert sum(round(w["throughput"] * w["span"]) for w in windows) == 50
+
+
+def test_completions_after_arrivals_stop_get_their_own_window():
+    records = [_record(i, 15.0) for i in range(10)]
+    analysis = loadtest.analyze(records, [], elapsed=25.0, rate=1.0, duration=10.0, ramp_to=None,
+                                window=10.0, saturation_factor=2.0)
+    tail = analysis["windows"][-1]
+    assert tail["start"] == 20.0 and tail["span"] == 5.0
+    assert tail["offered_rate"] is None and tail["target_rate"] is None
+    assert tail["throughput"] == 1.0
+
+
+def test_short_drain_tail_is_merged_into_the_previous_window():
+    # 20 QPS 均匀到达 3 秒，每个请求 20ms，排空后 elapsed=3.04：不应出现一个 40ms 的尾窗口
+    records = [_record(i / 20, 0.02) for i in range(60)]
+    analysis = loadtest.analyze(records, [], elapsed=3.04, rate=20.0, duration=3.0, ramp_to=None,
+                                window=1.0, saturation_factor=2.0)
+    windows = analysis["windows"]
+    assert [w["start"] for w in windows] == [0.0, 1.0, 2.0]
+    assert all(abs(w["offered_rate"] - 20.0) < 1e-9 for w in windows)
+    assert abs(windows[-1]["throughput"] - 20 / 1.04) < 1e-9
+    assert sum(round(w["throughput"] * w["span"]) for w in windows) == 60
+
+
+def test_mock_sql_choice_does_not_depend_on_the_hash_seed():
+    code = ("from test_case import loadtest; loadtest.configure_mock_backends(llm_latency=0.0); "
+            "print([loadtest.generate_sql_with_mock(q, '')[0] for q in ('q1', 'q2', 'q3', '有多少场比赛')])")
+    outputs = set()
+    for hash_seed in ("1", "2", "3"):
+        env = dict(os.environ, PYTHONHASHSEED=hash_seed)
+        outputs.add(subprocess.run([sys.executable, "-c", code], env=env, cwd=ROOT, capture_output=True,
+                                   text=True, check=True).stdout)
+    assert len(outputs) == 1
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""question_cache.QuestionCache：相似但含义相反的问题不能复用缓存的 SQL"""
+
+from test_case import question_cache
+from test_case.question_cache import QuestionCache, guard_tokens, jaccard, normalize_question, shingles
+
+SCOPE = QuestionCache.scope("tennis", "openai", "gpt-4o")
+
+ASCENDING = "请列出2023赛季所有参加过大满贯赛事的男子单打球员的姓名、国籍和世界排名，并按照世界排名升序排列，只返回前二十名球员的完整信息"
+PARTICIPATED = "请列出2023赛季在澳网、法网、温网和美网这四项大满贯赛事中都进入过正赛的男子单打球员的姓名、国籍、年龄和当前的世界排名"
+
+
+def _similarity(a: str, b: str) -> float:
+    return jaccard(shingles(normalize_question(a)), shingles(normalize_question(b)))
+
+
+def _cache_with(question: str) -> QuestionCache:
+    cache = QuestionCache()
+    cache.add(question, SCOPE, "SELECT 1 LIMIT 1")
+    return cache
+
+
+def test_opposite_order_is_not_served():
+    descending = ASCENDING.replace("升序", "降序")
+    assert _similarity(ASCENDING, descending) >= question_cache.DEFAULT_THRESHOLD
+    assert _cache_with(ASCENDING).lookup(descending, SCOPE) is None
+
+
+def test_negated_question_is_not_served():
+    negated = PARTICIPATED.replace("都进入过", "都没有进入过")
+    assert _similarity(PARTICIPATED, negated) >= question_cache.DEFAULT_THRESHOLD
+    assert _cache_with(PARTICIPATED).lookup(negated, SCOPE) is None
+
+
+def test_english_guard_words():
+    cache = _cache_with("list the top 10 players by ranking points in the 2023 season")
+    assert cache.lookup("list the bottom 10 players by ranking points in the 2023 season", SCOPE) is None
+    assert guard_tokens(normalize_question("players who have not won a title")) == ("not",)
+
+
+def test_paraphrase_is_still_served():
+    cache = _cache_with(ASCENDING)
+    paraphrase = ASCENDING.replace("请列出", "列出").replace("完整信息", "完整信息。")
+    hit = cache.lookup(paraphrase, SCOPE)
+    assert hit is not None and hit[1] >= question_cache.DEFAULT_THRESHOLD
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""metrics.run_scope：调度器中并发运行的任务各自统计共享对象的计数"""
+
+import threading
+
+from test_case import circuit_breaker, metrics, sql_validator
+
+PROMPT = """
+CREATE TABLE `t` (
+  `id` int NOT NULL,
+  `name` varchar(50) DEFAULT NULL,
+  PRIMARY KEY (`id`)
+);
+"""
+
+
+def test_concurrent_runs_report_only_their_own_counts():
+    validator = sql_validator.SchemaValidator()
+    breaker = circuit_breaker.CircuitBreaker("db", "run-scope-test", failure_threshold=100)
+    barrier = threading.Barrier(2)
+    snapshots = {}
+
+    def run(name: str, statements: int) -> None:
+        with metrics.run_scope():
+            barrier.wait()
+            for _ in range(statements):
+                validator.check("SELECT nope FROM t LIMIT 5", PROMPT, {"t"})
+                with breaker.call() as trial:
+                    trial.record(None)
+            barrier.wait()
+            snapshots[name] = validator.snapshot()
+
+    threads = [threading.Thread(target=run, args=("a", 3)), threading.Thread(target=run, args=("b", 5))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert snapshots["a"]["checked"] == 3 and snapshots["a"]["rejected"] == 3
+    assert snapshots["b"]["checked"] == 5
+    assert validator.snapshot()["checked"] == 8     # run_scope 之外为全局计数
+    with metrics.run_scope():
+        assert validator.snapshot() is None         # 新的运行还没有校验过
+        assert breaker.snapshot()["probes"] == 0
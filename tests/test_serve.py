@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""serve.Text2SQLService：从小型测试用例文件启动服务、请求超时后的背压"""
+
+import asyncio
+import json
+import threading
+
+from test_case import deadline, serve
+from test_case import test_text2sql as t2s
+
+TESTCASE = {
+    "database": {"tennis": {"host": "127.0.0.1", "port": 1, "user": "u", "password": "p", "database": "tennis"}},
+    "test_groups": [{
+        "name": "tennis",
+        "database_name": "tennis",
+        "prompt": "CREATE TABLE `t` (\n  `id` int NOT NULL,\n  PRIMARY KEY (`id`)\n);",
+        "questions": ["有多少条记录"],
+    }],
+}
+
+
+QUERY = json.dumps({"question": "有多少条记录"}, ensure_ascii=False).encode("utf-8")
+
+
+def _service(tmp_path, **kwargs) -> serve.Text2SQLService:
+    testcase = tmp_path / "testcase.json"
+    testcase.write_text(json.dumps(TESTCASE, ensure_ascii=False), encoding="utf-8")
+    return serve.Text2SQLService(str(testcase), **kwargs)
+
+
+def test_service_starts_from_a_testcase_file(tmp_path):
+    service = _service(tmp_path, concurrency=2, max_pending=1)
+    try:
+        assert sorted(service.groups) == ["tennis"]
+        status, health, _ = asyncio.run(service.dispatch("GET", "/healthz", b""))
+        assert status == 200
+        assert health["concurrency"] == 2 and health["pending"] == 0
+        status, error, _ = asyncio.run(service.dispatch("POST", "/v1/text2sql", b'{"group": "nope", "question": "q"}'))
+        assert status == 400 and "nope" in error["error"]
+    finally:
+        service.close()
+
+
+def test_stalled_worker_keeps_its_pending_slot(tmp_path, monkeypatch):
+    """提供方卡住时：首个请求超时返回 504，工作线程结束前新的请求返回 503 而不是排队"""
+    release = threading.Event()
+    budgets = []
+
+    def stalled(question, prompt, model_type, model_name, **kwargs):
+        budgets.append(deadline.remaining())
+        release.wait(10)
+        return {"success": False, "error": "stalled", "model_type": model_type, "model_name": model_name}
+
+    monkeypatch.setattr(t2s, "test_question", stalled)
+    service = _service(tmp_path, concurrency=1, max_pending=0, timeout=0.2, model_type="openai", model="m")
+
+    async def scenario():
+        first = await service.handle_query(QUERY)
+        second = await service.handle_query(QUERY)
+        pending = service.pending
+        release.set()
+        for _ in range(100):
+            if service.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        return first[0], second[0], pending
+
+    try:
+        first, second, pending = asyncio.run(scenario())
+        assert (first, second, pending) == (504, 503, 1)
+        assert service.pending == 0
+        # 工作线程内设置了请求的截止时间，模型和数据库调用以剩余时间作为超时
+        assert budgets and budgets[0] is not None and budgets[0] <= 0.2
+    finally:
+        release.set()
+        service.close()
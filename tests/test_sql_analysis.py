@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""sql_analysis.check_references 和执行前的表结构校验"""
+
+from test_case import sql_analysis
+from test_case import test_text2sql as t2s
+
+COLUMNS = {"t": {"id", "name", "tags"}, "u": {"id", "t_id", "score"}}
+
+PROMPT = """
+CREATE TABLE `t` (
+  `id` int NOT NULL,
+  `name` varchar(50) DEFAULT NULL,
+  `tags` json DEFAULT NULL,
+  PRIMARY KEY (`id`)
+);
+
+CREATE TABLE `u` (
+  `id` int NOT NULL,
+  `t_id` int DEFAULT NULL,
+  `score` int DEFAULT NULL,
+  PRIMARY KEY (`id`)
+);
+"""
+
+
+def test_json_table_is_an_opaque_source():
+    sql = ("SELECT t.id, jt.tag, ord FROM t, JSON_TABLE(t.tags, '$[*]' COLUMNS ("
+           "tag VARCHAR(50) PATH '$' DEFAULT '0' ON EMPTY, ord FOR ORDINALITY)) AS jt "
+           "WHERE jt.tag = 'x' ORDER BY tag LIMIT 5")
+    assert t2s.is_safe_sql(sql, {"T", "U"})[0]
+    assert sql_analysis.check_references(sql, COLUMNS) is None
+    assert sql_analysis.analyze(sql).tables == {"t"}
+    # 真实表的列仍然校验
+    bad = "SELECT t.nope FROM t, JSON_TABLE(t.tags, '$[*]' COLUMNS (tag TEXT PATH '$')) jt LIMIT 5"
+    assert sql_analysis.check_references(bad, COLUMNS).startswith("未知列 t.nope")
+
+
+def test_lateral_derived_table():
+    sql = ("SELECT t.id, d.best FROM t, LATERAL (SELECT MAX(u.score) AS best FROM u WHERE u.t_id = t.id) AS d "
+           "LIMIT 5")
+    assert sql_analysis.check_references(sql, COLUMNS) is None
+    assert sql_analysis.analyze(sql).tables == {"t", "u"}
+    bad = "SELECT d.best FROM t, LATERAL (SELECT MAX(u.nope) AS best FROM u) AS d LIMIT 5"
+    assert sql_analysis.check_references(bad, COLUMNS).startswith("未知列 u.nope")
+
+
+def test_known_sql_is_validated_against_the_group_prompt():
+    result = t2s.run_known_sql("q", "SELECT nope FROM t LIMIT 5", "openai", "gpt-4o",
+                               allowed_tables={"t", "u"}, prompt=PROMPT)
+    assert result["failed_stage"] == "validation"
+    assert result["error"].startswith("表结构校验失败: 未知列 nope")